@@ -0,0 +1,5 @@
+# coding=utf-8
+"""Benchmarks for the hot paths of the InaSAFE library.
+
+Run them with ``make benchmark`` or ``python benchmarks/run_benchmarks.py``.
+"""
@@ -0,0 +1,54 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+ **End to end impact calculation benchmarks.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import shutil
+from tempfile import mkdtemp
+
+from safe.storage.core import read_layer
+from safe.engine.core import calculate_impact
+from safe.impact_functions import get_plugin
+from benchmarks.generators import (
+    SIZES,
+    make_raster,
+    write_layer)
+
+
+class CalculateImpact(object):
+    """Flood depth raster on population raster, read to written impact."""
+    params = list(SIZES.keys())
+    param_names = ['size']
+
+    def setup(self, size):
+        """Write the hazard and exposure rasters."""
+        self.directory = mkdtemp(prefix='inasafe_bench_')
+        self.hazard_path = write_layer(
+            make_raster(size, kind='hazard'), self.directory, 'hazard')
+        self.exposure_path = write_layer(
+            make_raster(size, kind='exposure'), self.directory, 'exposure')
+        self.impact_function = get_plugin('FloodEvacuationFunction')
+
+    def teardown(self, size):
+        """Remove the written files."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_calculate_impact(self, size):
+        """Read the layers, run the impact function and write the impact."""
+        layers = [read_layer(self.hazard_path), read_layer(self.exposure_path)]
+        calculate_impact(layers=layers, impact_fcn=self.impact_function)
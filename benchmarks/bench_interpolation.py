@@ -0,0 +1,48 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+ **Interpolation benchmarks.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+from safe.gis.interpolation2d import interpolate2d
+from benchmarks.generators import (
+    SIZES,
+    make_points,
+    make_depth_grid,
+    raster_grid)
+
+
+class Interpolate2d(object):
+    """Interpolate a depth grid at scattered points."""
+    params = list(SIZES.keys())
+    param_names = ['size']
+
+    def setup(self, size):
+        """Generate the grid and the points."""
+        cells = SIZES[size]['raster']
+        self.x, self.y, _ = raster_grid(cells, cells)
+        # interpolate2d expects z[i, j] to belong to x[i], y[j]
+        self.z = make_depth_grid(cells, cells).transpose()
+        self.points = make_points(SIZES[size]['points'])
+
+    def time_interpolate2d_linear(self, size):
+        """Bilinear interpolation."""
+        interpolate2d(self.x, self.y, self.z, self.points, mode='linear')
+
+    def time_interpolate2d_constant(self, size):
+        """Nearest neighbour interpolation."""
+        interpolate2d(self.x, self.y, self.z, self.points, mode='constant')
@@ -0,0 +1,63 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+ **Polygon benchmarks.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+from safe.gis.polygon import (
+    separate_points_by_polygon,
+    clip_lines_by_polygons)
+from benchmarks.generators import (
+    SIZES,
+    make_points,
+    make_polygons,
+    make_roads)
+
+
+class SeparatePointsByPolygon(object):
+    """Points in one detailed polygon covering most of the area."""
+    params = list(SIZES.keys())
+    param_names = ['size']
+
+    def setup(self, size):
+        """Generate the points and the polygon."""
+        self.points = make_points(SIZES[size]['points'])
+        self.polygon = make_polygons(1, vertices=500)[0]
+
+    def time_separate_points_by_polygon(self, size):
+        """Separate the points with the default closed boundary."""
+        separate_points_by_polygon(self.points, self.polygon)
+
+    def time_separate_points_by_polygon_open(self, size):
+        """Separate the points leaving the boundary undefined."""
+        separate_points_by_polygon(
+            self.points, self.polygon, closed=None, check_input=False)
+
+
+class ClipLinesByPolygons(object):
+    """Clip a road network by a set of hazard zones."""
+    params = list(SIZES.keys())
+    param_names = ['size']
+
+    def setup(self, size):
+        """Generate the roads and the zones."""
+        self.lines = make_roads(SIZES[size]['roads'])
+        self.polygons = make_polygons(SIZES[size]['polygons'])
+
+    def time_clip_lines_by_polygons(self, size):
+        """Clip all roads by all zones."""
+        clip_lines_by_polygons(self.lines, self.polygons)
@@ -0,0 +1,86 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+ **Raster and vector read/write benchmarks.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import shutil
+from tempfile import mkdtemp
+
+from safe.storage.core import read_layer
+from benchmarks.generators import (
+    SIZES,
+    make_raster,
+    make_points,
+    make_polygons,
+    make_vector,
+    write_layer)
+
+
+class _LayerIO(object):
+    """Base class writing a layer in setup and timing its read and write."""
+    params = list(SIZES.keys())
+    param_names = ['size']
+
+    def make_layer(self, size):
+        """Generate the layer to benchmark, implemented by subclasses."""
+        raise NotImplementedError(
+            '%s does not generate a layer' % self.__class__.__name__)
+
+    def setup(self, size):
+        """Generate the layer and write a copy to read back."""
+        self.directory = mkdtemp(prefix='inasafe_bench_')
+        self.layer = self.make_layer(size)
+        self.filename = write_layer(self.layer, self.directory, 'source')
+        self.count = 0
+
+    def teardown(self, size):
+        """Remove the written files."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_write(self, size):
+        """Write the layer to a new file."""
+        self.count += 1
+        write_layer(self.layer, self.directory, 'copy_%i' % self.count)
+
+    def time_read(self, size):
+        """Read the layer from file."""
+        read_layer(self.filename)
+
+
+class RasterIO(_LayerIO):
+    """Read and write a flood depth raster."""
+
+    def make_layer(self, size):
+        """Generate the raster."""
+        return make_raster(size)
+
+
+class PointIO(_LayerIO):
+    """Read and write a point layer."""
+
+    def make_layer(self, size):
+        """Generate the points."""
+        return make_vector(make_points(SIZES[size]['points']), 'point')
+
+
+class PolygonIO(_LayerIO):
+    """Read and write a polygon layer."""
+
+    def make_layer(self, size):
+        """Generate the polygons."""
+        return make_vector(make_polygons(SIZES[size]['polygons']), 'polygon')
@@ -0,0 +1,61 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+ **Zonal statistics benchmarks.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import shutil
+from tempfile import mkdtemp
+
+from benchmarks.generators import (
+    SIZES,
+    make_raster,
+    make_polygons,
+    make_vector,
+    write_layer)
+
+
+class CalculateZonalStats(object):
+    """Zonal statistics of a population raster over polygons."""
+    params = list(SIZES.keys())
+    param_names = ['size']
+
+    def setup(self, size):
+        """Write the layers and load them in QGIS."""
+        from safe.test.utilities import get_qgis_app
+        if get_qgis_app()[0] is None:
+            # NotImplementedError is asv's signal to skip the benchmark
+            raise NotImplementedError('QGIS is not available')
+        from qgis.core import QgsRasterLayer, QgsVectorLayer
+        self.directory = mkdtemp(prefix='inasafe_bench_')
+        raster_path = write_layer(
+            make_raster(size, kind='exposure'), self.directory, 'raster')
+        polygon_path = write_layer(
+            make_vector(make_polygons(SIZES[size]['polygons']), 'polygon'),
+            self.directory,
+            'polygons')
+        self.raster_layer = QgsRasterLayer(raster_path, 'raster')
+        self.polygon_layer = QgsVectorLayer(polygon_path, 'polygons', 'ogr')
+
+    def teardown(self, size):
+        """Remove the written files."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_calculate_zonal_stats(self, size):
+        """Sum, mean, min, max and count of each polygon."""
+        from safe.impact_statistics.zonal_stats import calculate_zonal_stats
+        calculate_zonal_stats(self.raster_layer, self.polygon_layer)
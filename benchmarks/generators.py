@@ -0,0 +1,341 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+ **Synthetic data generators for the benchmark suite.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+All generators are deterministic: the same size and seed always produce the
+same data, so timings can be compared between commits.
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import os
+import numpy
+from collections import OrderedDict
+
+from safe.gis.polygon import (
+    generate_random_points_in_bbox,
+    populate_polygon)
+from safe.storage.raster import Raster
+from safe.storage.vector import Vector
+from safe.storage.projection import DEFAULT_PROJECTION
+
+# Seed used by all generators unless another one is given.
+DEFAULT_SEED = 1234
+
+# A patch of Jakarta, [west, south, east, north] in EPSG:4326.
+DEFAULT_BBOX = [106.7, -6.3, 106.9, -6.1]
+
+# Number of cells, points, polygons and roads generated for each size.
+SIZES = OrderedDict([
+    ('small', {
+        'raster': 100, 'points': 1000, 'polygons': 10, 'roads': 100}),
+    ('medium', {
+        'raster': 500, 'points': 10000, 'polygons': 100, 'roads': 1000}),
+    ('large', {
+        'raster': 2000, 'points': 100000, 'polygons': 1000, 'roads': 10000})
+])
+
+
+def bbox_to_polygon(bbox):
+    """Convert a bounding box to a closed polygon.
+
+    :param bbox: Bounding box [west, south, east, north].
+    :type bbox: list
+
+    :returns: Polygon vertices as an Nx2 array.
+    :rtype: numpy.ndarray
+    """
+    west, south, east, north = bbox
+    return numpy.array([
+        [west, south], [east, south], [east, north], [west, north],
+        [west, south]])
+
+
+def raster_grid(rows, columns, bbox=None):
+    """Cell centre coordinates of a raster covering bbox.
+
+    :param rows: Number of rows.
+    :type rows: int
+
+    :param columns: Number of columns.
+    :type columns: int
+
+    :param bbox: Bounding box [west, south, east, north].
+    :type bbox: list
+
+    :returns: Longitudes, latitudes (ascending) and the geotransform.
+    :rtype: (numpy.ndarray, numpy.ndarray, tuple)
+    """
+    if bbox is None:
+        bbox = DEFAULT_BBOX
+    west, south, east, north = bbox
+    dx = float(east - west) / columns
+    dy = float(north - south) / rows
+    longitudes = west + dx * (numpy.arange(columns) + 0.5)
+    latitudes = south + dy * (numpy.arange(rows) + 0.5)
+    geotransform = (west, dx, 0.0, north, 0.0, -dy)
+    return longitudes, latitudes, geotransform
+
+
+def make_depth_grid(rows, columns, seed=DEFAULT_SEED):
+    """Smooth synthetic flood depth field in metres.
+
+    The field is a sum of gaussian bumps so that thresholds produce a
+    realistic mix of large connected and small isolated zones.
+
+    :param rows: Number of rows.
+    :type rows: int
+
+    :param columns: Number of columns.
+    :type columns: int
+
+    :param seed: Seed for the random number generator.
+    :type seed: int
+
+    :returns: Array of shape (rows, columns) with depths between 0 and 3.
+    :rtype: numpy.ndarray
+    """
+    state = numpy.random.RandomState(seed)
+    y, x = numpy.mgrid[0:1:rows * 1j, 0:1:columns * 1j]
+    depth = numpy.zeros((rows, columns))
+    for _ in range(12):
+        cx, cy = state.uniform(0, 1, 2)
+        width = state.uniform(0.05, 0.25)
+        depth += state.uniform(0.5, 2.0) * numpy.exp(
+            -((x - cx) ** 2 + (y - cy) ** 2) / (2 * width ** 2))
+    return numpy.clip(depth, 0, 3)
+
+
+def make_raster(
+        size='small', kind='hazard', bbox=None, seed=DEFAULT_SEED,
+        keywords=None):
+    """Make a synthetic square raster layer.
+
+    :param size: One of the keys of SIZES.
+    :type size: str
+
+    :param kind: 'hazard' for flood depths in metres or 'exposure' for
+        population counts per cell.
+    :type kind: str
+
+    :param bbox: Bounding box [west, south, east, north].
+    :type bbox: list
+
+    :param seed: Seed for the random number generator.
+    :type seed: int
+
+    :param keywords: Keywords overriding the defaults for the kind.
+    :type keywords: dict
+
+    :returns: A raster layer in EPSG:4326.
+    :rtype: Raster
+    """
+    cells = SIZES[size]['raster']
+    _, _, geotransform = raster_grid(cells, cells, bbox)
+    if kind == 'hazard':
+        data = make_depth_grid(cells, cells, seed)
+        layer_keywords = {
+            'category': 'hazard',
+            'subcategory': 'flood',
+            'unit': 'm',
+            'title': 'Synthetic flood depth'}
+    else:
+        state = numpy.random.RandomState(seed)
+        data = state.poisson(5.0, (cells, cells)).astype(numpy.float64)
+        layer_keywords = {
+            'category': 'exposure',
+            'subcategory': 'population',
+            'datatype': 'count',
+            'title': 'Synthetic population'}
+    if keywords is not None:
+        layer_keywords.update(keywords)
+    return Raster(
+        data=data,
+        projection=DEFAULT_PROJECTION,
+        geotransform=geotransform,
+        name=layer_keywords['title'],
+        keywords=layer_keywords)
+
+
+def make_points(count, bbox=None, seed=DEFAULT_SEED):
+    """Make points uniformly distributed over a bounding box.
+
+    :param count: Number of points.
+    :type count: int
+
+    :param bbox: Bounding box [west, south, east, north].
+    :type bbox: list
+
+    :param seed: Seed for the random number generator.
+    :type seed: int
+
+    :returns: Nx2 array of points.
+    :rtype: numpy.ndarray
+    """
+    if bbox is None:
+        bbox = DEFAULT_BBOX
+    return generate_random_points_in_bbox(bbox_to_polygon(bbox), count, seed)
+
+
+def make_points_in_polygon(polygon, count, seed=DEFAULT_SEED):
+    """Make points uniformly distributed inside a polygon.
+
+    :param polygon: Polygon vertices.
+    :type polygon: numpy.ndarray
+
+    :param count: Number of points.
+    :type count: int
+
+    :param seed: Seed for the random number generator.
+    :type seed: int
+
+    :returns: Nx2 array of points.
+    :rtype: numpy.ndarray
+    """
+    return numpy.array(populate_polygon(polygon, count, seed=seed))
+
+
+def make_polygons(count, bbox=None, vertices=16, seed=DEFAULT_SEED):
+    """Make irregular star shaped polygons scattered over a bounding box.
+
+    :param count: Number of polygons.
+    :type count: int
+
+    :param bbox: Bounding box [west, south, east, north].
+    :type bbox: list
+
+    :param vertices: Number of vertices of each polygon.
+    :type vertices: int
+
+    :param seed: Seed for the random number generator.
+    :type seed: int
+
+    :returns: List of closed polygons, each an Nx2 array.
+    :rtype: list
+    """
+    if bbox is None:
+        bbox = DEFAULT_BBOX
+    west, south, east, north = bbox
+    state = numpy.random.RandomState(seed)
+    centres = make_points(count, bbox, seed)
+    # Polygons of about the mean spacing of the centres overlap a little.
+    radius = 0.5 * min(east - west, north - south) / numpy.sqrt(count)
+    angles = numpy.linspace(0, 2 * numpy.pi, vertices, endpoint=False)
+    polygons = []
+    for centre in centres:
+        radii = radius * state.uniform(0.5, 1.5, vertices)
+        ring = numpy.empty((vertices + 1, 2))
+        ring[:-1, 0] = centre[0] + radii * numpy.cos(angles)
+        ring[:-1, 1] = centre[1] + radii * numpy.sin(angles)
+        ring[-1] = ring[0]
+        polygons.append(ring)
+    return polygons
+
+
+def make_roads(count, bbox=None, segments=10, seed=DEFAULT_SEED):
+    """Make a network of random walk polylines over a bounding box.
+
+    :param count: Number of roads.
+    :type count: int
+
+    :param bbox: Bounding box [west, south, east, north].
+    :type bbox: list
+
+    :param segments: Number of segments of each road.
+    :type segments: int
+
+    :param seed: Seed for the random number generator.
+    :type seed: int
+
+    :returns: List of polylines, each an Nx2 array.
+    :rtype: list
+    """
+    if bbox is None:
+        bbox = DEFAULT_BBOX
+    west, south, east, north = bbox
+    state = numpy.random.RandomState(seed)
+    starts = make_points(count, bbox, seed)
+    step = 0.02 * min(east - west, north - south)
+    roads = []
+    for start in starts:
+        # Roads mostly keep their heading, like a real street network.
+        heading = state.uniform(0, 2 * numpy.pi)
+        headings = heading + numpy.cumsum(
+            state.normal(0, 0.3, segments))
+        steps = numpy.column_stack(
+            [step * numpy.cos(headings), step * numpy.sin(headings)])
+        road = numpy.vstack([start, start + numpy.cumsum(steps, axis=0)])
+        road[:, 0] = numpy.clip(road[:, 0], west, east)
+        road[:, 1] = numpy.clip(road[:, 1], south, north)
+        roads.append(road)
+    return roads
+
+
+def make_vector(geometry, geometry_type, keywords=None, seed=DEFAULT_SEED):
+    """Wrap synthetic geometry in a vector layer with a few attributes.
+
+    :param geometry: Points, lines or polygons as made by the generators.
+    :type geometry: list, numpy.ndarray
+
+    :param geometry_type: 'point', 'line' or 'polygon'.
+    :type geometry_type: str
+
+    :param keywords: Keywords for the layer.
+    :type keywords: dict
+
+    :param seed: Seed for the random number generator.
+    :type seed: int
+
+    :returns: A vector layer in EPSG:4326.
+    :rtype: Vector
+    """
+    state = numpy.random.RandomState(seed)
+    values = state.uniform(0, 3, len(geometry))
+    data = [
+        {'ID': index, 'VALUE': float(value), 'TYPE': 'type_%i' % (index % 5)}
+        for index, value in enumerate(values)]
+    if keywords is None:
+        keywords = {'title': 'Synthetic %s' % geometry_type}
+    return Vector(
+        data=data,
+        projection=DEFAULT_PROJECTION,
+        geometry=geometry,
+        geometry_type=geometry_type,
+        name=keywords.get('title'),
+        keywords=keywords)
+
+
+def write_layer(layer, directory, name):
+    """Write a synthetic layer to a directory.
+
+    :param layer: Raster or vector layer.
+    :type layer: Raster, Vector
+
+    :param directory: Output directory.
+    :type directory: str
+
+    :param name: Base name of the file, without extension.
+    :type name: str
+
+    :returns: Path of the written file.
+    :rtype: str
+    """
+    if layer.is_raster:
+        extension = '.tif'
+    else:
+        extension = '.shp'
+    filename = os.path.join(directory, name + extension)
+    layer.write_to_file(filename)
+    return filename
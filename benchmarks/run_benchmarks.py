@@ -0,0 +1,290 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+ **Benchmark runner.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+Benchmarks are written in the airspeed velocity (asv) style so they can be
+moved to asv later on: each ``bench_*.py`` module holds classes with
+``time_*`` methods, optional ``params``, ``setup`` and ``teardown``.
+
+Benchmarks that need an optional dependency are skipped when it is missing,
+following the asv conventions: a module that cannot be imported (e.g. no
+GDAL or QGIS python bindings) is reported and left out, and a ``setup``
+that raises NotImplementedError (asv's skip signal) skips that benchmark.
+
+Results are stored per machine and commit in ``benchmarks/results`` and
+compared with the previous run on the same machine (or with the commit given
+by ``--compare``). The runner exits with status 1 when a benchmark got slower
+than the baseline by more than ``--factor``, so it can gate a release::
+
+    python benchmarks/run_benchmarks.py --sizes small,medium
+    python benchmarks/run_benchmarks.py --bench polygon --compare <baseline-ref>
+
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import socket
+import argparse
+import platform
+import importlib
+from datetime import datetime
+from subprocess import PIPE, Popen
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def git_commit():
+    """Hash of the checked out commit.
+
+    :returns: The short hash, with '+' appended if the tree is dirty, or
+        'unknown' if git is not available.
+    :rtype: str
+    """
+    try:
+        commit = Popen(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stdout=PIPE, stderr=PIPE, cwd=ROOT_DIR).communicate()[0].strip()
+        status = Popen(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            stdout=PIPE, stderr=PIPE, cwd=ROOT_DIR).communicate()[0].strip()
+    except OSError:
+        return 'unknown'
+    if not commit:
+        return 'unknown'
+    if status:
+        commit += '+'
+    return commit
+
+
+def discover(pattern=None):
+    """Find the benchmark classes.
+
+    :param pattern: Regular expression the benchmark names must match.
+    :type pattern: str
+
+    :returns: List of (module name, class) tuples.
+    :rtype: list
+    """
+    classes = []
+    for path in sorted(glob.glob(os.path.join(BENCHMARK_DIR, 'bench_*.py'))):
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            module = importlib.import_module('benchmarks.%s' % module_name)
+        except ImportError, e:
+            print '%-60s skipped (%s)' % (module_name, e)
+            continue
+        for name in sorted(dir(module)):
+            value = getattr(module, name)
+            if (name.startswith('_') or not isinstance(value, type) or
+                    value.__module__ != module.__name__):
+                continue
+            if not [m for m in dir(value) if m.startswith('time_')]:
+                continue
+            if pattern and not re.search(
+                    pattern, '%s.%s' % (module_name, name)):
+                continue
+            classes.append((module_name, value))
+    return classes
+
+
+def time_method(method, param, repeat):
+    """Time repeated calls of a benchmark method.
+
+    :param method: Bound benchmark method.
+    :type method: callable
+
+    :param param: Parameter passed to the method.
+
+    :param repeat: Number of timed calls.
+    :type repeat: int
+
+    :returns: Minimum and median wall time in seconds.
+    :rtype: dict
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        method(param)
+        timings.append(time.time() - start)
+    timings.sort()
+    return {
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'repeat': repeat}
+
+
+def run(classes, sizes=None, repeat=3):
+    """Run the benchmarks.
+
+    :param classes: Benchmark classes as returned by discover.
+    :type classes: list
+
+    :param sizes: Parameters to run, all of them if None.
+    :type sizes: list
+
+    :param repeat: Number of timed calls of each benchmark.
+    :type repeat: int
+
+    :returns: Timings keyed by 'module.Class.method(param)'.
+    :rtype: dict
+    """
+    results = {}
+    for module_name, benchmark_class in classes:
+        params = getattr(benchmark_class, 'params', [None])
+        methods = sorted(
+            m for m in dir(benchmark_class) if m.startswith('time_'))
+        for param in params:
+            if sizes and param is not None and param not in sizes:
+                continue
+            benchmark = benchmark_class()
+            prefix = '%s.%s' % (module_name, benchmark_class.__name__)
+            try:
+                if hasattr(benchmark, 'setup'):
+                    benchmark.setup(param)
+            except NotImplementedError:
+                print '%-60s skipped' % ('%s(%s)' % (prefix, param))
+                continue
+            try:
+                for method in methods:
+                    key = '%s.%s(%s)' % (prefix, method, param)
+                    results[key] = time_method(
+                        getattr(benchmark, method), param, repeat)
+                    print '%-60s %10.4fs' % (key, results[key]['median'])
+            finally:
+                if hasattr(benchmark, 'teardown'):
+                    benchmark.teardown(param)
+    return results
+
+
+def results_path(commit, results_dir=RESULTS_DIR):
+    """Path of the result file of a commit on this machine."""
+    return os.path.join(results_dir, socket.gethostname(), '%s.json' % commit)
+
+
+def load_baseline(commit=None, exclude=None, results_dir=RESULTS_DIR):
+    """Load the results to compare with.
+
+    :param commit: Commit to load, the most recent run on this machine
+        if None.
+    :type commit: str
+
+    :param exclude: Result file that should not be used as the baseline.
+    :type exclude: str
+
+    :returns: The stored results or None if there are none.
+    :rtype: dict, None
+    """
+    if commit is not None:
+        path = results_path(commit, results_dir)
+        if not os.path.exists(path):
+            return None
+    else:
+        paths = [
+            p for p in glob.glob(results_path('*', results_dir))
+            if p != exclude]
+        if not paths:
+            return None
+        path = max(paths, key=os.path.getmtime)
+    with open(path) as result_file:
+        return json.load(result_file)
+
+
+def compare(results, baseline, factor):
+    """Report benchmarks slower than the baseline by more than factor.
+
+    :returns: Names of the regressed benchmarks.
+    :rtype: list
+    """
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline['results']:
+            continue
+        before = baseline['results'][key]['median']
+        after = results[key]['median']
+        if before > 0 and after / before > factor:
+            regressions.append(key)
+            print '%-60s %6.2fx slower than %s' % (
+                key, after / before, baseline['commit'])
+    return regressions
+
+
+def main():
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(
+        description='Run the InaSAFE benchmark suite.')
+    parser.add_argument(
+        '--bench', type=str, default=None,
+        help='Only run benchmarks matching this regular expression.')
+    parser.add_argument(
+        '--sizes', type=str, default='small,medium',
+        help='Comma separated sizes to run (small, medium, large).')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='Number of timed calls of each benchmark.')
+    parser.add_argument(
+        '--compare', type=str, default=None,
+        help='Commit to compare with, defaults to the previous run.')
+    parser.add_argument(
+        '--factor', type=float, default=1.2,
+        help='Slow down relative to the baseline counted as a regression.')
+    parser.add_argument(
+        '--results-dir', type=str, default=RESULTS_DIR,
+        help='Directory where results are stored.')
+    parser.add_argument(
+        '--no-save', action='store_true',
+        help='Do not store the results.')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = run(
+        discover(args.bench), args.sizes.split(','), args.repeat)
+    path = results_path(commit, args.results_dir)
+    baseline = load_baseline(args.compare, path, args.results_dir)
+
+    if not args.no_save:
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as result_file:
+            json.dump({
+                'commit': commit,
+                'date': datetime.now().isoformat(),
+                'machine': socket.gethostname(),
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'results': results}, result_file, indent=2, sort_keys=True)
+
+    if baseline is None:
+        if args.compare:
+            print 'No results stored for %s on this machine' % args.compare
+        return 0
+    if compare(results, baseline, args.factor):
+        return 1
+    print 'No regressions compared with %s' % baseline['commit']
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -325,3 +325,8 @@ class InsufficientMemoryWarning(Exception):
 class InvalidAggregationKeywords(Exception):
     """Raised when the aggregation keywords is invalid."""
     pass
+
+
+class AnalysisCancelledError(Exception):
+    """Raised when a running analysis is cancelled by the user."""
+    pass
@@ -0,0 +1,242 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool by AusAid - **Stage profiling.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+A light weight profiler recording wall time, CPU time and the peak resident
+set size of each stage of an analysis (clipping, layer reading,
+interpolation, the impact function body, writing, aggregation and the
+postprocessors). Stages are recorded with the :func:`Profiler.stage` context
+manager, or with :func:`profile_stage` and the :func:`profiled` decorator
+from code that does not hold a reference to the profiler (e.g. the
+interpolation engine called from inside an impact function)::
+
+    profiler = Profiler()
+    with profiler.stage('clip'):
+        clip_layer(...)
+
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, peak memory is not reported there.
+    resource = None
+
+# Suffix of the JSON sidecar written next to an impact layer.
+PROFILE_SUFFIX = '.profile.json'
+
+# Stack of (profiler, stage name) entries active in the current thread.
+_ACTIVE = threading.local()
+
+
+def peak_memory_usage():
+    """Peak resident set size of this process so far.
+
+    :returns: Peak RSS in megabytes or None if the platform does not expose
+        it.
+    :rtype: float, None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes on OSX, kilobytes everywhere else.
+        return peak / 1024.0 / 1024.0
+    return peak / 1024.0
+
+
+def cpu_time():
+    """User plus system CPU time consumed by this process.
+
+    :returns: CPU time in seconds.
+    :rtype: float
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _active_stack():
+    """Return the stack of stages active in the current thread."""
+    if not hasattr(_ACTIVE, 'stack'):
+        _ACTIVE.stack = []
+    return _ACTIVE.stack
+
+
+def active_profiler():
+    """The profiler of the innermost stage running in this thread.
+
+    :returns: A profiler or None if no stage is running.
+    :rtype: Profiler, None
+    """
+    stack = _active_stack()
+    if stack:
+        return stack[-1][0]
+    return None
+
+
+@contextmanager
+def profile_stage(name):
+    """Record a stage on the profiler currently active in this thread.
+
+    When no profiler is active this does nothing, so library code can be
+    instrumented without knowing whether it runs under a profiled analysis.
+
+    :param name: Name of the stage.
+    :type name: str
+    """
+    profiler = active_profiler()
+    if profiler is None:
+        yield
+    else:
+        with profiler.stage(name):
+            yield
+
+
+def profiled(name):
+    """Decorator recording each call of a function with profile_stage.
+
+    :param name: Name of the stage.
+    :type name: str
+    """
+    def decorator(function):
+        """Wrap function in a stage."""
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            """Run the wrapped function inside the stage."""
+            with profile_stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profile_path(filename):
+    """Path of the JSON profile sidecar for a layer file.
+
+    :param filename: Path of the impact layer.
+    :type filename: str
+
+    :returns: Path of the sidecar e.g. /tmp/impact.profile.json
+    :rtype: str
+    """
+    return os.path.splitext(filename)[0] + PROFILE_SUFFIX
+
+
+class Profiler(object):
+    """Record wall time, CPU time and peak memory for analysis stages."""
+
+    def __init__(self, callback=None):
+        """Constructor.
+
+        :param callback: Optional function called with the name of each
+            stage when it starts, e.g. to report progress.
+        :type callback: callable
+        """
+        self.stages = []
+        self.callback = callback
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager recording one stage.
+
+        Nested stages (including those recorded with :func:`profile_stage`
+        further down the call stack) are named after their parents, e.g.
+        'impact_function/interpolation'. The stage is recorded even when the
+        block raises.
+
+        CPU time is process wide, so it includes any other thread busy
+        during the stage.
+
+        :param name: Name of the stage.
+        :type name: str
+        """
+        stack = _active_stack()
+        parents = [entry[1] for entry in stack if entry[0] is self]
+        full_name = '/'.join(parents + [name])
+        if self.callback is not None:
+            self.callback(full_name)
+        record = {'name': full_name}
+        # Reserve the slot now so stages keep their start order.
+        self.stages.append(record)
+        stack.append((self, name))
+        peak_before = peak_memory_usage()
+        start_cpu = cpu_time()
+        start_wall = time.time()
+        try:
+            yield record
+        finally:
+            record['wall_time'] = time.time() - start_wall
+            record['cpu_time'] = cpu_time() - start_cpu
+            peak_after = peak_memory_usage()
+            record['peak_memory'] = peak_after
+            if peak_after is None:
+                record['peak_memory_growth'] = None
+            else:
+                record['peak_memory_growth'] = peak_after - peak_before
+            stack.pop()
+
+    def total_time(self):
+        """Wall time of all top level stages.
+
+        :returns: Time in seconds.
+        :rtype: float
+        """
+        return sum(
+            record.get('wall_time', 0) for record in self.stages
+            if '/' not in record['name'])
+
+    def to_dict(self):
+        """Profile as a dictionary ready for serialisation.
+
+        :returns: Dictionary with the stages and the overall peak memory.
+        :rtype: dict
+        """
+        return {
+            'stages': list(self.stages),
+            'total_time': self.total_time(),
+            'peak_memory': peak_memory_usage()}
+
+    def to_keyword(self):
+        """Compact one line summary of the stages for the layer keywords.
+
+        :returns: Summary like 'clip 1.20s 153MB, impact_function 3.10s 410MB'
+        :rtype: str
+        """
+        summary = []
+        for record in self.stages:
+            if 'wall_time' not in record:
+                continue
+            text = '%s %.2fs' % (record['name'], record['wall_time'])
+            if record['peak_memory'] is not None:
+                text += ' %dMB' % record['peak_memory']
+            summary.append(text)
+        return ', '.join(summary)
+
+    def write_json(self, filename):
+        """Write the profile to a JSON file.
+
+        :param filename: Path of the output file.
+        :type filename: str
+        """
+        with open(filename, 'w') as profile_file:
+            json.dump(self.to_dict(), profile_file, indent=2)
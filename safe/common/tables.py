@@ -68,10 +68,12 @@ __author__ = 'Philippe Lagadec'
 # 2012-09-14 Add func: - add new function, column(int) for retrieve all element
 #                        in the specific column
 #                        Ismail Sunni
+# 2014-10-19 SAFE fork - HTML is generated by joining chunks, column properties
+#                        are computed once per table and cells are no longer
+#                        modified while rendering. Added CSV and JSON output.
 
 # -----------------------------------------------------------------------------
 # TODO:
-# - method to return a generator (yield each row) instead of a single string
 # - unicode support (input and output)
 # - escape text in cells (optional)
 # - constants for standard colors
@@ -93,12 +95,99 @@ __author__ = 'Philippe Lagadec'
 # Mozilla: https://bugzilla.mozilla.org/show_bug.cgi?id=915
 
 
+import csv
+import json
+from cStringIO import StringIO
+
 # --- CONSTANTS ---------------------------------------------------------------
 
 TABLE_STYLE_THINBORDER = ''
 DEFAULT_TABLE_CLASS = 'table table-striped condensed'
 CAPTION_BOTTOM_CLASS = ' class="caption-bottom"'
 
+# Cell properties that can be given per column, with the name of the
+# attribute holding the column values in Table and TableRow.
+COLUMN_PROPERTIES = (
+    ('align', 'col_align'),
+    ('char', 'col_char'),
+    ('charoff', 'col_charoff'),
+    ('valign', 'col_valign'),
+    ('style', 'col_styles'))
+
+
+def attributes_string(attribs):
+    """Return the HTML attributes for a dict, e.g. ' width="10%"'."""
+    return ''.join([' %s="%s"' % (attr, attribs[attr]) for attr in attribs])
+
+
+def column_properties(*sources):
+    """Return the default cell properties of each column.
+
+    For each property the first source (a TableRow or Table) that defines
+    column values for it is used, so that a row can override the columns of
+    its table.
+
+    :param sources: Objects with col_align, col_char, col_charoff,
+        col_valign and col_styles attributes.
+
+    :returns: One dict per column mapping property names to values.
+    :rtype: list
+    """
+    values_by_property = []
+    for name, attribute in COLUMN_PROPERTIES:
+        for source in sources:
+            source_values = getattr(source, attribute)
+            if source_values:
+                values_by_property.append((name, source_values))
+                break
+    column_count = max(
+        [len(column_values) for _, column_values in values_by_property] or
+        [0])
+    return [
+        dict([(name, column_values[column])
+              for name, column_values in values_by_property
+              if column < len(column_values)])
+        for column in range(column_count)]
+
+
+def plain_cell_attributes(columns):
+    """Return the HTML attributes of cells given as plain values.
+
+    Such cells only get the properties of their column, so their attributes
+    can be worked out once per column rather than once per cell.
+
+    :param columns: Default cell properties of each column as made by
+        column_properties.
+    :type columns: list
+
+    :returns: The attributes string of each column.
+    :rtype: list
+    """
+    return [TableCell().attributes_string(defaults) for defaults in columns]
+
+
+def has_column_properties(source):
+    """Tell whether a TableRow or Table defines any column properties."""
+    for _, attribute in COLUMN_PROPERTIES:
+        if getattr(source, attribute):
+            return True
+    return False
+
+
+def plain_value(value):
+    """Return the value of a cell for CSV or JSON output.
+
+    :param value: A TableCell or any value given as a cell.
+
+    :returns: The cell text as given, or as a string if it is neither a
+        number nor a string.
+    """
+    if isinstance(value, TableCell):
+        value = value.text
+    if value is None or isinstance(value, (basestring, int, long, float)):
+        return value
+    return str(value)
+
 
 class TableCell(object):
     """
@@ -143,45 +232,103 @@ class TableCell(object):
             self.attribs = {}
 
     def __str__(self):
-        """return the HTML code for the table cell as a string
+        """return the HTML code for the table cell as a string"""
+        return self.html()
+
+    def html(self, defaults=None):
+        """Return the HTML code for the table cell.
+
+        :param defaults: Properties of the column (align, char, charoff,
+            valign and style) to use where the cell does not set them.
+        :type defaults: dict
+
+        :returns: The td or th element.
+        :rtype: str
+        """
+        return cell_html(
+            self.text, self.header, self.attributes_string(defaults))
+
+    def attributes_string(self, defaults=None):
+        """Return the HTML attributes of the table cell.
+
         .. note:: Since we are using the bootstrap framework we set
            alignment using inlined css as bootstrap will override the
            alignment given by align and valign html attributes.
+
+        :param defaults: Properties of the column (align, char, charoff,
+            valign and style) to use where the cell does not set them.
+        :type defaults: dict
+
+        :returns: The attributes, e.g. ' align="right"'.
+        :rtype: str
         """
-        attribs_str = ''
+        align = self.align
+        char = self.char
+        charoff = self.charoff
+        valign = self.valign
+        style = self.style
+        if defaults:
+            if align is None:
+                align = defaults.get('align')
+            if char is None:
+                char = defaults.get('char')
+            if charoff is None:
+                charoff = defaults.get('charoff')
+            if valign is None:
+                valign = defaults.get('valign')
+            if style is None:
+                style = defaults.get('style')
+        style = style or ''
+
+        attribs = dict(self.attribs)
         if self.bgcolor:
-            self.attribs['bgcolor'] = self.bgcolor
+            attribs['bgcolor'] = self.bgcolor
         if self.width:
-            self.attribs['width'] = self.width
-        if self.align:
-            self.attribs['align'] = self.align
-            self.style += 'text-align: ' + self.align + ';'
-        if self.char:
-            self.attribs['char'] = self.char
-        if self.charoff:
-            self.attribs['charoff'] = self.charoff
-        if self.valign:
-            self.attribs['valign'] = self.valign
-            self.style += 'text-align: ' + self.valign + ';'
-        if self.style:
-            self.attribs['style'] = self.style
+            attribs['width'] = self.width
+        if align:
+            attribs['align'] = align
+            style += 'text-align: ' + align + ';'
+        if char:
+            attribs['char'] = char
+        if charoff:
+            attribs['charoff'] = charoff
+        if valign:
+            attribs['valign'] = valign
+            style += 'text-align: ' + valign + ';'
+        if style:
+            attribs['style'] = style
         if self.cell_class:
-            self.attribs['class'] = self.cell_class
+            attribs['class'] = self.cell_class
         if self.row_span:
-            self.attribs['rowspan'] = self.row_span
+            attribs['rowspan'] = self.row_span
         if self.col_span:
-            self.attribs['colspan'] = self.col_span
-        for attr in self.attribs:
-            attribs_str += ' %s="%s"' % (attr, self.attribs[attr])
-        if self.text:
-            text = str(self.text)
-        else:
-            # An empty cell should at least contain a non-breaking space
-            text = '&nbsp;'
-        if self.header:
-            return '   <th%s>%s</th>\n' % (attribs_str, text)
-        else:
-            return '   <td%s>%s</td>\n' % (attribs_str, text)
+            attribs['colspan'] = self.col_span
+        return attributes_string(attribs)
+
+
+def cell_html(text, header=False, attribs_str=''):
+    """Return the HTML code of a cell.
+
+    :param text: Content of the cell, any object that str() accepts.
+
+    :param header: Whether this is a header (th) cell.
+    :type header: bool
+
+    :param attribs_str: HTML attributes of the cell, see attributes_string.
+    :type attribs_str: str
+
+    :returns: The td or th element.
+    :rtype: str
+    """
+    if text:
+        text = str(text)
+    else:
+        # An empty cell should at least contain a non-breaking space
+        text = '&nbsp;'
+    if header:
+        return '   <th%s>%s</th>\n' % (attribs_str, text)
+    else:
+        return '   <td%s>%s</td>\n' % (attribs_str, text)
 
 
 class TableRow(object):
@@ -242,30 +389,50 @@ class TableRow(object):
 
     def __str__(self):
         """return the HTML code for the table row as a string"""
-        attribs_str = ""
+        return ''.join(self.html_chunks())
+
+    def html_chunks(self, columns=None, plain_attributes=None):
+        """Generate the HTML code for the table row.
+
+        :param columns: Default cell properties of each column as made by
+            column_properties. The column properties of the row are used if
+            None.
+        :type columns: list
+
+        :param plain_attributes: Attributes of cells given as plain values,
+            as made by plain_cell_attributes for columns.
+        :type plain_attributes: list
+
+        :returns: A generator of HTML strings.
+        """
+        if columns is None:
+            columns = column_properties(self)
+        if plain_attributes is None:
+            plain_attributes = plain_cell_attributes(columns)
+        attribs = dict(self.attribs)
         if self.bgcolor:
-            self.attribs['bgcolor'] = self.bgcolor
-        for attr in self.attribs:
-            attribs_str += ' %s="%s"' % (attr, self.attribs[attr])
-        result = '  <tr%s>\n' % attribs_str
+            attribs['bgcolor'] = self.bgcolor
+        yield '  <tr%s>\n' % attributes_string(attribs)
         if isinstance(self.cells, basestring):
             # user instantiated the row with only a string for content\
-            col = 1
             # setting colspan to 100% will force rows that were
             # created by passing str for the ctor to span the full
             # table width
             cell = TableCell(self.cells, col_span='100%', header=self.header)
-            self.apply_properties(cell, col)
-            result += str(cell)
+            yield cell.html(columns[1] if len(columns) > 1 else None)
         else:
-            for cell in self.cells:
-                col = self.cells.index(cell)    # cell column index
-                if not isinstance(cell, TableCell):
-                    cell = TableCell(cell, header=self.header)
-                self.apply_properties(cell, col)
-                result += str(cell)
-        result += '  </tr>\n'
-        return result
+            column_count = len(columns)
+            for col, cell in enumerate(self.cells):
+                if isinstance(cell, TableCell):
+                    if col < column_count:
+                        yield cell.html(columns[col])
+                    else:
+                        yield cell.html()
+                elif col < column_count:
+                    yield cell_html(cell, self.header, plain_attributes[col])
+                else:
+                    yield cell_html(cell, self.header)
+        yield '  </tr>\n'
 
 
 class Table(object):
@@ -357,22 +524,31 @@ class Table(object):
 
     def __str__(self):
         """return the HTML code for the table as a string"""
-        attribs_str = ""
+        return ''.join(self.html_chunks())
+
+    def html_chunks(self):
+        """Generate the HTML code for the table.
+
+        The column properties are computed once for the whole table rather
+        than for every cell, and neither the rows nor the cells are modified.
+
+        :returns: A generator of HTML strings, e.g. to write them to a file
+            as they come.
+        """
+        attribs = dict(self.attribs)
         if self.table_class:
-            self.attribs['class'] = self.table_class
+            attribs['class'] = self.table_class
         if self.border:
-            self.attribs['border'] = self.border
+            attribs['border'] = self.border
         if self.style:
-            self.attribs['style'] = self.style
+            attribs['style'] = self.style
         if self.width:
-            self.attribs['width'] = self.width
+            attribs['width'] = self.width
         if self.cellspacing:
-            self.attribs['cellspacing'] = self.cellspacing
+            attribs['cellspacing'] = self.cellspacing
         if self.cellpadding:
-            self.attribs['cellpadding'] = self.cellpadding
-        for attr in self.attribs:
-            attribs_str += ' %s="%s"' % (attr, self.attribs[attr])
-        result = '<table%s>\n' % attribs_str
+            attribs['cellpadding'] = self.cellpadding
+        yield '<table%s>\n' % attributes_string(attribs)
         if self.caption is not None:
             caption_class = ''
             if self.caption_at_bottom:
@@ -382,38 +558,42 @@ class Table(object):
                 #  caption-side:bottom;
                 # }
                 caption_class = CAPTION_BOTTOM_CLASS
-            result += ' <caption%s>%s</caption>\n' % (
-                                    caption_class,
-                                    self.caption)
+            yield ' <caption%s>%s</caption>\n' % (caption_class, self.caption)
         # insert column tags and attributes if specified:
         if self.col_width:
             for width in self.col_width:
-                result += '  <col width="%s">\n' % width
+                yield '  <col width="%s">\n' % width
 
         # First insert a header row if specified:
         if self.header_row:
-            result += ' <thead>\n'
+            yield ' <thead>\n'
             if not isinstance(self.header_row, TableRow):
-                result += str(TableRow(self.header_row, header=True))
+                row = TableRow(self.header_row, header=True)
             else:
-                result += str(self.header_row)
-            result += ' </thead>\n'
-        # then all data rows:
-        result += ' <tbody>\n'
-        if isinstance(self.rows, basestring):
+                row = self.header_row
+            for chunk in row.html_chunks():
+                yield chunk
+            yield ' </thead>\n'
+        # then all data rows, with the column properties of the table unless
+        # a row has its own (this is the Mozilla bug workaround)
+        yield ' <tbody>\n'
+        columns = column_properties(self)
+        plain_attributes = plain_cell_attributes(columns)
+        rows = self.rows
+        if isinstance(rows, basestring):
             # user instantiated the table with only a string for content
-            row = TableRow(self.rows)
-            self.mozilla_row_fix(row)
-            result += str(row)
-        else:
-            for row in self.rows:
-                if not isinstance(row, TableRow):
-                    row = TableRow(row)
-                self.mozilla_row_fix(row)
-                result += str(row)
-        result += ' </tbody>\n'
-        result += '</table>'
-        return result
+            rows = [TableRow(rows)]
+        for row in rows:
+            if not isinstance(row, TableRow):
+                row = TableRow(row)
+            if has_column_properties(row):
+                chunks = row.html_chunks(column_properties(row, self))
+            else:
+                chunks = row.html_chunks(columns, plain_attributes)
+            for chunk in chunks:
+                yield chunk
+        yield ' </tbody>\n'
+        yield '</table>'
 
     def toNewlineFreeString(self):
         """Return a string representation of the table which contains no
@@ -449,6 +629,83 @@ class Table(object):
 
         return retval
 
+    def columns(self, header=False):
+        """Return all the columns, going through the rows only once.
+
+        This is much faster than calling column for each column of a large
+        table.
+
+        :param header: Whether to include header rows.
+        :type header: bool
+
+        :returns: One list per column with its elements, see column.
+        :rtype: list
+        """
+        rows = [row for row in self.rows if header or not row.header]
+        column_count = max([row.column_count() for row in rows] or [0])
+        retval = [[] for _ in range(column_count)]
+        for row in rows:
+            cells = row.cells
+            if isinstance(cells, basestring):
+                cells = [cells]
+            for col, elements in enumerate(retval):
+                if col < len(cells):
+                    elements.append(cells[col])
+                else:
+                    elements.append('')
+        return retval
+
+    def data(self, header=True):
+        """Return the content of the table without any HTML markup.
+
+        :param header: Whether to include the header row.
+        :type header: bool
+
+        :returns: One list of cell values per row, see plain_value.
+        :rtype: list
+        """
+        rows = self.rows
+        if isinstance(rows, basestring):
+            rows = [[rows]]
+        result = []
+        if header and self.header_row:
+            rows = [self.header_row] + list(rows)
+        for row in rows:
+            if isinstance(row, TableRow):
+                row = row.cells
+            if isinstance(row, basestring):
+                row = [row]
+            result.append([plain_value(value) for value in row])
+        return result
+
+    def to_csv(self, header=True):
+        """Return the content of the table as CSV.
+
+        :param header: Whether to include the header row.
+        :type header: bool
+
+        :returns: The rows in CSV format, encoded as utf-8.
+        :rtype: str
+        """
+        output = StringIO()
+        writer = csv.writer(output)
+        for row in self.data(header):
+            writer.writerow([
+                value.encode('utf-8') if isinstance(value, unicode) else value
+                for value in row])
+        return output.getvalue()
+
+    def to_json(self, header=True):
+        """Return the content of the table as a JSON list of rows.
+
+        :param header: Whether to include the header row.
+        :type header: bool
+
+        :returns: The rows in JSON format.
+        :rtype: str
+        """
+        return json.dumps(self.data(header))
+
 
 class List(object):
     """
@@ -487,11 +744,11 @@ class List(object):
             tag = 'ol'
         else:
             tag = 'ul'
-        result = '<%s%s>\n' % (tag, attribs_str)
+        result = ['<%s%s>\n' % (tag, attribs_str)]
         for line in self.lines:
-            result += ' <LI>%s\n' % str(line)
-        result += '</%s>\n' % tag
-        return result
+            result.append(' <LI>%s\n' % str(line))
+        result.append('</%s>\n' % tag)
+        return ''.join(result)
 
 
 # much simpler definition of a link as a function:
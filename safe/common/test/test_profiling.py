@@ -0,0 +1,95 @@
+# coding=utf-8
+"""InaSAFE Disaster risk assessment tool developed by AusAid -
+  **Profiling Tests implementation.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation; either version 2 of the License, or
+   (at your option) any later version.
+
+"""
+
+__author__ = 'info@inasafe.org'
+__version__ = '1.1.1'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
+__copyright__ += 'Disaster Reduction'
+
+import os
+import json
+import unittest
+
+from safe.common.utilities import unique_filename
+from safe.common.profiling import (
+    Profiler,
+    profile_stage,
+    profiled,
+    profile_path)
+
+
+@profiled('inner')
+def _profiled_function():
+    """Function recorded on whichever profiler is active."""
+    return 42
+
+
+class TestProfiling(unittest.TestCase):
+    """Test the stage profiler."""
+
+    def test_stages(self):
+        """Stages, nested stages and decorated functions are recorded."""
+        profiler = Profiler()
+        with profiler.stage('outer'):
+            with profile_stage('nested'):
+                pass
+            self.assertEqual(_profiled_function(), 42)
+
+        names = [record['name'] for record in profiler.stages]
+        self.assertEqual(names, ['outer', 'outer/nested', 'outer/inner'])
+        for record in profiler.stages:
+            self.assertTrue(record['wall_time'] >= 0)
+            self.assertIn('cpu_time', record)
+            self.assertIn('peak_memory', record)
+        self.assertEqual(
+            profiler.total_time(), profiler.stages[0]['wall_time'])
+        self.assertTrue(profiler.to_keyword().startswith('outer '))
+
+        # Without an active profiler nothing is recorded
+        self.assertEqual(_profiled_function(), 42)
+        self.assertEqual(len(profiler.stages), 3)
+
+    def test_stage_with_error(self):
+        """A stage is recorded when its block raises."""
+        profiler = Profiler()
+        with self.assertRaises(ValueError):
+            with profiler.stage('failing'):
+                raise ValueError('Failed')
+        self.assertIn('wall_time', profiler.stages[0])
+        # The stack is clean so profile_stage is a no-op again
+        with profile_stage('orphan'):
+            pass
+        self.assertEqual(len(profiler.stages), 1)
+
+    def test_write_json(self):
+        """The profile sidecar can be written and read back."""
+        profiler = Profiler()
+        with profiler.stage('writing'):
+            pass
+        layer_path = unique_filename(suffix='.shp')
+        sidecar = profile_path(layer_path)
+        self.assertTrue(sidecar.endswith('.profile.json'))
+        profiler.write_json(sidecar)
+        with open(sidecar) as profile_file:
+            profile = json.load(profile_file)
+        os.remove(sidecar)
+        self.assertEqual(profile['stages'][0]['name'], 'writing')
+        self.assertIn('total_time', profile)
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(TestProfiling, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -465,6 +465,34 @@ class TablesTest(unittest.TestCase):
         assert expected_result1 == real_result1, message1
         assert expected_result2 == real_result2, message2
 
+    def test_render_twice(self):
+        """Rendering a table does not change it."""
+        table = Table(
+            [['12', TableCell('3000', valign='top')]],
+            col_align=['right', 'left'])
+        self.assertEqual(str(table), str(table))
+        self.assertIn(
+            '<td align="right" style="text-align: right;">12</td>',
+            str(table))
+        self.assertEqual(''.join(table.html_chunks()), str(table))
+
+    def test_columns(self):
+        """All columns can be retrieved at once."""
+        table = Table([
+            TableRow(['header1', 'header2'], header=True),
+            TableRow([1, 2]),
+            TableRow(['a'])])
+        self.assertEqual(table.columns(), [[1, 'a'], [2, '']])
+        self.assertEqual(table.columns(True)[1], table.column(1, True))
+
+    def test_csv_and_json(self):
+        """Tables can be written as CSV and JSON."""
+        table = Table(
+            [[1, 'a, b'], [None, TableCell('c')]], header_row=['x', 'y'])
+        self.assertEqual(table.to_csv(), 'x,y\r\n1,"a, b"\r\n,c\r\n')
+        self.assertEqual(
+            table.to_json(header=False), '[[1, "a, b"], [null, "c"]]')
+
 if __name__ == '__main__':
     suite = unittest.makeSuite(TablesTest)
     runner = unittest.TextTestRunner(verbosity=2)
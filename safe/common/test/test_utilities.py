@@ -20,12 +20,15 @@ __copyright__ += 'Disaster Reduction'
 
 import unittest
 import os
+import numpy
 from safe.common.utilities import (
     get_significant_decimal,
     humanize_class,
     format_decimal,
     format_int,
+    class_statistics,
     create_classes,
+    create_classes_from_statistics,
     create_label,
     get_thousand_separator,
     get_decimal_separator,
@@ -274,6 +277,21 @@ class TestUtilities(unittest.TestCase):
         message = '%s is not same with %s' % (result, expected_classes)
         self.assertEqual(result, expected_classes, message)
 
+    def test_class_statistics(self):
+        """Test class_statistics works on arrays without a Python set."""
+        values = numpy.array([[0, 4, float('nan')], [2.5, 0, 6]])
+        statistics = class_statistics(values)
+        expected_statistics = {
+            'minimum': 0.0, 'maximum': 6.0, 'non_zero_minimum': 2.5}
+        self.assertEqual(statistics, expected_statistics)
+        self.assertEqual(
+            create_classes_from_statistics(statistics, 3),
+            create_classes(values.flat[:], 3))
+
+        # Negative values are not 0 either
+        statistics = class_statistics([-2, 0, 3])
+        self.assertEqual(statistics['non_zero_minimum'], -2.0)
+
     def test_create_label(self):
         """Test create label.
         """
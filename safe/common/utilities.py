@@ -516,6 +516,40 @@ def unhumanize_number(number):
     return number
 
 
+def class_statistics(values):
+    """Get the statistics of values that create_classes needs.
+
+    The values are reduced by numpy rather than collected into a Python set
+    so this is cheap enough to run once over a whole impact raster. The
+    result can be stored with the layer keywords so that styling and
+    legends do not need to scan the data again.
+
+    :param values: All values as a basis to create classes, NaN is ignored.
+    :type values: list, numpy.ndarray
+
+    :returns: The 'minimum', 'maximum' and 'non_zero_minimum' (the smallest
+        value that is not 0, or the maximum if there is none) as floats.
+    :rtype: dict
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    min_value = float(numpy.nanmin(values))
+    max_value = float(numpy.nanmax(values))
+
+    non_zero_min_value = max_value
+    if min_value != 0:
+        # Either negative or all values are positive
+        non_zero_min_value = min_value
+    elif max_value > 0:
+        with numpy.errstate(invalid='ignore'):
+            positive = values[values > 0]
+        non_zero_min_value = float(positive.min())
+
+    return {
+        'minimum': min_value,
+        'maximum': max_value,
+        'non_zero_minimum': non_zero_min_value}
+
+
 def create_classes(class_list, num_classes):
     """Create classes from class_list.
 
@@ -530,13 +564,24 @@ def create_classes(class_list, num_classes):
     :param num_classes: The number of class to hold all values in class_list.
     :type num_classes: int
     """
-    unique_class_list = list(set(class_list))
-    min_value = numpy.nanmin(unique_class_list)
-    max_value = numpy.nanmax(unique_class_list)
+    return create_classes_from_statistics(
+        class_statistics(class_list), num_classes)
+
+
+def create_classes_from_statistics(statistics, num_classes):
+    """Create classes from the statistics of the values, see create_classes.
+
+    :param statistics: Statistics of the values as made by class_statistics.
+    :type statistics: dict
+
+    :param num_classes: The number of class to hold all values.
+    :type num_classes: int
+    """
+    max_value = statistics['maximum']
 
     # If min_value == max_value (it only has 1 unique class), or
     # max_value <= 1.0, then we will populate the classes from 0 - max_value
-    if (min_value == max_value) or (max_value <= 1):
+    if (statistics['minimum'] == max_value) or (max_value <= 1):
         # noinspection PyTypeChecker,PyUnresolvedReferences
         classes = numpy.linspace(0, max_value, num_classes + 1).tolist()
         return classes[1:]
@@ -547,14 +592,7 @@ def create_classes(class_list, num_classes):
     #    1 so that the this smallest value goes into the 2nd class.
     # 3. (AG) Yes! The idea is to classify the non affected value to the 1st
     #    class (see #637, #702)
-
-    # Now, Get the smallest value that is not 0
-    non_zero_min_value = max_value
-    for value in unique_class_list:
-        if value < non_zero_min_value and value != 0:
-            non_zero_min_value = value
-
-    lower_bound = math.ceil(non_zero_min_value)
+    lower_bound = math.ceil(statistics['non_zero_minimum'])
     if lower_bound != 1:
         lower_bound -= 1
 
@@ -13,6 +13,7 @@ from safe.storage.projection import Projection
 from safe.storage.projection import DEFAULT_PROJECTION
 from safe.impact_functions.core import extract_layers
 from safe.common.utilities import unique_filename, verify
+from safe.common.profiling import Profiler, profile_path
 from safe.utilities.i18n import tr
 from safe.engine.utilities import REQUIRED_KEYWORDS
 
@@ -22,7 +23,8 @@ import logging
 LOGGER = logging.getLogger('InaSAFE')
 
 
-def calculate_impact(layers, impact_fcn, extent=None, check_integrity=True):
+def calculate_impact(layers, impact_fcn, extent=None, check_integrity=True,
+                     profiler=None):
     """Calculate impact levels as a function of list of input layers
 
     Input
@@ -35,9 +37,14 @@ def calculate_impact(layers, impact_fcn, extent=None, check_integrity=True):
 
         check_integrity:    If true, perform checking of input data integrity
 
+        profiler:   Optional Profiler recording the stages of the analysis.
+                    A new one is used if None.
+
     Output
         filename of resulting impact layer (GML). Comment is embedded as
         metadata. Filename is generated from input data and date.
+        The stage timings are stored in the 'profile' keyword and in a
+        JSON sidecar next to the impact layer (see profile_path).
 
     Note
         The admissible file types are tif and asc/prj for raster and
@@ -52,9 +59,13 @@ def calculate_impact(layers, impact_fcn, extent=None, check_integrity=True):
         'calculate_impact called with:\nLayers: %s\nFunction:%s' % (
             layers, impact_fcn))
 
+    if profiler is None:
+        profiler = Profiler()
+
     # Input checks
     if check_integrity:
-        check_data_integrity(layers)
+        with profiler.stage('integrity_check'):
+            check_data_integrity(layers)
 
     # Get an instance of the passed impact_fcn
     impact_function = impact_fcn()
@@ -66,7 +77,8 @@ def calculate_impact(layers, impact_fcn, extent=None, check_integrity=True):
     start_time = datetime.now()
 
     # Pass input layers to plugin
-    F = impact_function.run(layers)
+    with profiler.stage('impact_function'):
+        F = impact_function.run(layers)
 
     # End time
     end_time = datetime.now()
@@ -108,6 +120,7 @@ def calculate_impact(layers, impact_fcn, extent=None, check_integrity=True):
         F.keywords['%s_source' % cat] = source
 
     F.keywords['elapsed_time'] = elapsed_time_sec
+    F.keywords['profile'] = profiler.to_keyword()
     F.keywords['time_stamp'] = time_stamp[:19]  # remove decimal part
     F.keywords['host_name'] = host_name
     F.keywords['user'] = user
@@ -125,7 +138,9 @@ def calculate_impact(layers, impact_fcn, extent=None, check_integrity=True):
 
     output_filename = unique_filename(suffix=extension)
     F.filename = output_filename
-    F.write_to_file(output_filename)
+    with profiler.stage('writing'):
+        F.write_to_file(output_filename)
+    profiler.write_json(profile_path(output_filename))
 
     # Establish default name (layer1 X layer1 x impact_function)
     if not F.get_name():
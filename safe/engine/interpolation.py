@@ -9,6 +9,7 @@ import numpy
 
 from safe.gis.interpolation2d import interpolate_raster
 from safe.common.utilities import verify
+from safe.common.profiling import profiled
 from safe.utilities.i18n import tr
 from safe.gis.numerics import ensure_numeric
 from safe.common.exceptions import InaSAFEError, BoundsError
@@ -21,6 +22,7 @@ from safe.storage.utilities import geometry_type_to_string
 from safe.storage.utilities import DEFAULT_ATTRIBUTE
 
 
+@profiled('interpolation')
 def assign_hazard_values_to_exposure_data(hazard, exposure,
                                           layer_name=None,
                                           attribute_name=None,
@@ -3,7 +3,7 @@
 """
 
 from safe.common.exceptions import RadiiException
-from safe.gis.geodesy import Point
+from safe.gis.geodesy import generate_circles
 from safe.storage.geometry import Polygon
 from safe.storage.vector import Vector
 
@@ -43,14 +43,15 @@ def buffer_points(centers, radii, hazard_zone_attribute, data_table=None):
     if not monotonically_increasing_flag:
         raise RadiiException(RadiiException.suggestion)
 
+    # Generate all circle polygons in one go
+    all_circles = generate_circles(centers, radii)
+
     circles = []
     new_data_table = []
-    for i, center in enumerate(centers):
-        p = Point(longitude=center[0], latitude=center[1])
+    for i, center_circles in enumerate(all_circles):
         inner_rings = None
-        for radius in radii:
-            # Generate circle polygon
-            C = p.generate_circle(radius)
+        for j, radius in enumerate(radii):
+            C = center_circles[j]
             circles.append(Polygon(outer_ring=C, inner_rings=inner_rings))
 
             # Store current circle and inner ring for next poly
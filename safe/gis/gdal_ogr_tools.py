@@ -21,16 +21,17 @@ from safe.common.utilities import unique_filename
 LOGGER = logging.getLogger('InaSAFE')
 
 
-def polygonize_thresholds(
-        raster_file_name,
+def classify_thresholds(
+        data,
         threshold_min=0.0,
         threshold_max=float('inf')):
-    """
-    Function to polygonize raster. Areas (pixels) with threshold_min <
-    pixel_values < threshold_max will be converted to polygons.
+    """Classify values as within (1) or outside (0) thresholds.
 
-    :param raster_file_name:  Raster file name
-    :type raster_file_name: string
+    Values below threshold_min (if it is not negative), above threshold_max
+    (if it is positive and above threshold_min) and zeros are outside.
+
+    :param data: Values to classify.
+    :type data: numpy.ndarray
 
     :param threshold_min: Value that splits raster to
                     flooded or not flooded.
@@ -40,19 +41,53 @@ def polygonize_thresholds(
                     flooded or not flooded.
     :type threshold_max: float
 
-    :returns:   Polygon shape file name
-    :rtype:     string
-
+    :returns: Array of the same shape with 1 for values within thresholds
+        and 0 elsewhere.
+    :rtype: numpy.ndarray
     """
+    inside = numpy.not_equal(data, 0)
+    if threshold_min >= 0:
+        inside &= ~numpy.less(data, float(threshold_min))
+    if threshold_max > 0 and threshold_max > threshold_min:
+        inside &= ~numpy.greater(data, float(threshold_max))
+    return inside.astype(numpy.uint8)
 
-    # all values that are in the threshold are set to 1, others are set to 0
-    base_name = unique_filename()
-    outfile = base_name + '.tif'
 
-    indataset = gdal.Open(raster_file_name, gdal.GA_ReadOnly)
-    out_driver = gdal.GetDriverByName('GTiff')
+def threshold_dataset(
+        indataset,
+        threshold_min=0.0,
+        threshold_max=float('inf'),
+        driver_name='MEM',
+        output_file_name=''):
+    """Mark the pixels of a dataset that are within thresholds.
+
+    All values that are in the threshold are set to 1, others are set to 0.
+
+    :param indataset: Input raster dataset.
+    :type indataset: gdal.Dataset
+
+    :param threshold_min: Value that splits raster to
+                    flooded or not flooded.
+    :type threshold_min: float
+
+    :param threshold_max: Value that splits raster to
+                    flooded or not flooded.
+    :type threshold_max: float
+
+    :param driver_name: GDAL driver of the output, by default the dataset is
+        kept in memory.
+    :type driver_name: str
+
+    :param output_file_name: Output file name for file based drivers.
+    :type output_file_name: str
+
+    :returns: Byte dataset with the same size and georeferencing as the
+        input.
+    :rtype: gdal.Dataset
+    """
+    out_driver = gdal.GetDriverByName(driver_name)
     outdataset = out_driver.Create(
-        outfile,
+        output_file_name,
         indataset.RasterXSize,
         indataset.RasterYSize,
         indataset.RasterCount,
@@ -65,65 +100,168 @@ def polygonize_thresholds(
     if prj is not None and len(prj) > 0:
         outdataset.SetProjection(prj)
 
-    outNoData = 1
     for iBand in range(1, indataset.RasterCount + 1):
         inband = indataset.GetRasterBand(iBand)
         outband = outdataset.GetRasterBand(iBand)
 
-        for i in range(inband.YSize - 1, -1, -1):
-            scanline = inband.ReadAsArray(
-                0, i, inband.XSize, 1, inband.XSize, 1)
+        # Classify natural blocks of the source, e.g. tiles or strips
+        block_x_size, block_y_size = inband.GetBlockSize()
+        for y_offset in range(0, inband.YSize, block_y_size):
+            rows = min(block_y_size, inband.YSize - y_offset)
+            for x_offset in range(0, inband.XSize, block_x_size):
+                columns = min(block_x_size, inband.XSize - x_offset)
+                block = inband.ReadAsArray(x_offset, y_offset, columns, rows)
+                outband.WriteArray(
+                    classify_thresholds(block, threshold_min, threshold_max),
+                    x_offset,
+                    y_offset)
 
-            if threshold_min >= 0:
-                scanline = \
-                    numpy.choose(numpy.less(scanline, float(threshold_min)),
-                                 (scanline, 0))
+    return outdataset
 
-            if threshold_max > 0 and threshold_max > threshold_min:
-                scanline = \
-                    numpy.choose(numpy.greater(scanline, float(threshold_max)),
-                                 (scanline, 0))
 
-            scanline = numpy.choose(numpy.not_equal(scanline, 0),
-                                    (scanline, outNoData))
-            outband.WriteArray(scanline, 0, i)
+def _polygon_parts(geometry):
+    """Split a geometry into its polygons.
 
-    # polygonize
-    spat_ref = osr.SpatialReference()
-    proj = indataset.GetProjectionRef()
-    spat_ref.ImportFromWkt(proj)
-    drv = ogr.GetDriverByName("ESRI Shapefile")
-    base_name = unique_filename()
-    out_shape_file = base_name + ".shp"
-
-    dst_ds = drv.CreateDataSource(out_shape_file)
-    # ogr_layer_name = 'polygonized'
-    ogr_layer_name = os.path.splitext(os.path.split(out_shape_file)[1])[0]
-    dst_layer = dst_ds.CreateLayer(ogr_layer_name, spat_ref)
-    # fd = ogr.FieldDefn("DN", ogr.OFTInteger )
-    fd = ogr.FieldDefn("DN", ogr.OFTReal)
-    dst_layer.CreateField(fd)
-    dst_field = 0
-
-    # gdal.Polygonize(
-    #     outband, outband, dst_layer, dst_field, [], callback=None)
-    gdal.Polygonize(outband, None, dst_layer, dst_field, [], callback=None)
+    :param geometry: Polygon, multipolygon or collection, may be empty.
+    :type geometry: ogr.Geometry
+
+    :returns: The polygons of the geometry.
+    :rtype: list
+    """
+    if geometry is None or geometry.IsEmpty():
+        return []
+    if ogr.GT_Flatten(geometry.GetGeometryType()) == ogr.wkbPolygon:
+        return [geometry]
+    parts = []
+    for index in range(geometry.GetGeometryCount()):
+        parts.extend(_polygon_parts(geometry.GetGeometryRef(index)))
+    return parts
+
+
+def polygonize_classes(mask_dataset, spatial_reference, simplify=False):
+    """Polygonize a threshold mask into one in-memory layer.
+
+    :param mask_dataset: Dataset as returned by threshold_dataset.
+    :type mask_dataset: gdal.Dataset
+
+    :param spatial_reference: Spatial reference of the output layer.
+    :type spatial_reference: osr.SpatialReference
+
+    :param simplify: Whether to simplify the polygons with a tolerance of
+        one pixel. This removes the staircase vertices along the pixel
+        edges. The polygons within the thresholds are dissolved and
+        simplified together and the others cover the rest of the raster
+        extent, so the two classes still neither overlap nor leave gaps.
+    :type simplify: bool
+
+    :returns: Tuple (data_source, layer). The layer has a DN field holding
+        1 for polygons within the thresholds and 0 for others. The data
+        source must be kept alive as long as the layer is used.
+    :rtype: tuple
+    """
+    drv = ogr.GetDriverByName('Memory')
+    data_source = drv.CreateDataSource('')
+    layer = data_source.CreateLayer(
+        'polygonized', spatial_reference, ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+
+    band = mask_dataset.GetRasterBand(mask_dataset.RasterCount)
+    if not simplify:
+        gdal.Polygonize(band, None, layer, 0, [], callback=None)
+        return data_source, layer
+
+    # Simplifying each polygon on its own would move the edges it shares
+    # with its neighbours differently, so only the inside is simplified
+    # and the outside is derived from it.
+    pixel_source = drv.CreateDataSource('')
+    pixel_layer = pixel_source.CreateLayer(
+        'pixels', spatial_reference, ogr.wkbPolygon)
+    pixel_layer.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+    gdal.Polygonize(band, None, pixel_layer, 0, [], callback=None)
+
+    inside = ogr.Geometry(ogr.wkbMultiPolygon)
+    for feature in pixel_layer:
+        if feature.GetField('DN') == 1:
+            inside.AddGeometry(feature.GetGeometryRef())
+    pixel_source.Destroy()
+
+    x_origin, x_size, _, y_origin, _, y_size = \
+        mask_dataset.GetGeoTransform()
+    if inside.GetGeometryCount() > 0:
+        inside = inside.UnionCascaded().SimplifyPreserveTopology(abs(x_size))
+
+    x_end = x_origin + mask_dataset.RasterXSize * x_size
+    y_end = y_origin + mask_dataset.RasterYSize * y_size
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for x, y in [
+            (x_origin, y_origin), (x_end, y_origin), (x_end, y_end),
+            (x_origin, y_end), (x_origin, y_origin)]:
+        ring.AddPoint_2D(x, y)
+    extent = ogr.Geometry(ogr.wkbPolygon)
+    extent.AddGeometry(ring)
+    outside = extent.Difference(inside)
+
+    for value, geometry in [(1, inside), (0, outside)]:
+        for polygon in _polygon_parts(geometry):
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetField('DN', value)
+            feature.SetGeometry(polygon)
+            layer.CreateFeature(feature)
+    layer.ResetReading()
+
+    return data_source, layer
+
+
+def polygonize_dataset(
+        mask_dataset,
+        spatial_reference,
+        driver_name='Memory',
+        simplify=False):
+    """Polygonize a threshold mask into inside and outside layers.
+
+    :param mask_dataset: Dataset as returned by threshold_dataset.
+    :type mask_dataset: gdal.Dataset
+
+    :param spatial_reference: Spatial reference of the output layers.
+    :type spatial_reference: osr.SpatialReference
+
+    :param driver_name: OGR driver of the output. With the default
+        'Memory' driver nothing is written to disk. For file based drivers
+        the data sources are created in the temporary directory.
+    :type driver_name: str
+
+    :param simplify: Whether to simplify the polygons with a tolerance of
+        one pixel.
+    :type simplify: bool
+
+    :returns: Tuple (inside_data_source, inside_layer, outside_data_source,
+        outside_layer). The data sources must be kept alive as long as
+        their layers are used.
+    :rtype: tuple
+    """
+    dst_ds, dst_layer = polygonize_classes(
+        mask_dataset, spatial_reference, simplify)
+
+    drv = ogr.GetDriverByName(driver_name)
+    if driver_name == 'Memory':
+        inside_name = outside_name = ''
+    else:
+        base_name = unique_filename()
+        inside_name = base_name + '_inside.shp'
+        outside_name = base_name + '_outside.shp'
 
     # produce in and out polygon layers
-    base_name = unique_filename()
-    inside_shape_file = base_name + "_inside.shp"
     inside_layer_name = \
-        os.path.splitext(os.path.split(inside_shape_file)[1])[0]
-
-    outside_shape_file = base_name + "_outside.shp"
+        os.path.splitext(os.path.split(inside_name)[1])[0] or 'inside'
     outside_layer_name = \
-        os.path.splitext(os.path.split(outside_shape_file)[1])[0]
+        os.path.splitext(os.path.split(outside_name)[1])[0] or 'outside'
 
-    inside_ds = drv.CreateDataSource(inside_shape_file)
-    inside_layer = inside_ds.CreateLayer(inside_layer_name, spat_ref)
+    inside_ds = drv.CreateDataSource(inside_name)
+    inside_layer = inside_ds.CreateLayer(inside_layer_name, spatial_reference)
 
-    outside_ds = drv.CreateDataSource(outside_shape_file)
-    outside_layer = inside_ds.CreateLayer(outside_layer_name, spat_ref)
+    outside_ds = drv.CreateDataSource(outside_name)
+    outside_layer = outside_ds.CreateLayer(
+        outside_layer_name, spatial_reference)
 
     for feature in dst_layer:
         value = feature.GetField("DN")
@@ -137,9 +275,57 @@ def polygonize_thresholds(
             new_feature.SetGeometry(geom)
             outside_layer.CreateFeature(new_feature)
 
+    dst_ds.Destroy()
+    return inside_ds, inside_layer, outside_ds, outside_layer
+
+
+def polygonize_thresholds(
+        raster_file_name,
+        threshold_min=0.0,
+        threshold_max=float('inf'),
+        simplify=False):
+    """
+    Function to polygonize raster. Areas (pixels) with threshold_min <
+    pixel_values < threshold_max will be converted to polygons.
+
+    :param raster_file_name:  Raster file name
+    :type raster_file_name: string
+
+    :param threshold_min: Value that splits raster to
+                    flooded or not flooded.
+    :type threshold_min: float
+
+    :param threshold_max: Value that splits raster to
+                    flooded or not flooded.
+    :type threshold_max: float
+
+    :param simplify: Whether to simplify the polygons with a tolerance of
+        one pixel.
+    :type simplify: bool
+
+    :returns:   Polygon shape file name
+    :rtype:     string
+
+    """
+
+    indataset = gdal.Open(raster_file_name, gdal.GA_ReadOnly)
+    mask_dataset = threshold_dataset(indataset, threshold_min, threshold_max)
+
+    spat_ref = osr.SpatialReference()
+    spat_ref.ImportFromWkt(indataset.GetProjectionRef())
+    inside_ds, inside_layer, outside_ds, outside_layer = polygonize_dataset(
+        mask_dataset,
+        spat_ref,
+        driver_name='ESRI Shapefile',
+        simplify=simplify)
+
+    inside_shape_file = inside_ds.GetName()
+    inside_layer_name = inside_layer.GetName()
+    outside_shape_file = outside_ds.GetName()
+    outside_layer_name = outside_layer.GetName()
+
     inside_ds.Destroy()
     outside_ds.Destroy()
-    dst_ds.Destroy()
     return (
         inside_shape_file,
         inside_layer_name,
@@ -11,6 +11,8 @@ from math import acos as unsafe_acos  # this may cause a domain error
 
 import numpy
 
+from safe.common.exceptions import BoundsError
+
 
 def acos(c):
     """acos -  Safe inverse cosine
@@ -201,62 +203,121 @@ class Point(object):
               of 360 points. (optional)
         :type resolution: int, float
 
-        :returns: list of lon, lat coordinates defining the circle
-        :rtype: list
+        :returns: Array of lon, lat coordinates defining the (closed) circle
+        :rtype: numpy.ndarray
 
         ..note::
-            The circle is defined in geographic coordinates so
-            the distance in meters will be greater than the specified radius
-            in the north south direction.
+            Every vertex is at the given great circle distance from this
+            point, see generate_circles.
         """
+        return generate_circles(
+            [[self.longitude, self.latitude]],
+            [radius],
+            resolution=resolution)[0, 0]
+
+
+def destination_points(latitudes, longitudes, distances, bearings):
+    """Compute points at given distances and bearings from start points.
+
+    This solves the direct problem on the sphere with radius Point.R.
+    All arguments are broadcast against each other like numpy ufuncs.
+
+    :param latitudes: Latitudes of the start points in decimal degrees.
+    :type latitudes: float, numpy.ndarray
 
-        # Find first point in circle to the east of the center by bisecting
-        # until desired radius is achieved
+    :param longitudes: Longitudes of the start points in decimal degrees.
+    :type longitudes: float, numpy.ndarray
 
-        # Go north until distance is greater than desired
-        step = 0.001
-        d = 0
-        while d < radius:
-            stepmin = step
-            step *= 2
-            p = Point(self.latitude + step, self.longitude)
-            d = self.distance_to(p)
+    :param distances: Great circle distances to travel [m].
+    :type distances: float, numpy.ndarray
 
-        # Then bisect until the correct distance is found in degrees
-        stepmax = step
-        while not numpy.allclose(d, radius, rtol=1.0e-6):
-            step = (stepmax + stepmin) / 2
-            p = Point(self.latitude + step, self.longitude)
-            d = self.distance_to(p)
+    :param bearings: Initial bearings in degrees clockwise from north.
+    :type bearings: float, numpy.ndarray
 
-            if d > radius:
-                stepmax = step
-            else:
-                stepmin = step
+    :returns: Latitudes and longitudes (decimal degrees) of the
+        destination points. Longitudes are wrapped to [-180, 180).
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    phi = numpy.radians(latitudes)
+    delta = numpy.asarray(distances, dtype=numpy.float64) / Point.R
+    theta = numpy.radians(bearings)
+
+    sin_phi = numpy.sin(phi)
+    cos_phi = numpy.cos(phi)
+    sin_delta = numpy.sin(delta)
+    cos_delta = numpy.cos(delta)
+
+    sin_phi2 = sin_phi * cos_delta + cos_phi * sin_delta * numpy.cos(theta)
+    phi2 = numpy.arcsin(numpy.clip(sin_phi2, -1.0, 1.0))
+    lambda2 = numpy.radians(longitudes) + numpy.arctan2(
+        numpy.sin(theta) * sin_delta * cos_phi,
+        cos_delta - sin_phi * sin_phi2)
 
-        # print
-        # print ('Found geographical distance %f degrees yielding radius %f m'
-        #       % (step, d))
-        r = step
+    destination_latitudes = numpy.degrees(phi2)
+    destination_longitudes = (numpy.degrees(lambda2) + 540.0) % 360.0 - 180.0
+    return destination_latitudes, destination_longitudes
 
-        # Generate circle with geographic radius = step (degrees)
-        P = [[p.longitude, p.latitude]]
 
-        angle = 0
-        while angle < 360:
-            theta = angle * self.degrees2radians
-            # print angle, theta, self.bearing_to(p), self.distance_to(p)
+def generate_circles(centers, radii, resolution=1):
+    """Make circles for many centers and radii at once.
 
-            # Generate new point on circle
-            lat = self.latitude + r * cos(theta)
-            lon = self.longitude + r * sin(theta)
+    All vertices are computed in one vectorised pass with
+    destination_points, so every vertex is exactly at the requested
+    great circle distance from its center in every direction.
 
-            p = Point(latitude=lat, longitude=lon)
-            angle += resolution
+    :param centers: N centers as (longitude, latitude) pairs.
+    :type centers: list, numpy.ndarray
 
-            P.append([p.longitude, p.latitude])
+    :param radii: M circle radii [m].
+    :type radii: list, numpy.ndarray
 
-        # Close polygon
-        P.append(P[0])
+    :param resolution: Bearing (degrees) between vertices on each circle.
+        Default is 1 making each circle consist of 360 points.
+    :type resolution: int, float
 
-        return numpy.array(P)
+    :returns: Array of shape (N, M, K + 1, 2) where K = 360 / resolution.
+        Element [i, j] holds the closed ring of lon, lat coordinates of the
+        circle with radius radii[j] around centers[i].
+    :rtype: numpy.ndarray
+
+    :raises: BoundsError if a circle encloses a pole or crosses the
+        antimeridian, as its ring would not be a valid polygon in
+        geographic coordinates.
+    """
+    centers = numpy.array(centers, dtype=numpy.float64).reshape(-1, 2)
+    radii = numpy.array(radii, dtype=numpy.float64).reshape(-1)
+    bearings = numpy.arange(0, 360, resolution, dtype=numpy.float64)
+
+    if len(centers) > 0 and len(radii) > 0:
+        pole_distances = numpy.radians(90.0 - numpy.abs(centers[:, 1]))
+        if numpy.any(radii.max() / Point.R >= pole_distances):
+            msg = 'Circles of radius %f m around %s would enclose a pole' % (
+                radii.max(), centers.tolist())
+            raise BoundsError(msg)
+
+    latitudes, longitudes = destination_points(
+        centers[:, 1][:, None, None],
+        centers[:, 0][:, None, None],
+        radii[None, :, None],
+        bearings[None, None, :])
+
+    # Undo the wrapping relative to each center so that a circle crossing
+    # the antimeridian shows up as longitudes beyond +/-180 degrees.
+    center_longitudes = centers[:, 0][:, None, None]
+    longitudes = center_longitudes + (
+        (longitudes - center_longitudes + 540.0) % 360.0 - 180.0)
+    if numpy.any(numpy.abs(longitudes) > 180.0):
+        msg = ('Circles of radius %f m around %s would cross the '
+               'antimeridian' % (radii.max(), centers.tolist()))
+        raise BoundsError(msg)
+
+    number_of_vertices = len(bearings)
+    circles = numpy.empty(
+        (len(centers), len(radii), number_of_vertices + 1, 2))
+    circles[:, :, :number_of_vertices, 0] = longitudes
+    circles[:, :, :number_of_vertices, 1] = latitudes
+
+    # Close polygons
+    circles[:, :, number_of_vertices, :] = circles[:, :, 0, :]
+
+    return circles
@@ -1015,9 +1015,9 @@ def _clip_line_by_polygon(line,
                     else:
                         outside_line_segments.extend(segments.tolist())
 
-    # Rejoin adjacent segments and add to result lines
-    inside_lines = join_line_segments(inside_line_segments)
-    outside_lines = join_line_segments(outside_line_segments)
+    # Rejoin connected segments and add to result lines
+    inside_lines = reassemble_line_segments(inside_line_segments)
+    outside_lines = reassemble_line_segments(outside_line_segments)
 
     return inside_lines, outside_lines
 
@@ -1027,11 +1027,42 @@ def join_line_segments(segments, rtol=1.0e-12, atol=1.0e-12):
 
     Input
         segments: List of distinct line segments [[p0, p1], [p2, p3], ...]
-        rtol, atol: Optional tolerances passed on to numpy.allclose
+        rtol, atol: Optional tolerances. Only atol is used, as the snapping
+            tolerance of reassemble_line_segments. rtol is kept for
+            backwards compatibility.
 
     Output
         list of Nx2 numpy arrays each corresponding to a continuous line
-        formed from consecutive segments
+        formed from connected segments
+
+    This is a wrapper around reassemble_line_segments
+    """
+
+    return reassemble_line_segments(segments, tolerance=atol)
+
+
+def reassemble_line_segments(segments, tolerance=1.0e-12):
+    """Stitch line segments into maximal polylines
+
+    Input
+        segments: List of line segments [[p0, p1], [p2, p3], ...] or the
+            equivalent Sx2x2 array. Segments do not need to be in order.
+        tolerance: Optional grid size that end points are snapped to before
+            they are compared.
+
+    Output
+        list of Nx2 numpy arrays each corresponding to a continuous line.
+        Lines are listed in order of their lowest numbered segment and
+        follow the direction of that segment. A closed chain is returned as
+        a closed ring.
+
+    Algorithm
+        End points are snapped to a grid of size tolerance and given node
+        numbers by sorting the snapped coordinates. Two segments are joined
+        where they meet at a node with exactly two segment ends, so lines
+        stop at dangling ends and junctions. Walking the chains visits each
+        segment once, which makes the whole routine O(N log N) in the
+        sorting and linear otherwise.
     """
 
     lines = []
@@ -1039,19 +1070,79 @@ def join_line_segments(segments, rtol=1.0e-12, atol=1.0e-12):
     if len(segments) == 0:
         return lines
 
-    line = segments[0]
-    for i in range(len(segments) - 1):
-        if numpy.allclose(segments[i][1], segments[i + 1][0],
-                          rtol=rtol, atol=atol):
-            # Segments are adjacent
-            line.append(segments[i + 1][1])
-        else:
-            # Segments are disjoint - current line finishes here
-            lines.append(numpy.array(line))
-            line = segments[i + 1]
+    segments = ensure_numeric(segments, numpy.float)
+    segments = segments.reshape(-1, 2, 2)
+
+    # Snap end points to the tolerance grid. Ends are numbered so that
+    # end 2 * i is the start and 2 * i + 1 the end of segment i.
+    keys = numpy.floor(segments.reshape(-1, 2) / tolerance + 0.5)
 
-    # Finish line
-    lines.append(numpy.array(line))
+    # Skip degenerate segments whose end points snap to the same node
+    keys = keys.reshape(-1, 2, 2)
+    mask = numpy.any(keys[:, 0, :] != keys[:, 1, :], axis=1)
+    segments = segments[mask]
+    keys = keys[mask].reshape(-1, 2)
+    number_of_segments = segments.shape[0]
+    if number_of_segments == 0:
+        return lines
+
+    # Number the nodes by sorting the snapped end points
+    order = numpy.lexsort((keys[:, 1], keys[:, 0]))
+    sorted_keys = keys[order]
+    new_node = numpy.ones(len(order), dtype=bool)
+    new_node[1:] = numpy.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    sorted_node_ids = numpy.cumsum(new_node) - 1
+    degree = numpy.bincount(sorted_node_ids)
+
+    # For nodes shared by exactly two segment ends record each end's
+    # partner. Such pairs are adjacent in the sorted order.
+    partner = -numpy.ones(len(order), dtype=int)
+    first = numpy.nonzero(new_node & (degree[sorted_node_ids] == 2))[0]
+    partner[order[first]] = order[first + 1]
+    partner[order[first + 1]] = order[first]
+    partner = partner.tolist()
+
+    # Walk the chains. Each entry is (segment index, reversed flag).
+    visited = numpy.zeros(number_of_segments, dtype=bool)
+    for k in range(number_of_segments):
+        if visited[k]:
+            continue
+        visited[k] = True
+
+        # Follow the chain forward from the end of segment k
+        forward = []
+        end = 2 * k + 1
+        while partner[end] >= 0:
+            other = partner[end]
+            segment = other // 2
+            if visited[segment]:
+                break
+            visited[segment] = True
+            # Entering a segment at its end means traversing it backwards
+            forward.append((segment, other % 2 == 1))
+            end = other ^ 1
+
+        # Follow the chain backward from the start of segment k
+        backward = []
+        end = 2 * k
+        while partner[end] >= 0:
+            other = partner[end]
+            segment = other // 2
+            if visited[segment]:
+                break
+            visited[segment] = True
+            # Arriving at a segment's start means it runs backwards
+            backward.append((segment, other % 2 == 0))
+            end = other ^ 1
+
+        chain = backward[::-1] + [(k, False)] + forward
+        indices = numpy.array([c[0] for c in chain])
+        flipped = numpy.array([c[1] for c in chain])[:, numpy.newaxis]
+        starts = numpy.where(
+            flipped, segments[indices, 1], segments[indices, 0])
+        ends = numpy.where(
+            flipped, segments[indices, 0], segments[indices, 1])
+        lines.append(numpy.concatenate((starts[:1], ends)))
 
     # Return
     return lines
@@ -1353,7 +1444,8 @@ def clip_lines_by_polygons(lines, polygons, check_input=True, closed=True):
 
     Returns:
         lines_covered: List of polylines inside a polygon -o ne per input
-        polygon.
+        polygon. Pieces of each input line are reassembled into maximal
+        polylines by reassemble_line_segments.
 
 
     .. note:: If multiple polygons overlap, the one first encountered will be
@@ -8,10 +8,11 @@ __license__ = "GPL"
 __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
+import numpy
+from osgeo import gdal, osr
 
 from safe.common.utilities import unique_filename
-from safe.gis.gdal_ogr_tools import polygonize_thresholds
-from safe.common.exceptions import GetDataError
+from safe.gis.gdal_ogr_tools import threshold_dataset, polygonize_dataset
 
 # noinspection PyPackageRequirements
 from PyQt4.QtCore import QVariant
@@ -23,7 +24,8 @@ from qgis.core import (
     QgsPoint,
     QgsGeometry,
     QgsRasterFileWriter,
-    QgsRasterPipe
+    QgsRasterPipe,
+    QgsCoordinateReferenceSystem
 )
 
 from qgis_vector_tools import (
@@ -64,6 +66,109 @@ def _get_pixel_coordinates(extent, width, height, row, col):
     return output_x, output_y
 
 
+def _raster_to_array(raster):
+    """Read the first band of a raster layer into an array.
+
+    The data is read through GDAL in one call where possible. For other
+    providers it is copied from a raster block.
+
+    :param raster: Raster layer
+    :type raster: QgsRasterLayer
+
+    :returns: Array of shape (height, width) in which no data pixels are
+        nan.
+    :rtype: numpy.ndarray
+    """
+    width, height = raster.width(), raster.height()
+    dataset = None
+    if raster.dataProvider().name() == 'gdal':
+        dataset = gdal.Open(raster.source(), gdal.GA_ReadOnly)
+
+    if (dataset is not None and
+            dataset.RasterXSize == width and
+            dataset.RasterYSize == height):
+        band = dataset.GetRasterBand(1)
+        data = band.ReadAsArray().astype(numpy.float)
+        no_data = band.GetNoDataValue()
+        if no_data is not None:
+            data[data == no_data] = numpy.nan
+        return data
+
+    block = raster.dataProvider().block(1, raster.extent(), width, height)
+    data = numpy.empty((height, width), dtype=numpy.float)
+    for row in range(height):
+        data[row] = [block.value(row, col) for col in range(width)]
+    return data
+
+
+def _raster_to_dataset(raster):
+    """Get a GDAL dataset with the contents of a raster layer.
+
+    Rasters of the gdal provider are opened directly. Others are copied to a
+    MEM dataset so nothing is written to disk.
+
+    :param raster: Raster layer
+    :type raster: QgsRasterLayer
+
+    :returns: Dataset with the raster data and georeferencing.
+    :rtype: gdal.Dataset
+    """
+    if raster.dataProvider().name() == 'gdal':
+        dataset = gdal.Open(raster.source(), gdal.GA_ReadOnly)
+        if dataset is not None:
+            return dataset
+
+    extent = raster.extent()
+    width, height = raster.width(), raster.height()
+    dataset = gdal.GetDriverByName('MEM').Create(
+        '', width, height, 1, gdal.GDT_Float64)
+    dataset.SetGeoTransform([
+        extent.xMinimum(),
+        raster.rasterUnitsPerPixelX(),
+        0,
+        extent.yMaximum(),
+        0,
+        -raster.rasterUnitsPerPixelY()])
+    dataset.SetProjection(raster.crs().toWkt())
+    dataset.GetRasterBand(1).WriteArray(_raster_to_array(raster))
+    return dataset
+
+
+def _ogr_to_memory_layer(ogr_layer, crs, name):
+    """Copy an OGR polygon layer into a QGIS memory layer.
+
+    :param ogr_layer: Layer to copy, only geometries are kept.
+    :type ogr_layer: ogr.Layer
+
+    :param crs: Coordinate reference system of the layer.
+    :type crs: QgsCoordinateReferenceSystem
+
+    :param name: Name of the new layer.
+    :type name: str
+
+    :returns: Memory layer
+    :rtype: QgsVectorLayer
+    """
+    if crs.authid():
+        uri = 'Polygon?crs=%s&index=yes' % crs.authid().lower()
+    else:
+        uri = 'Polygon?index=yes'
+    layer = QgsVectorLayer(uri, name, 'memory')
+    # Custom CRSs have no authid, so set the CRS itself on the layer
+    layer.setCrs(crs)
+    features = []
+    ogr_layer.ResetReading()
+    for ogr_feature in ogr_layer:
+        feature = QgsFeature()
+        # noinspection PyCallByClass,PyTypeChecker,PyArgumentList
+        feature.setGeometry(QgsGeometry.fromWkt(
+            ogr_feature.GetGeometryRef().ExportToWkt()))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    layer.updateExtents()
+    return layer
+
+
 def pixels_to_points(
         raster,
         threshold_min=0.0,
@@ -96,8 +201,13 @@ def pixels_to_points(
 
     extent = raster.extent()
     width, height = raster.width(), raster.height()
-    provider = raster.dataProvider()
-    block = provider.block(1, extent, width, height)
+    data = _raster_to_array(raster)
+
+    # Select the pixels within the thresholds
+    rows, cols = numpy.nonzero(
+        (threshold_min < data) & (data < threshold_max))
+    values = data[rows, cols].tolist()
+    xs, ys = _get_pixel_coordinates(extent, width, height, rows, cols)
 
     # Create points
     crs = raster.crs().toWkt()
@@ -105,23 +215,18 @@ def pixels_to_points(
 
     point_provider = point_layer.dataProvider()
     point_provider.addAttributes([QgsField(field_name, QVariant.Double)])
-    field_index = point_provider.fieldNameIndex(field_name)
-    attribute_count = 1
-
-    point_layer.startEditing()
-    for row in range(height):
-        for col in range(width):
-            value = block.value(row, col)
-            x, y = _get_pixel_coordinates(extent, width, height, row, col)
-            # noinspection PyCallByClass,PyTypeChecker,PyArgumentList
-            geom = QgsGeometry.fromPoint(QgsPoint(x, y))
-            if threshold_min < value < threshold_max:
-                feature = QgsFeature()
-                feature.initAttributes(attribute_count)
-                feature.setAttribute(field_index, value)
-                feature.setGeometry(geom)
-                _ = point_layer.dataProvider().addFeatures([feature])
-    point_layer.commitChanges()
+    point_layer.updateFields()
+    fields = point_provider.fields()
+
+    features = []
+    for x, y, value in zip(xs.tolist(), ys.tolist(), values):
+        feature = QgsFeature(fields)
+        feature.setAttributes([value])
+        # noinspection PyCallByClass,PyTypeChecker,PyArgumentList
+        feature.setGeometry(QgsGeometry.fromPoint(QgsPoint(x, y)))
+        features.append(feature)
+    point_provider.addFeatures(features)
+    point_layer.updateExtents()
     return point_layer
 
 
@@ -190,16 +295,57 @@ def clip_raster(raster, column_count, row_count, output_extent):
     return QgsRasterLayer(file_name, 'clipped_raster')
 
 
+def clip_raster_to_dataset(raster, column_count, row_count, output_extent):
+    """Clip raster to specified extent, width and height in memory.
+
+    Same as clip_raster but the result is a MEM dataset, so nothing is
+    written to disk when the raster is read through GDAL (GDAL >= 2.1).
+
+    :param raster: Raster
+    :type raster: QgsRasterLayer
+
+    :param column_count: Desired width in pixels of new raster
+    :type column_count: Int
+
+    :param row_count: Desired height in pixels of new raster
+    :type row_count: Int
+
+    :param output_extent: Extent of the clipped region
+    :type output_extent: QgsRectangle
+
+    :returns: Clipped region of the raster
+    :rtype: gdal.Dataset
+    """
+    if raster.dataProvider().name() == 'gdal' and hasattr(gdal, 'Translate'):
+        source = gdal.Open(raster.source(), gdal.GA_ReadOnly)
+        if source is not None:
+            return gdal.Translate(
+                '',
+                source,
+                format='MEM',
+                projWin=[
+                    output_extent.xMinimum(),
+                    output_extent.yMaximum(),
+                    output_extent.xMaximum(),
+                    output_extent.yMinimum()],
+                width=column_count,
+                height=row_count)
+
+    return _raster_to_dataset(
+        clip_raster(raster, column_count, row_count, output_extent))
+
+
 def polygonize_gdal(
         raster,
         threshold_min=0.0,
-        threshold_max=float('inf')):
+        threshold_max=float('inf'),
+        simplify=False):
     """
     Function to polygonize raster. Areas (pixels) with threshold_min <
     pixel_values < threshold_max will be converted to polygons.
 
-    :param raster:  Raster layer
-    :type raster: QgsRasterLayer
+    :param raster:  Raster layer or dataset, e.g. from clip_raster_to_dataset
+    :type raster: QgsRasterLayer, gdal.Dataset
 
     :param threshold_min: Value that splits raster to flooded or not flooded.
     :type threshold_min: float
@@ -207,34 +353,35 @@ def polygonize_gdal(
     :param threshold_max: Value that splits raster to flooded or not flooded.
     :type threshold_max: float
 
-    :returns: Polygonal geometry
-    :rtype: QgsGeometry
+    :param simplify: Whether to simplify the polygons with a tolerance of
+        one pixel.
+    :type simplify: bool
+
+    :returns: Memory layers with the polygons inside and outside the
+        thresholds, or (None, None) if no pixel is within the thresholds.
+    :rtype: (QgsVectorLayer, QgsVectorLayer)
     """
 
-    # save qgis raster to disk
-    base_name = unique_filename()
-    file_name = base_name + '.tif'
-    file_writer = QgsRasterFileWriter(file_name)
-    pipe = QgsRasterPipe()
-    provider = raster.dataProvider()
-    if not pipe.set(provider.clone()):
-        msg = "Cannot set pipe provider"
-        raise GetDataError(msg)
-    file_writer.writeRaster(
-        pipe,
-        provider.xSize(),
-        provider.ySize(),
-        provider.extent(),
-        provider.crs())
-
-    (inside_file_name, inside_layer_name, outside_file_name,
-        outside_layer_name) = \
-        polygonize_thresholds(file_name, threshold_min, threshold_max)
-    inside_layer = \
-        QgsVectorLayer(inside_file_name, inside_layer_name, 'ogr')
-    outside_layer = \
-        QgsVectorLayer(outside_file_name, outside_layer_name, 'ogr')
-    if inside_layer.featureCount() == 0:
-        return None, None
+    if isinstance(raster, gdal.Dataset):
+        dataset = raster
+        crs = QgsCoordinateReferenceSystem()
+        crs.createFromWkt(dataset.GetProjectionRef())
     else:
-        return inside_layer, outside_layer
+        dataset = _raster_to_dataset(raster)
+        crs = raster.crs()
+    mask_dataset = threshold_dataset(dataset, threshold_min, threshold_max)
+
+    spatial_reference = osr.SpatialReference()
+    spatial_reference.ImportFromWkt(crs.toWkt())
+    inside_ds, inside_ogr_layer, outside_ds, outside_ogr_layer = \
+        polygonize_dataset(
+            mask_dataset, spatial_reference, simplify=simplify)
+
+    if inside_ogr_layer.GetFeatureCount() == 0:
+        return None, None
+
+    inside_layer = _ogr_to_memory_layer(inside_ogr_layer, crs, 'inside')
+    outside_layer = _ogr_to_memory_layer(outside_ogr_layer, crs, 'outside')
+    inside_ds.Destroy()
+    outside_ds.Destroy()
+    return inside_layer, outside_layer
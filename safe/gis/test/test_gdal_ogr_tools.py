@@ -18,9 +18,14 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
 import unittest
-from osgeo import ogr
-
-from safe.gis.gdal_ogr_tools import polygonize_thresholds
+import numpy
+from osgeo import gdal, ogr, osr
+
+from safe.gis.gdal_ogr_tools import (
+    polygonize_thresholds,
+    classify_thresholds,
+    threshold_dataset,
+    polygonize_classes)
 from safe.test.utilities import test_data_path
 
 
@@ -53,6 +58,79 @@ class TestGDALOGRTools(unittest.TestCase):
         # print 'outside %s' % (outside_file_name)
         self.assertEquals(feature_count2, 1)
 
+    def test_classify_thresholds(self):
+        """Test values are classified like the scanline version did
+        """
+        data = numpy.array([[0, 0.2, 0.5, 1.0, 2.0, numpy.nan]])
+        result = classify_thresholds(data, 0.5, 1.5)
+        self.assertEqual(result.tolist(), [[0, 0, 1, 1, 0, 1]])
+        self.assertEqual(result.dtype, numpy.uint8)
+
+        # Infinite upper threshold
+        result = classify_thresholds(data, 0.5)
+        self.assertEqual(result.tolist(), [[0, 0, 1, 1, 1, 1]])
+
+    def test_polygonize_classes(self):
+        """Test polygonizing a MEM dataset into one layer
+        """
+        data = numpy.zeros((100, 300))
+        data[10:20, 10:20] = 1.0
+        data[50:70, 200:250] = 2.0
+        dataset = gdal.GetDriverByName('MEM').Create(
+            '', 300, 100, 1, gdal.GDT_Float64)
+        dataset.SetGeoTransform([106.0, 0.01, 0, -6.0, 0, -0.01])
+        dataset.GetRasterBand(1).WriteArray(data)
+        mask = threshold_dataset(dataset, 0.5)
+        self.assertEqual(mask.GetDriver().ShortName, 'MEM')
+        self.assertEqual(
+            mask.GetRasterBand(1).ReadAsArray().sum(), 100 + 1000)
+
+        spatial_reference = osr.SpatialReference()
+        spatial_reference.ImportFromEPSG(4326)
+        data_source, layer = polygonize_classes(
+            mask, spatial_reference, simplify=True)
+        classes = [feature.GetField('DN') for feature in layer]
+        self.assertEqual(sorted(classes), [0, 1, 1])
+        _ = data_source
+
+    def test_polygonize_classes_simplify(self):
+        """Test simplified classes still tile the raster extent
+        """
+        # A staircase of pixels, which simplification cuts diagonally
+        data = numpy.zeros((100, 100))
+        for row in range(10, 90):
+            data[row, 10:row] = 1.0
+        dataset = gdal.GetDriverByName('MEM').Create(
+            '', 100, 100, 1, gdal.GDT_Float64)
+        dataset.SetGeoTransform([106.0, 0.01, 0, -6.0, 0, -0.01])
+        dataset.GetRasterBand(1).WriteArray(data)
+        mask = threshold_dataset(dataset, 0.5)
+
+        spatial_reference = osr.SpatialReference()
+        spatial_reference.ImportFromEPSG(4326)
+        data_source, layer = polygonize_classes(
+            mask, spatial_reference, simplify=True)
+        classes = {}
+        vertex_count = 0
+        for feature in layer:
+            geometry = feature.GetGeometryRef()
+            vertex_count += geometry.GetGeometryRef(0).GetPointCount()
+            classes.setdefault(
+                feature.GetField('DN'),
+                ogr.Geometry(ogr.wkbMultiPolygon)).AddGeometry(geometry)
+        _ = data_source
+
+        self.assertEqual(sorted(classes.keys()), [0, 1])
+        inside = classes[1].UnionCascaded()
+        outside = classes[0].UnionCascaded()
+        # The staircase has two vertices per row, far fewer are left
+        self.assertLess(vertex_count, 40)
+        # No gaps: together the classes cover the 1 x 1 degree extent
+        self.assertAlmostEqual(inside.GetArea() + outside.GetArea(), 1.0)
+        self.assertAlmostEqual(inside.Union(outside).GetArea(), 1.0)
+        # No overlaps between the classes
+        self.assertAlmostEqual(inside.Intersection(outside).GetArea(), 0.0)
+
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(TestGDALOGRTools, 'test')
@@ -1,7 +1,8 @@
 import unittest
 import numpy
 
-from safe.gis.geodesy import Point
+from safe.common.exceptions import BoundsError
+from safe.gis.geodesy import Point, generate_circles, destination_points
 
 
 class TestCase(unittest.TestCase):
@@ -181,6 +182,9 @@ class TestCase(unittest.TestCase):
                    % (d, radius))
             assert numpy.allclose(d, radius, rtol=2.0e-1), msg
 
+        # The circle is closed
+        assert numpy.allclose(C[0], C[-1])
+
         # Store and view
         # from safe.storage.vector import Vector
         # Vector(geometry=[C],
@@ -191,6 +195,52 @@ class TestCase(unittest.TestCase):
         #       geometry_type='point',
         #       data=None).write_to_file('center.shp')
 
+    def test_destination_points(self):
+        """Destination points are at the right distance and bearing
+        """
+        p1 = Point(latitude=-0.59, longitude=117.10)
+        p2 = Point(latitude=-0.50, longitude=117.15)
+        d = p1.distance_to(p2)
+        b = p1.AZ(p2) / p1.degrees2radians
+
+        lat, lon = destination_points(p1.latitude, p1.longitude, d, b)
+        assert numpy.allclose([lat, lon], [p2.latitude, p2.longitude])
+
+        # Longitudes wrap around the date line
+        lat, lon = destination_points(0.0, 179.99, 10000, 90)
+        assert -180 <= lon < -179.9
+
+    def test_generate_circles(self):
+        """Circles for several centers and radii are generated at once
+        """
+        centers = [[151.16794, -33.93479], [114.33, -8.43], [12.58, 55.70]]
+        radii = [1000, 3000, 10000, 30000]
+        circles = generate_circles(centers, radii, resolution=5)
+
+        assert circles.shape == (3, 4, 73, 2)
+        for i, center in enumerate(centers):
+            p = Point(latitude=center[1], longitude=center[0])
+            for j, radius in enumerate(radii):
+                ring = circles[i, j]
+                assert numpy.allclose(ring[0], ring[-1])
+                for c in ring:
+                    d = p.distance_to(Point(c[1], c[0]))
+                    assert numpy.allclose(d, radius, rtol=1.0e-6), d
+
+    def test_generate_circles_out_of_bounds(self):
+        """Circles crossing the antimeridian or enclosing a pole are rejected
+        """
+        # Close to but not across the antimeridian is fine
+        circles = generate_circles([[179.9, 0.0]], [10000])
+        assert numpy.all(circles[..., 0] <= 180.0)
+
+        self.assertRaises(
+            BoundsError, generate_circles, [[179.99, 0.0]], [10000])
+        self.assertRaises(
+            BoundsError, generate_circles, [[-179.99, 0.0]], [10000])
+        self.assertRaises(
+            BoundsError, generate_circles, [[0.0, 89.99]], [10000])
+
 if __name__ == '__main__':
     mysuite = unittest.makeSuite(TestCase, 'test')
     runner = unittest.TextTestRunner(verbosity=2)
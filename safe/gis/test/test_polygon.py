@@ -17,6 +17,7 @@ from safe.gis.polygon import (
     in_and_outside_polygon,
     intersection,
     join_line_segments,
+    reassemble_line_segments,
     clip_line_by_polygon,
     clip_grid_by_polygons,
     populate_polygon,
@@ -2267,6 +2268,49 @@ class TestPolygon(unittest.TestCase):
         for i in range(len(lines)):
             assert numpy.allclose(lines[i], segments[i])
 
+    def test_reassemble_line_segments(self):
+        """Unordered and reversed line segments can be reassembled
+        """
+
+        # Segments of one line listed out of order, one of them reversed
+        segments = [[[1, 0], [2, 0]],
+                    [[5, 5], [6, 5]],
+                    [[0, 0], [1, 0]],
+                    [[3, 1], [2, 0]],
+                    [[3, 1], [4, 1]]]
+        lines = reassemble_line_segments(segments)
+        assert len(lines) == 2
+        assert numpy.allclose(lines[0], [[0, 0], [1, 0], [2, 0],
+                                         [3, 1], [4, 1]])
+        assert numpy.allclose(lines[1], [[5, 5], [6, 5]])
+
+        # End points within tolerance are joined
+        segments = [[[0, 0], [1, 0]],
+                    [[1 + 1.0e-14, 0], [2, 0]]]
+        lines = reassemble_line_segments(segments, tolerance=1.0e-10)
+        assert len(lines) == 1
+        assert len(lines[0]) == 3
+
+        # Lines stop at junctions
+        segments = [[[0, 0], [1, 0]],
+                    [[1, 0], [2, 0]],
+                    [[1, 0], [1, 1]]]
+        lines = reassemble_line_segments(segments)
+        assert len(lines) == 3
+
+        # A closed chain comes back as a closed ring
+        segments = [[[1, 0], [1, 1]],
+                    [[0, 0], [1, 0]],
+                    [[0, 1], [0, 0]],
+                    [[1, 1], [0, 1]]]
+        lines = reassemble_line_segments(segments)
+        assert len(lines) == 1
+        assert numpy.allclose(lines[0], [[1, 0], [1, 1], [0, 1],
+                                         [0, 0], [1, 0]])
+
+        # No segments
+        assert reassemble_line_segments([]) == []
+
 if __name__ == '__main__':
     suite = unittest.makeSuite(TestPolygon, 'test')
     runner = unittest.TextTestRunner(verbosity=2)
@@ -19,18 +19,23 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 
 import unittest
 
+from osgeo import ogr
 from qgis.core import (
     QgsRasterLayer,
     QgsRaster,
     QgsPoint,
     QgsVectorLayer,
-    QgsRectangle)
+    QgsRectangle,
+    QgsCoordinateReferenceSystem)
 
 from safe.test.utilities import test_data_path, get_qgis_app
 from safe.gis.qgis_raster_tools import (
     pixels_to_points,
     polygonize,
-    clip_raster)
+    polygonize_gdal,
+    clip_raster,
+    clip_raster_to_dataset,
+    _ogr_to_memory_layer)
 
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
@@ -151,6 +156,57 @@ class TestQGISRasterTools(unittest.TestCase):
         self.assertEqual(self.raster.height(), new_raster.height())
     test_clip_raster.slow = True
 
+    def test_polygonize_gdal(self):
+        """Test polygonize_gdal works in memory"""
+        inside, outside = polygonize_gdal(
+            self.raster, threshold_min=1.0, threshold_max=1.5)
+        self.assertEqual(inside.dataProvider().name(), 'memory')
+        self.assertEqual(outside.dataProvider().name(), 'memory')
+        self.assertGreater(inside.featureCount(), 0)
+        self.assertGreater(outside.featureCount(), 0)
+
+        # A clipped dataset gives the same polygons
+        dataset = clip_raster_to_dataset(
+            self.raster,
+            self.raster.width(),
+            self.raster.height(),
+            self.extent)
+        self.assertEqual(dataset.RasterXSize, self.raster.width())
+        self.assertEqual(dataset.RasterYSize, self.raster.height())
+        dataset_inside, _ = polygonize_gdal(
+            dataset, threshold_min=1.0, threshold_max=1.5)
+        self.assertEqual(
+            inside.featureCount(), dataset_inside.featureCount())
+
+        # Nothing within the thresholds
+        inside, outside = polygonize_gdal(
+            self.raster, threshold_min=1000.0)
+        self.assertIsNone(inside)
+        self.assertIsNone(outside)
+
+    def test_ogr_to_memory_layer_custom_crs(self):
+        """Test memory layers keep a CRS that has no authority id"""
+        crs = QgsCoordinateReferenceSystem()
+        crs.createFromProj4(
+            '+proj=tmerc +lat_0=0 +lon_0=106.5 +k=0.9996 +x_0=123456 '
+            '+y_0=0 +ellps=WGS84 +units=m +no_defs')
+        self.assertEqual(crs.authid(), '')
+
+        # Keep a reference to the data source, it owns the layer
+        data_source = ogr.GetDriverByName('Memory').CreateDataSource(
+            'polygons')
+        ogr_layer = data_source.CreateLayer(
+            'polygons', geom_type=ogr.wkbPolygon)
+        ogr_feature = ogr.Feature(ogr_layer.GetLayerDefn())
+        ogr_feature.SetGeometry(ogr.CreateGeometryFromWkt(
+            'POLYGON((0 0, 1 0, 1 1, 0 0))'))
+        ogr_layer.CreateFeature(ogr_feature)
+
+        layer = _ogr_to_memory_layer(ogr_layer, crs, 'custom')
+        self.assertTrue(layer.crs().isValid())
+        self.assertEqual(layer.crs().toProj4(), crs.toProj4())
+        self.assertEqual(layer.featureCount(), 1)
+
 if __name__ == '__main__':
     suite = unittest.makeSuite(TestQGISRasterTools, 'test')
     runner = unittest.TextTestRunner()
@@ -21,13 +21,16 @@ import os
 from collections import OrderedDict
 from xml.dom import minidom
 
+import numpy
+
 # noinspection PyUnresolvedReferences
 from qgis.core import (
     QgsMapLayerRegistry,
     QgsMapSettings,
     QgsComposition,
     QgsRectangle,
-    QgsAtlasComposition)
+    QgsAtlasComposition,
+    QgsFeatureRequest)
 # noinspection PyPackageRequirements
 from PyQt4 import QtGui, QtCore
 # noinspection PyPackageRequirements
@@ -46,10 +49,11 @@ from safe.common.exceptions import (
     ReportCreationError,
     UnsupportedProviderError,
     TemplateLoadingError)
-from safe.common.utilities import temp_dir
+from safe.common.utilities import temp_dir, format_int, unhumanize_number
 from safe import messaging as m
 from safe.messaging import styles
 from safe.report.template_composition import TemplateComposition
+from safe.report.report_renderer import ReportRenderer, layer_spec
 from safe.utilities.resources import (
     html_header,
     html_footer,
@@ -61,7 +65,7 @@ from safe.utilities.utilities import (
     add_ordered_combo_item)
 from safe.utilities.help import show_context_help
 from safe.utilities.keyword_io import KeywordIO
-from safe.defaults import disclaimer
+from safe.defaults import disclaimer, get_defaults
 
 INFO_STYLE = styles.INFO_STYLE
 FORM_CLASS = get_ui_class('impact_merge_dialog_base.ui')
@@ -111,6 +115,7 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
             'hazard_title': None,
             'exposure_title': None,
             'postprocessing_report': None,
+            'postprocessing_summary': None,
         }
 
         # Stored information from second impact layer
@@ -120,6 +125,7 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
             'hazard_title': None,
             'exposure_title': None,
             'postprocessing_report': None,
+            'postprocessing_summary': None,
         }
 
         # Stored information from aggregation layer
@@ -134,9 +140,16 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
         # The html reports and its file path
         self.html_reports = {}
 
+        # The names of the aggregation areas of the reports
+        self.area_names = {}
+
         # A boolean flag whether to merge entire area or aggregated
         self.entire_area_mode = False
 
+        # Number of processes rendering the aggregated reports, 0 for one
+        # per CPU
+        self.report_workers = 0
+
         # Get the global settings and override some variable if exist
         self.read_settings()
 
@@ -322,6 +335,10 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
         if customised_disclaimer != '':
             self.disclaimer = customised_disclaimer
 
+        # Report rendering processes
+        self.report_workers = settings.value(
+            'inasafe/reportWorkerCount', 0, type=int)
+
     def get_project_layers(self):
         """Get impact layers and aggregation layer currently loaded in QGIS."""
         # noinspection PyArgumentList,PyUnresolvedReferences
@@ -508,6 +525,16 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
                     self.tr(
                         'Keyword %s not found for second layer.' % attribute))
 
+        # The numeric summary is optional, layers made by older versions
+        # only have the html report
+        for impact in [self.first_impact, self.second_impact]:
+            try:
+                impact['postprocessing_summary'] = \
+                    self.keyword_io.read_keywords(
+                        impact['layer'], 'postprocessing_summary')
+            except KeywordNotFoundError:
+                impact['postprocessing_summary'] = None
+
         # Validate that two impact layers are obtained from the same hazard.
         # Indicated by the same 'hazard_title' (to be fixed later by using
         # more reliable method)
@@ -536,34 +563,16 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
                         'aggregation layer.'))
 
     def merge(self):
-        """Merge the postprocessing_report from each impact."""
-        # Ensure there is always only a single root element or minidom moans
-        first_postprocessing_report = \
-            self.first_impact['postprocessing_report']
-        second_postprocessing_report = \
-            self.second_impact['postprocessing_report']
-        # noinspection PyTypeChecker
-        first_report = '<body>' + first_postprocessing_report + '</body>'
-        # noinspection PyTypeChecker
-        second_report = '<body>' + second_postprocessing_report + '</body>'
-
-        # Now create a dom document for each
-        first_document = minidom.parseString(first_report)
-        second_document = minidom.parseString(second_report)
-        first_impact_tables = first_document.getElementsByTagName('table')
-        second_impact_tables = second_document.getElementsByTagName('table')
-
-        # Now create dictionary report from DOM
-        first_report_dict = self.generate_report_dictionary_from_dom(
-            first_impact_tables)
-        second_report_dict = self.generate_report_dictionary_from_dom(
-            second_impact_tables)
+        """Merge the postprocessing results from each impact."""
+        # Join the numeric results of the impacts by aggregation area
+        first_summary, second_summary = self.impact_summaries()
+        merged_summary = self.join_summaries(first_summary, second_summary)
 
         # Generate report summary for all aggregation unit
-        self.generate_report_summary(first_report_dict, second_report_dict)
+        self.generate_report_summary(merged_summary)
 
-        # Generate html reports file from merged dictionary
-        self.generate_html_reports(first_report_dict, second_report_dict)
+        # Generate html reports file from merged summary
+        self.generate_html_reports(merged_summary)
 
         # Generate PDF Reports using composer and/or atlas generation:
         self.generate_reports()
@@ -574,6 +583,142 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
             if os.path.exists(report_path):
                 os.remove(report_path)
 
+    def impact_summaries(self):
+        """Get the numeric summaries of the two impact layers.
+
+        The 'postprocessing_summary' keywords are used when both layers have
+        them. Otherwise the html 'postprocessing_report' of both layers is
+        parsed, and as the html has no aggregation ids the areas are
+        identified by their names.
+
+        :return: Summaries of the first and second impact, see
+            PostprocessorManager.get_summary.
+        :rtype: list
+        """
+        impacts = [self.first_impact, self.second_impact]
+        summaries = [impact['postprocessing_summary'] for impact in impacts]
+        if all(isinstance(summary, dict) and 'zones' in summary
+               for summary in summaries):
+            return summaries
+
+        summaries = []
+        for impact in impacts:
+            # Ensure there is always only a single root element or minidom
+            # moans
+            # noinspection PyTypeChecker
+            report = '<body>' + impact['postprocessing_report'] + '</body>'
+            document = minidom.parseString(report)
+            report_dict = self.generate_report_dictionary_from_dom(
+                document.getElementsByTagName('table'))
+            summaries.append(
+                self.summary_from_report_dictionary(report_dict))
+        return summaries
+
+    @staticmethod
+    def summary_from_report_dictionary(report_dict):
+        """Turn a report dictionary parsed from html into a numeric summary.
+
+        :param report_dict: Dictionary as made by
+            generate_report_dictionary_from_dom.
+        :type report_dict: dict
+
+        :return: Summary like the 'postprocessing_summary' keyword. The ids
+            of the areas are their lower case names.
+        :rtype: OrderedDict
+        """
+        zones = OrderedDict()
+        tables = OrderedDict()
+        for area, exposure_dict in report_dict.iteritems():
+            zone_id = area.lower()
+            zones[zone_id] = area
+            for caption, exposure_detail_dict in exposure_dict.iteritems():
+                table = tables.setdefault(caption, OrderedDict([
+                    ('caption', caption),
+                    ('header', exposure_detail_dict.keys()),
+                    ('ids', []),
+                    ('values', [])]))
+                values = []
+                for datum in table['header']:
+                    value = unhumanize_number(exposure_detail_dict.get(datum))
+                    if not isinstance(value, (int, long, float)):
+                        # No data
+                        value = None
+                    values.append(value)
+                table['ids'].append(zone_id)
+                table['values'].append(values)
+        return OrderedDict([('zones', zones), ('tables', tables.values())])
+
+    @staticmethod
+    def join_summaries(first_summary, second_summary):
+        """Join the summaries of two impacts by aggregation area id.
+
+        The reports are made for the areas of the first impact. The values
+        of each table are put in an array with one row per area, NaN where
+        the area has no data or is not in the table.
+
+        :param first_summary: Summary of the first impact.
+        :type first_summary: dict
+
+        :param second_summary: Summary of the second impact.
+        :type second_summary: dict
+
+        :return: The 'ids' and 'names' of the areas, and the 'first' and
+            'second' lists of tables. A table has the 'caption', the
+            'header', the 'values' array and the 'present' flags of the
+            areas that are in the table.
+        :rtype: dict
+        """
+        ids = list(first_summary['zones'].keys())
+        names = list(first_summary['zones'].values())
+        positions = dict(
+            (zone_id, position) for position, zone_id in enumerate(ids))
+
+        def align(summary):
+            """Align the tables of a summary to the areas."""
+            tables = []
+            for table in summary['tables']:
+                header = list(table['header'])
+                values = numpy.empty((len(ids), len(header)))
+                values.fill(numpy.nan)
+                present = numpy.zeros(len(ids), dtype=bool)
+                rows = numpy.array(
+                    [positions.get(zone_id, -1) for zone_id in table['ids']],
+                    dtype=int)
+                found = rows >= 0
+                if found.any():
+                    # None becomes NaN
+                    table_values = numpy.array(
+                        table['values'], dtype=numpy.float).reshape(
+                            len(rows), len(header))
+                    values[rows[found]] = table_values[found]
+                    present[rows[found]] = True
+                tables.append({
+                    'caption': table['caption'],
+                    'header': header,
+                    'values': values,
+                    'present': present})
+            return tables
+
+        return {
+            'ids': ids,
+            'names': names,
+            'first': align(first_summary),
+            'second': align(second_summary)}
+
+    @staticmethod
+    def format_value(value):
+        """Format a value of a merged summary for the reports.
+
+        :param value: The value, NaN for no data.
+        :type value: float
+
+        :return: The formatted value.
+        :rtype: str
+        """
+        if numpy.isnan(value):
+            return get_defaults('NO_DATA')
+        return format_int(int(value))
+
     @staticmethod
     def generate_report_dictionary_from_dom(html_dom):
         """Generate dictionary representing report from html dom.
@@ -631,150 +776,98 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
                 merged_report_dict[aggregation_area] = exposure_dict
         return merged_report_dict
 
-    def generate_report_summary(self, first_report_dict, second_report_dict):
+    def generate_report_summary(self, merged_summary):
         """Generate report summary for each aggregation area from merged
-        report dictionary.
-
-        For each exposure, search for the total only. Report dictionary looks
-        like this:
-
-        :param first_report_dict: Dictionary report from the first impact.
-        :type first_report_dict: dict
-
-        :param second_report_dict: Dictionary report from the second impact.
-        :type second_report_dict: dict
-
-        Dictionary structure::
-
-            { aggregation_area:
-                {exposure_type:{
-                   exposure_detail}
-                }
-            }
+        summary.
 
-        Example::
-
-            {"Jakarta Barat":
-                {"Detailed Building Type Report":
-                    {"Total inundated":150,
-                     "Places of Worship": "No data"
-                    }
-                }
-            }
+        For each impact, search for the total of its first table only.
 
+        :param merged_summary: Summaries of the impacts as joined by
+            join_summaries.
+        :type merged_summary: dict
         """
-        for aggregation_area in first_report_dict:
+        impacts = [
+            (self.first_impact, merged_summary['first']),
+            (self.second_impact, merged_summary['second'])]
+        for index, area_id in enumerate(merged_summary['ids']):
             html = ''
             html += '<table style="margin:0px auto">'
 
-            # Summary total from first report
-            html += '<tr><td><b>%s</b></td><td></td></tr>' % \
-                    self.first_impact['exposure_title'].title()
-            first_exposure_type_dict = first_report_dict[aggregation_area]
-            first_exposure_type = first_exposure_type_dict.keys()[0]
-            first_exposure_detail_dict = \
-                first_exposure_type_dict[first_exposure_type]
-            for datum in first_exposure_detail_dict:
-                if self.tr('Total').lower() in datum.lower():
-                    html += ('<tr>'
-                             '<td>%s</td>'
-                             '<td>%s</td>'
-                             '</tr>') % \
-                            (datum, first_exposure_detail_dict[datum])
-                    break
-
-            # Catch fallback for aggregation_area not exist in second_report
-            if aggregation_area in second_report_dict:
-                second_exposure_report_dict = second_report_dict[
-                    aggregation_area]
-                # Summary total from second report
+            for impact, tables in impacts:
+                # Catch fallback for aggregation area not in the impact
+                tables = [
+                    table for table in tables if table['present'][index]]
+                if not tables:
+                    continue
+                # Summary total from the first table of the impact
                 html += '<tr><td><b>%s</b></td><td></td></tr>' % \
-                        self.second_impact['exposure_title'].title()
-                second_exposure = second_exposure_report_dict.keys()[0]
-                second_exposure_detail_dict = \
-                    second_exposure_report_dict[second_exposure]
-                for datum in second_exposure_detail_dict:
+                    impact['exposure_title'].title()
+                table = tables[0]
+                for column, datum in enumerate(table['header']):
                     if self.tr('Total').lower() in datum.lower():
                         html += ('<tr>'
                                  '<td>%s</td>'
                                  '<td>%s</td>'
                                  '</tr>') % \
-                                (datum, second_exposure_detail_dict[datum])
+                            (datum,
+                             self.format_value(table['values'][index, column]))
                         break
 
             html += '</table>'
-            self.summary_report[aggregation_area.lower()] = html
+            self.summary_report[area_id] = html
 
-    def generate_html_reports(self, first_report_dict, second_report_dict):
+    def generate_html_reports(self, merged_summary):
         """Generate html file for each aggregation units.
 
         It also saves the path of the each aggregation unit in
-        self.html_reports.
+        self.html_reports and its name in self.area_names, both keyed by
+        the aggregation area id.
         ::
 
-            Ex. {"jakarta barat": "/home/jakarta barat.html",
-                 "jakarta timur": "/home/jakarta timur.html"}
+            Ex. {3: "/home/3.html",
+                 7: "/home/7.html"}
 
-        :param first_report_dict: Dictionary report from first impact.
-        :type first_report_dict: dict
-
-        :param second_report_dict: Dictionary report from second impact.
-        :type second_report_dict: dict
+        :param merged_summary: Summaries of the impacts as joined by
+            join_summaries.
+        :type merged_summary: dict
         """
-        for aggregation_area in first_report_dict:
+        for index, area_id in enumerate(merged_summary['ids']):
+            area_name = merged_summary['names'][index]
             html = html_header()
             html += ('<table width="100%" style="position:absolute;left:0px;"'
                      'class="table table-condensed table-striped">')
-            html += '<caption><h4>%s</h4></caption>' % \
-                    aggregation_area.title()
+            html += '<caption><h4>%s</h4></caption>' % area_name.title()
 
             html += '<tr>'
 
-            # First impact on the left side
-            html += '<td width="48%">'
-            html += '<table width="100%">'
-            html += '<thead><th>%s</th></thead>' % \
-                    self.first_impact['exposure_title'].upper()
-            first_exposure_report_dict = first_report_dict[aggregation_area]
-            for first_exposure in first_exposure_report_dict:
-                first_exposure_detail_dict = \
-                    first_exposure_report_dict[first_exposure]
-                html += '<tr><th><i>%s</i></th><th></th></tr>' % \
-                        first_exposure.title()
-                for datum in first_exposure_detail_dict:
-                    html += ('<tr>'
-                             '<td>%s</td>'
-                             '<td>%s</td>'
-                             '</tr>') % (datum,
-                                         first_exposure_detail_dict[datum])
-            html += '</table>'
-            html += '</td>'
+            # First impact on the left side, second impact on the right
+            impacts = [
+                (self.first_impact, merged_summary['first']),
+                (self.second_impact, merged_summary['second'])]
+            for impact_index, (impact, tables) in enumerate(impacts):
+                tables = [
+                    table for table in tables if table['present'][index]]
+                if impact_index > 0:
+                    if not tables:
+                        continue
+                    # Add spaces between
+                    html += '<td width="4%">'
+                    html += '</td>'
 
-            # Second impact on the right side
-            if aggregation_area in second_report_dict:
-                # Add spaces between
-                html += '<td width="4%">'
-                html += '</td>'
-
-                # Second impact report
                 html += '<td width="48%">'
                 html += '<table width="100%">'
                 html += '<thead><th>%s</th></thead>' % \
-                        self.second_impact['exposure_title'].upper()
-                second_exposure_report_dict = \
-                    second_report_dict[aggregation_area]
-                for second_exposure in second_exposure_report_dict:
-                    second_exposure_detail_dict = \
-                        second_exposure_report_dict[second_exposure]
+                    impact['exposure_title'].upper()
+                for table in tables:
                     html += '<tr><th><i>%s</i></th><th></th></tr>' % \
-                            second_exposure.title()
-                    for datum in second_exposure_detail_dict:
+                        table['caption'].title()
+                    for column, datum in enumerate(table['header']):
                         html += ('<tr>'
                                  '<td>%s</td>'
                                  '<td>%s</td>'
                                  '</tr>') % \
-                                (datum,
-                                 second_exposure_detail_dict[datum])
+                            (datum,
+                             self.format_value(table['values'][index, column]))
                 html += '</table>'
                 html += '</td>'
 
@@ -782,10 +875,11 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
             html += '</table>'
             html += html_footer()
 
-            file_path = '%s.html' % aggregation_area
+            file_path = '%s.html' % area_id
             path = os.path.join(temp_dir(), file_path)
             html_to_file(html, path)
-            self.html_reports[aggregation_area.lower()] = path
+            self.html_reports[area_id] = path
+            self.area_names[area_id] = area_name
 
     def generate_reports(self):
         """Generate PDF reports for each aggregation unit using map composer.
@@ -884,18 +978,19 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
             composer_map.setGridIntervalY(y_interval)
 
             # Self.html_reports must have only 1 key value pair
-            area_title = list(self.html_reports.keys())[0]
+            area_id = list(self.html_reports.keys())[0]
+            area_title = self.area_names[area_id].lower()
 
             # Set Report Summary
             summary_report = composition.getComposerItemById('summary-report')
-            summary_report.setText(self.summary_report[area_title])
+            summary_report.setText(self.summary_report[area_id])
 
             # Set Aggregation Area Label
             area_label = composition.getComposerItemById('aggregation-area')
             area_label.setText(area_title.title())
 
             # Set merged-report-table
-            html_report_path = self.html_reports[area_title]
+            html_report_path = self.html_reports[area_id]
             # noinspection PyArgumentList
             html_frame_url = QUrl.fromLocalFile(html_report_path)
             html_report_frame.setUrl(html_frame_url)
@@ -933,40 +1028,108 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
             # Start rendering
             atlas.beginRender()
 
-            # Iterate all aggregation unit in aggregation layer
+            # The atlas walks the coverage features in provider order
+            request = QgsFeatureRequest()
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            request.setSubsetOfAttributes([])
+            feature_ids = [
+                feature.id() for feature in
+                self.aggregation['layer'].getFeatures(request)]
+
+            # Iterate all aggregation unit in aggregation layer to collect
+            # the page of each area, they are rendered afterwards so that
+            # they can be exported concurrently.
+            pages = []
+            paths = set()
             for i in range(0, atlas.numFeatures()):
                 atlas.prepareForFeature(i)
 
                 current_filename = atlas.currentFilename()
                 file_name = '_'.join(current_filename.split())
+
+                # Reports are keyed by the aggregation area id, or by the
+                # area name when they were parsed from html
+                area_id = feature_ids[i]
+                if area_id not in self.summary_report:
+                    area_id = current_filename.lower()
+
+                # Areas sharing a name get a report each
                 file_path = '%s.pdf' % file_name
+                if file_path in paths:
+                    file_path = '%s_%s.pdf' % (file_name, area_id)
+                paths.add(file_path)
                 path = os.path.join(self.out_dir, file_path)
 
                 # Only print the area that has the report
-                area_title = current_filename.lower()
-                if area_title in self.summary_report:
-                    # Set Report Summary
-                    summary_report = composition.getComposerItemById(
-                        'summary-report')
-                    summary_report.setText(self.summary_report[area_title])
-
-                    # Set Aggregation Area Label
-                    area_label = composition.getComposerItemById(
-                        'aggregation-area')
-                    area_label.setText(area_title.title())
-
-                    # Set merged-report-table
-                    html_report_path = self.html_reports[area_title]
-                    # noinspection PyArgumentList
-                    html_frame_url = QUrl.fromLocalFile(html_report_path)
-                    html_report_frame.setUrl(html_frame_url)
-
-                    # Export composition to PDF file
-                    composition.exportAsPDF(path)
+                if area_id in self.summary_report:
+                    if hasattr(composer_map, 'currentMapExtent'):
+                        extent = composer_map.currentMapExtent()
+                    else:
+                        extent = composer_map.extent()
+                    pages.append({
+                        'extent': [
+                            extent.xMinimum(), extent.yMinimum(),
+                            extent.xMaximum(), extent.yMaximum()],
+                        'labels': {
+                            'summary-report': self.summary_report[area_id],
+                            'aggregation-area':
+                                self.area_names[area_id].title()},
+                        'html': {
+                            'merged-report-table':
+                                self.html_reports[area_id]},
+                        'pdf': path})
 
             # End of rendering
             atlas.endRender()
 
+            # Export the pages, reusing the loaded composition when they are
+            # not rendered by worker processes.
+            base = self.report_specification(
+                layer_set, (x_interval, y_interval))
+            renderer = ReportRenderer(self.report_workers)
+            renderer.render(base, pages, composition)
+
+    def substitution_map(self):
+        """Substitution map of the merged report template.
+
+        :returns: Template placeholders and their values.
+        :rtype: dict
+        """
+        impact_title = '%s and %s' % (
+            self.first_impact['map_title'],
+            self.second_impact['map_title'])
+        return {
+            'impact-title': impact_title,
+            'hazard-title': self.first_impact['hazard_title'],
+            'disclaimer': self.disclaimer
+        }
+
+    def report_specification(self, layer_set, grid_interval):
+        """Describe the parts shared by all pages of the merged report.
+
+        :param layer_set: Ids of the layers of the impact map.
+        :type layer_set: list
+
+        :param grid_interval: Grid interval (x, y) of the impact map.
+        :type grid_interval: tuple
+
+        :returns: Report specification for the ReportRenderer.
+        :rtype: dict
+        """
+        registry = QgsMapLayerRegistry.instance()
+        return {
+            'template': self.template_path,
+            'substitution': self.substitution_map(),
+            'layers': [
+                layer_spec(registry.mapLayer(layer_id))
+                for layer_id in layer_set],
+            'pictures': {
+                'safe-logo': self.safe_logo_path,
+                'organisation-logo': self.organisation_logo_path},
+            'legends': ['map-legend'],
+            'map_id': 'impact-map',
+            'grid_interval': list(grid_interval)}
+
     # noinspection PyArgumentList
     def load_template(self, map_settings):
         """Load composer template for merged report.
@@ -1004,15 +1167,7 @@ class ImpactMergeDialog(QDialog, FORM_CLASS):
                     template_composition.missing_elements)))
 
         # Prepare map substitution and set to composition
-        impact_title = '%s and %s' % (
-            self.first_impact['map_title'],
-            self.second_impact['map_title'])
-        substitution_map = {
-            'impact-title': impact_title,
-            'hazard-title': self.first_impact['hazard_title'],
-            'disclaimer': self.disclaimer
-        }
-        template_composition.substitution = substitution_map
+        template_composition.substitution = self.substitution_map()
 
         # Load Template
         try:
@@ -1128,6 +1128,7 @@ class KeywordsDialog(QtGui.QDialog, FORM_CLASS):
             # noinspection PyCallByClass,PyTypeChecker,PyArgumentList
             QtGui.QMessageBox.warning(self, self.tr('InaSAFE'), message)
         if self.dock is not None:
+            self.dock.forget_layer_keywords(self.layer)
             self.dock.get_layers()
         self.done(QtGui.QDialog.Accepted)
 
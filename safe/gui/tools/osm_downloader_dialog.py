@@ -39,7 +39,7 @@ from PyQt4.QtNetwork import QNetworkAccessManager
 from safe.common.exceptions import (
     CanceledImportDialogError, ImportDialogError, DownloadError)
 from safe import messaging as m
-from safe.utilities.file_downloader import FileDownloader
+from safe.utilities.file_downloader import FileDownloader, default_cache_dir
 from safe.utilities.gis import viewport_geo_array
 from safe.utilities.resources import html_footer, html_header, get_ui_class
 from safe.utilities.help import show_context_help
@@ -362,8 +362,14 @@ class OsmDownloaderDialog(QDialog, FORM_CLASS):
         self.progress_dialog.setLabelText(label_text)
 
         # Download Process
+        # Extracts of the same area are served from the cache if the server
+        # says they did not change
         downloader = FileDownloader(
-            self.network_manager, url, output_path, self.progress_dialog)
+            self.network_manager,
+            url,
+            output_path,
+            self.progress_dialog,
+            cache_dir=default_cache_dir())
         try:
             result = downloader.download()
         except IOError as ex:
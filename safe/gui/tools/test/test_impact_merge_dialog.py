@@ -22,6 +22,9 @@ import os
 from xml.dom import minidom
 from glob import glob
 import shutil
+from collections import OrderedDict
+
+import numpy
 
 # noinspection PyUnresolvedReferences
 from qgis.core import (
@@ -36,7 +39,8 @@ from safe.common.exceptions import (
     ReportCreationError,
     KeywordNotFoundError,
     InvalidLayerError)
-from safe.common.utilities import temp_dir
+from safe.common.utilities import temp_dir, unique_filename
+from safe.storage.utilities import read_keywords, write_keywords
 
 LOGGER = logging.getLogger('InaSAFE')
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
@@ -436,40 +440,97 @@ class ImpactMergeDialogTest(unittest.TestCase):
         expected_number_of_keys = 4
         self.assertEqual(len(report_dict), expected_number_of_keys)
 
-    def test_generate_report_summary(self):
-        """Test generate_report_summary function."""
+    def test_summary_from_report_dictionary(self):
+        """Test summary_from_report_dictionary function."""
+        report_dict = OrderedDict([
+            ('Jakarta Barat', OrderedDict([(
+                'Detailed gender report',
+                OrderedDict([('Total', '1,500'), ('Females', 'No data *')]))
+            ])),
+            ('Jakarta Timur', OrderedDict([(
+                'Detailed gender report',
+                OrderedDict([('Total', '20'), ('Females', '10')]))]))])
+        summary = self.impact_merge_dialog.summary_from_report_dictionary(
+            report_dict)
+        self.assertEqual(
+            summary['zones'].keys(), ['jakarta barat', 'jakarta timur'])
+        table = summary['tables'][0]
+        self.assertEqual(table['caption'], 'Detailed gender report')
+        self.assertEqual(table['header'], ['Total', 'Females'])
+        self.assertEqual(table['ids'], ['jakarta barat', 'jakarta timur'])
+        self.assertEqual(table['values'], [[1500, None], [20, 10]])
+
+    def test_join_summaries_duplicate_names(self):
+        """Test areas sharing a name are merged by their id."""
         self.mock_the_dialog(test_entire_mode=False)
         self.impact_merge_dialog.prepare_input()
         self.impact_merge_dialog.validate_all_layers()
 
-        first_postprocessing_report = \
-            self.impact_merge_dialog.first_impact['postprocessing_report']
-        second_postprocessing_report = \
-            self.impact_merge_dialog.second_impact['postprocessing_report']
-        first_report = (
-            '<body>' +
-            first_postprocessing_report +
-            '</body>')
-        second_report = (
-            '<body>' +
-            second_postprocessing_report +
-            '</body>')
+        first_summary = OrderedDict([
+            ('zones', OrderedDict([
+                (1, u'Kebon Jeruk'), (2, u'Kebon Jeruk'), (3, u'Menteng')])),
+            ('tables', [OrderedDict([
+                ('caption', 'Detailed gender report'),
+                ('header', ['Total', 'Females']),
+                ('ids', [2, 1, 3]),
+                ('values', [[300, 150], [1500, None], [20, 10]])])])])
+        second_summary = OrderedDict([
+            ('zones', OrderedDict([(2, u'Kebon Jeruk'), (1, u'Kebon Jeruk')])),
+            ('tables', [OrderedDict([
+                ('caption', 'Detailed building type report'),
+                ('header', ['Total inundated']),
+                ('ids', [1, 2]),
+                ('values', [[7], [40000]])])])])
+
+        # The summaries survive a keywords file round trip
+        keywords_path = unique_filename(suffix='.keywords', dir=temp_dir())
+        write_keywords(
+            {'postprocessing_summary': first_summary}, keywords_path)
+        keyword = read_keywords(keywords_path)['postprocessing_summary']
+        self.assertEqual(keyword, first_summary)
+
+        merged = self.impact_merge_dialog.join_summaries(
+            keyword, second_summary)
+        self.assertEqual(merged['ids'], [1, 2, 3])
+        self.assertEqual(
+            merged['names'], ['Kebon Jeruk', 'Kebon Jeruk', 'Menteng'])
+        first_values = merged['first'][0]['values']
+        self.assertEqual(first_values[:, 0].tolist(), [1500, 300, 20])
+        self.assertTrue(numpy.isnan(first_values[0, 1]))
+        second_table = merged['second'][0]
+        self.assertEqual(second_table['present'].tolist(), [True, True, False])
+        self.assertEqual(second_table['values'][:2, 0].tolist(), [7, 40000])
+
+        self.impact_merge_dialog.generate_report_summary(merged)
+        self.assertEqual(
+            sorted(self.impact_merge_dialog.summary_report.keys()), [1, 2, 3])
+        self.assertIn('1,500', self.impact_merge_dialog.summary_report[1])
+        self.assertIn('7', self.impact_merge_dialog.summary_report[1])
+        self.assertIn('300', self.impact_merge_dialog.summary_report[2])
+        self.assertIn('40,000', self.impact_merge_dialog.summary_report[2])
+        self.assertNotIn(
+            self.impact_merge_dialog.second_impact['exposure_title'].title(),
+            self.impact_merge_dialog.summary_report[3])
+
+        self.impact_merge_dialog.generate_html_reports(merged)
+        self.assertEqual(
+            len(set(self.impact_merge_dialog.html_reports.values())), 3)
+        self.assertEqual(
+            self.impact_merge_dialog.area_names[2], 'Kebon Jeruk')
 
-        # Now create a dom document for each
-        first_document = minidom.parseString(first_report)
-        second_document = minidom.parseString(second_report)
-        first_impact_tables = first_document.getElementsByTagName('table')
-        second_impact_tables = second_document.getElementsByTagName('table')
+    def test_generate_report_summary(self):
+        """Test generate_report_summary function."""
+        self.mock_the_dialog(test_entire_mode=False)
+        self.impact_merge_dialog.prepare_input()
+        self.impact_merge_dialog.validate_all_layers()
 
-        first_report_dict = \
-            self.impact_merge_dialog.generate_report_dictionary_from_dom(
-                first_impact_tables)
-        second_report_dict = \
-            self.impact_merge_dialog.generate_report_dictionary_from_dom(
-                second_impact_tables)
+        # The test layers only have the html report
+        first_summary, second_summary = \
+            self.impact_merge_dialog.impact_summaries()
+        merged_summary = self.impact_merge_dialog.join_summaries(
+            first_summary, second_summary)
 
-        self.impact_merge_dialog.generate_report_summary(
-            first_report_dict, second_report_dict)
+        self.impact_merge_dialog.generate_report_summary(merged_summary)
 
         # There should be 4 keys in that dict
         # (3 for each aggregation unit and 1 for total in aggregation unit)
@@ -483,34 +544,12 @@ class ImpactMergeDialogTest(unittest.TestCase):
         self.impact_merge_dialog.prepare_input()
         self.impact_merge_dialog.validate_all_layers()
 
-        first_postprocessing_report = \
-            self.impact_merge_dialog.first_impact['postprocessing_report']
-        second_postprocessing_report = \
-            self.impact_merge_dialog.second_impact['postprocessing_report']
-        first_report = (
-            '<body>' +
-            first_postprocessing_report +
-            '</body>')
-        second_report = (
-            '<body>' +
-            second_postprocessing_report +
-            '</body>')
+        first_summary, second_summary = \
+            self.impact_merge_dialog.impact_summaries()
+        merged_summary = self.impact_merge_dialog.join_summaries(
+            first_summary, second_summary)
 
-        # Now create a dom document for each
-        first_document = minidom.parseString(first_report)
-        second_document = minidom.parseString(second_report)
-        first_impact_tables = first_document.getElementsByTagName('table')
-        second_impact_tables = second_document.getElementsByTagName('table')
-
-        first_report_dict = \
-            self.impact_merge_dialog.generate_report_dictionary_from_dom(
-                first_impact_tables)
-        second_report_dict = \
-            self.impact_merge_dialog.generate_report_dictionary_from_dom(
-                second_impact_tables)
-
-        self.impact_merge_dialog.generate_html_reports(
-            first_report_dict, second_report_dict)
+        self.impact_merge_dialog.generate_html_reports(merged_summary)
 
         # There should be 4 HTML files generated on temp_dir()
         html_list = glob(
@@ -524,37 +563,13 @@ class ImpactMergeDialogTest(unittest.TestCase):
         self.impact_merge_dialog.prepare_input()
         self.impact_merge_dialog.validate_all_layers()
 
-        # Create the DOM
-        first_postprocessing_report = \
-            self.impact_merge_dialog.first_impact['postprocessing_report']
-        second_postprocessing_report = \
-            self.impact_merge_dialog.second_impact['postprocessing_report']
-        first_report = (
-            '<body>' +
-            first_postprocessing_report +
-            '</body>')
-        second_report = (
-            '<body>' +
-            second_postprocessing_report +
-            '</body>')
-
-        # Now create a dom document for each
-        first_document = minidom.parseString(first_report)
-        second_document = minidom.parseString(second_report)
-        first_impact_tables = first_document.getElementsByTagName('table')
-        second_impact_tables = second_document.getElementsByTagName('table')
-
-        first_report_dict = \
-            self.impact_merge_dialog.generate_report_dictionary_from_dom(
-                first_impact_tables)
-        second_report_dict = \
-            self.impact_merge_dialog.generate_report_dictionary_from_dom(
-                second_impact_tables)
+        first_summary, second_summary = \
+            self.impact_merge_dialog.impact_summaries()
+        merged_summary = self.impact_merge_dialog.join_summaries(
+            first_summary, second_summary)
 
-        self.impact_merge_dialog.generate_report_summary(
-            first_report_dict, second_report_dict)
-        self.impact_merge_dialog.generate_html_reports(
-            first_report_dict, second_report_dict)
+        self.impact_merge_dialog.generate_report_summary(merged_summary)
+        self.impact_merge_dialog.generate_html_reports(merged_summary)
 
         # Generate PDF Reports
         self.impact_merge_dialog.generate_reports()
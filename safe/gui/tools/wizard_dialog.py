@@ -2771,6 +2771,8 @@ class WizardDialog(QDialog, FORM_CLASS):
                     'An error was encountered when saving the keywords:\n'
                     '%s') % error_message.to_html())))
         if self.dock is not None:
+            # noinspection PyUnresolvedReferences
+            self.dock.forget_layer_keywords(self.layer)
             # noinspection PyUnresolvedReferences
             self.dock.get_layers()
 
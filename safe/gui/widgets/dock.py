@@ -105,6 +105,9 @@ LOGO_ELEMENT = m.Image(
     'InaSAFE Logo')
 LOGGER = logging.getLogger('InaSAFE')
 
+# Milliseconds to wait for more layer signals before refreshing the combos.
+LAYER_REFRESH_DELAY = 100
+
 
 # noinspection PyArgumentList
 # noinspection PyUnresolvedReferences
@@ -151,11 +154,21 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         # Flag used to prevent recursion and allow bulk loads of layers to
         # trigger a single event only
         self.get_layers_lock = False
+        # Bursts of layer signals are collapsed into one refresh
+        self.get_layers_timer = QtCore.QTimer(self)
+        self.get_layers_timer.setSingleShot(True)
+        self.get_layers_timer.setInterval(LAYER_REFRESH_DELAY)
+        self.get_layers_timer.timeout.connect(self.get_layers)
+        # Keywords of the project layers keyed by layer id, see
+        # layer_keywords
+        self.keywords_cache = {}
         # Flag so we can see if the dock is busy processing
         self.busy = False
 
         # Values for settings these get set in read_settings.
         self.run_in_thread_flag = None
+        self.run_in_process_flag = None
+        self.memory_limit = None
         self.show_only_visible_layers_flag = None
         self.set_layer_from_title_flag = None
         self.zoom_to_impact_flag = None
@@ -344,6 +357,15 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
             'inasafe/useThreadingFlag', False, type=bool)
         self.run_in_thread_flag = flag
 
+        flag = settings.value(
+            'inasafe/useProcessIsolationFlag', False, type=bool)
+        self.run_in_process_flag = flag
+
+        # Zero means the impact calculation process is not limited
+        memory_limit = settings.value(
+            'inasafe/processMemoryLimit', 0, type=int)
+        self.memory_limit = memory_limit or None
+
         flag = settings.value(
             'inasafe/visibleLayersOnlyFlag', True, type=bool)
         self.show_only_visible_layers_flag = flag
@@ -400,11 +422,11 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         ..seealso:: disconnect_layer_listener
         """
         registry = QgsMapLayerRegistry.instance()
-        registry.layersWillBeRemoved.connect(self.get_layers)
-        registry.layersAdded.connect(self.get_layers)
-        registry.layersRemoved.connect(self.get_layers)
+        registry.layersWillBeRemoved.connect(self.schedule_get_layers)
+        registry.layersAdded.connect(self.schedule_get_layers)
+        registry.layersRemoved.connect(self.schedule_get_layers)
 
-        self.iface.mapCanvas().layersChanged.connect(self.get_layers)
+        self.iface.mapCanvas().layersChanged.connect(self.schedule_get_layers)
         self.iface.currentLayerChanged.connect(self.layer_changed)
         self.iface.mapCanvas().extentsChanged.connect(self.draw_rubber_bands)
 
@@ -415,11 +437,12 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         ..seealso:: connect_layer_listener
         """
         registry = QgsMapLayerRegistry.instance()
-        registry.layersWillBeRemoved.disconnect(self.get_layers)
-        registry.layersAdded.disconnect(self.get_layers)
-        registry.layersRemoved.disconnect(self.get_layers)
+        registry.layersWillBeRemoved.disconnect(self.schedule_get_layers)
+        registry.layersAdded.disconnect(self.schedule_get_layers)
+        registry.layersRemoved.disconnect(self.schedule_get_layers)
 
-        self.iface.mapCanvas().layersChanged.disconnect(self.get_layers)
+        self.iface.mapCanvas().layersChanged.disconnect(
+            self.schedule_get_layers)
         self.iface.currentLayerChanged.disconnect(self.layer_changed)
         self.iface.mapCanvas().extentsChanged.disconnect(
             self.draw_rubber_bands)
@@ -682,7 +705,7 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         False this method will simply return, doing nothing.
         """
         if self.show_only_visible_layers_flag:
-            self.get_layers()
+            self.schedule_get_layers()
 
     def unblock_signals(self):
         """Let the combos listen for event changes again."""
@@ -707,6 +730,110 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         except NoKeywordsFoundError:
             # the layer has no keyword file. we leave it alone.
             pass
+        self.forget_layer_keywords(layer)
+
+    # noinspection PyUnusedLocal
+    def schedule_get_layers(self, *args):
+        """Refresh the layer combos once the layer signals settle down.
+
+        Adding or removing many layers emits a signal per layer, the timer
+        is restarted by each of them so get_layers only runs once.
+
+        :param args: Arguments passed by the signal, ignored.
+        :type args: list
+        """
+        _ = args
+        self.get_layers_timer.start()
+
+    @staticmethod
+    def _keywords_signature(layer):
+        """Signature telling whether the keywords of a layer may have changed.
+
+        :param layer: The layer.
+        :type layer: QgsMapLayer
+
+        :returns: The source with the modification time and size of the
+            source and its keywords and xml files (None for remote sources).
+        :rtype: tuple
+        """
+        source = layer.source()
+        base_name = os.path.splitext(source)[0]
+        signature = [source]
+        for path in [source, base_name + '.keywords', base_name + '.xml']:
+            try:
+                status = os.stat(path)
+                signature.append((status.st_mtime, status.st_size))
+            except (OSError, UnicodeError):
+                signature.append(None)
+        return tuple(signature)
+
+    def layer_keywords(self, layers):
+        """Get the keywords of layers, reading only those that changed.
+
+        Keywords are kept per layer id with the signature of the layer files,
+        so they are only read again for new layers or when the layer or its
+        keywords changed on disk. Keywords of remote layers are read from the
+        keywords database in one query. Use forget_layer_keywords when the
+        keywords of a remote layer have been changed.
+
+        :param layers: Layers to get the keywords for.
+        :type layers: list
+
+        :returns: Keywords dict (or None if the layer has no keywords) keyed
+            by layer id. The dicts are shared with the cache, copy them
+            before changing them.
+        :rtype: dict
+        """
+        keywords_for_layers = {}
+        remote_layers = []
+        for layer in layers:
+            layer_id = layer.id()
+            signature = self._keywords_signature(layer)
+            cached = self.keywords_cache.get(layer_id)
+            if cached is not None and cached[0] == signature:
+                keywords_for_layers[layer_id] = cached[1]
+                continue
+            try:
+                file_based = self.keyword_io.are_keywords_file_based(layer)
+            except UnsupportedProviderError:
+                keywords = None
+            else:
+                if not file_based:
+                    remote_layers.append((layer, signature))
+                    continue
+                # noinspection PyBroadException
+                try:
+                    keywords = self.keyword_io.read_keywords(layer)
+                except:  # pylint: disable=W0702
+                    keywords = None
+            self.keywords_cache[layer_id] = (signature, keywords)
+            keywords_for_layers[layer_id] = keywords
+
+        if remote_layers:
+            uris = [str(layer.source()) for layer, _ in remote_layers]
+            # noinspection PyBroadException
+            try:
+                keywords_for_uris = self.keyword_io.read_keywords_for_uris(
+                    uris)
+            except:  # pylint: disable=W0702
+                LOGGER.exception('Could not read keywords of remote layers')
+                keywords_for_uris = {}
+            for (layer, signature), uri in zip(remote_layers, uris):
+                keywords = keywords_for_uris.get(uri)
+                self.keywords_cache[layer.id()] = (signature, keywords)
+                keywords_for_layers[layer.id()] = keywords
+        return keywords_for_layers
+
+    def forget_layer_keywords(self, layer=None):
+        """Drop cached keywords so they are read again by get_layers.
+
+        :param layer: The layer whose keywords changed, None for all layers.
+        :type layer: QgsMapLayer
+        """
+        if layer is None:
+            self.keywords_cache.clear()
+        else:
+            self.keywords_cache.pop(layer.id(), None)
 
     # noinspection PyUnusedLocal
     @pyqtSlot('QgsMapLayer')
@@ -753,6 +880,13 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         self.cboExposure.clear()
         self.cboAggregation.clear()
 
+        # Forget the layers that have been removed from the project
+        layer_ids = set(layer.id() for layer in layers)
+        for layer_id in self.keywords_cache.keys():
+            if layer_id not in layer_ids:
+                del self.keywords_cache[layer_id]
+
+        listed_layers = []
         for layer in layers:
 
             try:
@@ -767,32 +901,38 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
             if (self.show_only_visible_layers_flag and
                     (layer not in canvas_layers)):
                 continue
+            listed_layers.append(layer)
+
+        # Keywords are only read for new layers or layers that changed
+        keywords_for_layers = self.layer_keywords(listed_layers)
+
+        for layer in listed_layers:
 
             # .. todo:: check raster is single band
             #    store uuid in user property of list widget for layers
 
             name = layer.name()
             source = str(layer.id())
-            # See if there is a title for this layer, if not,
-            # fallback to the layer's filename
 
-            # noinspection PyBroadException
-            try:
-                title = self.keyword_io.read_keywords(layer, 'title')
-            except NoKeywordsFoundError:
-                # Skip if there are no keywords at all
+            keywords = keywords_for_layers[layer.id()]
+            # Skip if there are no keywords at all
+            if keywords is None:
                 continue
-            except:  # pylint: disable=W0702
+
+            # See if there is a title for this layer, if not,
+            # fallback to the layer's filename
+            if 'title' in keywords:
+                # Lookup internationalised title if available
+                title = self.tr(keywords['title'])
+            else:
                 # automatically adding file name to title in keywords
                 # See #575
                 try:
                     self.keyword_io.update_keywords(layer, {'title': name})
-                    title = name
                 except UnsupportedProviderError:
                     continue
-            else:
-                # Lookup internationalised title if available
-                title = self.tr(title)
+                title = name
+                keywords['title'] = name
             # Register title with layer
             if title and self.set_layer_from_title_flag:
                 layer.setLayerName(title)
@@ -808,12 +948,7 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
             # Find out if the layer is a hazard or an exposure
             # layer by querying its keywords. If the query fails,
             # the layer will be ignored.
-            # noinspection PyBroadException
-            try:
-                category = self.keyword_io.read_keywords(layer, 'category')
-            except:  # pylint: disable=W0702
-                # continue ignoring this layer
-                continue
+            category = keywords.get('category')
 
             if category == 'hazard':
                 add_ordered_combo_item(self.cboHazard, title, source)
@@ -857,16 +992,17 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         exposure_layer = self.get_exposure_layer()
         if exposure_layer is None:
             return
-        # noinspection PyTypeChecker
-        hazard_keywords = self.keyword_io.read_keywords(hazard_layer)
+        keywords_for_layers = self.layer_keywords(
+            [hazard_layer, exposure_layer])
+        hazard_keywords = dict(keywords_for_layers[hazard_layer.id()] or {})
         # We need to add the layer type to the returned keywords
         if hazard_layer.type() == QgsMapLayer.VectorLayer:
             hazard_keywords['layertype'] = 'vector'
         elif hazard_layer.type() == QgsMapLayer.RasterLayer:
             hazard_keywords['layertype'] = 'raster'
 
-        # noinspection PyTypeChecker
-        exposure_keywords = self.keyword_io.read_keywords(exposure_layer)
+        exposure_keywords = dict(
+            keywords_for_layers[exposure_layer.id()] or {})
         # We need to add the layer type to the returned keywords
         if exposure_layer.type() == QgsMapLayer.VectorLayer:
             exposure_keywords['layertype'] = 'vector'
@@ -999,6 +1135,10 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
             of the web view after model completion are asynchronous (when
             threading mode is enabled especially)
         """
+        if self.busy and self.analysis is not None:
+            # While a cancellable analysis runs the button stops it
+            self.analysis.cancel_analysis()
+            return
         self.enable_signal_receiver()
         try:
             if self.get_aggregation_layer():
@@ -1076,6 +1216,11 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         self.grpQuestion.setEnabled(False)
         self.grpQuestion.setVisible(False)
         QtGui.qApp.setOverrideCursor(QtGui.QCursor(QtCore.Qt.WaitCursor))
+        runner = getattr(self.analysis, 'runner', None)
+        if hasattr(runner, 'cancel'):
+            # The impact calculation can be stopped from the run button
+            self.pbnRunStop.setText(self.tr('Stop'))
+            self.pbnRunStop.setEnabled(True)
         self.repaint()
         QtGui.qApp.processEvents()
         self.busy = True
@@ -1126,6 +1271,8 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         analysis.clip_hard = self.clip_hard
         analysis.show_intermediate_layers = self.show_intermediate_layers
         analysis.run_in_thread_flag = self.run_in_thread_flag
+        analysis.run_in_process_flag = self.run_in_process_flag
+        analysis.memory_limit = self.memory_limit
         analysis.map_canvas = self.iface.mapCanvas()
         analysis.clip_to_viewport = self.clip_to_viewport
         analysis.user_extent = self.extent.user_extent
@@ -1182,14 +1329,9 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         :returns: Provides a report for writing to the dock.
         :rtype: str
         """
-        keywords = self.keyword_io.read_keywords(qgis_impact_layer)
-
         # write postprocessing report to keyword
-        output = self.analysis.postprocessor_manager.get_output(
-            self.analysis.aggregator.aoi_mode)
-        keywords['postprocessing_report'] = output.to_html(
-            suppress_newlines=True)
-        self.keyword_io.write_keywords(qgis_impact_layer, keywords)
+        keywords = self.analysis.write_impact_keywords(
+            qgis_impact_layer, self.keyword_io)
 
         # Get tabular information from impact layer
         report = m.Message()
@@ -1264,7 +1406,7 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
 
     def hide_busy(self):
         """A helper function to indicate processing is done."""
-        # self.pbnRunStop.setText('Run')
+        self.pbnRunStop.setText(self.tr('Run'))
         if self.analysis:
             if self.analysis.runner:
                 try:
@@ -326,6 +326,19 @@ class TestDock(TestCase):
                          exposure_layer_count), message
         # pylint: disable=W0106
 
+    def test_layer_keywords_cache(self):
+        """Layer keywords are cached until the layer is forgotten."""
+        load_standard_layers(DOCK)
+        layer = DOCK.get_hazard_layer()
+        keywords = DOCK.layer_keywords([layer])[layer.id()]
+        self.assertEqual(keywords['category'], 'hazard')
+        self.assertIn(layer.id(), DOCK.keywords_cache)
+        # The cached dict is returned while the files are unchanged
+        self.assertIs(DOCK.layer_keywords([layer])[layer.id()], keywords)
+
+        DOCK.forget_layer_keywords(layer)
+        self.assertNotIn(layer.id(), DOCK.keywords_cache)
+
     def test_issue71(self):
         """Test issue #71 in github - cbo changes should update ok button."""
         # See https://github.com/AIFDR/inasafe/issues/71
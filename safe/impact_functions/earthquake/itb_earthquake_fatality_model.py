@@ -29,7 +29,8 @@ from safe.storage.raster import Raster
 from safe.common.utilities import (
     format_int,
     humanize_class,
-    create_classes,
+    class_statistics,
+    create_classes_from_statistics,
     create_label,
     get_thousand_separator)
 from safe.common.tables import Table, TableRow
@@ -437,8 +438,10 @@ class ITBFatalityFunction(FunctionProvider):
         impact_summary = Table(table_body).toNewlineFreeString()
         impact_table = impact_summary
 
+        statistics = class_statistics(mask)
+
         # check for zero impact
-        if numpy.nanmax(mask) == 0 == numpy.nanmin(mask):
+        if statistics['maximum'] == 0 == statistics['minimum']:
             table_body = [
                 question,
                 TableRow([tr('Fatalities'), '%s' % format_int(fatalities)],
@@ -448,7 +451,7 @@ class ITBFatalityFunction(FunctionProvider):
 
         # Create style
         colours = ['#EEFFEE', '#FFFF7F', '#E15500', '#E4001B', '#730000']
-        classes = create_classes(mask.flat[:], len(colours))
+        classes = create_classes_from_statistics(statistics, len(colours))
         interval_classes = humanize_class(classes)
         style_classes = []
         for i in xrange(len(colours)):
@@ -491,7 +494,8 @@ class ITBFatalityFunction(FunctionProvider):
                 'legend_notes': legend_notes,
                 'legend_units': legend_units,
                 'legend_title': legend_title,
-                'total_needs': total_needs},
+                'total_needs': total_needs,
+                'class_statistics': statistics},
             name=tr('Estimated displaced population per cell'),
             style_info=style_info)
 
@@ -45,7 +45,8 @@ from safe.storage.raster import Raster
 from safe.common.utilities import (
     format_int,
     humanize_class,
-    create_classes,
+    class_statistics,
+    create_classes_from_statistics,
     create_label,
     get_thousand_separator)
 from safe.utilities.i18n import tr
@@ -334,7 +335,8 @@ class CategoricalHazardPopulationImpactFunction(FunctionProvider):
         colours = [
             '#FFFFFF', '#38A800', '#79C900', '#CEED00',
             '#FFCC00', '#FF6600', '#FF0000', '#7A0000']
-        classes = create_classes(impact.flat[:], len(colours))
+        statistics = class_statistics(impact)
+        classes = create_classes_from_statistics(statistics, len(colours))
         interval_classes = humanize_class(classes)
         style_classes = []
 
@@ -388,6 +390,7 @@ class CategoricalHazardPopulationImpactFunction(FunctionProvider):
                 'legend_notes': legend_notes,
                 'legend_units': legend_units,
                 'legend_title': legend_title,
-                'total_needs': total_needs},
+                'total_needs': total_needs,
+                'class_statistics': statistics},
             style_info=style_info)
         return raster_layer
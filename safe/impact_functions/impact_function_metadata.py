@@ -20,6 +20,17 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 import json
 from safe.impact_functions.utilities import add_to_list
 
+# Memory cost model for impact functions that do not declare one in the
+# 'memory' entry of their metadata
+DEFAULT_MEMORY_MODEL = {
+    # Bytes per raster cell of one full-size array (numpy uses float64)
+    'bytes_per_cell': 8,
+    # Bytes per vector feature (geometry, attribute dict and results)
+    'bytes_per_feature': 2048,
+    # Number of full-size raster arrays alive at the peak of the analysis
+    'temporaries': 10
+}
+
 
 class ImpactFunctionMetadata(object):
     """Abstract metadata class for an impact function.
@@ -254,6 +265,31 @@ class ImpactFunctionMetadata(object):
         except AttributeError:
             return True
 
+    @classmethod
+    def memory_model(cls):
+        """Determine the memory cost model of an impact function.
+
+        Impact functions can describe their memory use in a 'memory' entry
+        of the metadata, e.g.::
+
+            'memory': {
+                'bytes_per_cell': 8,
+                'bytes_per_feature': 4096,
+                'temporaries': 6
+            }
+
+        Missing values are taken from DEFAULT_MEMORY_MODEL.
+
+        :returns: The memory model with all keys of DEFAULT_MEMORY_MODEL.
+        :rtype: dict
+        """
+        model = dict(DEFAULT_MEMORY_MODEL)
+        try:
+            model.update(cls.get_metadata().get('memory', {}))
+        except (AttributeError, NotImplementedError):
+            pass
+        return model
+
     @classmethod
     def allowed_layer_constraints(cls, category=None):
         """Determine allowed layer constraints.
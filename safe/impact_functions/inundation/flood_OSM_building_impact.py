@@ -88,6 +88,11 @@ class FloodBuildingImpactFunction(FunctionProvider):
                     'To assess the impacts of (flood or tsunami) inundation '
                     'on building footprints originating from OpenStreetMap '
                     '(OSM).'),
+                'memory': {
+                    # The hazard raster is only sampled at the buildings
+                    'temporaries': 2,
+                    'bytes_per_feature': 4096
+                },
                 'categories': {
                     'hazard': {
                         'definition': hazard_definition,
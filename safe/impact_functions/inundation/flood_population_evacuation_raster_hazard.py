@@ -34,7 +34,8 @@ from safe.common.utilities import (
     format_int,
     verify,
     humanize_class,
-    create_classes,
+    class_statistics,
+    create_classes_from_statistics,
     create_label,
     get_thousand_separator)
 from safe.common.tables import Table, TableRow
@@ -88,6 +89,12 @@ class FloodEvacuationFunction(FunctionProvider):
                 'overview': tr(
                     'To assess the impacts of flood inundation in raster '
                     'format on population.'),
+                'memory': {
+                    # hazard, population, scaled population, impact and
+                    # the threshold masks
+                    'bytes_per_cell': 8,
+                    'temporaries': 6
+                },
                 'categories': {
                     'hazard': {
                         'definition': hazard_definition,
@@ -291,8 +298,10 @@ class FloodEvacuationFunction(FunctionProvider):
         impact_summary = Table(table_body).toNewlineFreeString()
         impact_table = impact_summary
 
+        statistics = class_statistics(impact)
+
         # check for zero impact
-        if numpy.nanmax(impact) == 0 == numpy.nanmin(impact):
+        if statistics['maximum'] == 0 == statistics['minimum']:
             table_body = [
                 question,
                 TableRow([(tr('People in %.1f m of water') % thresholds[-1]),
@@ -305,7 +314,7 @@ class FloodEvacuationFunction(FunctionProvider):
         colours = [
             '#FFFFFF', '#38A800', '#79C900', '#CEED00',
             '#FFCC00', '#FF6600', '#FF0000', '#7A0000']
-        classes = create_classes(impact.flat[:], len(colours))
+        classes = create_classes_from_statistics(statistics, len(colours))
         interval_classes = humanize_class(classes)
         style_classes = []
 
@@ -357,6 +366,7 @@ class FloodEvacuationFunction(FunctionProvider):
                 'legend_units': legend_units,
                 'legend_title': legend_title,
                 'evacuated': evacuated,
-                'total_needs': total_needs},
+                'total_needs': total_needs,
+                'class_statistics': statistics},
             style_info=style_info)
         return raster
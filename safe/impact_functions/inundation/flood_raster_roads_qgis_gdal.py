@@ -31,7 +31,7 @@ from safe.storage.vector import Vector
 from safe.common.utilities import get_utm_epsg
 from safe.common.exceptions import GetDataError
 from safe.gis.qgis_raster_tools import (
-    clip_raster, polygonize_gdal)
+    clip_raster_to_dataset, polygonize_gdal)
 from safe.gis.qgis_vector_tools import (
     split_by_polygon_in_out,
     extent_to_geo_array,
@@ -229,7 +229,7 @@ class FloodRasterRoadsExperimentalFunction2(FunctionProvider):
         clip_extent = [x, y, x + width * x_delta, y + height * y_delta]
 
         # Clip and polygonize
-        small_raster = clip_raster(
+        small_raster = clip_raster_to_dataset(
             H, width, height, QgsRectangle(*clip_extent))
         (flooded_polygon_inside, flooded_polygon_outside) = polygonize_gdal(
             small_raster, threshold_min, threshold_max)
@@ -30,6 +30,8 @@ from qgis.core import (
     QgsFeature,
     QgsFeatureRequest,
     QgsRectangle,
+    QgsSpatialIndex,
+    QgsCoordinateTransform,
     QgsPoint,
     QgsField,
     QgsFields,
@@ -86,11 +88,8 @@ WARNING_STYLE = styles.WARNING_STYLE
 
 LOGGER = logging.getLogger('InaSAFE')
 
-# If inasafe is running as qgis plugin,
-# it can import processing (from QGIS / sextante),
-# pylint: disable=F0401
-import processing
-# pylint: enable=F0401
+# Field holding the length of line pieces in line aggregation
+LINE_LENGTH_FIELD = 'length'
 
 
 class Aggregator(QtCore.QObject):
@@ -138,8 +137,6 @@ class Aggregator(QtCore.QObject):
         # aggregation polygons (one list for one polygon)
         self.impact_layer_attributes = []
 
-        self.processing = processing
-
         # If this flag is not True, no aggregation or postprocessing will run
         # this is set as True by validateKeywords()
         self.is_valid = False
@@ -903,146 +900,153 @@ class Aggregator(QtCore.QObject):
     def _aggregate_line_impact(self, safe_impact_layer):
         """Aggregation of lines in polygons
 
+        Impacted lines are intersected with the aggregation polygons in
+        memory, using a spatial index on the polygons. The length of each
+        piece is measured in the UTM zone of the analysis extent and the
+        lengths are summed per polygon (and per class for class_count
+        statistics).
+
         :param safe_impact_layer: The impact layer in SAFE format
         :type safe_impact_layer: read_layer
         """
-        if self.statistics_type == 'class_count':
-            msg = "Summary length calculation is only one " \
-                  "implemented method for line aggregation."
-            raise NotImplementedError(msg)
-        elif self.statistics_type == 'sum':
-
-            output_directory = temp_dir(sub_dir='pre-process')
-            agg_provider = self.layer.dataProvider()
-
-            # Split lines from impact layer by aggregation polygons,
-            # Add column with polygon names to the line attributes
-            impact_layer = safe_to_qgis_layer(safe_impact_layer)
-
-            splits_filename = unique_filename(
-                suffix='.shp', dir=output_directory)
-            res = self.processing.runalg('qgis:intersection',
-                impact_layer, self.layer, splits_filename)
-            impact_layer_splits = QgsVectorLayer(
-                res['OUTPUT'], 'split aggregation', 'ogr')
-
-            # Add length column to impact layer
-
-            # We need calculate length in meters, not degrees:
-            # We can use processing 'qgis:exportaddgeometrycolumns' with
-            # CALC_METHODS=2 (Ellipsoidal) directly, but that
-            # requires  QgsProject instance (see ftools source).
-            # To simplify test writing, use reprojection before.
-
-            tmp_filename = unique_filename(
-                suffix='.shp', dir=output_directory)
-            epsg = "EPSG:" + str(get_utm_epsg(self.extent[0], self.extent[1]))
-            res = processing.runalg(
-                'qgis:reprojectlayer',
-                impact_layer_splits,
-                epsg,
-                tmp_filename)
-            projected_layer = QgsVectorLayer(
-                res['OUTPUT'],
-                'projected aggregation',
-                'ogr')
-            tmp_filename = unique_filename(
-                suffix='.shp', dir=output_directory)
-            res = self.processing.runalg('qgis:exportaddgeometrycolumns',
-                projected_layer,
-                # 2, # Ellipsoidal
-                0,  # Layer CRS
-                tmp_filename)
-            impact_layer_splits = QgsVectorLayer(
-                res['OUTPUT'],
-                'length aggregation',
-                'ogr'
-            )
-            # This column name is used by the processing algorithm:
-            LENGTH_COLUMN = 'length'
-
-            sum_field_index = \
-                agg_provider.fieldNameIndex(self.sum_field_name())
-
-            # agg_attribute is a field name of aggregating polygons
-            agg_attribute = self.read_keywords(
-                    self.layer, self.get_default_keyword('AGGR_ATTR_KEY'))
-            agg_attribute_index = agg_provider.fieldNameIndex(agg_attribute)
-
-            request = QgsFeatureRequest().\
-                setSubsetOfAttributes([agg_attribute_index])
-            agg_attribute_dict = {}
-            for feature_id, feat in enumerate(self.layer.getFeatures(request)):
-                name = feat.attributes()[0]
-                if name in agg_attribute_dict:  # The name isn't unique
-                    name += str(feature_id)  # Add a number to make unique key
-                agg_attribute_dict[name] = feature_id
-            # Total impacted length in the aggregation polygons:
-            total = {
-                feature_id: 0 for feature_id, __ in enumerate(
-                self.layer.getFeatures(request))
-            }
-
-            # Create slots for dicts
-            self.impact_layer_attributes = []
-            for i in range(len(agg_attribute_dict)):
-                self.impact_layer_attributes.append([])
-                _ = i
-            # Create list of line objects that are covered by
-            # aggregation polygons (a list of dicts for a polygon)
-            impact_field_map = {}   # {'FieldName': FieldIndex}
-            temp_aggr_field_map = \
-                impact_layer_splits.dataProvider().fieldNameMap()
-            for k, v in temp_aggr_field_map.iteritems():
-                impact_field_map[str(k)] = v
-
-            request = QgsFeatureRequest().\
-                setFlags(QgsFeatureRequest.NoGeometry)
-            agg_attribute_index = impact_layer_splits.dataProvider().\
-                fieldNameIndex(agg_attribute)
-            for feat in impact_layer_splits.getFeatures(request):
-                line_attributes = feat.attributes()
-                polygon_name = line_attributes[agg_attribute_index]
-                line_attribute_dict = \
-                    feature_attributes_as_dict(
-                        impact_field_map, line_attributes)
-                line_attribute_dict[self.sum_field_name()] = \
-                    line_attribute_dict[LENGTH_COLUMN]
-
-                if isinstance(
-                        line_attribute_dict[self.target_field],
-                        QtCore.QPyNullVariant):
-                    message = m.Paragraph(
-                        self.tr(
-                            'The target_field contains Null values.'
-                            ' The impact function should define this.')
-                    )
-                    LOGGER.debug(
-                        'Skipping postprocessing due to: %s' % message)
-                    self.error_message = message
-                    return
-
-                # Postprocessor will sum all impacted length,
-                # (remember, if line_attribute_dict[self.target_field]==0,
-                # then the line is not impacted), so to keep the impacted
-                # length and non-impacted zeros, the multiplication is used
-                line_attribute_dict[self.target_field] = \
-                    line_attribute_dict[LENGTH_COLUMN] * \
-                    line_attribute_dict[self.target_field]
-                polygon_index = agg_attribute_dict[polygon_name]
-                self.impact_layer_attributes[polygon_index].\
-                    append(line_attribute_dict)
-
-                # ##################################################
-                # total in aggregation polygon
-                total[polygon_index] +=  \
-                    line_attribute_dict[self.target_field]
-
-            for polygon_index in total.keys():
-                agg_provider.changeAttributeValues(
-                    {polygon_index: {sum_field_index: total[polygon_index]}})
+        if self.statistics_type not in ['sum', 'class_count']:
+            return
 
-            self.layer.commitChanges()
+        agg_provider = self.layer.dataProvider()
+        impact_layer = safe_to_qgis_layer(safe_impact_layer)
+
+        # Index the aggregation polygons
+        polygon_ids = []
+        polygon_geometries = []
+        polygon_attributes = []
+        polygon_index_by_id = {}
+        spatial_index = QgsSpatialIndex()
+        agg_field_map = {}
+        for k, v in agg_provider.fieldNameMap().iteritems():
+            agg_field_map[str(k)] = v
+        for polygon_index, feature in enumerate(self.layer.getFeatures()):
+            polygon_index_by_id[feature.id()] = polygon_index
+            polygon_ids.append(feature.id())
+            polygon_geometries.append(QgsGeometry(feature.geometry()))
+            polygon_attributes.append(feature_attributes_as_dict(
+                agg_field_map, feature.attributes()))
+            spatial_index.insertFeature(feature)
+        number_of_polygons = len(polygon_geometries)
+
+        # We need lengths in meters, not degrees
+        epsg = get_utm_epsg(self.extent[0], self.extent[1])
+        transform = QgsCoordinateTransform(
+            impact_layer.crs(),
+            QgsCoordinateReferenceSystem('EPSG:%s' % epsg))
+
+        impact_field_map = {}   # {'FieldName': FieldIndex}
+        for k, v in impact_layer.dataProvider().fieldNameMap().iteritems():
+            impact_field_map[str(k)] = v
+
+        # Create slots for the lines covered by each aggregation polygon
+        self.impact_layer_attributes = [
+            [] for _ in range(number_of_polygons)]
+
+        # Pieces of lines within aggregation polygons
+        piece_polygons = []
+        piece_lengths = []
+        piece_values = []
+        for feature in impact_layer.getFeatures():
+            geometry = feature.geometry()
+            if geometry is None:
+                continue
+            line_attributes = feature_attributes_as_dict(
+                impact_field_map, feature.attributes())
+            value = line_attributes[self.target_field]
+            if isinstance(value, QtCore.QPyNullVariant):
+                message = m.Paragraph(
+                    self.tr(
+                        'The target_field contains Null values.'
+                        ' The impact function should define this.')
+                )
+                LOGGER.debug(
+                    'Skipping postprocessing due to: %s' % message)
+                self.error_message = message
+                return
+
+            for feature_id in spatial_index.intersects(
+                    geometry.boundingBox()):
+                polygon_index = polygon_index_by_id[feature_id]
+                polygon = polygon_geometries[polygon_index]
+                if not geometry.intersects(polygon):
+                    continue
+                piece = geometry.intersection(polygon)
+                if piece is None or piece.isGeosEmpty():
+                    continue
+                piece.transform(transform)
+                length = piece.length()
+                if length <= 0:
+                    continue
+
+                piece_polygons.append(polygon_index)
+                piece_lengths.append(length)
+                piece_values.append(value)
+
+                line_attribute_dict = dict(line_attributes)
+                line_attribute_dict.update(
+                    polygon_attributes[polygon_index])
+                line_attribute_dict[LINE_LENGTH_FIELD] = length
+                if self.statistics_type == 'sum':
+                    line_attribute_dict[self.sum_field_name()] = length
+                    # Postprocessor will sum all impacted length,
+                    # (remember, if the target field is 0, then the line
+                    # is not impacted), so to keep the impacted length and
+                    # non-impacted zeros, the multiplication is used
+                    line_attribute_dict[self.target_field] = length * value
+                self.impact_layer_attributes[polygon_index].append(
+                    line_attribute_dict)
+
+        piece_polygons = numpy.array(piece_polygons, dtype=numpy.int)
+        piece_lengths = numpy.array(piece_lengths, dtype=numpy.float)
+
+        # Attribute changes are keyed on the aggregation feature ids
+        attributes = {}
+        if self.statistics_type == 'sum':
+            sum_field_index = agg_provider.fieldNameIndex(
+                self.sum_field_name())
+            impacted_lengths = piece_lengths * numpy.array(
+                piece_values, dtype=numpy.float)
+            totals = numpy.bincount(
+                piece_polygons,
+                weights=impacted_lengths,
+                minlength=number_of_polygons)
+            for polygon_index, feature_id in enumerate(polygon_ids):
+                attributes[feature_id] = {
+                    sum_field_index: float(totals[polygon_index])}
+        else:
+            class_totals = OrderedDict()
+            for statistics_class in self.statistics_classes:
+                mask = numpy.array(
+                    [v == statistics_class for v in piece_values],
+                    dtype=numpy.bool)
+                class_totals[statistics_class] = numpy.bincount(
+                    piece_polygons[mask],
+                    weights=piece_lengths[mask],
+                    minlength=number_of_polygons)
+            unknown = set(piece_values) - set(self.statistics_classes)
+            if unknown:
+                error = (
+                    'StatisticsClasses %s does not include '
+                    'the %s class which was found in the '
+                    'data. This is a problem in the impact '
+                    'function statistics_classes definition' %
+                    (self.statistics_classes, list(unknown)[0]))
+                raise KeyError(error)
+            for polygon_index, feature_id in enumerate(polygon_ids):
+                attributes[feature_id] = {}
+                for statistics_class, totals in class_totals.iteritems():
+                    field_index = agg_provider.fieldNameIndex(
+                        self._aggregation_field_name(statistics_class))
+                    attributes[feature_id][field_index] = float(
+                        totals[polygon_index])
+
+        agg_provider.changeAttributeValues(attributes)
+        self.layer.commitChanges()
 
     def _prepare_layer(self):
         """Prepare the aggregation layer to match analysis extents.
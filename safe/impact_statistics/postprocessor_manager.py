@@ -18,6 +18,7 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
 import logging
+import numpy
 # noinspection PyPackageRequirements
 from PyQt4 import QtCore
 from collections import OrderedDict
@@ -27,6 +28,7 @@ from safe.common.utilities import (
     unhumanize_number,
     format_int)
 from safe.common.exceptions import PostProcessorError
+from safe.common.profiling import profile_stage
 from safe.common.exceptions import KeywordNotFoundError
 from safe.utilities.keyword_io import KeywordIO
 from safe.postprocessors.postprocessor_factory import (
@@ -93,21 +95,22 @@ class PostprocessorManager(QtCore.QObject):
 
         return position
 
-    def _generate_tables(self, aoi_mode=True):
-        """Parses the postprocessing output as one table per postprocessor.
-
-        TODO: This should rather return json and then have a helper method to
-        make html from the JSON.
+    def _summary_tables(self, aoi_mode=True):
+        """Compute the content of one table per postprocessor.
 
         :param aoi_mode: adds a Total in aggregation areas
         row to the calculated table
         :type aoi_mode: bool
 
-        :returns: The html.
-        :rtype: str
+        :returns: One dictionary per postprocessor with the 'caption', the
+            'header' (indicator names), the 'rows' as (zone name, values)
+            tuples where values are ints or the NO_DATA keyword, the 'ids'
+            of the zones of the rows (the totals row has none) and a
+            'has_no_data' flag.
+        :rtype: list
         """
-        message = m.Message()
-
+        no_data = self.aggregator.get_default_keyword('NO_DATA')
+        tables = []
         for processor, results_list in self.output.iteritems():
 
             self.current_output_postprocessor = processor
@@ -127,59 +130,88 @@ class PostprocessorManager(QtCore.QObject):
                 key=self._sort_no_data,
                 reverse=True)
 
-            # init table
             has_no_data = False
-            table = m.Table(
-                style_class='table table-condensed table-striped')
-            table.caption = self.tr('Detailed %s report') % (tr(
+            caption = self.tr('Detailed %s report') % (tr(
                 get_postprocessor_human_name(processor)).lower())
-
-            header = m.Row()
-            header.add(str(self.attribute_title).capitalize())
-            for calculation_name in sorted_results[0][1]:
-                header.add(self.tr(calculation_name))
-            table.add(header)
+            header = [
+                self.tr(calculation_name)
+                for calculation_name in sorted_results[0][1]]
 
             # used to calculate the totals row as per issue #690
             postprocessor_totals = OrderedDict()
 
-            for zone_name, calc in sorted_results:
-                row = m.Row(zone_name)
-
+            rows = []
+            ids = []
+            for zone_name, calc, zone_id in sorted_results:
+                values = []
                 for indicator, calculation_data in calc.iteritems():
                     value = calculation_data['value']
                     value = str(unhumanize_number(value))
-                    if value == self.aggregator.get_default_keyword('NO_DATA'):
+                    if value == no_data:
                         has_no_data = True
-                        value += ' *'
-                        try:
-                            postprocessor_totals[indicator] += 0
-                        except KeyError:
-                            postprocessor_totals[indicator] = 0
+                        postprocessor_totals.setdefault(indicator, 0)
                     else:
                         value = int(value)
-                        try:
-                            postprocessor_totals[indicator] += value
-                        except KeyError:
-                            postprocessor_totals[indicator] = value
-                    row.add(format_int(value))
-                table.add(row)
+                        postprocessor_totals[indicator] = (
+                            postprocessor_totals.get(indicator, 0) + value)
+                    values.append(value)
+                rows.append((zone_name, values))
+                ids.append(zone_id)
 
             if not aoi_mode:
                 # add the totals row
-                row = m.Row(self.tr('Total in aggregation areas'))
-                for _, total in postprocessor_totals.iteritems():
-                    row.add(format_int(total))
+                rows.append((
+                    self.tr('Total in aggregation areas'),
+                    postprocessor_totals.values()))
+
+            tables.append({
+                'caption': caption,
+                'header': header,
+                'rows': rows,
+                'ids': ids,
+                'has_no_data': has_no_data})
+        return tables
+
+    def _generate_tables(self, aoi_mode=True):
+        """Parses the postprocessing output as one table per postprocessor.
+
+        :param aoi_mode: adds a Total in aggregation areas
+        row to the calculated table
+        :type aoi_mode: bool
+
+        :returns: The html.
+        :rtype: str
+        """
+        no_data = self.aggregator.get_default_keyword('NO_DATA')
+        message = m.Message()
+
+        for summary_table in self._summary_tables(aoi_mode):
+            # init table
+            table = m.Table(
+                style_class='table table-condensed table-striped')
+            table.caption = summary_table['caption']
+
+            header = m.Row()
+            header.add(str(self.attribute_title).capitalize())
+            for indicator in summary_table['header']:
+                header.add(indicator)
+            table.add(header)
+
+            for zone_name, values in summary_table['rows']:
+                row = m.Row(zone_name)
+                for value in values:
+                    if value == no_data:
+                        value += ' *'
+                    row.add(format_int(value))
                 table.add(row)
 
             # add table to message
             message.add(table)
-            if has_no_data:
+            if summary_table['has_no_data']:
                 message.add(m.EmphasizedText(self.tr(
                     '* "%s" values mean that there where some problems while '
                     'calculating them. This did not affect the other '
-                    'values.') % (
-                        self.aggregator.get_default_keyword('NO_DATA'))))
+                    'values.') % no_data))
 
         return message
 
@@ -195,14 +227,15 @@ class PostprocessorManager(QtCore.QObject):
         # iterate postprocessors
         for postprocessor, results_list in output.iteritems():
             # see self._generateTables to see details about results_list
-            checked_polygon_names = {}
+            # The parts of a multipart polygon share the id of the zone
+            checked_zone_ids = {}
             parts_to_delete = []
             polygon_index = 0
             # iterate polygons
-            for polygon_name, results in results_list:
-                if polygon_name in checked_polygon_names.keys():
+            for _, results, zone_id in results_list:
+                if zone_id in checked_zone_ids:
                     for result_name, result in results.iteritems():
-                        first_part_index = checked_polygon_names[polygon_name]
+                        first_part_index = checked_zone_ids[zone_id]
                         first_part = self.output[postprocessor][
                             first_part_index]
                         first_part_results = first_part[1]
@@ -238,7 +271,7 @@ class PostprocessorManager(QtCore.QObject):
 
                 else:
                     # add polygon to checked list
-                    checked_polygon_names[polygon_name] = polygon_index
+                    checked_zone_ids[zone_id] = polygon_index
 
                 polygon_index += 1
 
@@ -369,112 +402,199 @@ class PostprocessorManager(QtCore.QObject):
                 # use 'type' as default
                 key_attribute = 'type'
 
-        # iterate zone features
+        # Read the zone attributes once, as columns
+        needed_indexes = [
+            index for index in [
+                name_filed_index,
+                sum_field_index,
+                female_ratio_field_index,
+                youth_ratio_field_index,
+                adult_ratio_field_index,
+                elderly_ratio_field_index]
+            if index is not None and index != -1]
         request = QgsFeatureRequest()
         request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(needed_indexes)
         provider = self.aggregator.layer.dataProvider()
-        # start data retrieval: fetch no geometry and all attributes for each
-        # feature
-        polygon_index = 0
-        for feature in provider.getFeatures(request):
+        # The parts of a clipped aggregation layer know the id of the
+        # aggregation area they come from
+        try:
+            source_ids = self.keyword_io.read_keywords(
+                self.aggregator.layer, 'source feature ids')
+        except KeywordNotFoundError:
+            source_ids = None
+        if (source_ids is not None and
+                len(source_ids) != provider.featureCount()):
+            source_ids = None
+        zone_ids = []
+        zone_names = []
+        impact_totals = []
+        female_ratios = []
+        age_ratios = []
+        for position, feature in enumerate(provider.getFeatures(request)):
+            if source_ids is None:
+                zone_ids.append(feature.id())
+            else:
+                zone_ids.append(source_ids[position])
             # if a feature has no field called
             if name_filed_index == -1:
-                zone_name = str(feature.id())
+                zone_names.append(str(feature.id()))
             else:
-                zone_name = feature[name_filed_index]
+                zone_names.append(feature[name_filed_index])
+
+            if self.aggregator.statistics_type == 'sum':
+                impact_totals.append(
+                    self._float_value(feature[sum_field_index]))
+            if user_defined_female_ratio:
+                female_ratios.append(
+                    self._float_value(feature[female_ratio_field_index]))
+            if user_defined_age_ratios:
+                age_ratios.append([
+                    self._float_value(feature[youth_ratio_field_index]),
+                    self._float_value(feature[adult_ratio_field_index]),
+                    self._float_value(feature[elderly_ratio_field_index])])
+        zone_count = len(zone_names)
+
+        # create dictionary of attributes to pass to postprocessors
+        general_params = {
+            'target_field': self.aggregator.target_field,
+            'function_params': self.function_parameters}
+        if self.aggregator.statistics_type == 'class_count':
+            general_params['impact_classes'] = (
+                self.aggregator.statistics_classes)
+
+        # rasters and attributeless vectors have no attributes
+        impact_attributes = self.aggregator.impact_layer_attributes
+        columns = {
+            'impact_attrs': [
+                impact_attributes[i] if i < len(impact_attributes) else None
+                for i in xrange(zone_count)]}
+        if self.aggregator.statistics_type == 'sum':
+            columns['impact_total'] = numpy.array(
+                impact_totals, dtype=numpy.float)
+        else:
+            columns['impact_total'] = numpy.nan * numpy.ones(zone_count)
 
-            # create dictionary of attributes to pass to postprocessor
-            general_params = {
-                'target_field': self.aggregator.target_field,
-                'function_params': self.function_parameters}
+        if 'Gender' in postprocessors:
+            if user_defined_female_ratio:
+                female_ratio = numpy.array(female_ratios, dtype=numpy.float)
+                missing = numpy.isnan(female_ratio)
+                if missing.any():
+                    female_ratio[missing] = self.aggregator.defaults[
+                        'FEMALE_RATIO']
+                    LOGGER.warning(
+                        'Data Driven Female ratio incomplete, using '
+                        'defaults for aggregation units %s' % [
+                            zone_names[i] for i in numpy.nonzero(missing)[0]])
+            columns['female_ratio'] = female_ratio * numpy.ones(zone_count)
+
+        if 'Age' in postprocessors:
+            if user_defined_age_ratios:
+                age_ratio = numpy.array(
+                    age_ratios, dtype=numpy.float).reshape(zone_count, 3)
+                missing = numpy.isnan(age_ratio).any(axis=1)
+                if missing.any():
+                    age_ratio[missing] = [
+                        self.aggregator.defaults['YOUTH_RATIO'],
+                        self.aggregator.defaults['ADULT_RATIO'],
+                        self.aggregator.defaults['ELDERLY_RATIO']]
+                    LOGGER.warning(
+                        'Data Driven Age ratios incomplete, using '
+                        'defaults for aggregation units %s' % [
+                            zone_names[i] for i in numpy.nonzero(missing)[0]])
+                youth_ratio = age_ratio[:, 0]
+                adult_ratio = age_ratio[:, 1]
+                elderly_ratio = age_ratio[:, 2]
+            columns['youth_ratio'] = youth_ratio * numpy.ones(zone_count)
+            columns['adult_ratio'] = adult_ratio * numpy.ones(zone_count)
+            columns['elderly_ratio'] = elderly_ratio * numpy.ones(zone_count)
+
+        for key, value in postprocessors.iteritems():
+            parameters = dict(general_params)
+            try:
+                # look if params are available for this postprocessor
+                parameters.update(
+                    self.function_parameters[
+                        'postprocessors'][key]['params'])
+            except KeyError:
+                pass
 
-            if self.aggregator.statistics_type == 'class_count':
-                general_params['impact_classes'] = (
-                    self.aggregator.statistics_classes)
-            elif self.aggregator.statistics_type == 'sum':
-                impact_total = feature[sum_field_index]
-                general_params['impact_total'] = impact_total
+            if key == 'BuildingType' or key == 'RoadType':
+                parameters['key_attribute'] = key_attribute
 
             try:
-                general_params['impact_attrs'] = (
-                    self.aggregator.impact_layer_attributes[polygon_index])
-            except IndexError:
-                # rasters and attributeless vectors have no attributes
-                general_params['impact_attrs'] = None
-
-            for key, value in postprocessors.iteritems():
-                parameters = general_params
-                try:
-                    # look if params are available for this postprocessor
-                    parameters.update(
-                        self.function_parameters[
-                            'postprocessors'][key]['params'])
-                except KeyError:
-                    pass
-
-                if key == 'Gender':
-                    if user_defined_female_ratio:
-                        female_ratio = feature[female_ratio_field_index]
-                        if female_ratio is None:
-                            female_ratio = self.aggregator.defaults[
-                                'FEMALE_RATIO']
-                            LOGGER.warning('Data Driven Female ratio '
-                                           'incomplete, using defaults for'
-                                           ' aggregation unit'
-                                           ' %s' % feature.id)
-
-                    parameters['female_ratio'] = female_ratio
-
-                if key == 'Age':
-                    if user_defined_age_ratios:
-                        youth_ratio = feature[youth_ratio_field_index]
-                        adult_ratio = feature[adult_ratio_field_index]
-                        elderly_ratio = feature[elderly_ratio_field_index]
-                        if (youth_ratio is None or
-                                adult_ratio is None or
-                                elderly_ratio is None):
-                            youth_ratio = self.aggregator.defaults[
-                                'YOUTH_RATIO']
-                            adult_ratio = self.aggregator.defaults[
-                                'ADULT_RATIO']
-                            elderly_ratio = self.aggregator.defaults[
-                                'ELDERLY_RATIO']
-                            LOGGER.warning('Data Driven Age ratios '
-                                           'incomplete, using defaults for'
-                                           ' aggregation unit'
-                                           ' %s' % feature.id)
-
-                    parameters['youth_ratio'] = youth_ratio
-                    parameters['adult_ratio'] = adult_ratio
-                    parameters['elderly_ratio'] = elderly_ratio
-
-                if key == 'BuildingType' or key == 'RoadType':
-                    parameters['key_attribute'] = key_attribute
+                with profile_stage(key):
+                    results, valid = value.process_zones(
+                        parameters, columns, zone_count)
+            except PostProcessorError as e:
+                self._set_postprocessor_error(key, str(e))
+                continue
 
-                try:
-                    value.setup(parameters)
-                    value.process()
-                    results = value.results()
-                    value.clear()
-                    # LOGGER.debug(results)
-
-                    # this can raise a KeyError
-                    self.output[key].append(
-                        (zone_name, results))
-
-                except PostProcessorError as e:
-                    message = m.Message(
-                        m.Heading(self.tr('%s postprocessor problem' % key),
-                                  **styles.DETAILS_STYLE),
-                        m.Paragraph(self.tr(str(e))))
-                    self.error_message = message
-
-                except KeyError:
-                    self.output[key] = []
-                    self.output[key].append(
-                        (zone_name, results))
-            # increment the index
-            polygon_index += 1
+            if value.zone_errors:
+                self._set_postprocessor_error(key, value.zone_errors[-1])
+
+            self.output.setdefault(key, []).extend(
+                self._zone_results(zone_ids, zone_names, results, valid))
+
+    @staticmethod
+    def _float_value(value):
+        """Convert an attribute value to float, using nan for missing values.
+
+        :param value: The attribute value.
+        :type value: int, float, None, QPyNullVariant
+
+        :returns: The value as a float.
+        :rtype: float
+        """
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return numpy.nan
+
+    @staticmethod
+    def _zone_results(zone_ids, zone_names, results, valid):
+        """Turn the columns returned by a postprocessor into per zone results.
+
+        :param zone_ids: Ids of the aggregation areas of the zones.
+        :type zone_ids: list
+
+        :param zone_names: Names of the zones.
+        :type zone_names: list
+
+        :param results: Indicator columns as returned by process_zones.
+        :type results: OrderedDict
+
+        :param valid: Flags of the zones the postprocessor handled.
+        :type valid: numpy.ndarray
+
+        :returns: List of (zone_name, OrderedDict, zone_id) tuples, one per
+            valid zone.
+        :rtype: list
+        """
+        zone_results = []
+        for i in numpy.nonzero(valid)[0].tolist():
+            zone_result = OrderedDict()
+            for name, column in results.iteritems():
+                zone_result[name] = {
+                    'value': column['values'][i],
+                    'metadata': column['metadata']}
+            zone_results.append((zone_names[i], zone_result, zone_ids[i]))
+        return zone_results
+
+    def _set_postprocessor_error(self, key, error):
+        """Record a postprocessor problem for the report.
+
+        :param key: Name of the postprocessor.
+        :type key: str
+
+        :param error: The problem.
+        :type error: str
+        """
+        message = m.Message(
+            m.Heading(self.tr('%s postprocessor problem' % key),
+                      **styles.DETAILS_STYLE),
+            m.Paragraph(self.tr(error)))
+        self.error_message = message
 
     def get_output(self, aoi_mode):
         """Returns the results of the post processing as a table.
@@ -497,6 +617,16 @@ class PostprocessorManager(QtCore.QObject):
                     'the detailed postprocessing report is unavailable:')))
             message.add(self.error_message)
 
+        self._consolidate_if_multipart()
+
+        message.add(self._generate_tables(aoi_mode))
+        return message
+
+    def _consolidate_if_multipart(self):
+        """Consolidate the results if the aggregation layer is multipart.
+
+        Consolidating is idempotent so this can be called before each output.
+        """
         try:
             if (self.keyword_io.read_keywords(
                     self.aggregator.layer, 'had multipart polygon')):
@@ -504,5 +634,40 @@ class PostprocessorManager(QtCore.QObject):
         except KeywordNotFoundError:
             pass
 
-        message.add(self._generate_tables(aoi_mode))
-        return message
+    def get_summary(self, aoi_mode):
+        """Returns the results of the post processing as numbers.
+
+        This is the machine readable counterpart of get_output, meant to be
+        stored in the 'postprocessing_summary' keyword so that tools like
+        the impact merge dialog can join the results of two impacts by
+        aggregation area without parsing the html.
+
+        :param aoi_mode: aoi mode of the aggregator.
+        :type aoi_mode: bool
+
+        :returns: The 'zones' (the name of each aggregation area by id) and
+            one 'tables' entry per postprocessor with the 'caption', the
+            'header' (indicator names), the 'ids' of the aggregation areas
+            and their 'values' rows. Values are ints or None for no data,
+            e.g. {'zones': {3: 'Jakarta Barat'}, 'tables': [{'caption':
+            'Detailed gender report', 'header': ['Total', 'Females'],
+            'ids': [3], 'values': [[1000, 510]]}]}.
+        :rtype: OrderedDict
+        """
+        self._consolidate_if_multipart()
+        no_data = self.aggregator.get_default_keyword('NO_DATA')
+        zones = OrderedDict()
+        tables = []
+        for table in self._summary_tables(aoi_mode):
+            values = []
+            # The totals row has no id and is left out
+            for zone_id, (zone_name, row) in zip(table['ids'], table['rows']):
+                zones.setdefault(zone_id, unicode(zone_name))
+                values.append(
+                    [None if value == no_data else value for value in row])
+            tables.append(OrderedDict([
+                ('caption', table['caption']),
+                ('header', table['header']),
+                ('ids', table['ids']),
+                ('values', values)]))
+        return OrderedDict([('zones', zones), ('tables', tables)])
@@ -25,10 +25,13 @@ import numpy
 from qgis.core import (
     QgsVectorLayer,
     QgsCoordinateReferenceSystem,
-    QgsMapLayerRegistry)
+    QgsMapLayerRegistry,
+    QgsFeature,
+    QgsGeometry)
 
 from safe.gis.qgis_vector_tools import extent_to_geo_array
 from safe.defaults import get_defaults
+from safe.storage.projection import DEFAULT_PROJECTION
 from safe.storage.raster import Raster
 from safe.storage.vector import Vector
 from safe.test.utilities import (
@@ -595,6 +598,92 @@ class AggregatorTest(unittest.TestCase):
             expected_results,
             impact_layer_attributes=impact_layer_attributes)
 
+    def _aggregate_small_line_impact(self, statistics_type, target_field):
+        """Helper to aggregate two lines in two adjacent squares.
+
+        The first line crosses both squares with 0.005 degrees in each, the
+        second line has 0.002 degrees in the first square only.
+
+        :returns: The aggregator and its aggregation values by square name.
+        :rtype: (Aggregator, dict)
+        """
+        aggregator = self._create_aggregator(False, False)
+        aggregator.target_field = target_field
+        aggregator.statistics_type = statistics_type
+        aggregator.statistics_classes = ['High', 'Low']
+        field_names = [
+            aggregator.sum_field_name(),
+            aggregator._aggregation_field_name('High'),
+            aggregator._aggregation_field_name('Low')]
+
+        layer = QgsVectorLayer(
+            'Polygon?crs=EPSG:4326&field=KAB_NAME:string' + ''.join(
+                '&field=%s:double' % name for name in field_names),
+            'squares',
+            'memory')
+        features = []
+        for name, west in [('West', 106.80), ('East', 106.81)]:
+            feature = QgsFeature(layer.pendingFields())
+            feature.setGeometry(QgsGeometry.fromWkt(
+                'POLYGON((%f -6.2, %f -6.2, %f -6.19, %f -6.19, %f -6.2))' % (
+                    west, west + 0.01, west + 0.01, west, west)))
+            feature.setAttributes([name, 0.0, 0.0, 0.0])
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        aggregator.layer = layer
+
+        impact_layer = Vector(
+            data=[
+                {target_field: 'High' if statistics_type != 'sum' else 1},
+                {target_field: 'Low' if statistics_type != 'sum' else 0}],
+            projection=DEFAULT_PROJECTION,
+            geometry=[
+                [[106.805, -6.195], [106.815, -6.195]],
+                [[106.801, -6.197], [106.803, -6.197]]],
+            geometry_type='line',
+            name='small line impact')
+        aggregator._aggregate_line_impact(impact_layer)
+
+        values = {}
+        for feature in layer.getFeatures():
+            attributes = feature.attributes()
+            values[attributes[0]] = dict(zip(field_names, attributes[1:]))
+        return aggregator, values
+
+    def test_line_aggregation_sum(self):
+        """Test impacted line lengths are summed per polygon."""
+        aggregator, values = self._aggregate_small_line_impact(
+            'sum', 'flooded')
+        sum_field = aggregator.sum_field_name()
+        # 0.005 degrees along the parallel at 6.195 S
+        expected_length = 553.3
+        numpy.testing.assert_allclose(
+            values['West'][sum_field], expected_length, rtol=0.01)
+        numpy.testing.assert_allclose(
+            values['East'][sum_field], expected_length, rtol=0.01)
+
+        # The attributes of each line piece are kept by polygon
+        self.assertEqual(
+            [len(pieces) for pieces in aggregator.impact_layer_attributes],
+            [2, 1])
+
+    def test_line_aggregation_class_count(self):
+        """Test line lengths are summed per polygon and class."""
+        aggregator, values = self._aggregate_small_line_impact(
+            'class_count', 'hazard')
+        high_field = aggregator._aggregation_field_name('High')
+        low_field = aggregator._aggregation_field_name('Low')
+        expected_length = 553.3
+        numpy.testing.assert_allclose(
+            values['West'][high_field], expected_length, rtol=0.01)
+        numpy.testing.assert_allclose(
+            values['East'][high_field], expected_length, rtol=0.01)
+        numpy.testing.assert_allclose(
+            values['West'][low_field],
+            0.4 * values['West'][high_field],
+            rtol=0.001)
+        self.assertEqual(values['East'][low_field], 0)
+
     def test_set_layers(self):
         """
         Test set up aggregator's layers work
@@ -11,6 +11,7 @@ __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
 import logging
+import numpy
 
 from safe.common.utilities import OrderedDict
 
@@ -48,6 +49,7 @@ class AbstractPostprocessor(object):
         AbstractPostprocessor.__init__(self)
         """
         self._results = None
+        self.zone_errors = []
 
     def description(self):
         """
@@ -125,6 +127,102 @@ class AbstractPostprocessor(object):
         """
         return self._results
 
+    def process_zones(self, params, columns, zone_count):
+        """Run the postprocessor for all aggregation zones at once.
+
+        This default implementation calls setup, process, results and clear
+        once per zone. Postprocessors that can work on whole columns should
+        override it.
+
+        Args:
+            * params: Dict of parameters shared by all zones
+            * columns: Dict of parameters that differ per zone. Each value
+                is a sequence (usually a numpy array) with one element per
+                zone. They take precedence over params.
+            * zone_count: int the number of zones
+        Returns:
+            Tuple (results, valid) where results is an Odict mapping each
+            indicator name to a dict with 'values' (a list with one formatted
+            value per zone) and 'metadata', and valid is a boolean array
+            that is False for zones the postprocessor could not handle.
+            The reasons are listed in self.zone_errors.
+        Raises:
+            None
+        """
+        self.zone_errors = []
+        results = OrderedDict()
+        valid = numpy.zeros(zone_count, dtype=numpy.bool)
+        for i in xrange(zone_count):
+            zone_params = dict(params)
+            for key, values in columns.iteritems():
+                zone_params[key] = values[i]
+            try:
+                self.setup(zone_params)
+                self.process()
+                zone_results = self.results()
+            except PostProcessorError as e:
+                self.zone_errors.append(str(e))
+                continue
+            finally:
+                self.clear()
+
+            valid[i] = True
+            for name, result in zone_results.iteritems():
+                if name not in results:
+                    results[name] = {
+                        'values': [self.NO_DATA_TEXT] * zone_count,
+                        'metadata': result['metadata']}
+                results[name]['values'][i] = result['value']
+        return results, valid
+
+    def _append_column(self, results, name, values, metadata=None):
+        """add an indicator column to the results of process_zones.
+
+        internal method to be used by postprocessors that override
+        process_zones. Values are rounded and formatted like
+        _append_result does, non finite values become NO_DATA_TEXT.
+
+        Args:
+            * results: Odict the results being built
+            * name: str the name of the indicator
+            * values: numpy array of values, one per zone
+            * metadata Dict of metadata
+        Returns:
+            None
+        Raises:
+            None
+        """
+        if metadata is None:
+            metadata = dict()
+        values = numpy.asarray(values, dtype=numpy.float)
+        finite = numpy.isfinite(values).tolist()
+        rounded = self._round(numpy.where(finite, values, 0)).tolist()
+        column = []
+        for value, is_finite in zip(rounded, finite):
+            if is_finite:
+                column.append(format_int(int(value)))
+            else:
+                column.append(self.NO_DATA_TEXT)
+        results[name] = {'values': column,
+                         'metadata': metadata}
+
+    @staticmethod
+    def _round(values):
+        """round values half away from zero like the builtin round.
+
+        numpy.round rounds halves to even, which would make process_zones
+        disagree with the per zone process results on odd totals.
+
+        Args:
+            * values: numpy array of values
+        Returns:
+            numpy array of the rounded values
+        Raises:
+            None
+        """
+        values = numpy.asarray(values, dtype=numpy.float)
+        return numpy.sign(values) * numpy.floor(numpy.abs(values) + 0.5)
+
     def _raise_error(self, message=None):
         """internal method to be used by the postprocessors to raise an error
 
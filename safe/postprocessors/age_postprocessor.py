@@ -11,7 +11,9 @@ __license__ = "GPL"
 __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
+import numpy
 
+from safe.common.utilities import OrderedDict
 from safe.defaults import get_defaults
 from safe.postprocessors.abstract_postprocessor import AbstractPostprocessor
 
@@ -103,6 +105,64 @@ class AgePostprocessor(AbstractPostprocessor):
         AbstractPostprocessor.clear(self)
         self.impact_total = None
 
+    def process_zones(self, params, columns, zone_count):
+        """Calculate all indicators for all zones at once.
+
+        :param params: Parameters shared by all zones.
+        :type params: dict
+
+        :param columns: Per zone arrays, needs impact_total and optionally
+            youth_ratio, adult_ratio and elderly_ratio.
+        :type columns: dict
+
+        :param zone_count: The number of zones.
+        :type zone_count: int
+
+        :returns: Tuple (results, valid), see
+            AbstractPostprocessor.process_zones.
+        :rtype: tuple
+        """
+        del params
+        self.zone_errors = []
+        impact_total = numpy.asarray(
+            columns['impact_total'], dtype=numpy.float)
+        ratios = []
+        for key, default_key in [('youth_ratio', 'YOUTH_RATIO'),
+                                 ('adult_ratio', 'ADULT_RATIO'),
+                                 ('elderly_ratio', 'ELDERLY_RATIO')]:
+            try:
+                ratio = columns[key]
+            except KeyError:
+                ratio = get_defaults(default_key)
+            ratios.append(
+                numpy.asarray(ratio, dtype=numpy.float) *
+                numpy.ones(zone_count))
+        youth_ratio, adult_ratio, elderly_ratio = ratios
+
+        ratios_total = youth_ratio + adult_ratio + elderly_ratio
+        valid = ~(ratios_total > 1)
+        for i in numpy.nonzero(~valid)[0]:
+            self.zone_errors.append(
+                'Age ratios should sum up to 1. Found: '
+                '%s + %s + %s = %s ' % (
+                    youth_ratio[i],
+                    adult_ratio[i],
+                    elderly_ratio[i],
+                    ratios_total[i]))
+
+        # FIXME (MB) Shameless hack to deal with issue #368
+        elderly = impact_total * elderly_ratio
+        elderly[(impact_total > 8000000000) | (impact_total < 0)] = numpy.nan
+
+        results = OrderedDict()
+        self._append_column(results, tr('Total'), impact_total)
+        self._append_column(
+            results, tr('Youth count (affected)'), impact_total * youth_ratio)
+        self._append_column(
+            results, tr('Adult count (affected)'), impact_total * adult_ratio)
+        self._append_column(results, tr('Elderly count (affected)'), elderly)
+        return results, valid
+
     def _calculate_total(self):
         """Indicator that shows total population.
 
@@ -10,6 +10,9 @@ __license__ = "GPL"
 __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
+import numpy
+
+from safe.common.utilities import OrderedDict
 from safe.postprocessors.abstract_postprocessor import AbstractPostprocessor
 from safe.utilities.i18n import tr
 
@@ -99,6 +102,50 @@ class GenderPostprocessor(AbstractPostprocessor):
         self.impact_total = None
         self.female_ratio = None
 
+    def process_zones(self, params, columns, zone_count):
+        """concrete implementation that calculates all indicators for all
+        zones at once
+
+        Args:
+            * params: Dict of parameters shared by all zones
+            * columns: Dict of per zone arrays, needs impact_total and
+                female_ratio
+            * zone_count: int the number of zones
+        Returns:
+            Tuple (results, valid), see AbstractPostprocessor.process_zones
+        Raises:
+            None
+        """
+        del params
+        self.zone_errors = []
+        impact_total = numpy.asarray(
+            columns['impact_total'], dtype=numpy.float)
+        female_ratio = numpy.asarray(
+            columns['female_ratio'], dtype=numpy.float) * numpy.ones(
+            zone_count)
+        valid = ~(female_ratio > 1)
+        for ratio in numpy.unique(female_ratio[~valid]):
+            self.zone_errors.append(
+                'Female ratio should be lower max 1. Found: %s ' % ratio)
+
+        females = impact_total * female_ratio
+        results = OrderedDict()
+        self._append_column(results, tr('Total'), impact_total)
+        self._append_column(
+            results, tr('Female count (affected)'), females)
+        self._append_column(
+            results,
+            tr('Weekly hygiene packs'),
+            females * 0.7937 * (7 / 7),
+            {'description': 'Females hygiene packs for weekly use'})
+        self._append_column(
+            results,
+            tr('Additional weekly rice kg for pregnant and lactating women'),
+            females * 2 * 0.033782 + females * 2 * 0.01281,
+            {'description': 'Additional rice kg per week for pregnant and '
+                            'lactating women'})
+        return results, valid
+
     def _calculate_total(self):
         """Total population indicator.
 
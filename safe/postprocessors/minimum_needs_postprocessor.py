@@ -11,7 +11,9 @@ __license__ = "GPL"
 __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
+import numpy
 
+from safe.common.utilities import OrderedDict
 from safe.postprocessors.abstract_postprocessor import AbstractPostprocessor
 
 
@@ -76,6 +78,39 @@ class MinimumNeedsPostprocessor(AbstractPostprocessor):
         self.impact_total = None
         self.minimum_needs = None
 
+    def process_zones(self, params, columns, zone_count):
+        """Aggregate minimum needs for all zones at once.
+
+        :param params: Parameters shared by all zones, needs function_params.
+        :type params: dict
+
+        :param columns: Per zone arrays, needs impact_total.
+        :type columns: dict
+
+        :param zone_count: The number of zones.
+        :type zone_count: int
+
+        :returns: Tuple (results, valid), see
+            AbstractPostprocessor.process_zones.
+        :rtype: tuple
+        """
+        self.zone_errors = []
+        minimum_needs = params['function_params']['minimum needs']
+        impact_total = self._round(columns['impact_total'])
+
+        results = OrderedDict()
+        for resource in minimum_needs:
+            if resource.unit.abbreviation:
+                need = "%s [%s]" % (resource.name, resource.unit.abbreviation)
+            else:
+                need = resource.name
+            try:
+                value = float(resource.value)
+            except (ValueError, TypeError):
+                value = numpy.nan
+            self._append_column(results, need, value * impact_total)
+        return results, numpy.ones(zone_count, dtype=numpy.bool)
+
     def _calculate_needs(self):
         """Indicator that shows aggregated minimum needs.
 
@@ -11,6 +11,7 @@ __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
 import unittest
+import numpy
 
 from safe.common.exceptions import PostProcessorError
 from safe.postprocessors.gender_postprocessor import GenderPostprocessor
@@ -53,6 +54,36 @@ class TestGenderPostprocessor(unittest.TestCase):
         key = 'Additional weekly rice kg for pregnant and lactating women'
         assert results[key]['value'] == '6,960'
 
+    def test_process_zones(self):
+        columns = {'impact_total': numpy.array([146458, numpy.nan, 10]),
+                   'female_ratio': numpy.array([0.51, 0.51, 1.1])}
+        results, valid = POSTPROCESSOR.process_zones({}, columns, 3)
+        assert valid.tolist() == [True, True, False]
+        assert len(POSTPROCESSOR.zone_errors) == 1
+        values = results['Female count (affected)']['values']
+        assert values[0] == '74,694'
+        assert values[1] == POSTPROCESSOR.NO_DATA_TEXT
+        assert results['Weekly hygiene packs']['values'][0] == '59,284'
+        key = 'Additional weekly rice kg for pregnant and lactating women'
+        assert results[key]['values'][0] == '6,960'
+
+    def test_process_zones_matches_process(self):
+        """Test process_zones rounds odd totals like process does."""
+        impact_totals = [1, 3, 5, 146459]
+        columns = {'impact_total': numpy.array(impact_totals),
+                   'female_ratio': numpy.array([0.5] * len(impact_totals))}
+        zone_results, _ = POSTPROCESSOR.process_zones(
+            {}, columns, len(impact_totals))
+
+        for i, impact_total in enumerate(impact_totals):
+            POSTPROCESSOR.clear()
+            POSTPROCESSOR.setup(
+                {'impact_total': impact_total, 'female_ratio': 0.5})
+            POSTPROCESSOR.process()
+            for name, result in POSTPROCESSOR.results().iteritems():
+                self.assertEqual(
+                    zone_results[name]['values'][i], result['value'])
+
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(TestGenderPostprocessor, 'test')
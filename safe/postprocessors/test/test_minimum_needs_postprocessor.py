@@ -11,6 +11,7 @@ __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
 import unittest
+import numpy
 
 from safe.postprocessors.minimum_needs_postprocessor import \
     MinimumNeedsPostprocessor
@@ -45,6 +46,26 @@ class TestMinimumNeedsPostprocessor(unittest.TestCase):
         assert results['Family Kits']['value'] == '29,292'
         assert results['Toilets']['value'] == '7,323'
 
+    def test_process_zones_matches_process(self):
+        """Test process_zones rounds odd totals like process does."""
+        minimum_needs = default_minimum_needs()
+        impact_totals = [0.5, 1.5, 2.5, 146458.5, 7]
+        columns = {'impact_total': numpy.array(impact_totals)}
+        zone_results, _ = POSTPROCESSOR.process_zones(
+            {'function_params': {'minimum needs': minimum_needs}},
+            columns,
+            len(impact_totals))
+
+        for i, impact_total in enumerate(impact_totals):
+            POSTPROCESSOR.clear()
+            POSTPROCESSOR.setup({
+                'impact_total': impact_total,
+                'function_params': {'minimum needs': minimum_needs}})
+            POSTPROCESSOR.process()
+            for name, result in POSTPROCESSOR.results().iteritems():
+                self.assertEqual(
+                    zone_results[name]['values'][i], result['value'])
+
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(TestMinimumNeedsPostprocessor, 'test')
@@ -20,8 +20,9 @@ __date__ = '10/01/2011'
 __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
-import time
 import logging
+import hashlib
+from collections import OrderedDict
 
 # noinspection PyPackageRequirements
 from PyQt4 import QtCore, QtGui, QtWebKit
@@ -35,6 +36,47 @@ from safe.common.utilities import unique_filename, temp_dir
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Seconds to wait for WebKit to load a page.
+LOAD_TIMEOUT = 20
+
+# Number of images kept by html_to_image.
+IMAGE_CACHE_SIZE = 32
+
+# One web view is kept per process, creating a WebKit page is expensive.
+_WEB_VIEW = None
+_DEFAULT_VIEWPORT_SIZE = None
+
+# Rendered images keyed by (html hash, width in mm, dpi), oldest first.
+_IMAGE_CACHE = OrderedDict()
+
+
+def _shared_web_view():
+    """Get the web view shared by all renderers of this process.
+
+    The view is reset to the viewport size of a new view so that pages are
+    laid out the same way as in a fresh view.
+
+    :returns: The shared web view.
+    :rtype: QWebView
+    """
+    global _WEB_VIEW, _DEFAULT_VIEWPORT_SIZE  # pylint: disable=W0603
+    if _WEB_VIEW is None:
+        _WEB_VIEW = QtWebKit.QWebView()
+        frame = _WEB_VIEW.page().mainFrame()
+        frame.setScrollBarPolicy(
+            QtCore.Qt.Vertical, QtCore.Qt.ScrollBarAlwaysOff)
+        frame.setScrollBarPolicy(
+            QtCore.Qt.Horizontal, QtCore.Qt.ScrollBarAlwaysOff)
+        _DEFAULT_VIEWPORT_SIZE = _WEB_VIEW.page().viewportSize()
+    else:
+        _WEB_VIEW.page().setViewportSize(_DEFAULT_VIEWPORT_SIZE)
+    return _WEB_VIEW
+
+
+def clear_image_cache():
+    """Forget the images rendered by html_to_image."""
+    _IMAGE_CACHE.clear()
+
 
 class HtmlRenderer():
     """A class for creating a map."""
@@ -50,6 +92,7 @@ class HtmlRenderer():
         # Need to keep state here for loadCompleted signals
         self.web_view = None
         self.html_loaded_flag = False
+        self._load_finished = False
         self.printer = None
 
     # noinspection PyMethodMayBeStatic
@@ -82,8 +125,20 @@ class HtmlRenderer():
         """
         LOGGER.debug('InaSAFE Map renderHtmlToImage called')
 
+        full_html = self._full_html(html_snippet=html)
+        data = full_html
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        key = (hashlib.sha1(data).hexdigest(), width_mm, self.page_dpi)
+        if key in _IMAGE_CACHE:
+            # QImage is implicitly shared, painting on the returned image
+            # does not change the cached one.
+            image = _IMAGE_CACHE.pop(key)
+            _IMAGE_CACHE[key] = image
+            return image
+
         width_px = mm_to_points(width_mm, self.page_dpi)
-        self.load_and_wait(html_snippet=html)
+        self.load_and_wait(html=full_html)
         frame = self.web_view.page().mainFrame()
 
         # Using 150dpi as the baseline, work out a standard text size
@@ -108,6 +163,10 @@ class HtmlRenderer():
         frame.render(painter)
         painter.end()
 
+        if self.html_loaded_flag:
+            _IMAGE_CACHE[key] = image
+            while len(_IMAGE_CACHE) > IMAGE_CACHE_SIZE:
+                _IMAGE_CACHE.popitem(last=False)
         return image
 
     def to_pdf(self, html, filename=None):
@@ -142,9 +201,34 @@ class HtmlRenderer():
 
         return html_pdf_path
 
-    def load_and_wait(self, html_path=None, html_snippet=None):
+    @staticmethod
+    def _full_html(html_path=None, html_snippet=None):
+        """Get the html document to render.
+
+        :param html_path: The path to an html document (file).
+        :type html_path: str
+
+        :param html_snippet: Some html that will be 'topped and tailed' with
+            the standard header and footer.
+        :type html_snippet: str
+
+        :returns: The html document.
+        :rtype: str
+        """
+        if html_snippet:
+            header = html_header()
+            footer = html_footer()
+            return header + html_snippet + footer
+        with open(html_path) as html_file:
+            return html_file.read()
+
+    def load_and_wait(self, html_path=None, html_snippet=None, html=None):
         """Load some html to a web view and wait till it is done.
 
+        The web view is shared by all renderers of the process. Instead of
+        polling, a local event loop runs until WebKit signals that the page
+        is loaded or LOAD_TIMEOUT seconds have passed.
+
         :param html_path: The path to an html document (file). This option
             is mutually exclusive to html_snippet.
         :type html_path: str
@@ -153,42 +237,44 @@ class HtmlRenderer():
             string. It will be 'topped and tailed' with with standard header
             and footer. This option is mutually exclusive to html_path.
         :type html_snippet: str
+
+        :param html: A complete html document, used as is.
+        :type html: str
         """
-        if html_snippet:
-            header = html_header()
-            footer = html_footer()
-            html = header + html_snippet + footer
-        else:
-            with open(html_path) as html_file:
-                html = html_file.read()
+        if html is None:
+            html = self._full_html(html_path, html_snippet)
 
-        self.web_view = QtWebKit.QWebView()
-        frame = self.web_view.page().mainFrame()
-        frame.setScrollBarPolicy(
-            QtCore.Qt.Vertical, QtCore.Qt.ScrollBarAlwaysOff)
-        frame.setScrollBarPolicy(
-            QtCore.Qt.Horizontal, QtCore.Qt.ScrollBarAlwaysOff)
+        self.web_view = _shared_web_view()
 
-        # noinspection PyUnresolvedReferences
         self.html_loaded_flag = False
-        self.web_view.loadFinished.connect(self.html_loaded_slot)
-        self.web_view.setHtml(html)
-        my_counter = 0
-        my_sleep_period = 0.1  # sec
-        my_timeout = 20  # sec
-        while not self.html_loaded_flag and my_counter < my_timeout:
-            # Block until the event loop is done printing the page
-            my_counter += my_sleep_period
-            time.sleep(my_sleep_period)
-            # noinspection PyArgumentList
-            QtCore.QCoreApplication.processEvents()
+        self._load_finished = False
+        event_loop = QtCore.QEventLoop()
+        timer = QtCore.QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(event_loop.quit)
+
+        def load_finished(ok):
+            """Record the outcome and stop waiting."""
+            self._load_finished = True
+            self.html_loaded_slot(ok)
+            event_loop.quit()
+
+        # noinspection PyUnresolvedReferences
+        self.web_view.loadFinished.connect(load_finished)
+        try:
+            self.web_view.setHtml(html)
+            # loadFinished may have been emitted by setHtml already.
+            if not self._load_finished:
+                timer.start(LOAD_TIMEOUT * 1000)
+                event_loop.exec_()
+        finally:
+            timer.stop()
+            # noinspection PyUnresolvedReferences
+            self.web_view.loadFinished.disconnect(load_finished)
 
         if not self.html_loaded_flag:
             LOGGER.error('Failed to load html')
 
-        # noinspection PyUnresolvedReferences
-        self.web_view.loadFinished.disconnect(self.html_loaded_slot)
-
     def html_loaded_slot(self, ok):
         """Slot called when the page is loaded.
 
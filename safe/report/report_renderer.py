@@ -0,0 +1,376 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+ **Report page renderer.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+Render the pages of a composer report (e.g. one page per aggregation area of
+an atlas) either in this process or spread over a pool of headless QGIS
+worker processes.
+
+A report is described by plain data so it can be handed to a worker:
+
+* ``base`` - what all pages share: the template path, the substitution map,
+  the layers (see :func:`layer_spec`), pictures, legends, the id of the map
+  item and its grid interval.
+* ``pages`` - what changes from page to page: the map extent, label texts,
+  html frame urls and the PDF and/or PNG output paths.
+
+Each worker loads the layers and the template once and then only updates the
+per page items before exporting, the same way an atlas does.
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import os
+import sys
+import json
+import logging
+import multiprocessing
+from subprocess import PIPE
+
+# noinspection PyUnresolvedReferences
+from qgis.core import (
+    QgsApplication,
+    QgsMapLayer,
+    QgsMapLayerRegistry,
+    QgsMapSettings,
+    QgsRasterLayer,
+    QgsRectangle,
+    QgsVectorLayer)
+# noinspection PyPackageRequirements
+from PyQt4.QtCore import QUrl
+
+from safe.common.exceptions import ReportCreationError
+from safe.common.utilities import temp_dir, unique_filename
+from safe.report.template_composition import TemplateComposition
+from safe.utilities.gis import qgis_version
+from safe.utilities.i18n import tr
+from safe.utilities.worker import start_worker
+
+LOGGER = logging.getLogger('InaSAFE')
+
+# Upper bound of the number of worker processes.
+MAX_WORKERS = 4
+
+# Below this number of pages starting workers costs more than it saves.
+MIN_PAGES_PER_POOL = 4
+
+# Resolution of PNG exports when the page does not give one.
+DEFAULT_DPI = 300
+
+
+def default_worker_count():
+    """Number of worker processes to use when none is given.
+
+    :returns: The number of CPUs, capped by MAX_WORKERS.
+    :rtype: int
+    """
+    try:
+        return min(multiprocessing.cpu_count(), MAX_WORKERS)
+    except NotImplementedError:
+        return 1
+
+
+def split_pages(pages, workers):
+    """Distribute pages over workers.
+
+    Pages are dealt round robin so that each worker gets a similar mix of
+    small and large areas.
+
+    :param pages: Page specifications.
+    :type pages: list
+
+    :param workers: Number of workers.
+    :type workers: int
+
+    :returns: One non empty list of pages per worker.
+    :rtype: list
+    """
+    chunks = [pages[index::workers] for index in range(workers)]
+    return [chunk for chunk in chunks if chunk]
+
+
+def layer_spec(layer):
+    """Describe a map layer so that a worker process can load it.
+
+    The current style of the layer is saved to a QML file next to the other
+    temporary report files.
+
+    :param layer: A raster or vector layer.
+    :type layer: QgsMapLayer
+
+    :returns: The layer id, name, source, provider, type and style path.
+    :rtype: dict
+    """
+    style_path = unique_filename(
+        prefix='report_style', suffix='.qml', dir=temp_dir('reports'))
+    layer.saveNamedStyle(style_path)
+    return {
+        'id': layer.id(),
+        'name': layer.name(),
+        'source': layer.source(),
+        'provider': layer.providerType(),
+        'raster': layer.type() == QgsMapLayer.RasterLayer,
+        'style': style_path}
+
+
+def load_layer(spec):
+    """Get the layer described by a layer specification.
+
+    The registered layer is used when it exists (i.e. when rendering in the
+    process that made the specification), otherwise it is loaded from its
+    source and registered.
+
+    :param spec: Layer specification made by layer_spec.
+    :type spec: dict
+
+    :returns: The layer.
+    :rtype: QgsMapLayer
+
+    :raises: ReportCreationError if the layer can not be loaded.
+    """
+    registry = QgsMapLayerRegistry.instance()
+    layer = registry.mapLayer(spec['id'])
+    if layer is not None:
+        return layer
+    if spec['raster']:
+        layer = QgsRasterLayer(spec['source'], spec['name'], spec['provider'])
+    else:
+        layer = QgsVectorLayer(spec['source'], spec['name'], spec['provider'])
+    if not layer.isValid():
+        message = tr('Layer %s could not be loaded from %s') % (
+            spec['name'], spec['source'])
+        raise ReportCreationError(message)
+    layer.loadNamedStyle(spec['style'])
+    registry.addMapLayer(layer, False)
+    return layer
+
+
+def build_composition(base, layers):
+    """Make the composition shared by all pages of a report.
+
+    :param base: Report specification, see the module documentation.
+    :type base: dict
+
+    :param layers: Layers of the map, in drawing order.
+    :type layers: list
+
+    :returns: The composition with everything but the page items set.
+    :rtype: QgsComposition
+    """
+    layer_ids = [layer.id() for layer in layers]
+    map_settings = QgsMapSettings()
+    map_settings.setLayers(layer_ids)
+
+    template_composition = TemplateComposition(
+        base['template'], map_settings)
+    template_composition.substitution = base.get('substitution', {})
+    template_composition.load_template()
+    composition = template_composition.composition
+
+    for item_id, picture_path in base.get('pictures', {}).items():
+        picture = composition.getComposerItemById(item_id)
+        if picture is None:
+            continue
+        if qgis_version() < 20600:
+            picture.setPictureFile(picture_path)
+        else:
+            picture.setPicturePath(picture_path)
+
+    for item_id in base.get('legends', []):
+        legend = composition.getComposerItemById(item_id)
+        if legend is None:
+            continue
+        if qgis_version() < 20600:
+            legend.model().setLayerSet(layer_ids)
+        else:
+            root_group = legend.modelV2().rootGroup()
+            for layer in layers:
+                root_group.addLayer(layer)
+        legend.synchronizeWithModel()
+
+    grid_interval = base.get('grid_interval')
+    if grid_interval:
+        composer_map = composition.getComposerItemById(base['map_id'])
+        composer_map.setGridIntervalX(grid_interval[0])
+        composer_map.setGridIntervalY(grid_interval[1])
+    return composition
+
+
+def render_page(composition, base, page):
+    """Update the page items of a composition and export it.
+
+    :param composition: Composition made by build_composition.
+    :type composition: QgsComposition
+
+    :param base: Report specification, see the module documentation.
+    :type base: dict
+
+    :param page: Page specification, see the module documentation.
+    :type page: dict
+
+    :returns: Paths of the files written.
+    :rtype: list
+    """
+    extent = page.get('extent')
+    if extent:
+        composer_map = composition.getComposerItemById(base['map_id'])
+        # noinspection PyCallingNonCallable
+        composer_map.setNewExtent(QgsRectangle(*extent))
+
+    for item_id, text in page.get('labels', {}).items():
+        composition.getComposerItemById(item_id).setText(text)
+
+    for item_id, html_path in page.get('html', {}).items():
+        html_item = composition.getComposerItemById(item_id)
+        html_frame = composition.getComposerHtmlByItem(html_item)
+        # noinspection PyArgumentList
+        html_frame.setUrl(QUrl.fromLocalFile(html_path))
+
+    outputs = []
+    if page.get('pdf'):
+        composition.exportAsPDF(page['pdf'])
+        outputs.append(page['pdf'])
+    if page.get('png'):
+        composition.setPrintResolution(page.get('dpi', DEFAULT_DPI))
+        image = composition.printPageAsRaster(0)
+        image.save(page['png'])
+        outputs.append(page['png'])
+    return outputs
+
+
+class ReportRenderer(object):
+    """Render report pages in this process or in worker processes."""
+
+    def __init__(self, workers=None):
+        """Constructor.
+
+        :param workers: Number of worker processes, 0 or None to use
+            default_worker_count and 1 to always render in this process.
+        :type workers: int
+        """
+        if not workers:
+            workers = default_worker_count()
+        self.workers = workers
+
+    def render(self, base, pages, composition=None):
+        """Render the pages of a report.
+
+        :param base: Report specification, see the module documentation.
+        :type base: dict
+
+        :param pages: Page specifications.
+        :type pages: list
+
+        :param composition: Composition to reuse when rendering in this
+            process, built from base if None.
+        :type composition: QgsComposition
+
+        :returns: Paths of the files written.
+        :rtype: list
+        """
+        if self.workers > 1 and len(pages) >= MIN_PAGES_PER_POOL:
+            try:
+                return self.render_in_pool(base, pages)
+            except (OSError, ReportCreationError):
+                LOGGER.exception(
+                    'Report workers failed, rendering in this process.')
+
+        if composition is None:
+            layers = [load_layer(spec) for spec in base['layers']]
+            composition = build_composition(base, layers)
+        outputs = []
+        for page in pages:
+            outputs.extend(render_page(composition, base, page))
+        return outputs
+
+    def render_in_pool(self, base, pages):
+        """Render the pages in concurrent worker processes.
+
+        :param base: Report specification, see the module documentation.
+        :type base: dict
+
+        :param pages: Page specifications.
+        :type pages: list
+
+        :returns: Paths of the files written.
+        :rtype: list
+
+        :raises: ReportCreationError if a worker fails.
+        """
+        workers = []
+        for chunk in split_pages(pages, self.workers):
+            job_path = unique_filename(
+                prefix='report_job', suffix='.json', dir=temp_dir('reports'))
+            with open(job_path, 'w') as job_file:
+                json.dump({'base': base, 'pages': chunk}, job_file)
+            process = start_worker(
+                'safe.report.report_renderer', [job_path],
+                stdout=PIPE, stderr=PIPE)
+            workers.append((process, job_path))
+
+        outputs = []
+        errors = []
+        for process, job_path in workers:
+            output, error = process.communicate()
+            os.remove(job_path)
+            if process.returncode:
+                errors.append(error)
+                continue
+            try:
+                outputs.extend(json.loads(output))
+            except ValueError:
+                # Something else was printed to stdout by the worker
+                errors.append(tr('Unexpected worker output: %s') % output)
+        if errors:
+            message = tr('Report rendering failed: %s') % '\n'.join(errors)
+            raise ReportCreationError(message)
+        return outputs
+
+
+def main(job_path):
+    """Worker entry point: render the pages of a job file.
+
+    The list of files written is printed to stdout as JSON.
+
+    :param job_path: Path of the JSON job written by ReportRenderer.
+    :type job_path: str
+    """
+    # Anything else printed while rendering goes to stderr, so that stdout
+    # only holds the JSON list.
+    result_file = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    # Only ask for a display when there is one, e.g. not on a CI server.
+    gui_flag = sys.platform != 'linux2' or bool(os.environ.get('DISPLAY'))
+    application = QgsApplication([], gui_flag)
+    application.initQgis()
+    try:
+        with open(job_path) as job_file:
+            job = json.load(job_file)
+        base = job['base']
+        layers = [load_layer(spec) for spec in base['layers']]
+        composition = build_composition(base, layers)
+        outputs = []
+        for page in job['pages']:
+            outputs.extend(render_page(composition, base, page))
+        result_file.write(json.dumps(outputs))
+        result_file.close()
+    finally:
+        application.exitQgis()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -16,6 +16,8 @@ __date__ = '21/03/2014'
 __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
+import os
+
 # noinspection PyUnresolvedReferences
 from qgis.core import QgsComposition, QgsMapSettings
 from PyQt4 import QtCore, QtXml
@@ -23,6 +25,48 @@ from PyQt4 import QtCore, QtXml
 from safe.utilities.i18n import tr
 from safe.common.exceptions import TemplateLoadingError
 
+# Raw template content keyed by (path, modification time). QgsComposition
+# changes the document it loads from (e.g. it strips the item uuids), so a
+# new document is parsed from the content for every composition.
+_TEMPLATE_CACHE = {}
+
+
+def template_content(template_path):
+    """Read a composer template, once per template version.
+
+    :param template_path: Path to the .qpt template.
+    :type template_path: str
+
+    :returns: The raw template content.
+    :rtype: QByteArray
+    """
+    try:
+        modified = os.path.getmtime(template_path)
+    except (OSError, TypeError):
+        modified = None
+    key = (template_path, modified)
+    if key not in _TEMPLATE_CACHE:
+        template_file = QtCore.QFile(template_path)
+        template_file.open(
+            QtCore.QIODevice.ReadOnly | QtCore.QIODevice.Text)
+        _TEMPLATE_CACHE[key] = template_file.readAll()
+        template_file.close()
+    return _TEMPLATE_CACHE[key]
+
+
+def template_document(template_path):
+    """Parse a composer template into a new document.
+
+    :param template_path: Path to the .qpt template.
+    :type template_path: str
+
+    :returns: A dom document containing the template content.
+    :rtype: QDomDocument
+    """
+    document = QtXml.QDomDocument()
+    document.setContent(template_content(template_path))
+    return document
+
 
 class TemplateComposition(object):
     """Class for handling composition using specific template.
@@ -97,11 +141,9 @@ class TemplateComposition(object):
         self._component_ids = component_ids
         # Set missing_elements every time we set component_ids
         missing_elements = []
-        template_file = QtCore.QFile(self.template_path)
-        template_file.open(QtCore.QIODevice.ReadOnly | QtCore.QIODevice.Text)
-        template_content = template_file.readAll()
+        content = template_content(self.template_path)
         for component_id in self.component_ids:
-            if component_id not in template_content:
+            if component_id not in content:
                 missing_elements.append(component_id)
         self._missing_elements = missing_elements
 
@@ -163,14 +205,7 @@ class TemplateComposition(object):
 
         :raises: LoadingTemplateError
         """
-        template_file = QtCore.QFile(self.template_path)
-        template_file.open(QtCore.QIODevice.ReadOnly | QtCore.QIODevice.Text)
-        template_content = template_file.readAll()
-        template_file.close()
-
-        # Create a dom document containing template content
-        document = QtXml.QDomDocument()
-        document.setContent(template_content)
+        document = template_document(self.template_path)
 
         # Load template
         load_status = self.composition.loadFromTemplate(
@@ -24,7 +24,7 @@ import logging
 from safe.common.utilities import temp_dir, unique_filename
 from safe.test.utilities import (
     load_layer, check_images, get_qgis_app)
-from safe.report.html_renderer import HtmlRenderer
+from safe.report.html_renderer import HtmlRenderer, clear_image_cache
 from safe.utilities.keyword_io import KeywordIO
 from safe.test.utilities import test_data_path
 
@@ -153,6 +153,24 @@ class HtmlRendererTest(unittest.TestCase):
             'render_html_to_image', path, tolerance)
         self.assertTrue(flag, message + '\n' + path)
 
+    def test_render_html_to_image_cache(self):
+        """Test that rendering the same html twice reuses the image."""
+        clear_image_cache()
+        html = self.sample_html(5)
+        renderer = HtmlRenderer(100)
+        first = renderer.html_to_image(html, 150)
+        self.assertTrue(renderer.html_loaded_flag)
+
+        # A new renderer shares the cache and the web view
+        other_renderer = HtmlRenderer(100)
+        second = other_renderer.html_to_image(html, 150)
+        self.assertEqual(first.cacheKey(), second.cacheKey())
+
+        # The width is part of the key
+        wider = renderer.html_to_image(html, 200)
+        self.assertGreater(wider.width(), first.width())
+        clear_image_cache()
+
 if __name__ == '__main__':
     suite = unittest.makeSuite(HtmlRendererTest, 'test')
     runner = unittest.TextTestRunner(verbosity=2)
@@ -0,0 +1,86 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid and World Bank
+- **Report Renderer Test Cases.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+__author__ = 'info@inasafe.org'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2013, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import sys
+import unittest
+from subprocess import Popen
+
+from safe.common.exceptions import ReportCreationError
+from safe.report import report_renderer
+from safe.report.report_renderer import split_pages, ReportRenderer
+from safe.report.template_composition import (
+    template_content,
+    template_document)
+from safe.utilities.resources import resources_path
+from safe.test.utilities import get_qgis_app
+
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+INASAFE_TEMPLATE_PATH = resources_path(
+    'qgis-composer-templates', 'inasafe-portrait-a4.qpt')
+
+
+class ReportRendererTest(unittest.TestCase):
+    """Test the report renderer."""
+
+    def test_split_pages(self):
+        """Pages are dealt round robin over the workers."""
+        pages = range(5)
+        self.assertEqual(split_pages(pages, 2), [[0, 2, 4], [1, 3]])
+        # No empty chunk when there are more workers than pages
+        self.assertEqual(split_pages(pages[:2], 4), [[0], [1]])
+
+    def test_worker_count(self):
+        """A worker count of 0 means one worker per CPU."""
+        self.assertTrue(ReportRenderer(0).workers >= 1)
+        self.assertEqual(ReportRenderer(1).workers, 1)
+
+    def test_render_in_pool_unexpected_output(self):
+        """A worker printing something else than JSON has failed."""
+        def start_worker(module, arguments, **kwargs):
+            """Start a worker printing text instead of the JSON list."""
+            del module, arguments
+            return Popen([sys.executable, '-c', 'print "Done"'], **kwargs)
+
+        original_start_worker = report_renderer.start_worker
+        report_renderer.start_worker = start_worker
+        try:
+            self.assertRaises(
+                ReportCreationError,
+                ReportRenderer(2).render_in_pool,
+                {},
+                range(4))
+        finally:
+            report_renderer.start_worker = original_start_worker
+
+    def test_template_document(self):
+        """A template is read once but every load gets its own document."""
+        content = template_content(INASAFE_TEMPLATE_PATH)
+        self.assertIn('impact-map', content)
+        self.assertIs(template_content(INASAFE_TEMPLATE_PATH), content)
+        document = template_document(INASAFE_TEMPLATE_PATH)
+        self.assertIsNot(template_document(INASAFE_TEMPLATE_PATH), document)
+        self.assertEqual(
+            document.toString(),
+            template_document(INASAFE_TEMPLATE_PATH).toString())
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(ReportRendererTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -22,9 +22,9 @@ def read_layer(filename):
     """
 
     _, ext = os.path.splitext(filename)
-    if ext in ['.asc', '.tif', '.nc']:
+    if ext in ['.asc', '.tif', '.nc', '.vrt']:
         return Raster(filename)
-    elif ext in ['.shp', '.sqlite']:
+    elif ext in ['.shp', '.sqlite', '.gpkg']:
         return Vector(filename)
     else:
         msg = ('Could not read %s. '
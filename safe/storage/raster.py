@@ -29,6 +29,12 @@ from utilities import (geotransform_to_bbox, geotransform_to_resolution,
                        check_geotransform)
 from utilities import safe_to_qgis_layer
 
+# Number of histogram bins used to estimate quantiles, see Raster.get_bins
+QUANTILE_HISTOGRAM_BINS = 4096
+
+# Approximate number of cells read at a time when estimating quantiles
+QUANTILE_BLOCK_SIZE = 1024 * 1024
+
 
 class Raster(Layer):
     """InaSAFE representation of raster data
@@ -539,13 +545,20 @@ class Raster(Layer):
         """
         return numpy.nan
 
-    def get_bins(self, N=10, quantiles=False):
+    def get_bins(self, N=10, quantiles=False, approximate=False):
         """Get N values between the min and the max occurred in this dataset.
 
         Return sorted list of length N+1 where the first element is min and
         the last is max. Intermediate values depend on the keyword quantiles:
         If quantiles is True, they represent boundaries between quantiles.
         If quantiles is False, they represent equidistant interval boundaries.
+
+        Quantile boundaries are selected with numpy.partition rather than by
+        sorting all the data. If approximate is True they are estimated
+        from a histogram that is built block by block instead, which needs
+        no copy of the data. Each estimate then lies in the same histogram
+        bin as the exact boundary, i.e. within
+        (max - min) / QUANTILE_HISTOGRAM_BINS of it.
         """
 
         rmin, rmax = self.get_extrema()
@@ -557,6 +570,8 @@ class Raster(Layer):
 
             for i in range(N):
                 levels.append(rmin + i * d)
+        elif approximate:
+            levels = self._estimate_quantiles(N, rmin, rmax)
         else:
             # Quantiles
             # FIXME (Ole): Not 100% sure about this algorithm,
@@ -567,18 +582,63 @@ class Raster(Layer):
             mask = numpy.logical_not(numpy.isnan(A))  # Omit NaN's
             A = A.compress(mask)
 
-            A.sort()
-
-            verify(len(A) == A.shape[0])
-
             d = float(len(A) + 0.5) / N
-            for i in range(N):
-                levels.append(A[int(i * d)])
+            ranks = [int(i * d) for i in range(N)]
+            if hasattr(numpy, 'partition'):
+                # Only put the elements at the needed ranks in place
+                A.partition(ranks)
+            else:
+                A.sort()
+
+            for rank in ranks:
+                levels.append(A[rank])
 
         levels.append(rmax)
 
         return levels
 
+    def _estimate_quantiles(self, N, rmin, rmax):
+        """Estimate the lower quantile boundaries for get_bins.
+
+        The ranks are the same as for the exact boundaries. Each is located
+        in a histogram of the data and interpolated linearly within its bin.
+
+        :param N: Number of quantiles.
+        :type N: int
+
+        :param rmin: Minimum of the data.
+        :type rmin: float
+
+        :param rmax: Maximum of the data.
+        :type rmax: float
+
+        :returns: The N lower boundaries, starting with rmin.
+        :rtype: list
+        """
+        if rmin == rmax:
+            return [rmin] * N
+
+        A = self.get_data()
+        edges = numpy.linspace(rmin, rmax, QUANTILE_HISTOGRAM_BINS + 1)
+        counts = numpy.zeros(QUANTILE_HISTOGRAM_BINS, dtype=numpy.int64)
+        block_rows = max(1, QUANTILE_BLOCK_SIZE // max(1, A.shape[1]))
+        for start in range(0, A.shape[0], block_rows):
+            block = A[start:start + block_rows]
+            block = block[numpy.logical_not(numpy.isnan(block))]
+            counts += numpy.histogram(block, bins=edges)[0]
+        cumulative = numpy.cumsum(counts)
+
+        levels = [rmin]
+        d = float(cumulative[-1] + 0.5) / N
+        for i in range(1, N):
+            rank = int(i * d)
+            # The bin holding the element of this rank
+            k = int(numpy.searchsorted(cumulative, rank, side='right'))
+            below = cumulative[k - 1] if k > 0 else 0
+            fraction = (rank - below + 0.5) / counts[k]
+            levels.append(edges[k] + fraction * (edges[k + 1] - edges[k]))
+        return levels
+
     def get_bounding_box(self):
         """Get bounding box coordinates for raster layer
 
@@ -3,10 +3,11 @@
 import unittest
 import numpy
 import os
-from osgeo import gdal
+from osgeo import gdal, ogr
 
-from safe.storage.raster import Raster
-from safe.storage.vector import Vector, convert_polygons_to_centroids
+from safe.storage.raster import Raster, QUANTILE_HISTOGRAM_BINS
+from safe.storage.vector import (
+    Vector, convert_polygons_to_centroids, _attribute_column, _pseudo_inf)
 from safe.storage.projection import Projection, DEFAULT_PROJECTION
 from safe.storage.utilities import (
     write_keywords,
@@ -15,6 +16,9 @@ from safe.storage.utilities import (
     minimal_bounding_box,
     buffered_bounding_box,
     array_to_wkt,
+    array_to_wkb,
+    polygon_to_wkb,
+    points_to_wkb,
     calculate_polygon_area,
     calculate_polygon_centroid,
     points_along_line,
@@ -351,6 +355,28 @@ class TestIO(unittest.TestCase):
                 else:
                     raise Exception
 
+    def test_top_N_order(self):
+        """Top N features come in increasing order and NaN ranks lowest."""
+        data = [{'value': value} for value in [3, float('nan'), 7, 1, 5]]
+        geometry = [(106.0 + i, -6.0) for i in range(len(data))]
+        layer = Vector(data=data, geometry=geometry)
+
+        top = layer.get_topN('value', 3)
+        self.assertEqual(top.get_data('value'), [3, 5, 7])
+        self.assertEqual(list(top.get_geometry()[0]), [106.0, -6.0])
+
+        # Asking for more features than there are gives all of them
+        top = layer.get_topN('value', 10)
+        self.assertEqual(top.get_data('value')[1:], [1, 3, 5, 7])
+
+        # Numeric strings are ranked as strings
+        data = [{'value': value} for value in ['9', '10', '2']]
+        layer = Vector(data=data, geometry=geometry[:3])
+        self.assertEqual(layer.get_topN('value', 2).get_data('value'),
+                         ['2', '9'])
+
+        self.assertRaises(VerificationError, layer.get_topN, 'value', 0)
+
     def test_vector_class(self):
         """Consistency of vector class for point data
         """
@@ -1462,6 +1488,13 @@ class TestIO(unittest.TestCase):
                     assert numpy.allclose(linear_intervals[i], rmin + i * d)
 
                 quantiles = R.get_bins(N=N, quantiles=True)
+
+                # Estimates are within one histogram bin of the quantiles
+                estimates = R.get_bins(N=N, quantiles=True, approximate=True)
+                tolerance = (rmax - rmin) / QUANTILE_HISTOGRAM_BINS
+                assert len(estimates) == len(quantiles)
+                assert numpy.allclose(estimates, quantiles, atol=tolerance)
+
                 A = R.get_data(nan=True).flat[:]
 
                 mask = numpy.logical_not(numpy.isnan(A))  # Omit NaN's
@@ -2154,6 +2187,56 @@ class TestIO(unittest.TestCase):
             x, y = field.split()
             assert numpy.allclose(A[i, :], [float(x), float(y)])
 
+    def test_array_to_wkb(self):
+        """Conversion to wkb data works"""
+        A = numpy.arange(10, dtype='d').reshape(5, 2)
+
+        line = ogr.CreateGeometryFromWkb(array_to_wkb(A))
+        assert line.GetGeometryType() == ogr.wkbLineString
+        assert numpy.allclose(line.GetPoints(), A)
+
+        hole = A[::-1] * 0.5
+        polygon = ogr.CreateGeometryFromWkb(polygon_to_wkb(A, [hole]))
+        assert polygon.GetGeometryType() == ogr.wkbPolygon
+        assert polygon.GetGeometryCount() == 2
+        assert numpy.allclose(polygon.GetGeometryRef(0).GetPoints(), A)
+        assert numpy.allclose(polygon.GetGeometryRef(1).GetPoints(), hole)
+
+        points = points_to_wkb(A)
+        assert len(points) == 5
+        for i, wkb in enumerate(points):
+            point = ogr.CreateGeometryFromWkb(wkb)
+            assert point.GetGeometryType() == ogr.wkbPoint
+            assert numpy.allclose([point.GetX(), point.GetY()], A[i])
+
+    def test_attribute_column(self):
+        """Real columns are converted at once, None stays missing"""
+        values = _attribute_column([1.5, 2, float('nan')], ogr.OFTReal)
+        assert values == [1.5, 2.0, _pseudo_inf]
+
+        # None is written as an empty value, not as a number
+        values = _attribute_column([1.5, None], ogr.OFTReal)
+        assert values == [1.5, '']
+
+        # Numeric strings are left for OGR to parse
+        values = _attribute_column(['1.5', '2'], ogr.OFTReal)
+        assert values == ['1.5', '2']
+
+    def test_vector_gpkg_roundtrip(self):
+        """Vector layers can be written to and read from GeoPackage"""
+        filename = '%s/%s' % (TESTDATA, 'test_buildings.shp')
+        layer = read_layer(filename)
+
+        tmp_filename = unique_filename(suffix='.gpkg')
+        layer.write_to_file(tmp_filename)
+        layer_file = read_layer(tmp_filename)
+
+        assert len(layer_file) == len(layer)
+        assert numpy.allclose(
+            layer_file.get_geometry(), layer.get_geometry())
+        for name in layer.get_attribute_names():
+            assert layer_file.get_data(name) == layer.get_data(name)
+
     def test_polygon_area(self):
         """Polygon areas are computed correctly
         """
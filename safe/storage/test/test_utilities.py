@@ -12,10 +12,13 @@ __copyright__ += 'Disaster Reduction'
 import os
 import logging
 import unittest
+from collections import OrderedDict
 
+import safe.storage.utilities
 from safe.storage.utilities import (
     read_keywords,
-    write_keywords)
+    write_keywords,
+    clear_keywords_cache)
 from safe.test.utilities import test_data_path
 
 LOGGER = logging.getLogger('InaSAFE')
@@ -117,5 +120,66 @@ class CommonUtilitiesTest(unittest.TestCase):
         self.assertEquals(keywords, expected_keywords, msg)
         LOGGER.debug(keywords)
 
+    def test_read_keywords_cached(self):
+        """Test keywords are cached and invalidated on write."""
+        clear_keywords_cache()
+        filename = self.make_temp_file()
+        with open(filename, 'w') as keywords_file:
+            keywords_file.write('category: exposure\ntitle: Cached\n')
+        xml_filename = os.path.splitext(filename)[0] + '.xml'
+
+        keywords = read_keywords(filename)
+        self.assertEqual(keywords['title'], 'Cached')
+        # Reading must not generate the ISO xml file
+        self.assertFalse(os.path.exists(xml_filename))
+
+        # Callers get a copy they are free to modify
+        keywords['title'] = 'Modified'
+        self.assertEqual(read_keywords(filename)['title'], 'Cached')
+
+        # Writing keywords invalidates the cached entry
+        write_keywords({'category': 'exposure', 'title': 'New'}, filename)
+        self.assertEqual(read_keywords(filename)['title'], 'New')
+
+    def test_read_nested_ordered_dict_keyword(self):
+        """Test nested OrderedDict keywords keep their structure."""
+        filename = self.make_temp_file()
+        value = OrderedDict([
+            (u'Zone B', OrderedDict([('Total', 3), ('Other', 'No data')])),
+            (u'Zone A', OrderedDict([('Total', 1), ('Other', -2)]))])
+        write_keywords({'summary': value, 'title': 'Nested'}, filename)
+        keywords = read_keywords(filename)
+        self.assertEqual(keywords['summary'], value)
+        self.assertEqual(keywords['summary'].keys(), value.keys())
+        self.assertIsInstance(keywords['summary'][u'Zone B'], OrderedDict)
+        self.assertEqual(keywords['title'], 'Nested')
+
+    def test_read_keywords_cache_bounded(self):
+        """Test the keywords cache drops the least recently used file."""
+        clear_keywords_cache()
+        cache = safe.storage.utilities._KEYWORDS_CACHE
+        original_size = safe.storage.utilities.KEYWORDS_CACHE_SIZE
+        safe.storage.utilities.KEYWORDS_CACHE_SIZE = 2
+        try:
+            filenames = []
+            for title in ['First', 'Second', 'Third']:
+                filename = self.make_temp_file()
+                with open(filename, 'w') as keywords_file:
+                    keywords_file.write('title: %s\n' % title)
+                filenames.append(os.path.abspath(filename))
+
+            read_keywords(filenames[0])
+            read_keywords(filenames[1])
+            # Touching the first file makes the second the oldest entry
+            read_keywords(filenames[0])
+            read_keywords(filenames[2])
+            self.assertEqual(len(cache), 2)
+            self.assertIn(filenames[0], cache)
+            self.assertNotIn(filenames[1], cache)
+            self.assertIn(filenames[2], cache)
+        finally:
+            safe.storage.utilities.KEYWORDS_CACHE_SIZE = original_size
+            clear_keywords_cache()
+
 if __name__ == '__main__':
     unittest.main()
@@ -13,6 +13,7 @@ import logging
 import unittest
 
 from safe.common.utilities import temp_dir, unique_filename
+from safe.common.exceptions import WriteLayerError
 from safe.storage.utilities import read_keywords
 from safe.storage.vector import Vector, QGIS_IS_AVAILABLE
 from safe.test.utilities import test_data_path, get_qgis_app
@@ -70,6 +71,26 @@ class VectorTest(unittest.TestCase):
         self.assertTrue(os.path.exists(test_file))
     test_sqlite_writing.slow = True
 
+    def test_failed_writing_removes_file(self):
+        """Test that a failed write does not leave a partial file."""
+        keywords = read_keywords(SHP_BASE + '.keywords')
+        layer = Vector(data=SHP_BASE + '.shp', keywords=keywords)
+        test_dir = temp_dir(sub_dir='test')
+        test_file = unique_filename(suffix='.shp', dir=test_dir)
+
+        def fail(*args):
+            """Fail like a feature that can not be created."""
+            raise WriteLayerError('Failed to create feature')
+
+        write_features = Vector._write_features
+        Vector._write_features = staticmethod(fail)
+        try:
+            self.assertRaises(
+                WriteLayerError, layer.write_to_file, test_file)
+        finally:
+            Vector._write_features = staticmethod(write_features)
+        self.assertFalse(os.path.exists(test_file))
+
     def test_qgis_vector_layer_loading(self):
         """Test that reading from QgsVectorLayer works."""
         keywords = read_keywords(KEYWORD_PATH, EXPOSURE_SUBLAYER_NAME)
@@ -7,6 +7,8 @@ import re
 import copy
 import numpy
 import math
+import struct
+import ast
 from ast import literal_eval
 from osgeo import ogr
 from collections import OrderedDict
@@ -25,12 +27,20 @@ from safe.storage.metadata_utilities import (
 
 DEFAULT_ATTRIBUTE = 'inapolygon'
 
+# Parsed keywords per keywords file, see read_keywords. Maps the absolute
+# path of a .keywords file to (signature, (blocks, first_keywords)) where
+# signature is the mtime and size of the .keywords and .xml files. The least
+# recently used entries are dropped beyond KEYWORDS_CACHE_SIZE files.
+KEYWORDS_CACHE_SIZE = 256
+_KEYWORDS_CACHE = OrderedDict()
+
 # Spatial layer file extensions that are recognised in Risiko
 # FIXME: Perhaps add '.gml', '.zip', ...
 LAYER_TYPES = ['.shp', '.asc', '.tif', '.tiff', '.geotif', '.geotiff']
 
 # Map between extensions and ORG drivers
 DRIVER_MAP = {'.sqlite': 'SQLITE',
+              '.gpkg': 'GPKG',
               '.shp': 'ESRI Shapefile',
               '.gml': 'GML',
               '.tif': 'GTiff',
@@ -206,6 +216,7 @@ def write_keywords(keywords, filename, sublayer=None):
     handle.close()
 
     write_keyword_in_iso_metadata(filename)
+    _KEYWORDS_CACHE.pop(os.path.abspath(filename), None)
 
 
 def read_keywords(keyword_filename, sublayer=None, all_blocks=False):
@@ -258,6 +269,10 @@ def read_keywords(keyword_filename, sublayer=None, all_blocks=False):
     Blank lines are ignored
     Surrounding whitespace is removed from values, but keys are unmodified
     If there are no ':', then the keyword is treated as a key with no value
+
+    Parsed keywords are cached for the process keyed on the path, mtime and
+    size of the keywords and xml files, so repeated reads of an unchanged
+    file do not parse it again. write_keywords invalidates the entry.
     """
 
     # Input checks
@@ -267,20 +282,88 @@ def read_keywords(keyword_filename, sublayer=None, all_blocks=False):
            'Expected %s.keywords' % (keyword_filename, basename))
     verify(ext == '.keywords', msg)
 
-    metadata = False
-    keywords_file = os.path.isfile(keyword_filename)
+    signature = _keywords_signature(keyword_filename)
+
+    # we have no valid xml metadata nor a keyword file
+    if signature == (None, None):
+        return {}
+
+    cache_key = os.path.abspath(keyword_filename)
+    cached = _KEYWORDS_CACHE.pop(cache_key, None)
+    if cached is not None and cached[0] == signature:
+        blocks, first_keywords = cached[1]
+    else:
+        blocks, first_keywords = _parse_keywords(keyword_filename)
+        cached = (signature, (blocks, first_keywords))
+    # (Re)inserting makes this the most recently used entry
+    _KEYWORDS_CACHE[cache_key] = cached
+    if len(_KEYWORDS_CACHE) > KEYWORDS_CACHE_SIZE:
+        _KEYWORDS_CACHE.popitem(last=False)
 
+    # Ok we have generated a structure that looks like this:
+    # blocks = {{ 'foo' : { 'a': 'b', 'c': 'd'},
+    #           { 'bar' : { 'd': 'e', 'f': 'g'}}
+    # where foo and bar are sublayers and their dicts are the sublayer keywords
+    # Copies are returned so callers can not modify the cached entries.
+    if all_blocks:
+        return copy.deepcopy(blocks)
+    if sublayer is not None:
+        if sublayer in blocks:
+            return copy.deepcopy(blocks[sublayer])
+    else:
+        return copy.deepcopy(first_keywords)
+
+
+def clear_keywords_cache():
+    """Remove all entries from the process wide keywords cache.
+
+    Entries are invalidated automatically when the keywords or xml file
+    changes on disk, so this is only needed when files are modified by
+    means that do not change their modification time or size.
+    """
+    _KEYWORDS_CACHE.clear()
+
+
+def _keywords_signature(keyword_filename):
+    """Get the modification time and size of a keywords and its xml file.
+
+    :param keyword_filename: Name of keywords file.
+    :type keyword_filename: str
+
+    :returns: Two-tuple with a (mtime, size) tuple for the .keywords file
+        and the .xml file, None for a file that does not exist.
+    :rtype: tuple
+    """
+    basename = os.path.splitext(keyword_filename)[0]
+    signature = []
+    for path in [keyword_filename, basename + '.xml']:
+        try:
+            status = os.stat(path)
+        except OSError:
+            signature.append(None)
+        else:
+            signature.append((status.st_mtime, status.st_size))
+    return tuple(signature)
+
+
+def _parse_keywords(keyword_filename):
+    """Parse the keyword blocks of a keywords file.
+
+    Keywords are taken from the ISO xml file next to the keywords file when
+    it is valid, otherwise from the keywords file itself. Nothing is written
+    to disk.
+
+    :param keyword_filename: Name of keywords file.
+    :type keyword_filename: str
+
+    :returns: Two-tuple of a dict of sublayer blocks and the keywords of the
+        first block (or of the whole file if it has no blocks).
+    :rtype: (dict, dict)
+    """
     try:
         metadata = read_iso_metadata(keyword_filename)
     except (IOError, ReadMetadataError):
-        if keywords_file:
-            # if there is a keyword file generate an xml file also
-            write_keyword_in_iso_metadata(keyword_filename)
-            metadata = read_iso_metadata(keyword_filename)
-
-    # we have no valid xml metadata nor a keyword file
-    if not metadata and not keywords_file:
-        return {}
+        metadata = False
 
     if metadata:
         lines = metadata['keywords']
@@ -339,8 +422,7 @@ def read_keywords(keyword_filename, sublayer=None, all_blocks=False):
             except (ValueError, SyntaxError):
                 if 'OrderedDict(' == textval[:12]:
                     try:
-                        val = OrderedDict(
-                            literal_eval(textval[12:-1]))
+                        val = _ordered_literal_eval(textval)
                     except (ValueError, SyntaxError, TypeError):
                         val = textval
                 else:
@@ -355,17 +437,45 @@ def read_keywords(keyword_filename, sublayer=None, all_blocks=False):
     if first_keywords is None:
         first_keywords = keywords
 
-    # Ok we have generated a structure that looks like this:
-    # blocks = {{ 'foo' : { 'a': 'b', 'c': 'd'},
-    #           { 'bar' : { 'd': 'e', 'f': 'g'}}
-    # where foo and bar are sublayers and their dicts are the sublayer keywords
-    if all_blocks:
-        return blocks
-    if sublayer is not None:
-        if sublayer in blocks:
-            return blocks[sublayer]
-    else:
-        return first_keywords
+    return blocks, first_keywords
+
+
+def _ordered_literal_eval(text):
+    """Evaluate a literal which may contain (nested) OrderedDicts.
+
+    This is literal_eval extended with the repr of OrderedDict, so that
+    keywords like OrderedDict([('a', OrderedDict([('b', 1)]))]) keep their
+    structure and order when read back.
+
+    :param text: The repr of the value.
+    :type text: str
+
+    :returns: The value.
+
+    :raises: ValueError, SyntaxError if text is not such a literal.
+    """
+    def convert(node):
+        """Convert a node, delegating anything but containers."""
+        if isinstance(node, ast.Call):
+            if (not isinstance(node.func, ast.Name) or
+                    node.func.id != 'OrderedDict' or
+                    len(node.args) > 1 or node.keywords or
+                    node.starargs or node.kwargs):
+                raise ValueError('Malformed OrderedDict: %s' % text)
+            if not node.args:
+                return OrderedDict()
+            return OrderedDict(convert(node.args[0]))
+        if isinstance(node, ast.List):
+            return [convert(element) for element in node.elts]
+        if isinstance(node, ast.Tuple):
+            return tuple(convert(element) for element in node.elts)
+        if isinstance(node, ast.Dict):
+            return dict(
+                (convert(key), convert(value))
+                for key, value in zip(node.keys, node.values))
+        return literal_eval(node)
+
+    return convert(ast.parse(text, mode='eval').body)
 
 
 # noinspection PyExceptionInherit
@@ -812,6 +922,116 @@ def array_to_line(A, geometry_type=ogr.wkbLinearRing):
     return line
 
 
+# Little endian (NDR) WKB header: byte order, geometry type
+_WKB_HEADER = struct.Struct('<BI')
+_WKB_COUNT = struct.Struct('<I')
+
+
+def _coordinates_to_wkb(A):
+    """Pack an Nx2 array of vertices as a WKB point count and coordinates.
+
+    :param A: Nx2 array of coordinates.
+    :type A: numpy.ndarray
+
+    :returns: Packed little endian vertex count followed by the doubles.
+    :rtype: str
+    """
+    A = numpy.ascontiguousarray(A, dtype='<f8')
+
+    msg = 'Array must be a 2d array of vertices. I got %s' % (str(A.shape))
+    verify(len(A.shape) == 2, msg)
+
+    msg = 'A array must have two columns. I got %s' % (str(A.shape[1]))
+    verify(A.shape[1] == 2, msg)
+
+    return _WKB_COUNT.pack(A.shape[0]) + A.tostring()
+
+
+def array_to_wkb(A, geometry_type=ogr.wkbLineString):
+    """Convert coordinates to a 2D WKB line string.
+
+    This is the bulk equivalent of array_to_line: the vertices are packed
+    in one go from the array rather than added to an OGR geometry point by
+    point.
+
+    :param A: Nx2 Array of coordinates representing a line.
+        A can be either a numpy array or a list of coordinates.
+    :type A: numpy.ndarray, list
+
+    :param geometry_type: OGR geometry type. Only ogr.wkbLineString is
+        supported as linear rings have no WKB representation of their own.
+    :type geometry_type: int
+
+    :returns: Little endian WKB for the line.
+    :rtype: str
+    """
+    msg = 'Geometry type %s can not be encoded as WKB' % geometry_type
+    verify(geometry_type == ogr.wkbLineString, msg)
+
+    return (_WKB_HEADER.pack(1, ogr.wkbLineString) +
+            _coordinates_to_wkb(A))
+
+
+def polygon_to_wkb(outer_ring, inner_rings=None):
+    """Convert polygon rings to a 2D WKB polygon.
+
+    :param outer_ring: Nx2 array of vertices of the outer ring.
+    :type outer_ring: numpy.ndarray, list
+
+    :param inner_rings: Optional list of Nx2 arrays of vertices of holes.
+    :type inner_rings: list
+
+    :returns: Little endian WKB for the polygon.
+    :rtype: str
+    """
+    if inner_rings is None:
+        inner_rings = []
+
+    parts = [
+        _WKB_HEADER.pack(1, ogr.wkbPolygon),
+        _WKB_COUNT.pack(1 + len(inner_rings)),
+        _coordinates_to_wkb(outer_ring)]
+    for ring in inner_rings:
+        parts.append(_coordinates_to_wkb(ring))
+
+    return ''.join(parts)
+
+
+def points_to_wkb(points):
+    """Convert an array of point coordinates to a list of 2D WKB points.
+
+    All points are encoded with a single array operation.
+
+    :param points: Nx2 array of point coordinates.
+    :type points: numpy.ndarray, list
+
+    :returns: List of N little endian WKB points.
+    :rtype: list
+    """
+    points = ensure_numeric(points, numpy.float)
+    if len(points) == 0:
+        return []
+
+    msg = 'Points must be an Nx2 array. I got %s' % (str(points.shape))
+    verify(len(points.shape) == 2 and points.shape[1] == 2, msg)
+
+    record_type = numpy.dtype([
+        ('byte_order', 'u1'),
+        ('geometry_type', '<u4'),
+        ('x', '<f8'),
+        ('y', '<f8')])
+    records = numpy.empty(points.shape[0], dtype=record_type)
+    records['byte_order'] = 1
+    records['geometry_type'] = ogr.wkbPoint
+    records['x'] = points[:, 0]
+    records['y'] = points[:, 1]
+
+    size = record_type.itemsize
+    buffer_string = records.tostring()
+    return [buffer_string[i:i + size]
+            for i in xrange(0, len(buffer_string), size)]
+
+
 def rings_equal(x, y, rtol=1.0e-6, atol=1.0e-8):
     """Compares to linear rings as numpy arrays
 
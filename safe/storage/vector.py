@@ -44,7 +44,7 @@ from utilities import read_keywords
 from utilities import write_keywords
 from utilities import get_geometry_type
 from utilities import is_sequence
-from utilities import array_to_line
+from utilities import array_to_wkb, polygon_to_wkb, points_to_wkb
 from utilities import calculate_polygon_centroid
 from utilities import points_along_line
 from utilities import geometry_type_to_string
@@ -56,6 +56,89 @@ from safe.common.utilities import unique_filename
 LOGGER = logging.getLogger('InaSAFE')
 _pseudo_inf = float(99999999)
 
+# Number of features written per transaction in Vector.write_to_file
+WRITE_TRANSACTION_SIZE = 50000
+
+
+def _attribute_value(value):
+    """Convert a single attribute value to something OGR can store.
+
+    :param value: Attribute value as found in the vector data.
+
+    :returns: The value with None replaced by an empty string, numpy
+        singletons converted to float and NaN replaced by _pseudo_inf.
+    """
+    if type(value) == numpy.ndarray:
+        # A singleton of type <type 'numpy.ndarray'> works
+        # for gdal version 1.6 but fails for version 1.8
+        # in SetField with error: NotImplementedError:
+        # Wrong number of arguments for overloaded function
+        value = float(value)
+    elif value is None:
+        value = ''
+
+    # We do this because there is NaN problem on windows
+    # NaN value must be converted to _pseudo_in to solve the
+    # problem. But, when InaSAFE read the file, it'll be
+    # converted back to NaN value, so that NaN in InaSAFE is a
+    # numpy.nan
+    # please check https://github.com/AIFDR/inasafe/issues/269
+    # for more information
+    if value != value:
+        value = _pseudo_inf
+
+    return value
+
+
+def _numeric_column(values):
+    """Convert a column of attribute values to one numpy array.
+
+    This is the one place that decides whether a column is numeric, both
+    for writing (_attribute_column) and for ranking (Vector.get_topN).
+    Only numbers qualify: numeric strings are not parsed, so get_topN
+    compares them as strings and the writer hands them to OGR as they are,
+    and None is kept so that it is written as a missing value.
+
+    :param values: Values of one attribute for all features.
+    :type values: list
+
+    :returns: A float64 array, or None if the values are not all numbers
+        (e.g. strings, None or sequences).
+    :rtype: numpy.ndarray
+    """
+    try:
+        column = numpy.array(values)
+    except (TypeError, ValueError):
+        return None
+    if column.shape != (len(values),) or column.dtype.kind not in 'biuf':
+        return None
+    return column.astype(numpy.float64)
+
+
+def _attribute_column(values, ogr_type):
+    """Convert a column of attribute values for writing with OGR.
+
+    Real valued columns are converted as one numpy array. Columns that are
+    not cleanly numeric fall back to converting value by value, so None is
+    still written as an empty (missing) value rather than as _pseudo_inf.
+
+    :param values: Values of one attribute for all features.
+    :type values: list
+
+    :param ogr_type: OGR field type of the attribute.
+    :type ogr_type: int
+
+    :returns: List of values ready for OGRFeature.SetField.
+    :rtype: list
+    """
+    if ogr_type == ogr.OFTReal:
+        column = _numeric_column(values)
+        if column is not None:
+            column[numpy.isnan(column)] = _pseudo_inf
+            return column.tolist()
+
+    return [_attribute_value(value) for value in values]
+
 
 # noinspection PyExceptionInherit
 class Vector(Layer):
@@ -607,11 +690,14 @@ class Vector(Layer):
     def write_to_file(self, filename, sublayer=None):
         """Save vector data to file
 
-        :param filename: filename with extension .shp or .gml
+        Features are written in transactions of WRITE_TRANSACTION_SIZE
+        features, which makes the SQLite and GeoPackage formats fast.
+
+        :param filename: filename with extension .shp, .sqlite or .gpkg
         :type filename: str
 
         :param sublayer: Optional parameter for writing a sublayer. Ignored
-            unless we are writing to an sqlite file.
+            unless we are writing to an sqlite or gpkg file.
         :type sublayer: str
 
         :raises: WriteLayerError
@@ -631,8 +717,8 @@ class Vector(Layer):
         base_name, extension = os.path.splitext(filename)
 
         msg = ('Invalid file type for file %s. Only extensions '
-               'sqlite, shp or gml allowed.' % filename)
-        verify(extension in ['.sqlite', '.shp', '.gml'], msg)
+               'sqlite, gpkg, shp or gml allowed.' % filename)
+        verify(extension in ['.sqlite', '.gpkg', '.shp', '.gml'], msg)
         driver = DRIVER_MAP[extension]
 
         # FIXME (Ole): Tempory flagging of GML issue (ticket #18)
@@ -733,72 +819,84 @@ class Vector(Layer):
                 # Restore error handler
                 gdal.PopErrorHandler()
 
-        # Store geometry
-        geom = ogr.Geometry(self.geometry_type)
+        # Encode all geometries as WKB up front
+        if self.is_point_data:
+            wkb_geometries = points_to_wkb(geometry)
+        elif self.is_line_data:
+            wkb_geometries = [array_to_wkb(line) for line in geometry]
+        elif self.is_polygon_data:
+            wkb_geometries = [
+                polygon_to_wkb(polygon.outer_ring, polygon.inner_rings)
+                for polygon in geometry]
+        else:
+            msg = 'Geometry type %s not implemented' % self.geometry_type
+            raise WriteLayerError(msg)
+
+        # Convert attributes column by column so that the type handling
+        # is not repeated for every value
+        columns = []
+        if store_attributes:
+            for name in fields:
+                columns.append(_attribute_column(
+                    [row[name] for row in data], ogr_types[name]))
+
         layer_def = lyr.GetLayerDefn()
-        for i in range(N):
+        lyr.StartTransaction()
+        try:
+            self._write_features(
+                lyr, layer_def, wkb_geometries, columns, filename)
+        except Exception:
+            # Only the current batch can be rolled back: earlier batches
+            # are committed and shapefiles have no transactions at all, so
+            # remove the partly written file rather than leave it behind
+            lyr.RollbackTransaction()
+            lyr = None
+            ds = None
+            drv.DeleteDataSource(filename)
+            raise
+        lyr.CommitTransaction()
+
+        # Write keywords if any
+        write_keywords(self.keywords, base_name + '.keywords')
+
+        # FIXME (Ole): Maybe store style_info
+
+    @staticmethod
+    def _write_features(lyr, layer_def, wkb_geometries, columns, filename):
+        """Create the features of write_to_file in an open transaction.
+
+        :param lyr: OGR layer to write to.
+        :type lyr: ogr.Layer
+
+        :param layer_def: Definition of the layer.
+        :type layer_def: ogr.FeatureDefn
+
+        :param wkb_geometries: Geometry of each feature as WKB.
+        :type wkb_geometries: list
+
+        :param columns: Values of each field as made by _attribute_column.
+        :type columns: list
+
+        :param filename: Name of the file, for error messages.
+        :type filename: str
+
+        :raises: WriteLayerError
+        """
+        field_indices = range(len(columns))
+        for i in range(len(wkb_geometries)):
             # Create new feature instance
             feature = ogr.Feature(layer_def)
 
             # Store geometry and check
-            if self.is_point_data:
-                x = float(geometry[i][0])
-                y = float(geometry[i][1])
-                geom.SetPoint_2D(0, x, y)
-            elif self.is_line_data:
-                geom = array_to_line(
-                    geometry[i], geometry_type=ogr.wkbLineString)
-            elif self.is_polygon_data:
-                # Create polygon geometry
-                geom = ogr.Geometry(ogr.wkbPolygon)
-
-                # Add outer ring
-                linear_ring = array_to_line(
-                    geometry[i].outer_ring, geometry_type=ogr.wkbLinearRing)
-                geom.AddGeometry(linear_ring)
-
-                # Add inner rings if any
-                for A in geometry[i].inner_rings:
-                    geom.AddGeometry(array_to_line(
-                        A, geometry_type=ogr.wkbLinearRing))
-            else:
-                msg = 'Geometry type %s not implemented' % self.geometry_type
-                raise WriteLayerError(msg)
-
-            feature.SetGeometry(geom)
-
-            G = feature.GetGeometryRef()
-            if G is None:
+            geom = ogr.CreateGeometryFromWkb(wkb_geometries[i])
+            if geom is None:
                 msg = 'Could not create GeometryRef for file %s' % filename
                 raise WriteLayerError(msg)
+            feature.SetGeometryDirectly(geom)
 
             # Store attributes
-            if store_attributes:
-                for j, name in enumerate(fields):
-                    actual_field_name = layer_def.GetFieldDefn(j).GetNameRef()
-
-                    val = data[i][name]
-
-                    if type(val) == numpy.ndarray:
-                        # A singleton of type <type 'numpy.ndarray'> works
-                        # for gdal version 1.6 but fails for version 1.8
-                        # in SetField with error: NotImplementedError:
-                        # Wrong number of arguments for overloaded function
-                        val = float(val)
-                    elif val is None:
-                        val = ''
-
-                    # We do this because there is NaN problem on windows
-                    # NaN value must be converted to _pseudo_in to solve the
-                    # problem. But, when InaSAFE read the file, it'll be
-                    # converted back to NaN value, so that NaN in InaSAFE is a
-                    # numpy.nan
-                    # please check https://github.com/AIFDR/inasafe/issues/269
-                    # for more information
-                    if val != val:
-                        val = _pseudo_inf
-
-                    feature.SetField(actual_field_name, val)
+            for j in field_indices:
+                feature.SetField(j, columns[j][i])
 
             # Save this feature
             if lyr.CreateFeature(feature) != 0:
@@ -807,10 +905,11 @@ class Vector(Layer):
 
             feature.Destroy()
 
-        # Write keywords if any
-        write_keywords(self.keywords, base_name + '.keywords')
-
-        # FIXME (Ole): Maybe store style_info
+            # Commit in batches so the journal of transactional
+            # formats (sqlite, gpkg) stays small
+            if (i + 1) % WRITE_TRANSACTION_SIZE == 0:
+                lyr.CommitTransaction()
+                lyr.StartTransaction()
 
     def copy(self):
         """Return copy of vector layer
@@ -1013,12 +1112,23 @@ class Vector(Layer):
         # Create list of values for specified attribute
         values = self.get_data(attribute)
 
-        # Sort and select using Schwarzian transform
-        A = zip(values, self.data, self.geometry)
-        A.sort()
+        # Indices of the top N features in increasing order of value
+        column = _numeric_column(values)
+        if column is None:
+            # Not numeric, let Python compare the values
+            order = sorted(range(len(values)), key=values.__getitem__)[-N:]
+        else:
+            # NaN ranks lowest
+            column[numpy.isnan(column)] = -numpy.inf
+            if 0 < N < len(column) and hasattr(numpy, 'argpartition'):
+                # Select the top N without sorting the rest
+                top = numpy.argpartition(column, len(column) - N)[-N:]
+            else:
+                top = numpy.argsort(column)[-N:]
+            order = top[numpy.argsort(column[top], kind='mergesort')]
 
-        # Pick top N and unpack
-        data, geometry = zip(*A[-N:])[1:]
+        data = [self.data[i] for i in order]
+        geometry = [self.geometry[i] for i in order]
 
         # Create new Vector instance and return
         return Vector(data=data,
@@ -31,7 +31,10 @@ from PyQt4 import QtCore
 from safe.impact_statistics.postprocessor_manager import (
     PostprocessorManager)
 from safe.impact_statistics.aggregator import Aggregator
-from safe.common.exceptions import ReadLayerError, ZeroImpactException
+from safe.common.exceptions import (
+    ReadLayerError,
+    ZeroImpactException,
+    AnalysisCancelledError)
 from safe.postprocessors.postprocessor_factory import (
     get_postprocessors,
     get_postprocessor_human_name)
@@ -58,8 +61,10 @@ from safe.utilities.gis import (
     get_wgs84_resolution,
     viewport_geo_array,
     extent_to_array)
-from safe.utilities.utilities import get_error_message
-from safe.utilities.clipper import clip_layer, adjust_clip_extent
+from safe.utilities.utilities import (
+    get_error_message,
+    get_safe_impact_function)
+from safe.utilities.clipper import clip_layers, adjust_clip_extent
 from safe.messaging import styles
 from safe.common.signals import (
     DYNAMIC_MESSAGE_SIGNAL,
@@ -70,6 +75,7 @@ from safe.common.signals import (
     ANALYSIS_DONE_SIGNAL)
 from safe_extras.pydispatch import dispatcher
 from safe.common.exceptions import BoundingBoxError, NoValidLayerError
+from safe.common.profiling import Profiler, profile_path
 
 
 PROGRESS_UPDATE_STYLE = styles.PROGRESS_UPDATE_STYLE
@@ -103,6 +109,9 @@ class Analysis(object):
         self.clip_hard = None
         self.show_intermediate_layers = None
         self.run_in_thread_flag = None
+        self.run_in_process_flag = False
+        # Megabytes the impact calculation process may allocate
+        self.memory_limit = None
         self.map_canvas = None
         self.clip_to_viewport = None
         self.user_extent = None
@@ -115,6 +124,7 @@ class Analysis(object):
         self.runner = None
         self.aggregator = None
         self.postprocessor_manager = None
+        self.profiler = Profiler()
 
         self.num_dynamic_signals = 3
 
@@ -578,6 +588,53 @@ class Analysis(object):
 
         return optimal_extent
 
+    def impact_function_memory_model(self):
+        """Get the memory cost model declared by the impact function.
+
+        :returns: The memory model or None if the impact function can not
+            be found.
+        :rtype: dict, None
+        """
+        try:
+            functions = get_safe_impact_function(self.impact_function_id)
+            function = functions[0][self.impact_function_id]
+            return function.Metadata.memory_model()
+        except (AttributeError, IndexError, KeyError, RuntimeError):
+            return None
+
+    def estimate_feature_count(self, geo_extent):
+        """Estimate the number of vector features in the analysis extent.
+
+        The feature count of each vector input layer is scaled by the part
+        of the layer extent that falls within the analysis extent.
+
+        :param geo_extent: Analysis extent [xmin, ymin, xmax, ymax] in
+            EPSG:4326.
+        :type geo_extent: list
+
+        :returns: Estimated number of features.
+        :rtype: int
+        """
+        feature_count = 0
+        for layer in [self.hazard_layer, self.exposure_layer]:
+            if layer is None or layer.type() != QgsMapLayer.VectorLayer:
+                continue
+            layer_extent = extent_to_array(layer.extent(), layer.crs())
+            layer_area = (
+                (layer_extent[2] - layer_extent[0]) *
+                (layer_extent[3] - layer_extent[1]))
+            overlap = bbox_intersection(layer_extent, geo_extent)
+            if overlap is None:
+                continue
+            if layer_area > 0:
+                fraction = min(1.0, (
+                    (overlap[2] - overlap[0]) *
+                    (overlap[3] - overlap[1])) / layer_area)
+            else:
+                fraction = 1.0
+            feature_count += int(layer.featureCount() * fraction)
+        return feature_count
+
     def setup_aggregator(self):
         """Create an aggregator for this analysis run."""
         # Refactor from dock.prepare_aggregator
@@ -691,7 +748,11 @@ class Analysis(object):
 
         if not self.force_memory:
             # Ensure there is enough memory
-            result = check_memory_usage(buffered_geoextent, cell_size)
+            result = check_memory_usage(
+                buffered_geoextent,
+                cell_size,
+                memory_model=self.impact_function_memory_model(),
+                feature_count=self.estimate_feature_count(buffered_geoextent))
             if not result:
                 raise InsufficientMemoryWarning
 
@@ -751,41 +812,37 @@ class Analysis(object):
             raise
         # Make sure that we have EPSG:4326 versions of the input layers
         # that are clipped and (in the case of two raster inputs) resampled to
-        # the best resolution.
-        title = self.tr('Preparing hazard data')
+        # the best resolution. Layers that already match are used as they
+        # are and raster warps run concurrently in worker processes.
+        title = self.tr('Preparing hazard and exposure data')
         detail = self.tr(
-            'We are resampling and clipping the hazard layer to match the '
-            'intersection of the exposure layer and the current view extents.')
+            'We are resampling and clipping the hazard and exposure layers '
+            'to match their intersection and the current view extents.')
         message = m.Message(
             m.Heading(title, **PROGRESS_UPDATE_STYLE),
             m.Paragraph(detail))
         self.send_dynamic_message(message)
+        clip_jobs = [
+            {
+                'layer': hazard_layer,
+                'extent': buffered_geo_extent,
+                'cell_size': cell_size,
+                'hard_clip_flag': self.clip_hard,
+                'reuse_source': True},
+            {
+                'layer': exposure_layer,
+                'extent': geo_extent,
+                'cell_size': cell_size,
+                'extra_keywords': extra_exposure_keywords,
+                'hard_clip_flag': self.clip_hard,
+                'reuse_source': True}]
         try:
-            clipped_hazard = clip_layer(
-                layer=hazard_layer,
-                extent=buffered_geo_extent,
-                cell_size=cell_size,
-                hard_clip_flag=self.clip_hard)
+            clipped_hazard, clipped_exposure = clip_layers(clip_jobs)
         except CallGDALError, e:
             raise e
         except IOError, e:
             raise e
 
-        title = self.tr('Preparing exposure data')
-        detail = self.tr(
-            'We are resampling and clipping the exposure layer to match the '
-            'intersection of the hazard layer and the current view extents.')
-        message = m.Message(
-            m.Heading(title, **PROGRESS_UPDATE_STYLE),
-            m.Paragraph(detail))
-        self.send_dynamic_message(message)
-
-        clipped_exposure = clip_layer(
-            layer=exposure_layer,
-            extent=geo_extent,
-            cell_size=cell_size,
-            extra_keywords=extra_exposure_keywords,
-            hard_clip_flag=self.clip_hard)
         return clipped_hazard, clipped_exposure
 
     def setup_impact_calculator(self):
@@ -807,7 +864,8 @@ class Analysis(object):
         if self.impact_calculator.requires_clipping():
             # The impact function uses SAFE layers,
             # clip them
-            hazard_layer, exposure_layer = self.optimal_clip()
+            with self.profiler.stage('clip'):
+                hazard_layer, exposure_layer = self.optimal_clip()
             self.aggregator.set_layers(hazard_layer, exposure_layer)
             # Extent is calculated in the aggregator:
             self.impact_calculator.set_extent(None)
@@ -816,7 +874,8 @@ class Analysis(object):
             try:
                 # This line is a fix for #997
                 self.aggregator.validate_keywords()
-                self.aggregator.deintersect()
+                with self.profiler.stage('deintersect'):
+                    self.aggregator.deintersect()
             except (InvalidLayerError,
                     UnsupportedProviderError,
                     KeywordDbError):
@@ -847,6 +906,12 @@ class Analysis(object):
                 'No impact layer was calculated. Error message: %s\n'
             ) % (str(result)))
             exception = self.runner.last_exception()
+            if isinstance(exception, AnalysisCancelledError):
+                self.send_static_message(m.Message(
+                    m.Heading(self.tr('Analysis cancelled'), **INFO_STYLE),
+                    m.Paragraph(exception.message)))
+                self.send_not_busy_signal()
+                return
             if isinstance(exception, ZeroImpactException):
                 report = m.Message()
                 report.add(LOGO_ELEMENT)
@@ -888,7 +953,8 @@ class Analysis(object):
             return
 
         try:
-            self.aggregator.aggregate(self.runner.impact_layer())
+            with self.profiler.stage('aggregation'):
+                self.aggregator.aggregate(self.runner.impact_layer())
         except InvalidGeometryError, e:
             message = get_error_message(e)
             self.send_error_message(message)
@@ -915,12 +981,76 @@ class Analysis(object):
         self.postprocessor_manager = PostprocessorManager(self.aggregator)
         self.postprocessor_manager.function_parameters = \
             self.impact_function_parameters
-        self.postprocessor_manager.run()
+        with self.profiler.stage('postprocessing'):
+            self.postprocessor_manager.run()
+        self.write_profile()
         self.send_not_busy_signal()
         self.send_analysis_done_signal()
 
+    def show_runner_progress(self, stage):
+        """Show the stage the impact calculation process is busy with.
+
+        :param stage: Name of the stage e.g. 'impact_function/interpolation'.
+        :type stage: str
+        """
+        title = self.tr('Calculating impact')
+        detail = self.tr('Current step: %s') % stage.replace('_', ' ')
+        message = m.Message(
+            m.Heading(title, **PROGRESS_UPDATE_STYLE),
+            m.Paragraph(detail))
+        self.send_dynamic_message(message)
+
+    def cancel_analysis(self):
+        """Cancel the impact calculation if it supports cancellation."""
+        if self.runner is not None and hasattr(self.runner, 'cancel'):
+            self.runner.cancel()
+
+    def write_profile(self):
+        """Write the stage profile of the analysis next to the impact layer.
+
+        The sidecar written by calculate_impact only covers the stages up to
+        writing the impact layer, it is replaced here by the profile of the
+        whole analysis.
+        """
+        impact_layer = self.get_impact_layer()
+        filename = getattr(impact_layer, 'filename', None)
+        if not filename:
+            return
+        try:
+            self.profiler.write_json(profile_path(filename))
+        except IOError:
+            LOGGER.exception('Could not write the analysis profile.')
+
+    def write_impact_keywords(self, qgis_impact_layer, keyword_io):
+        """Store the postprocessing results and profile as keywords.
+
+        The postprocessing report (html), its numeric summary and the stage
+        profile of the analysis are added to the keywords of the impact
+        layer.
+
+        :param qgis_impact_layer: A QGIS layer representing the impact.
+        :type qgis_impact_layer: QgsMapLayer, QgsVectorLayer, QgsRasterLayer
+
+        :param keyword_io: The keyword reader / writer to use.
+        :type keyword_io: KeywordIO
+
+        :returns: All the keywords of the impact layer.
+        :rtype: dict
+        """
+        keywords = keyword_io.read_keywords(qgis_impact_layer)
+        aoi_mode = self.aggregator.aoi_mode
+        output = self.postprocessor_manager.get_output(aoi_mode)
+        keywords['postprocessing_report'] = output.to_html(
+            suppress_newlines=True)
+        keywords['postprocessing_summary'] = (
+            self.postprocessor_manager.get_summary(aoi_mode))
+        keywords['profile'] = self.profiler.to_keyword()
+        keyword_io.write_keywords(qgis_impact_layer, keywords)
+        return keywords
+
     def run_analysis(self):
         """It's similar with run function in previous dock.py"""
+        self.profiler = Profiler()
         try:
             self.setup_impact_calculator()
         except CallGDALError, e:
@@ -962,7 +1092,11 @@ class Analysis(object):
             return
 
         try:
-            self.runner = self.impact_calculator.get_runner()
+            with self.profiler.stage('layer_reading'):
+                self.runner = self.impact_calculator.get_runner(
+                    profiler=self.profiler,
+                    isolated=self.run_in_process_flag,
+                    memory_limit=self.memory_limit)
         except (InsufficientParametersError, ReadLayerError), e:
             self.analysis_error(
                 e,
@@ -971,6 +1105,8 @@ class Analysis(object):
             return
 
         self.runner.done.connect(self.run_aggregator)
+        if hasattr(self.runner, 'progress'):
+            self.runner.progress.connect(self.show_runner_progress)
 
         self.send_busy_signal()
 
@@ -100,6 +100,8 @@ class AnalysisHandler(QObject):
 
         # Values for settings these get set in read_settings.
         self.run_in_thread_flag = None
+        self.run_in_process_flag = None
+        self.memory_limit = None
         self.zoom_to_impact_flag = None
         self.hide_exposure_flag = None
         self.clip_hard = None
@@ -254,6 +256,15 @@ class AnalysisHandler(QObject):
             'inasafe/useThreadingFlag', False, type=bool)
         self.run_in_thread_flag = flag
 
+        flag = settings.value(
+            'inasafe/useProcessIsolationFlag', False, type=bool)
+        self.run_in_process_flag = flag
+
+        # Zero means the impact calculation process is not limited
+        memory_limit = settings.value(
+            'inasafe/processMemoryLimit', 0, type=int)
+        self.memory_limit = memory_limit or None
+
         flag = settings.value(
             'inasafe/setZoomToImpactFlag', True, type=bool)
         self.zoom_to_impact_flag = flag
@@ -370,6 +381,8 @@ class AnalysisHandler(QObject):
         self.analysis.clip_hard = self.clip_hard
         self.analysis.show_intermediate_layers = self.show_intermediate_layers
         self.analysis.run_in_thread_flag = self.run_in_thread_flag
+        self.analysis.run_in_process_flag = self.run_in_process_flag
+        self.analysis.memory_limit = self.memory_limit
         self.analysis.map_canvas = self.iface.mapCanvas()
 
         # Extent
@@ -435,14 +448,9 @@ class AnalysisHandler(QObject):
         :returns: Provides a report for writing to the dock.
         :rtype: str
         """
-        keywords = self.keyword_io.read_keywords(qgis_impact_layer)
-
         # write postprocessing report to keyword
-        output = self.analysis.postprocessor_manager.get_output(
-            self.analysis.aggregator.aoi_mode)
-        keywords['postprocessing_report'] = output.to_html(
-            suppress_newlines=True)
-        self.keyword_io.write_keywords(qgis_impact_layer, keywords)
+        keywords = self.analysis.write_impact_keywords(
+            qgis_impact_layer, self.keyword_io)
 
         # Get tabular information from impact layer
         report = m.Message()
@@ -19,10 +19,14 @@ __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
 import os
+import sys
+import json
 import tempfile
 import logging
+from subprocess import PIPE
 
-from PyQt4.QtCore import QProcess
+from osgeo import gdal, ogr, osr
+from PyQt4.QtCore import QProcess, QVariant, QPyNullVariant
 from qgis.core import (
     QGis,
     QgsCoordinateTransform,
@@ -31,6 +35,7 @@ from qgis.core import (
     QgsMapLayer,
     QgsFeatureRequest,
     QgsVectorFileWriter,
+    QgsVectorDataProvider,
     QgsGeometry,
     QgsVectorLayer,
     QgsRasterLayer)
@@ -44,10 +49,37 @@ from safe.common.exceptions import (
     InvalidProjectionError,
     InvalidClipGeometryError)
 from safe.utilities.utilities import read_file_keywords
+from safe.utilities.worker import start_worker
 
 
 LOGGER = logging.getLogger(name='InaSAFE')
 
+# File extensions for the raster formats _clip_raster_layer can write
+RASTER_OUTPUT_EXTENSIONS = {
+    'GTiff': '.tif',
+    'VRT': '.vrt'}
+
+# File extensions for the vector formats _clip_vector_layer can write
+VECTOR_OUTPUT_EXTENSIONS = {
+    'ESRI Shapefile': '.shp',
+    'GPKG': '.gpkg'}
+
+# Extensions of the sources read_layer can read, only those sources may be
+# used in place of a clipped copy
+REUSABLE_RASTER_EXTENSIONS = ['.tif', '.asc', '.nc', '.vrt']
+REUSABLE_VECTOR_EXTENSIONS = ['.shp', '.sqlite', '.gpkg']
+
+# Relative difference below which a cell size counts as the native one
+CELL_SIZE_TOLERANCE = 1e-9
+
+# OGR field types used when writing QGIS fields to a GeoPackage
+OGR_FIELD_TYPES = {
+    QVariant.Int: ogr.OFTInteger,
+    QVariant.LongLong: getattr(ogr, 'OFTInteger64', ogr.OFTReal),
+    QVariant.Double: ogr.OFTReal,
+    QVariant.Date: ogr.OFTDate,
+    QVariant.DateTime: ogr.OFTDateTime}
+
 
 def clip_layer(
         layer,
@@ -56,7 +88,10 @@ def clip_layer(
         extra_keywords=None,
         explode_flag=True,
         hard_clip_flag=False,
-        explode_attribute=None):
+        explode_attribute=None,
+        raster_output_format='GTiff',
+        vector_output_format='ESRI Shapefile',
+        reuse_source=False):
     """Clip a Hazard or Exposure layer to the extents provided.
 
     .. note:: Will delegate to clipVectorLayer or clipRasterLayer as needed.
@@ -96,10 +131,33 @@ def clip_layer(
 
     :param explode_attribute: A str specifying to which attribute #1,
         #2 and so on will be added in case of explode_flag being true. The
-        attribute is modified only if there are at least 2 parts.
+        attribute is modified only if there are at least 2 parts. The ids of
+        the source features are then kept in the 'source feature ids'
+        keyword.
         **This parameter is ignored for raster layer clipping.**
     :type explode_attribute: str
 
+    :param raster_output_format: GDAL driver used for a clipped raster.
+        Either 'GTiff' (default) or 'VRT'. A VRT output is a lightweight
+        virtual dataset that warps the source lazily when it is read, or
+        just a window over its pixels when no resampling is needed.
+        **This parameter is ignored for vector layer clipping.**
+    :type raster_output_format: str
+
+    :param vector_output_format: OGR driver used for a clipped vector.
+        Either 'ESRI Shapefile' (default) or 'GPKG'. A GeoPackage is written
+        in a single transaction and carries its own spatial index.
+        **This parameter is ignored for raster layer clipping.**
+    :type vector_output_format: str
+
+    :param reuse_source: Whether the input layer itself may be returned when
+        clipping would not change it (it is in EPSG:4326, lies within the
+        extent and, for rasters, has the requested cell size). This is only
+        done for whole files of a format read_layer supports, not for
+        sublayers or filtered layers. Only use this when the result is not
+        modified afterwards.
+    :type reuse_source: bool
+
     :returns: Clipped layer (placed in the system temp dir). The output layer
         will be reprojected to EPSG:4326 if needed.
     :rtype: QgsMapLayer
@@ -112,14 +170,18 @@ def clip_layer(
             extra_keywords=extra_keywords,
             explode_flag=explode_flag,
             hard_clip_flag=hard_clip_flag,
-            explode_attribute=explode_attribute)
+            explode_attribute=explode_attribute,
+            output_format=vector_output_format,
+            reuse_source=reuse_source)
     else:
         try:
             return _clip_raster_layer(
                 layer,
                 extent,
                 cell_size,
-                extra_keywords=extra_keywords)
+                extra_keywords=extra_keywords,
+                output_format=raster_output_format,
+                reuse_source=reuse_source)
         except CallGDALError, e:
             raise e
         except IOError, e:
@@ -133,7 +195,9 @@ def _clip_vector_layer(
         extra_keywords=None,
         explode_flag=True,
         hard_clip_flag=False,
-        explode_attribute=None):
+        explode_attribute=None,
+        output_format='ESRI Shapefile',
+        reuse_source=False):
     """Clip a Hazard or Exposure layer to the extents provided.
 
     The layer must be a vector layer or an exception will be thrown.
@@ -170,9 +234,21 @@ def _clip_vector_layer(
 
     :param explode_attribute: A str specifying to which attribute #1,
         #2 and so on will be added in case of explode_flag being true. The
-        attribute is modified only if there are at least 2 parts.
+        attribute is modified only if there are at least 2 parts. When it is
+        given the id of the source feature of each output feature is stored
+        in the 'source feature ids' keyword, so that results of the parts
+        can be related to the features of the layer.
     :type explode_attribute: str
 
+    :param output_format: OGR driver for the output, either
+        'ESRI Shapefile' or 'GPKG'. In both cases a spatial index is
+        available on the output layer.
+    :type output_format: str
+
+    :param reuse_source: Whether the layer itself may be returned when it is
+        in EPSG:4326 and lies within the extent, see clip_layer.
+    :type reuse_source: bool
+
     :returns: Clipped layer (placed in the system temp dir). The output layer
         will be reprojected to EPSG:4326 if needed.
     :rtype: QgsVectorLayer
@@ -188,10 +264,19 @@ def _clip_vector_layer(
             str(layer.type()))
         raise InvalidParameterError(message)
 
-    # handle, file_name = tempfile.mkstemp('.sqlite', 'clip_',
-    #    temp_dir())
+    if output_format not in VECTOR_OUTPUT_EXTENSIONS:
+        message = tr(
+            'Unsupported vector output format "%s". Expected one of %s.' % (
+                output_format, VECTOR_OUTPUT_EXTENSIONS.keys()))
+        raise InvalidParameterError(message)
+
+    if reuse_source and not extra_keywords and _vector_clip_is_noop(
+            layer, extent, explode_flag):
+        LOGGER.debug('%s needs no clipping, using it as is' % layer.source())
+        return layer
+
     handle, file_name = tempfile.mkstemp(
-        '.shp', 'clip_', temp_dir())
+        VECTOR_OUTPUT_EXTENSIONS[output_format], 'clip_', temp_dir())
 
     # Ensure the file is deleted before we try to write to it
     # fixes windows specific issue where you get a message like this
@@ -213,10 +298,12 @@ def _clip_vector_layer(
         # noinspection PyCallByClass
         # noinspection PyTypeChecker
         polygon = QgsGeometry.fromRect(rectangle)
+        clip_rectangle = rectangle
     elif (type(extent) is QgsGeometry and
           extent.wkbType in allowed_clip_values):
         rectangle = extent.boundingBox().toRectF()
         polygon = extent
+        clip_rectangle = None
     else:
         raise InvalidClipGeometryError(
             tr(
@@ -244,58 +331,62 @@ def _clip_vector_layer(
 
     field_list = provider.fields()
 
-    writer = QgsVectorFileWriter(
-        file_name,
-        'UTF-8',
-        field_list,
-        layer.wkbType(),
-        geo_crs,
-        # 'SQLite')  # FIXME (Ole): This works but is far too slow
-        'ESRI Shapefile')
-    if writer.hasError() != QgsVectorFileWriter.NoError:
-        message = tr(
-            'Error when creating shapefile: <br>Filename:'
-            '%s<br>Error: %s' %
-            (file_name, writer.hasError()))
-        raise Exception(message)
-
     # Reverse the coordinate xform now so that we can convert
-    # geometries from layer crs to geocrs.
-    transform = QgsCoordinateTransform(layer.crs(), geo_crs)
-    # Retrieve every feature with its geometry and attributes
-    count = 0
-    has_multipart = False
-
-    for feature in provider.getFeatures(request):
-        geometry = feature.geometry()
-
-        # Loop through the parts adding them to the output file
-        # we write out single part features unless explode_flag is False
-        if explode_flag:
-            geometry_list = explode_multipart_geometry(geometry)
-        else:
-            geometry_list = [geometry]
-
-        for part_index, part in enumerate(geometry_list):
-            part.transform(transform)
-            if hard_clip_flag:
-                # Remove any dangling bits so only intersecting area is
-                # kept.
-                part = clip_geometry(polygon, part)
-            if part is None:
-                continue
-
-            feature.setGeometry(part)
-            # There are multiple parts and we want to show it in the
-            # explode_attribute
-            if part_index > 0 and explode_attribute is not None:
-                has_multipart = True
-
-            writer.addFeature(feature)
-        count += 1
-    del writer  # Flush to disk
+    # geometries from layer crs to geocrs. Layers that are already in
+    # EPSG:4326 need no transform at all.
+    if layer.crs() == geo_crs:
+        transform = None
+    else:
+        transform = QgsCoordinateTransform(layer.crs(), geo_crs)
+    # Retrieve every feature with its geometry and attributes. They are
+    # handed to the writer one by one so they are never all in memory.
+    state = {'count': 0, 'has_multipart': False, 'source_ids': []}
+
+    def clipped_features():
+        """Generate the clipped parts of the features in the extent."""
+        for feature in provider.getFeatures(request):
+            geometry = feature.geometry()
+
+            # Loop through the parts adding them to the output file
+            # we write out single part features unless explode_flag is False
+            if explode_flag:
+                geometry_list = explode_multipart_geometry(geometry)
+            else:
+                geometry_list = [geometry]
+
+            for part_index, part in enumerate(geometry_list):
+                if transform is not None:
+                    part.transform(transform)
+                if hard_clip_flag and not (
+                        clip_rectangle is not None and
+                        clip_rectangle.contains(part.boundingBox())):
+                    # Remove any dangling bits so only intersecting area is
+                    # kept. Parts entirely inside a rectangular extent are
+                    # kept as they are.
+                    part = clip_geometry(polygon, part)
+                if part is None:
+                    continue
+
+                feature.setGeometry(part)
+                # There are multiple parts and we want to show it in the
+                # explode_attribute
+                if part_index > 0 and explode_attribute is not None:
+                    state['has_multipart'] = True
+
+                state['source_ids'].append(feature.id())
+                yield feature
+            state['count'] += 1
+
+    if output_format == 'GPKG':
+        _write_features_to_geopackage(
+            file_name, field_list, layer.wkbType(), geo_crs,
+            clipped_features())
+    else:
+        _write_features_to_shapefile(
+            file_name, field_list, layer.wkbType(), geo_crs,
+            clipped_features())
 
-    if count < 1:
+    if state['count'] < 1:
         message = tr(
             'No features fall within the clip extents. Try panning / zooming '
             'to an area containing data and then try to run your analysis '
@@ -309,22 +400,139 @@ def _clip_vector_layer(
     keyword_io = KeywordIO()
     if extra_keywords is None:
         extra_keywords = {}
-    extra_keywords['had multipart polygon'] = has_multipart
+    extra_keywords['had multipart polygon'] = state['has_multipart']
+    if explode_attribute is not None:
+        extra_keywords['source feature ids'] = state['source_ids']
     keyword_io.copy_keywords(
         layer, file_name, extra_keywords=extra_keywords)
     base_name = '%s clipped' % layer.name()
     layer = QgsVectorLayer(file_name, base_name, 'ogr')
 
+    # GeoPackages carry an rtree already, shapefiles get a .qix index
+    provider = layer.dataProvider()
+    if (output_format == 'ESRI Shapefile' and
+            provider.capabilities() &
+            QgsVectorDataProvider.CreateSpatialIndex):
+        provider.createSpatialIndex()
+
     return layer
 
 
+def _write_features_to_shapefile(
+        file_name, fields, wkb_type, crs, features):
+    """Write features to a new shapefile with QgsVectorFileWriter.
+
+    :param file_name: Path of the shapefile to create.
+    :type file_name: str
+
+    :param fields: Fields of the features.
+    :type fields: QgsFields
+
+    :param wkb_type: Geometry type of the output layer.
+    :type wkb_type: QGis.WkbType
+
+    :param crs: Coordinate reference system of the features.
+    :type crs: QgsCoordinateReferenceSystem
+
+    :param features: Features to write, they are written as they come.
+    :type features: iterable
+    """
+    writer = QgsVectorFileWriter(
+        file_name,
+        'UTF-8',
+        fields,
+        wkb_type,
+        crs,
+        'ESRI Shapefile')
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        message = tr(
+            'Error when creating shapefile: <br>Filename:'
+            '%s<br>Error: %s' %
+            (file_name, writer.hasError()))
+        raise Exception(message)
+
+    for feature in features:
+        writer.addFeature(feature)
+    del writer  # Flush to disk
+
+
+def _write_features_to_geopackage(
+        file_name, fields, wkb_type, crs, features):
+    """Write features to a new GeoPackage in a single OGR transaction.
+
+    Writing row by row to a SQLite based format without a transaction
+    commits every feature on its own which is what made the SQLite
+    output of the clipper far too slow. The GeoPackage layer is created
+    with an rtree spatial index.
+
+    :param file_name: Path of the GeoPackage to create.
+    :type file_name: str
+
+    :param fields: Fields of the features.
+    :type fields: QgsFields
+
+    :param wkb_type: Geometry type of the output layer.
+    :type wkb_type: QGis.WkbType
+
+    :param crs: Coordinate reference system of the features.
+    :type crs: QgsCoordinateReferenceSystem
+
+    :param features: Features to write, they are written as they come.
+    :type features: iterable
+    """
+    driver = ogr.GetDriverByName('GPKG')
+    if driver is None:
+        message = tr(
+            'The GeoPackage driver is not available in your GDAL/OGR '
+            'installation.')
+        raise Exception(message)
+
+    data_source = driver.CreateDataSource(file_name)
+    if data_source is None:
+        message = tr('Error when creating GeoPackage %s' % file_name)
+        raise Exception(message)
+
+    spatial_reference = osr.SpatialReference()
+    spatial_reference.ImportFromWkt(str(crs.toWkt()))
+    layer_name = os.path.splitext(os.path.basename(file_name))[0]
+    ogr_layer = data_source.CreateLayer(
+        layer_name, spatial_reference, wkb_type, ['SPATIAL_INDEX=YES'])
+
+    for field in fields.toList():
+        field_type = OGR_FIELD_TYPES.get(field.type(), ogr.OFTString)
+        ogr_layer.CreateField(ogr.FieldDefn(str(field.name()), field_type))
+    definition = ogr_layer.GetLayerDefn()
+    # Fields are matched by name: OGR indexes differ from the QGIS ones
+    # when e.g. a source field named fid becomes the GeoPackage FID column
+    field_indexes = [
+        definition.GetFieldIndex(str(field.name()))
+        for field in fields.toList()]
+
+    ogr_layer.StartTransaction()
+    for feature in features:
+        ogr_feature = ogr.Feature(definition)
+        ogr_feature.SetGeometryDirectly(
+            ogr.CreateGeometryFromWkb(feature.geometry().asWkb()))
+        for field_index, value in zip(field_indexes, feature.attributes()):
+            if field_index < 0:
+                continue
+            if value is None or isinstance(value, QPyNullVariant):
+                continue
+            if not isinstance(value, (int, long, float, basestring)):
+                # e.g. QDate, QDateTime
+                value = str(value.toString())
+            ogr_feature.SetField(field_index, value)
+        ogr_layer.CreateFeature(ogr_feature)
+    ogr_layer.CommitTransaction()
+    data_source = None  # Flush to disk
+
+
 def clip_geometry(clip_polygon, geometry):
     """Clip a geometry (linestring or polygon) using a clip polygon.
 
-    To do this we combine the clip polygon with the input geometry which
-    will add nodes to the input geometry where it intersects the clip polygon.
-    Next we get the symmetrical difference between the input geometry and the
-    combined geometry.
+    Lines and polygons are clipped with a GEOS intersection so only the
+    part of the geometry inside the clip polygon is kept. Points are kept
+    if they fall inside the clip polygon.
 
     :param clip_polygon: A Polygon or Polygon25D geometry to clip with.
         Multipart polygons are not supported so the client needs to take care
@@ -334,21 +542,19 @@ def clip_geometry(clip_polygon, geometry):
     :param geometry: Linestring or polygon that should be clipped.
     :type geometry: QgsGeometry
 
-    :returns: A new geometry clipped to the region of the clip polygon.
+    :returns: A new geometry clipped to the region of the clip polygon or
+        None if nothing of the geometry is inside the clip polygon.
     :rtype: QgsGeometry
     """
-    # Add nodes to input geometry where it intersects with clip
     line_types = [QGis.WKBLineString, QGis.WKBLineString25D]
     point_types = [QGis.WKBPoint, QGis.WKBPoint25D]
     polygons_types = [QGis.WKBPolygon, QGis.WKBPolygon25D]
     geometry_type = geometry.wkbType()
-    if geometry_type in line_types:
-        combined_geometry = geometry.combine(clip_polygon)
-        # Gives you the lines inside the clip
-        symmetrical_geometry = geometry.symDifference(combined_geometry)
-        return symmetrical_geometry
-    elif geometry_type in polygons_types:
+    if geometry_type in line_types or geometry_type in polygons_types:
         intersection_geometry = geometry.intersection(clip_polygon)
+        if (intersection_geometry is None or
+                intersection_geometry.isGeosEmpty()):
+            return None
         return intersection_geometry
     elif geometry_type in point_types:
         if clip_polygon.contains(geometry):
@@ -398,7 +604,12 @@ def explode_multipart_geometry(geometry):
 
 
 def _clip_raster_layer(
-        layer, extent, cell_size=None, extra_keywords=None):
+        layer,
+        extent,
+        cell_size=None,
+        extra_keywords=None,
+        output_format='GTiff',
+        reuse_source=False):
     """Clip a Hazard or Exposure raster layer to the extents provided.
 
     The layer must be a raster layer or an exception will be thrown.
@@ -424,12 +635,45 @@ def _clip_raster_layer(
             theCellSize=None), the native raster cell size will be used.
     :type cell_size: float
 
-    :returns: Output clipped layer (placed in the system temp dir).
+    :param output_format: GDAL driver for the output, either 'GTiff' or
+        'VRT'. VRT output is only available with the in-process GDAL warp
+        API (GDAL >= 2.1).
+    :type output_format: str
+
+    :param reuse_source: Whether the layer itself may be returned when it
+        already has the extent and cell size, see clip_layer.
+    :type reuse_source: bool
+
+    :returns: Output clipped layer (placed in the system temp dir). A
+        geographic layer that only needs cropping is cropped without
+        resampling, which for VRT output is a window over its pixels.
     :rtype: QgsRasterLayer
 
     :raises: InvalidProjectionError - if input layer is a density
         layer in projected coordinates. See issue #123.
 
+    """
+    plan = _plan_raster_clip(
+        layer, extent, cell_size, extra_keywords, output_format,
+        reuse_source)
+    if plan is None:
+        return layer
+    run_raster_clip(plan)
+    return _raster_clip_result(layer, plan, extra_keywords)
+
+
+def _plan_raster_clip(
+        layer, extent, cell_size, extra_keywords, output_format,
+        reuse_source=False):
+    """Validate a raster clip and decide how to do it.
+
+    :returns: None if the layer can be used as is, otherwise the plan for
+        run_raster_clip: the 'source' and 'output' paths, the 'extent' as
+        [xmin, ymin, xmax, ymax], the 'cell_size', the output 'format' and
+        whether a 'window' on the source pixels (no resampling) is enough.
+    :rtype: dict, None
+
+    :raises: InvalidParameterError, InvalidProjectionError
     """
     if not layer or not extent:
         message = tr('Layer or Extent passed to clip is None.')
@@ -441,6 +685,12 @@ def _clip_raster_layer(
             str(layer.type()))
         raise InvalidParameterError(message)
 
+    if output_format not in RASTER_OUTPUT_EXTENSIONS:
+        message = tr(
+            'Unsupported raster output format "%s". Expected one of %s.' % (
+                output_format, RASTER_OUTPUT_EXTENSIONS.keys()))
+        raise InvalidParameterError(message)
+
     working_layer = str(layer.source())
 
     # Check for existence of keywords file
@@ -473,15 +723,402 @@ def _clip_raster_layer(
                 ))
             raise InvalidProjectionError(message)
 
-    # We need to provide gdalwarp with a dataset for the clip
-    # because unlike gdal_translate, it does not take projwin.
-    clip_kml = extent_to_kml(extent)
+    if type(extent) is not list:
+        bounding_box = extent.boundingBox()
+        extent = [
+            bounding_box.xMinimum(),
+            bounding_box.yMinimum(),
+            bounding_box.xMaximum(),
+            bounding_box.yMaximum()]
+
+    window = _raster_window(layer, extent, cell_size)
+    if (window == 'source' and reuse_source and not extra_keywords and
+            _is_reusable_source(layer, REUSABLE_RASTER_EXTENSIONS)):
+        LOGGER.debug('%s needs no clipping, using it as is' % working_layer)
+        return None
+    window = window is not None and hasattr(gdal, 'Translate')
 
     # Create a filename for the clipped, resampled and reprojected layer
-    handle, filename = tempfile.mkstemp('.tif', 'clip_', temp_dir())
+    handle, filename = tempfile.mkstemp(
+        RASTER_OUTPUT_EXTENSIONS[output_format], 'clip_', temp_dir())
     os.close(handle)
     os.remove(filename)
 
+    return {
+        'source': working_layer,
+        'output': filename,
+        'extent': extent,
+        'cell_size': cell_size,
+        'format': output_format,
+        'window': window}
+
+
+def run_raster_clip(plan):
+    """Write the output of a raster clip planned by _plan_raster_clip.
+
+    Only GDAL is used here, so this can run in a worker process.
+
+    :param plan: The clip plan.
+    :type plan: dict
+
+    :returns: Path of the output raster.
+    :rtype: str
+
+    :raises: CallGDALError
+    """
+    if plan['window']:
+        source = gdal.Open(plan['source'], gdal.GA_ReadOnly)
+        if source is None:
+            message = tr('GDAL could not open raster %s' % plan['source'])
+            raise CallGDALError(message)
+        extent = plan['extent']
+        # Crop the source pixels, a VRT output copies nothing at all
+        dataset = gdal.Translate(
+            plan['output'],
+            source,
+            format=plan['format'],
+            projWin=[extent[0], extent[3], extent[2], extent[1]])
+        if dataset is None:
+            message = tr(
+                'GDAL could not crop raster %s: %s' % (
+                    plan['source'], gdal.GetLastErrorMsg()))
+            raise CallGDALError(message)
+    elif hasattr(gdal, 'Warp'):
+        dataset = warp_raster(
+            plan['source'],
+            plan['extent'],
+            cell_size=plan['cell_size'],
+            output_path=plan['output'],
+            output_format=plan['format'])
+    elif plan['format'] == 'GTiff':
+        dataset = None
+        _clip_raster_with_gdalwarp(
+            plan['source'], plan['output'], plan['extent'],
+            plan['cell_size'])
+    else:
+        message = tr(
+            'Raster output format "%s" requires GDAL 2.1 or newer.' %
+            plan['format'])
+        raise CallGDALError(message)
+    dataset = None  # Close and flush to disk
+    return plan['output']
+
+
+def _raster_clip_result(layer, plan, extra_keywords):
+    """Make the layer written by run_raster_clip.
+
+    :returns: Output clipped layer with the keywords of the input layer.
+    :rtype: QgsRasterLayer
+    """
+    keyword_io = KeywordIO()
+    keyword_io.copy_keywords(
+        layer, plan['output'], extra_keywords=extra_keywords)
+    base_name = '%s clipped' % layer.name()
+    return QgsRasterLayer(plan['output'], base_name)
+
+
+def _raster_window(layer, extent, cell_size):
+    """Find out whether a raster can be clipped without resampling.
+
+    :param layer: The raster layer.
+    :type layer: QgsRasterLayer
+
+    :param extent: Clip extent [xmin, ymin, xmax, ymax] in EPSG:4326.
+    :type extent: list
+
+    :param cell_size: Requested cell size or None for the native one.
+    :type cell_size: float
+
+    :returns: 'source' if the raster already has the extent and cell size,
+        'window' if a window over its pixels is enough and None if it has
+        to be warped.
+    :rtype: str, None
+    """
+    if (str(layer.crs().authid()) != 'EPSG:4326' or
+            layer.providerType() != 'gdal'):
+        return None
+    native_x = layer.rasterUnitsPerPixelX()
+    native_y = layer.rasterUnitsPerPixelY()
+    if abs(native_x - native_y) > CELL_SIZE_TOLERANCE * native_x:
+        # Non square cells are made square by the warp
+        return None
+    if (cell_size is not None and
+            abs(cell_size - native_x) > CELL_SIZE_TOLERANCE * native_x):
+        return None
+    layer_extent = layer.extent()
+    layer_bounds = [
+        layer_extent.xMinimum(),
+        layer_extent.yMinimum(),
+        layer_extent.xMaximum(),
+        layer_extent.yMaximum()]
+    # Bounds within half a cell select the same pixels
+    if all(abs(bound - layer_bound) <= native_x / 2.0
+           for bound, layer_bound in zip(extent, layer_bounds)):
+        return 'source'
+    return 'window'
+
+
+def _is_reusable_source(layer, extensions):
+    """Check if the source of a layer can be used in place of a clip.
+
+    :param layer: The layer.
+    :type layer: QgsMapLayer
+
+    :param extensions: File extensions read_layer supports for the layer.
+    :type extensions: list
+
+    :returns: False for sublayers ('path|layername=...'), filtered layers
+        and files read_layer can not read, True otherwise.
+    :rtype: bool
+    """
+    source = str(layer.source())
+    if '|' in source:
+        return False
+    if hasattr(layer, 'subsetString') and layer.subsetString():
+        return False
+    _, extension = os.path.splitext(source)
+    return extension.lower() in extensions
+
+
+def _vector_clip_is_noop(layer, extent, explode_flag):
+    """Find out whether clipping a vector layer would keep it as it is.
+
+    That is the case for a whole file in EPSG:4326 that lies within a
+    rectangular extent and has no multipart features to explode.
+
+    :returns: True if the layer can be used instead of a clipped copy.
+    :rtype: bool
+    """
+    if (type(extent) is not list or
+            layer.providerType() != 'ogr' or
+            not _is_reusable_source(layer, REUSABLE_VECTOR_EXTENSIONS) or
+            str(layer.crs().authid()) != 'EPSG:4326' or
+            layer.featureCount() < 1):
+        return False
+    if explode_flag and QGis.isMultiType(layer.wkbType()):
+        return False
+    base, _ = os.path.splitext(str(layer.source()))
+    if not os.path.isfile(base + '.keywords'):
+        return False
+    layer_extent = layer.extent()
+    return (
+        extent[0] <= layer_extent.xMinimum() and
+        extent[1] <= layer_extent.yMinimum() and
+        extent[2] >= layer_extent.xMaximum() and
+        extent[3] >= layer_extent.yMaximum())
+
+
+def _start_clip_worker(plan):
+    """Run a raster clip in a new python interpreter.
+
+    :param plan: The clip plan, see _plan_raster_clip.
+    :type plan: dict
+
+    :returns: The worker process and the path of its plan file.
+    :rtype: (Popen, str)
+    """
+    handle, plan_path = tempfile.mkstemp('.json', 'clip_plan_', temp_dir())
+    with os.fdopen(handle, 'w') as plan_file:
+        json.dump(plan, plan_file)
+    try:
+        process = start_worker(
+            'safe.utilities.clipper', [plan_path], stderr=PIPE)
+    except OSError:
+        os.remove(plan_path)
+        raise
+    return process, plan_path
+
+
+def clip_layers(clip_jobs, concurrent=True):
+    """Clip several layers, warping rasters in worker processes.
+
+    Raster warps only need GDAL so they run in worker processes (fresh
+    python interpreters, see safe.utilities.worker) while this process
+    clips the vector layers (which need QGIS). Jobs may set reuse_source
+    to get layers that need no clipping back as they are, see clip_layer.
+
+    :param clip_jobs: Keyword arguments of clip_layer for each layer.
+    :type clip_jobs: list
+
+    :param concurrent: Whether raster warps may run in worker processes.
+    :type concurrent: bool
+
+    :returns: The clipped layers in the order of clip_jobs.
+    :rtype: list
+    """
+    results = [None] * len(clip_jobs)
+    plans = {}
+    for index, job in enumerate(clip_jobs):
+        layer = job['layer']
+        if layer.type() != QgsMapLayer.RasterLayer:
+            continue
+        plan = _plan_raster_clip(
+            layer,
+            job['extent'],
+            job.get('cell_size'),
+            job.get('extra_keywords'),
+            job.get('raster_output_format', 'GTiff'),
+            job.get('reuse_source', False))
+        if plan is None:
+            results[index] = layer
+        else:
+            plans[index] = plan
+
+    warps = [index for index in plans if not plans[index]['window']]
+    pending = {}
+    try:
+        if (concurrent and warps and len(clip_jobs) > 1 and
+                hasattr(gdal, 'Warp')):
+            for index in warps:
+                try:
+                    pending[index] = _start_clip_worker(plans[index])
+                except OSError:
+                    LOGGER.exception('Could not start clip workers')
+                    break
+
+        # Meanwhile do the rest of the work in this process
+        for index, job in enumerate(clip_jobs):
+            if results[index] is not None or index in pending:
+                continue
+            if index in plans:
+                run_raster_clip(plans[index])
+                results[index] = _raster_clip_result(
+                    job['layer'], plans[index], job.get('extra_keywords'))
+            else:
+                results[index] = clip_layer(**job)
+
+        for index in sorted(pending):
+            process, plan_path = pending.pop(index)
+            _, error = process.communicate()
+            os.remove(plan_path)
+            if process.returncode:
+                message = tr('Could not clip raster %s: %s' % (
+                    plans[index]['source'], error))
+                raise CallGDALError(message)
+            results[index] = _raster_clip_result(
+                clip_jobs[index]['layer'],
+                plans[index],
+                clip_jobs[index].get('extra_keywords'))
+    finally:
+        # Stop the workers left over after an error
+        for process, plan_path in pending.itervalues():
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            os.remove(plan_path)
+    return results
+
+
+def warp_raster(
+        source_path,
+        extent,
+        cell_size=None,
+        output_path='',
+        output_format='MEM'):
+    """Clip and resample a raster to EPSG:4326 with the GDAL warp API.
+
+    The warp runs in process, so no gdalwarp binary is spawned and with the
+    default MEM driver nothing is written to disk. The native data type of
+    the source band is kept.
+
+    A rectangular extent is passed to GDAL as output bounds. A polygon
+    extent falls back to a KML cutline of its bounding box.
+
+    :param source_path: Path to a raster file readable by GDAL.
+    :type source_path: str
+
+    :param extent: Extent in the form [xmin, ymin, xmax, ymax] in
+        EPSG:4326, or a QgsGeometry of type polygon.
+    :type extent: list(float), QgsGeometry
+
+    :param cell_size: Cell size (in GeoCRS) which the raster should be
+        resampled to. If None the native cell size is kept when the source
+        is already geographic, otherwise GDAL picks an equivalent one.
+    :type cell_size: float
+
+    :param output_path: Path of the output dataset. Ignored (and may be
+        empty) for the MEM driver.
+    :type output_path: str
+
+    :param output_format: GDAL driver name e.g. 'MEM', 'VRT' or 'GTiff'.
+    :type output_format: str
+
+    :returns: The warped GDAL dataset. The caller must release it (set it
+        to None) to flush file based outputs to disk.
+    :rtype: gdal.Dataset
+
+    :raises: CallGDALError if the source cannot be opened or warped.
+    """
+    source = gdal.Open(source_path, gdal.GA_ReadOnly)
+    if source is None:
+        message = tr('GDAL could not open raster %s' % source_path)
+        raise CallGDALError(message)
+
+    options = {
+        'format': output_format,
+        'dstSRS': 'EPSG:4326',
+        'resampleAlg': 'near'}
+
+    if cell_size is not None:
+        options['xRes'] = cell_size
+        options['yRes'] = cell_size
+    else:
+        source_srs = osr.SpatialReference(wkt=source.GetProjection())
+        geo_srs = osr.SpatialReference()
+        geo_srs.ImportFromEPSG(4326)
+        if source_srs.IsSame(geo_srs):
+            # Pin the native cell size so the raster dims stay consistent
+            geotransform = source.GetGeoTransform()
+            options['xRes'] = abs(geotransform[1])
+            options['yRes'] = abs(geotransform[5])
+
+    if type(extent) is list:
+        options['outputBounds'] = extent
+    else:
+        bounding_box = extent.boundingBox()
+        options['cutlineDSName'] = extent_to_kml([
+            bounding_box.xMinimum(),
+            bounding_box.yMinimum(),
+            bounding_box.xMaximum(),
+            bounding_box.yMaximum()])
+        options['cropToCutline'] = True
+
+    LOGGER.debug('Warping %s with options %s' % (source_path, options))
+    dataset = gdal.Warp(output_path, source, **options)
+    if dataset is None:
+        message = tr(
+            'GDAL could not warp raster %s: %s' % (
+                source_path, gdal.GetLastErrorMsg()))
+        raise CallGDALError(message)
+
+    return dataset
+
+
+def _clip_raster_with_gdalwarp(source_path, output_path, extent, cell_size):
+    """Clip a raster by spawning the gdalwarp binary.
+
+    This is used when the GDAL python bindings do not expose gdal.Warp
+    (GDAL < 2.1). The output is always a Float64 GeoTIFF.
+
+    :param source_path: Path to the raster that should be clipped.
+    :type source_path: str
+
+    :param output_path: Path of the GeoTIFF to write.
+    :type output_path: str
+
+    :param extent: Extent in the form [xmin, ymin, xmax, ymax].
+    :type extent: list(float)
+
+    :param cell_size: Cell size (in GeoCRS) which the raster should be
+        resampled to or None to keep the native cell size.
+    :type cell_size: float
+
+    :raises: CallGDALError if gdalwarp cannot be found or fails to run.
+    """
+    # We need to provide gdalwarp with a dataset for the clip
+    # because unlike gdal_translate, it does not take projwin.
+    clip_kml = extent_to_kml(extent)
+
     # If no cell size is specified, we need to run gdalwarp without
     # specifying the output pixel size to ensure the raster dims
     # remain consistent.
@@ -498,8 +1135,8 @@ def _clip_raster_layer(
             '-ot Float64 -of GTiff "%s" "%s"' % (
                 binary,
                 clip_kml,
-                working_layer,
-                filename))
+                source_path,
+                output_path))
     else:
         command = (
             '"%s" -q -t_srs EPSG:4326 -r near -tr %s %s -cutline %s '
@@ -508,8 +1145,8 @@ def _clip_raster_layer(
                 repr(cell_size),
                 repr(cell_size),
                 clip_kml,
-                working_layer,
-                filename))
+                source_path,
+                output_path))
 
     LOGGER.debug(command)
     result = QProcess().execute(command)
@@ -529,14 +1166,7 @@ def _clip_raster_layer(
             '<p>Error while executing the following shell command:</p>'
             '<pre>%s</pre><p>Error message: %s' % (command, message_detail))
         raise CallGDALError(message)
-
     # .. todo:: Check the result of the shell call is ok
-    keyword_io = KeywordIO()
-    keyword_io.copy_keywords(layer, filename, extra_keywords=extra_keywords)
-    base_name = '%s clipped' % layer.name()
-    layer = QgsRasterLayer(filename, base_name)
-
-    return layer
 
 
 def extent_to_kml(extent):
@@ -678,3 +1308,18 @@ def adjust_clip_extent(clip_extent, cell_size, layer_extent):
         adjusted_xmin, adjusted_ymin, adjusted_xmax, adjusted_ymax]
 
     return adjusted_extent
+
+
+def main(plan_path):
+    """Worker entry point: run the raster clip planned in a JSON file.
+
+    :param plan_path: Path of the plan written by clip_layers.
+    :type plan_path: str
+    """
+    with open(plan_path) as plan_file:
+        plan = json.load(plan_file)
+    run_raster_clip(plan)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
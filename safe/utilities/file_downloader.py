@@ -19,15 +19,83 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
 
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
 # noinspection PyPackageRequirements
-from PyQt4.QtCore import QCoreApplication, QFile, QUrl, QByteArray
+from PyQt4.QtCore import QEventLoop, QFile, QUrl
 # noinspection PyPackageRequirements
 from PyQt4.QtNetwork import QNetworkRequest, QNetworkReply
 
+# HTTP status codes the downloader handles itself.
+HTTP_OK = 200
+HTTP_PARTIAL_CONTENT = 206
+HTTP_NOT_MODIFIED = 304
+
+
+def default_cache_dir():
+    """Directory of the download cache.
+
+    Unlike temp_dir this does not change from day to day so that the same
+    download can be reused later. INASAFE_WORK_DIR is honoured.
+
+    :returns: Path of the cache directory, created if needed.
+    :rtype: str
+    """
+    if 'INASAFE_WORK_DIR' in os.environ:
+        root = os.environ['INASAFE_WORK_DIR']
+    else:
+        root = tempfile.gettempdir()
+    path = os.path.join(root, 'inasafe', 'download_cache')
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return path
+
+
+def _read_metadata(path):
+    """Read the JSON metadata stored next to a cached or partial file.
+
+    :returns: The metadata or an empty dict if there is none.
+    :rtype: dict
+    """
+    try:
+        with open(path) as metadata_file:
+            return json.load(metadata_file)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_metadata(path, metadata):
+    """Write the JSON metadata of a cached or partial file."""
+    with open(path, 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+
+
+def _remove(path):
+    """Remove a file if it exists."""
+    if os.path.exists(path):
+        os.remove(path)
+
 
 class FileDownloader(object):
-    """The blueprint for downloading file from url."""
-    def __init__(self, manager, url, output_path, progress_dialog=None):
+    """The blueprint for downloading file from url.
+
+    The response is streamed to ``<output_path>.part`` and moved to
+    output_path once complete. An interrupted download is resumed with an
+    HTTP range request the next time, provided the server gave an ETag or
+    Last-Modified validator for it.
+
+    When a cache directory is given, complete downloads are kept there,
+    keyed by URL (for OSM extracts the URL carries the extent). Later
+    downloads of the same URL send a conditional request and copy the
+    cached file if the server answers 304 Not Modified.
+    """
+    def __init__(
+            self, manager, url, output_path, progress_dialog=None,
+            cache_dir=None):
         """Constructor of the class.
 
         :param manager: QNetworkAccessManager instance to handle downloading.
@@ -42,16 +110,33 @@ class FileDownloader(object):
         :param progress_dialog: Progress dialog widget.
         :type progress_dialog: QWidget
 
+        :param cache_dir: Directory of the download cache, None to not use
+            a cache.
+        :type cache_dir: str
         """
         self.manager = manager
         self.url = url
         self.output_path = output_path
         self.progress_dialog = progress_dialog
+        self.cache_dir = cache_dir
+        self.part_path = output_path + '.part'
         self.output_file = None
         self.reply = None
-        self.downloaded_file_buffer = None
+        self.resume_from = 0
+        self.status_code = None
         self.finished_flag = False
 
+    def cache_path(self):
+        """Path of the cached copy of the url.
+
+        :returns: The path or None when there is no cache.
+        :rtype: str
+        """
+        if not self.cache_dir:
+            return None
+        return os.path.join(
+            self.cache_dir, hashlib.sha1(self.url.encode('utf-8')).hexdigest())
+
     def download(self):
         """Downloading the file.
 
@@ -60,19 +145,44 @@ class FileDownloader(object):
 
         :raises: IOError - when cannot create output_path
         """
+        request = QNetworkRequest(QUrl(self.url))
+
+        cache_path = self.cache_path()
+        cache_metadata = {}
+        if cache_path and os.path.exists(cache_path):
+            cache_metadata = _read_metadata(cache_path + '.json')
+        if cache_metadata:
+            # Revalidate the cached copy, no need to resume anything
+            _remove(self.part_path)
+            if cache_metadata.get('etag'):
+                request.setRawHeader(
+                    'If-None-Match', str(cache_metadata['etag']))
+            if cache_metadata.get('last_modified'):
+                request.setRawHeader(
+                    'If-Modified-Since', str(cache_metadata['last_modified']))
+        else:
+            self.resume_from = self.resumable_size()
+            if self.resume_from:
+                part_metadata = _read_metadata(self.part_path + '.json')
+                request.setRawHeader(
+                    'Range', 'bytes=%d-' % self.resume_from)
+                # The server sends the whole file if it changed meanwhile
+                request.setRawHeader(
+                    'If-Range',
+                    str(part_metadata.get('etag') or
+                        part_metadata['last_modified']))
+
         # Prepare output path
-        self.output_file = QFile(self.output_path)
-        if not self.output_file.open(QFile.WriteOnly):
+        self.output_file = QFile(self.part_path)
+        if not self.output_file.open(QFile.Append):
             raise IOError(self.output_file.errorString())
 
-        # Prepare downloaded buffer
-        self.downloaded_file_buffer = QByteArray()
-
         # Request the url
-        request = QNetworkRequest(QUrl(self.url))
+        self.status_code = None
+        self.finished_flag = False
         self.reply = self.manager.get(request)
-        self.reply.readyRead.connect(self.get_buffer)
-        self.reply.finished.connect(self.write_data)
+        self.reply.readyRead.connect(self.write_chunk)
+        self.reply.finished.connect(self.finish)
 
         if self.progress_dialog:
             # progress bar
@@ -85,9 +195,10 @@ class FileDownloader(object):
                 :param total: Total expected data.
                 :type total: int
                 """
-                # noinspection PyArgumentList
-                QCoreApplication.processEvents()
-
+                if self.status_code == HTTP_PARTIAL_CONTENT:
+                    received += self.resume_from
+                    if total > 0:
+                        total += self.resume_from
                 label_text = "%s / %s" % (received, total)
                 self.progress_dialog.setLabelText(label_text)
                 self.progress_dialog.setMaximum(total)
@@ -101,28 +212,112 @@ class FileDownloader(object):
             self.reply.downloadProgress.connect(progress_event)
             self.progress_dialog.canceled.connect(cancel_action)
 
-        # Wait until finished
+        # Wait until finished, the event loop keeps the UI responsive.
         # On Windows 32bit AND QGIS 2.2, self.reply.isFinished() always
         # returns False even after finished slot is called. So, that's why we
         # are adding self.finished_flag (see #864)
-        while not self.reply.isFinished() and not self.finished_flag:
-            # noinspection PyArgumentList
-            QCoreApplication.processEvents()
+        loop = QEventLoop()
+        self.reply.finished.connect(loop.quit)
+        if not self.reply.isFinished() and not self.finished_flag:
+            loop.exec_()
 
         result = self.reply.error()
         if result == QNetworkReply.NoError:
+            self.store_result(cache_path, cache_metadata)
             return True, None
         else:
+            self.keep_partial()
             return result, str(self.reply.errorString())
 
-    def get_buffer(self):
-        """Get buffer from self.reply and store it to our buffer container."""
-        buffer_size = self.reply.size()
-        data = self.reply.read(buffer_size)
-        self.downloaded_file_buffer.append(data)
+    def resumable_size(self):
+        """Size of a previous partial download that can be resumed.
+
+        :returns: The number of bytes already downloaded, 0 if there is
+            nothing to resume.
+        :rtype: int
+        """
+        if not os.path.exists(self.part_path):
+            return 0
+        part_metadata = _read_metadata(self.part_path + '.json')
+        if (part_metadata.get('url') != self.url or not (
+                part_metadata.get('etag') or
+                part_metadata.get('last_modified'))):
+            # No way to tell whether the bytes we have are still valid
+            _remove(self.part_path)
+            _remove(self.part_path + '.json')
+            return 0
+        return os.path.getsize(self.part_path)
+
+    def validators(self):
+        """The ETag and Last-Modified headers of the reply.
+
+        :returns: The url and its validators.
+        :rtype: dict
+        """
+        return {
+            'url': self.url,
+            'etag': str(self.reply.rawHeader('ETag')),
+            'last_modified': str(self.reply.rawHeader('Last-Modified'))}
+
+    def write_chunk(self):
+        """Write the data available in self.reply to the partial file."""
+        if self.status_code is None:
+            self.status_code = self.reply.attribute(
+                QNetworkRequest.HttpStatusCodeAttribute)
+            if self.status_code == HTTP_OK:
+                # A full response, start from scratch
+                self.output_file.resize(0)
+        data = self.reply.readAll()
+        if self.status_code in (HTTP_OK, HTTP_PARTIAL_CONTENT):
+            self.output_file.write(data)
 
-    def write_data(self):
-        """Write data to a file."""
-        self.output_file.write(self.downloaded_file_buffer)
+    def finish(self):
+        """Write the remaining data and close the partial file."""
+        if self.reply.bytesAvailable() or self.status_code is None:
+            self.write_chunk()
         self.output_file.close()
         self.finished_flag = True
+
+    def store_result(self, cache_path, cache_metadata):
+        """Move a complete download into place and update the cache.
+
+        :param cache_path: Path of the cached copy, None if no cache.
+        :type cache_path: str
+
+        :param cache_metadata: Validators of the cached copy.
+        :type cache_metadata: dict
+        """
+        _remove(self.part_path + '.json')
+        if self.status_code == HTTP_NOT_MODIFIED and cache_metadata:
+            _remove(self.part_path)
+            shutil.copyfile(cache_path, self.output_path)
+            return
+
+        _remove(self.output_path)
+        os.rename(self.part_path, self.output_path)
+        if cache_path:
+            metadata = self.validators()
+            if metadata['etag'] or metadata['last_modified']:
+                shutil.copyfile(self.output_path, cache_path)
+                _write_metadata(cache_path + '.json', metadata)
+
+    def keep_partial(self):
+        """Keep what was downloaded so the download can be resumed.
+
+        Only the body of a successful response with a validator is kept.
+        """
+        if self.status_code is None:
+            # No response at all, what we had before is still valid
+            if not os.path.getsize(self.part_path):
+                _remove(self.part_path)
+            return
+        metadata = self.validators()
+        if (self.status_code in (HTTP_OK, HTTP_PARTIAL_CONTENT) and
+                os.path.getsize(self.part_path) and
+                (metadata['etag'] or metadata['last_modified'])):
+            if self.status_code == HTTP_OK or not os.path.exists(
+                    self.part_path + '.json'):
+                _write_metadata(self.part_path + '.json', metadata)
+        else:
+            _remove(self.part_path)
+            _remove(self.part_path + '.json')
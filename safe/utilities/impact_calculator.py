@@ -25,6 +25,7 @@ from PyQt4.QtCore import QObject
 
 # Do not import any QGIS or SAFE modules in this module!
 from safe.utilities.impact_calculator_thread import ImpactCalculatorThread
+from safe.utilities.impact_calculator_process import ImpactCalculatorProcess
 from safe.utilities.qgis_layer_wrapper import QgisWrapper
 from safe.utilities.utilities import (
     get_safe_impact_function,
@@ -153,7 +154,21 @@ class ImpactCalculator(QObject):
         """
         self._function = str(function_id)
 
-    def get_runner(self):
+    @staticmethod
+    def _layer_path(layer):
+        """Path of the file behind a layer.
+
+        :param layer: A layer.
+        :type layer: QgsMapLayer or SAFE layer.
+
+        :returns: The path of the layer data.
+        :rtype: str
+        """
+        if hasattr(layer, 'is_inasafe_spatial_object'):
+            return layer.get_filename()
+        return str(layer.source())
+
+    def get_runner(self, profiler=None, isolated=False, memory_limit=None):
         """ Factory to create a new runner thread.
 
         Requires three parameters to be set before execution can take place:
@@ -163,8 +178,21 @@ class ImpactCalculator(QObject):
         * Function - a function name that defines how the Hazard assessment
           will be computed (string).
 
-        :returns: An impact calculator thread instance.
-        :rtype: ImpactCalculatorThread
+        :param profiler: Optional profiler the runner records its stages on.
+        :type profiler: Profiler
+
+        :param isolated: Whether to calculate an 'old-style' impact function
+            in a child process. Layers are then read by the child from
+            their files instead of in this process.
+        :type isolated: bool
+
+        :param memory_limit: Megabytes the child process may allocate,
+            unlimited if None. Only used if isolated is True.
+        :type memory_limit: int
+
+        :returns: An impact calculator thread instance, or a process
+            instance with the same interface if isolated.
+        :rtype: ImpactCalculatorThread, ImpactCalculatorProcess
 
         :raises: InsufficientParametersError if not all parameters are set.
         """
@@ -182,6 +210,19 @@ class ImpactCalculator(QObject):
             message = self.tr('Error: Function not set.')
             raise InsufficientParametersError(message)
 
+        if isolated and self.requires_clipping():
+            functions = get_safe_impact_function(self._function)
+            function = functions[0][self._function]
+            return ImpactCalculatorProcess(
+                self._layer_path(self._hazardLayer),
+                self._layer_path(self._exposureLayer),
+                self._function,
+                parameters=getattr(function, 'parameters', None),
+                extent=self.extent(),
+                check_integrity=True,
+                profiler=profiler,
+                memory_limit=memory_limit)
+
         # Call impact calculation engine
         hazard_layer = self.hazard_layer()
         exposure_layer = self.exposure_layer()
@@ -193,7 +234,8 @@ class ImpactCalculator(QObject):
             exposure_layer,
             function,
             extent=self.extent(),
-            check_integrity=self.requires_clipping())
+            check_integrity=self.requires_clipping(),
+            profiler=profiler)
 
     def requires_clipping(self):
         """Check to clip or not to clip layers.
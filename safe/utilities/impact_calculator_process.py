@@ -0,0 +1,542 @@
+# coding=utf-8
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid -
+**Impact calculator running in a child process.**
+
+The module runs an impact function in a separate process so that a long
+calculation does not hold the GIL of the QGIS process, can be cancelled and
+can run out of memory without taking QGIS down with it.
+
+The child is a fresh python interpreter (see safe.utilities.worker) rather
+than a fork of QGIS. Only paths and parameters go to the child and only the
+path of the impact layer (with its name and style) comes back, so this
+runner is limited to 'old-style' impact functions working on SAFE layers.
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'info@inasafe.org'
+__revision__ = '$Format:%H$'
+__date__ = '19/10/2014'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import os
+import sys
+import Queue
+import logging
+import threading
+import traceback
+import cPickle as pickle
+from subprocess import PIPE
+
+# noinspection PyPackageRequirements
+from PyQt4.QtCore import QObject, QTimer, QCoreApplication, pyqtSignal
+
+from safe.common.exceptions import (
+    InaSAFEError,
+    InsufficientParametersError,
+    AnalysisCancelledError)
+from safe.common.utilities import temp_dir, unique_filename
+from safe.utilities.worker import start_worker
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, the memory limit is not applied there.
+    resource = None
+
+LOGGER = logging.getLogger('InaSAFE')
+
+# Milliseconds between checks of the child process when run asynchronously.
+POLL_INTERVAL = 100
+
+
+def _limit_memory(memory_limit):
+    """Limit the address space the current process may still allocate.
+
+    :param memory_limit: Megabytes the process may allocate on top of what
+        it uses already, no limit if None.
+    :type memory_limit: int
+    """
+    if memory_limit is None or resource is None:
+        return
+    try:
+        with open('/proc/self/statm') as statm:
+            current = int(statm.read().split()[0]) * resource.getpagesize()
+    except (IOError, ValueError):
+        # Only Linux enforces RLIMIT_AS reliably and it has /proc.
+        return
+    limit = current + int(memory_limit) * 1024 * 1024
+    hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+class MessageChannel(object):
+    """Send pickled messages over a binary stream."""
+
+    def __init__(self, stream):
+        """Constructor.
+
+        :param stream: Binary stream the messages are written to.
+        :type stream: file
+        """
+        self._stream = stream
+
+    def send(self, message):
+        """Send a message right away.
+
+        :param message: A picklable message.
+        :type message: tuple
+        """
+        pickle.dump(message, self._stream, pickle.HIGHEST_PROTOCOL)
+        self._stream.flush()
+
+    def close(self):
+        """Close the stream."""
+        self._stream.close()
+
+
+def read_messages(process, messages):
+    """Queue the messages sent by a worker until it exits.
+
+    This runs in a thread of the parent. None is queued once the worker
+    closed its end of the pipe and exited.
+
+    :param process: The worker process writing messages to its stdout.
+    :type process: Popen
+
+    :param messages: Queue receiving the messages.
+    :type messages: Queue.Queue
+    """
+    try:
+        while True:
+            messages.put(pickle.load(process.stdout))
+    except EOFError:
+        pass
+    # pylint: disable=W0703
+    except Exception:
+        LOGGER.exception('Could not read a message of the impact process.')
+    # pylint: enable=W0703
+    finally:
+        process.stdout.close()
+        process.wait()
+        messages.put(None)
+
+
+def run_impact_function(
+        connection,
+        hazard_path,
+        exposure_path,
+        function_id,
+        parameters=None,
+        extent=None,
+        check_integrity=True,
+        memory_limit=None):
+    """Calculate an impact and send the outcome through connection.
+
+    This is the entry point of the child process. Messages sent are
+    ('progress', stage name), then either ('done', filename, name,
+    style_info, profile stages) or ('error', exception, traceback lines).
+
+    :param connection: Channel to the parent.
+    :type connection: MessageChannel
+
+    :param hazard_path: Path of the hazard layer.
+    :type hazard_path: str
+
+    :param exposure_path: Path of the exposure layer.
+    :type exposure_path: str
+
+    :param function_id: Identifier of the impact function.
+    :type function_id: str
+
+    :param parameters: Parameters of the impact function, its defaults are
+        used if None.
+    :type parameters: dict
+
+    :param extent: Bounding box [xmin, ymin, xmax, ymax] of the analysis.
+    :type extent: list
+
+    :param check_integrity: Whether to check the input layers first.
+    :type check_integrity: bool
+
+    :param memory_limit: Megabytes the calculation may allocate.
+    :type memory_limit: int
+    """
+    # Imported here so the parent does not pay for them on import.
+    from safe.common.profiling import Profiler
+    from safe.engine.core import calculate_impact
+    from safe.impact_functions import get_plugin
+    from safe.storage.core import read_layer
+
+    try:
+        _limit_memory(memory_limit)
+        profiler = Profiler(
+            callback=lambda name: connection.send(('progress', name)))
+        with profiler.stage('layer_reading'):
+            layers = [read_layer(hazard_path), read_layer(exposure_path)]
+        function = get_plugin(function_id)
+        if parameters is not None:
+            function.parameters = parameters
+        impact_layer = calculate_impact(
+            layers=layers,
+            impact_fcn=function,
+            extent=extent,
+            check_integrity=check_integrity,
+            profiler=profiler)
+        connection.send((
+            'done',
+            impact_layer.get_filename(),
+            impact_layer.get_name(),
+            impact_layer.get_style_info(),
+            profiler.stages))
+    # pylint: disable=W0703
+    except Exception, e:
+        trace = traceback.format_tb(sys.exc_info()[2])
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            # The exception can not be pickled, send its text instead.
+            e = InaSAFEError(str(e))
+        connection.send(('error', e, trace))
+    # pylint: enable=W0703
+    finally:
+        connection.close()
+
+
+def main(job_path):
+    """Worker entry point: calculate the impact described by a job file.
+
+    Messages are written to stdout, anything the impact function prints
+    goes to stderr instead.
+
+    :param job_path: Path of the pickled arguments of run_impact_function
+        written by ImpactCalculatorProcess, the file is removed once read.
+    :type job_path: str
+    """
+    # noinspection PyPackageRequirements
+    from qgis.core import QgsApplication
+
+    descriptor = os.dup(sys.stdout.fileno())
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.setmode(descriptor, os.O_BINARY)
+    channel = MessageChannel(os.fdopen(descriptor, 'wb'))
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    application = QgsApplication([], False)
+    application.initQgis()
+    try:
+        with open(job_path, 'rb') as job_file:
+            job = pickle.load(job_file)
+        os.remove(job_path)
+        run_impact_function(channel, **job)
+    finally:
+        application.exitQgis()
+
+
+class ImpactCalculatorProcess(QObject):
+    """Run an impact function in a child process.
+
+    The runner is a drop in replacement of ImpactCalculatorThread: it has
+    the same start, run, join, result and impact_layer methods and emits
+    done when the calculation is over. In addition it reports the stage
+    being calculated with the progress signal and can be cancelled.
+
+    start() returns immediately and watches the child from the Qt event
+    loop, run() blocks until the child is finished while still processing
+    Qt events.
+    """
+    done = pyqtSignal()
+    progress = pyqtSignal(str)
+
+    def __init__(self,
+                 hazard_path,
+                 exposure_path,
+                 function_id,
+                 parameters=None,
+                 extent=None,
+                 check_integrity=True,
+                 profiler=None,
+                 memory_limit=None):
+        """Constructor for the impact calculator process.
+
+        :param hazard_path: Path of the hazard layer.
+        :type hazard_path: str
+
+        :param exposure_path: Path of the exposure layer.
+        :type exposure_path: str
+
+        :param function_id: Identifier of the impact function.
+        :type function_id: str
+
+        :param parameters: Parameters of the impact function.
+        :type parameters: dict
+
+        :param extent: Bounding box [xmin, ymin, xmax, ymax] of the working
+            region.
+        :type extent: list
+
+        :param check_integrity: If true, perform checking of input data
+            integrity before running impact calculation
+        :type check_integrity: bool
+
+        :param profiler: Optional profiler the stages calculated in the
+            child are added to.
+        :type profiler: Profiler
+
+        :param memory_limit: Megabytes the child may allocate, unlimited if
+            None. A calculation going over the limit fails with a
+            MemoryError in the child only.
+        :type memory_limit: int
+        """
+        QObject.__init__(self)
+        self._hazard_path = hazard_path
+        self._exposure_path = exposure_path
+        self._function_id = function_id
+        self._parameters = parameters
+        self._extent = extent
+        self._check_integrity = check_integrity
+        self._profiler = profiler
+        self._memory_limit = memory_limit
+        self._process = None
+        self._messages = None
+        self._job_path = None
+        self._timer = None
+        self._finished = False
+        self._impactLayer = None
+        self._result = None
+        self._exception = None
+        self._traceback = None
+
+    def impact_layer(self):
+        """Get the impact output from the last run.
+
+        :returns: An impact layer.
+        :rtype: read_layer
+        """
+        return self._impactLayer
+
+    def result(self):
+        """Return the result of the last run.
+
+        :returns: A message containing the status info for the last run.
+        :rtype: str
+        """
+        return self._result
+
+    def last_exception(self):
+        """Get any exception that may have been raised while running.
+
+        :returns: An exception if any.
+        :rtype: Exception
+        """
+        return self._exception
+
+    def last_traceback(self):
+        """Get the stack trace for any exception occurring in the last run."""
+        return self._traceback
+
+    def is_alive(self):
+        """Whether the calculation is still running.
+
+        :rtype: bool
+        """
+        return self._process is not None and not self._finished
+
+    def _launch(self):
+        """Start the child process.
+
+        :raises: InsufficientParametersError if not all parameters are set.
+        """
+        if (self._hazard_path is None) or \
+                (self._exposure_path is None) or \
+                (self._function_id is None):
+            message = self.tr(
+                'Ensure that hazard, exposure and function are all set before '
+                'trying to run the analysis.')
+            raise InsufficientParametersError(message)
+        self._job_path = unique_filename(
+            prefix='impact_job', suffix='.pickle', dir=temp_dir('impacts'))
+        with open(self._job_path, 'wb') as job_file:
+            pickle.dump({
+                'hazard_path': self._hazard_path,
+                'exposure_path': self._exposure_path,
+                'function_id': self._function_id,
+                'parameters': self._parameters,
+                'extent': self._extent,
+                'check_integrity': self._check_integrity,
+                'memory_limit': self._memory_limit},
+                job_file,
+                pickle.HIGHEST_PROTOCOL)
+        self._process = start_worker(
+            'safe.utilities.impact_calculator_process',
+            [self._job_path],
+            stdout=PIPE)
+        self._messages = Queue.Queue()
+        reader = threading.Thread(
+            target=read_messages, args=(self._process, self._messages))
+        reader.daemon = True
+        reader.start()
+
+    def start(self):
+        """Start the calculation and return immediately.
+
+        The child is watched from the Qt event loop, done is emitted once
+        it is finished.
+        """
+        self._launch()
+        self._timer = QTimer()
+        self._timer.timeout.connect(self._poll)
+        self._timer.start(POLL_INTERVAL)
+
+    def run(self):
+        """Run the calculation and wait until it is finished.
+
+        Qt events are processed while waiting so that progress messages are
+        shown and the analysis can be cancelled.
+
+        .. note:: a done signal is emitted when the analysis is complete.
+        """
+        self._launch()
+        self.join(process_events=True)
+
+    def join(self, timeout=None, process_events=False):
+        """Wait until the calculation is finished.
+
+        :param timeout: Seconds to wait at most, wait forever if None.
+        :type timeout: float
+
+        :param process_events: Whether to process Qt events while waiting.
+        :type process_events: bool
+        """
+        waited = 0.0
+        while self.is_alive():
+            if timeout is not None and waited >= timeout:
+                return
+            self._receive(POLL_INTERVAL / 1000.0)
+            waited += POLL_INTERVAL / 1000.0
+            if process_events:
+                QCoreApplication.processEvents()
+
+    def cancel(self):
+        """Kill the child process.
+
+        The runner finishes with an AnalysisCancelledError and emits done.
+        """
+        if not self.is_alive():
+            return
+        try:
+            self._process.terminate()
+        except OSError:
+            # The child exited in the meantime
+            pass
+        self._finish(
+            exception=AnalysisCancelledError(
+                self.tr('The analysis was cancelled.')),
+            message=self.tr('The analysis was cancelled.'))
+
+    def _poll(self):
+        """Handle the messages of the child without blocking."""
+        if self.is_alive():
+            self._receive(0)
+
+    def _receive(self, timeout):
+        """Handle the messages sent by the child.
+
+        :param timeout: Seconds to wait for the first message.
+        :type timeout: float
+        """
+        while True:
+            try:
+                message = self._messages.get(True, timeout)
+            except Queue.Empty:
+                return
+            timeout = 0
+            if message is None:
+                # The child exited without reporting back.
+                self._finish(
+                    exception=InaSAFEError(self.tr(
+                        'The analysis process stopped unexpectedly with '
+                        'exit code %s.') % self._process.returncode),
+                    message=self.tr('Calculation error encountered:\n'))
+                return
+            if message[0] == 'progress':
+                # noinspection PyUnresolvedReferences
+                self.progress.emit(message[1])
+            elif message[0] == 'done':
+                self._done(*message[1:])
+                return
+            else:
+                self._error(*message[1:])
+                return
+
+    def _done(self, filename, name, style_info, stages):
+        """Read the impact layer written by the child."""
+        from safe.storage.core import read_layer
+        if self._profiler is not None:
+            self._profiler.stages.extend(stages)
+        try:
+            impact_layer = read_layer(filename)
+        # pylint: disable=W0703
+        except Exception, e:
+            self._finish(
+                exception=e,
+                message=self.tr('Calculation error encountered:\n'),
+                trace=traceback.format_tb(sys.exc_info()[2]))
+            return
+        # pylint: enable=W0703
+        # Name and style are not stored in the impact layer file.
+        impact_layer.set_name(name)
+        impact_layer.style_info = style_info
+        self._impactLayer = impact_layer
+        self._finish(message=self.tr('Calculation completed successfully.'))
+
+    def _error(self, exception, trace):
+        """Record the exception raised in the child."""
+        if isinstance(exception, MemoryError):
+            message = self.tr(
+                'An error occurred because it appears that your system does '
+                'not have sufficient memory. Upgrading your computer so that '
+                'it has more memory may help. Alternatively, consider using a '
+                'smaller geographical area for your analysis, or using '
+                'rasters with a larger cell size.')
+        else:
+            message = self.tr('Calculation error encountered:\n')
+        LOGGER.error('%s\n%s' % (message, ''.join(trace)))
+        self._finish(exception=exception, message=message, trace=trace)
+
+    def _finish(self, exception=None, message=None, trace=None):
+        """Clean up after the child and emit done."""
+        if self._finished:
+            return
+        self._finished = True
+        if self._timer is not None:
+            self._timer.stop()
+        # The reader thread reaps the child, it is not waited for here.
+        if self._job_path is not None and os.path.exists(self._job_path):
+            try:
+                os.remove(self._job_path)
+            except OSError:
+                # Still open in a child that is being terminated
+                pass
+        self._exception = exception
+        self._traceback = trace
+        self._result = message
+        #  Let any listening slots know we are done
+        # noinspection PyUnresolvedReferences
+        self.done.emit()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -76,7 +76,8 @@ class ImpactCalculatorThread(threading.Thread, QObject):
                  exposure_layer,
                  function,
                  extent=None,
-                 check_integrity=True):
+                 check_integrity=True,
+                 profiler=None):
         """Constructor for the impact calculator thread.
 
         :param hazard_layer: read_layer object containing the Hazard data.
@@ -97,6 +98,9 @@ class ImpactCalculatorThread(threading.Thread, QObject):
             integrity before running impact calculation
         :type check_integrity: bool
 
+        :param profiler: Optional profiler recording the stages of the run.
+        :type profiler: Profiler
+
         :raises: InsufficientParametersError if not all parameters are set.
         """
         threading.Thread.__init__(self)
@@ -110,6 +114,7 @@ class ImpactCalculatorThread(threading.Thread, QObject):
         self._exception = None
         self._traceback = None
         self._check_integrity = check_integrity
+        self._profiler = profiler
 
     def impact_layer(self):
         """Get the impact output from the last run.
@@ -183,7 +188,8 @@ class ImpactCalculatorThread(threading.Thread, QObject):
                 layers=layers,
                 impact_fcn=self._function,
                 extent=self._extent,
-                check_integrity=self._check_integrity)
+                check_integrity=self._check_integrity,
+                profiler=self._profiler)
         except MemoryError, e:
             message = self.tr(
                 'An error occurred because it appears that your system does '
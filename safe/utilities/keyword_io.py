@@ -15,6 +15,7 @@ __copyright__ += 'Disaster Reduction'
 
 import json
 import os
+import threading
 from os.path import expanduser
 from xml.etree import ElementTree
 import logging
@@ -42,6 +43,27 @@ from safe.common.utilities import verify
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Version of the keywords database schema, stored as PRAGMA user_version
+KEYWORD_DB_SCHEMA_VERSION = 1
+
+# Maximum number of hashes bound in a single 'in (...)' query. SQLite
+# limits the number of host parameters per statement to 999 by default.
+KEYWORD_DB_BATCH_SIZE = 500
+
+# sqlite connections may only be used in the thread that created them, so
+# the pool holds one connection per database path for each thread.
+_CONNECTION_POOL = threading.local()
+_MIGRATED_DATABASES = set()
+_MIGRATION_LOCK = threading.Lock()
+
+
+def close_keyword_db_connections():
+    """Close all pooled keyword database connections of this thread."""
+    connections = getattr(_CONNECTION_POOL, 'connections', {})
+    for connection in connections.values():
+        connection.close()
+    _CONNECTION_POOL.connections = {}
+
 
 class KeywordIO(QObject):
     """Class for doing keyword read/write operations.
@@ -306,36 +328,146 @@ class KeywordIO(QObject):
         overridden in QSettings. If the db does not exist it will
         be created.
 
+        Connections are long lived: each thread keeps one connection per
+        database path which is reused by every KeywordIO instance. A new
+        connection is switched to WAL journal mode and the schema is
+        migrated once per database and process.
+
         :raises: An sqlite.Error is raised if anything goes wrong
         """
         self.connection = None
-        base_directory = os.path.dirname(self.keyword_db_path)
-        if not os.path.exists(base_directory):
+        connections = getattr(_CONNECTION_POOL, 'connections', None)
+        if connections is None:
+            connections = _CONNECTION_POOL.connections = {}
+        connection = connections.get(self.keyword_db_path)
+        if connection is not None and not self._connection_is_usable(
+                connection):
+            # The database was removed or the connection closed behind our
+            # back, so drop it and migrate the new database again.
+            del connections[self.keyword_db_path]
+            try:
+                connection.close()
+            except sqlite.Error:
+                pass
+            connection = None
+        if connection is None:
+            base_directory = os.path.dirname(self.keyword_db_path)
+            if not os.path.exists(base_directory):
+                try:
+                    os.mkdir(base_directory)
+                except IOError:
+                    LOGGER.exception(
+                        'Could not create directory for keywords cache.')
+                    raise
+
             try:
-                os.mkdir(base_directory)
-            except IOError:
-                LOGGER.exception(
-                    'Could not create directory for keywords cache.')
+                connection = sqlite.connect(self.keyword_db_path)
+                connection.execute('PRAGMA journal_mode=WAL;')
+            except (OperationalError, sqlite.Error):
+                LOGGER.exception('Failed to open keywords cache database.')
                 raise
+            connections[self.keyword_db_path] = connection
+            # The file may have been replaced since it was last migrated
+            _MIGRATED_DATABASES.discard(self.keyword_db_path)
+
+        self.connection = connection
+        self.migrate_schema()
+
+    def _connection_is_usable(self, connection):
+        """Check if a pooled connection can still be used.
 
+        :param connection: A connection taken from the connection pool.
+        :type connection: sqlite.Connection
+
+        :returns: False if the database file is gone or the connection was
+            closed, True otherwise.
+        :rtype: bool
+        """
+        if not os.path.exists(self.keyword_db_path):
+            return False
         try:
-            self.connection = sqlite.connect(self.keyword_db_path)
-        except (OperationalError, sqlite.Error):
-            LOGGER.exception('Failed to open keywords cache database.')
-            raise
+            connection.execute('select 1;')
+        except sqlite.Error:
+            return False
+        return True
 
     def close_connection(self):
-        """Close the active sqlite3 connection."""
+        """Release the active sqlite3 connection.
+
+        Any uncommitted changes are rolled back, as they were when the
+        connection was really closed. The underlying connection stays open
+        in the connection pool so that it can be reused and is revalidated
+        the next time it is opened. Use close_keyword_db_connections to
+        really close it.
+        """
         if self.connection is not None:
-            self.connection.close()
-            self.connection = None
+            try:
+                self.connection.rollback()
+            except sqlite.Error:
+                LOGGER.exception('Failed to release keywords connection.')
+        self.connection = None
+
+    def migrate_schema(self):
+        """Bring the schema of the keywords database up to date.
+
+        This runs once per database and process. It creates the keyword
+        table if needed and converts records written by InaSAFE versions
+        before 2.2 (pickled dicts) to ISO metadata.
+
+        :raises: An sqlite.Error will be raised if anything goes wrong.
+        """
+        if self.keyword_db_path in _MIGRATED_DATABASES:
+            return
+
+        with _MIGRATION_LOCK:
+            if self.keyword_db_path in _MIGRATED_DATABASES:
+                return
+            cursor = self.connection.cursor()
+            cursor.execute('PRAGMA user_version;')
+            version = cursor.fetchone()[0]
+            if version < KEYWORD_DB_SCHEMA_VERSION:
+                LOGGER.debug(
+                    'Migrating keywords database %s from version %s' % (
+                        self.keyword_db_path, version))
+                try:
+                    cursor.execute(
+                        'create table if not exists keyword ('
+                        'hash varchar(32) primary key, dict text);')
+                    cursor.execute('select hash, dict from keyword;')
+                    updates = []
+                    for hash_value, data in cursor.fetchall():
+                        try:
+                            metadata = pickle.loads(str(data))
+                        except (pickle.UnpicklingError, EOFError,
+                                TypeError, ValueError):
+                            # A corrupt record must not block the migration
+                            # of the rest of the database.
+                            LOGGER.exception(
+                                'Skipping unreadable keywords record %s' %
+                                hash_value)
+                            continue
+                        if type(metadata) is dict:
+                            updates.append((
+                                self._pickle_metadata(
+                                    generate_iso_metadata(metadata)),
+                                hash_value))
+                    cursor.executemany(
+                        'update keyword set dict=? where hash = ?;', updates)
+                    cursor.execute(
+                        'PRAGMA user_version = %i;' %
+                        KEYWORD_DB_SCHEMA_VERSION)
+                    self.connection.commit()
+                except sqlite.Error:
+                    self.connection.rollback()
+                    raise
+            _MIGRATED_DATABASES.add(self.keyword_db_path)
 
     def get_cursor(self):
         """Get a cursor for the active connection.
 
         The cursor can be used to execute arbitrary queries against the
-        database. This method also checks that the keywords table exists in
-        the schema, and if not, it creates it.
+        database. The connection is opened (and the schema migrated) if
+        needed.
 
         :returns: A valid cursor opened against the connection.
         :rtype: sqlite.
@@ -348,28 +480,7 @@ class KeywordIO(QObject):
             except OperationalError:
                 raise
         try:
-            cursor = self.connection.cursor()
-            cursor.execute('SELECT SQLITE_VERSION()')
-            data = cursor.fetchone()
-            LOGGER.debug("SQLite version: %s" % data)
-            # Check if we have some tables, if not create them
-            sql = 'select sql from sqlite_master where type = \'table\';'
-            cursor.execute(sql)
-            data = cursor.fetchone()
-            LOGGER.debug("Tables: %s" % data)
-            if data is None:
-                LOGGER.debug('No tables found')
-                sql = (
-                    'create table keyword (hash varchar(32) primary key,'
-                    'dict text);')
-                LOGGER.debug(sql)
-                cursor.execute(sql)
-                # data = cursor.fetchone()
-                cursor.fetchone()
-            else:
-                LOGGER.debug('Keywords table already exists')
-
-            return cursor
+            return self.connection.cursor()
         except sqlite.Error, e:
             LOGGER.debug("Error %s:" % e.args[0])
             raise
@@ -445,9 +556,8 @@ class KeywordIO(QObject):
         hash_value = self.hash_for_datasource(uri)
         try:
             cursor = self.get_cursor()
-            # now see if we have any data for our hash
-            sql = 'delete from keyword where hash = \'' + hash_value + '\';'
-            cursor.execute(sql)
+            cursor.execute(
+                'delete from keyword where hash = ?;', (hash_value,))
             self.connection.commit()
         except sqlite.Error, e:
             LOGGER.debug("SQLITE Error %s:" % e.args[0])
@@ -481,30 +591,39 @@ class KeywordIO(QObject):
 
         :raises: KeywordNotFoundError if the keyword is not recognised.
         """
-        hash_value = self.hash_for_datasource(uri)
+        return self.write_keywords_for_uris({uri: keywords})[uri]
+
+    def write_keywords_for_uris(self, keywords_for_uris):
+        """Write keywords for several URIs into the keywords database.
+
+        All records are written in a single transaction. Existing records
+        for a URI are replaced.
+
+        .. seealso:: write_keywords_for_uri, read_keywords_for_uris
+
+        :param keywords_for_uris: A dict mapping layer uris to the keywords
+            dict that should be written for them.
+        :type keywords_for_uris: dict
+
+        :returns: A dict mapping each uri to the XML written to the DB.
+        :rtype: dict
+
+        :raises: sqlite.Error if the records could not be written.
+        """
+        metadata_for_uris = {}
+        records = []
+        for uri, keywords in keywords_for_uris.iteritems():
+            metadata_xml = generate_iso_metadata(keywords)
+            metadata_for_uris[uri] = metadata_xml
+            records.append((
+                self.hash_for_datasource(uri),
+                self._pickle_metadata(metadata_xml)))
         try:
             cursor = self.get_cursor()
-            # now see if we have any data for our hash
-            sql = (
-                'select dict from keyword where hash = \'%s\';' % hash_value)
-            cursor.execute(sql)
-            data = cursor.fetchone()
-            metadata_xml = generate_iso_metadata(keywords)
-            pickle_dump = pickle.dumps(metadata_xml, pickle.HIGHEST_PROTOCOL)
-            if data is None:
-                # insert a new rec
-                # cursor.execute('insert into keyword(hash) values(:hash);',
-                #             {'hash': hash_value})
-                cursor.execute(
-                    'insert into keyword(hash, dict) values(:hash, :dict);',
-                    {'hash': hash_value, 'dict': sqlite.Binary(pickle_dump)})
-                self.connection.commit()
-            else:
-                # update existing rec
-                cursor.execute(
-                    'update keyword set dict=? where hash = ?;',
-                    (sqlite.Binary(pickle_dump), hash_value))
-                self.connection.commit()
+            cursor.executemany(
+                'insert or replace into keyword(hash, dict) values(?, ?);',
+                records)
+            self.connection.commit()
         except sqlite.Error:
             LOGGER.exception('Error writing keywords to SQLite db %s' %
                              self.keyword_db_path)
@@ -515,7 +634,79 @@ class KeywordIO(QObject):
         finally:
             self.close_connection()
 
-        return metadata_xml
+        return metadata_for_uris
+
+    def read_keywords_for_uris(self, uris):
+        """Get the keywords of several URIs from the keywords database.
+
+        The records are fetched with a few 'in' queries over the pooled
+        connection instead of one query (and connection) per URI.
+
+        .. seealso:: read_keyword_from_uri, write_keywords_for_uris
+
+        :param uris: Layer uris to read the keywords for.
+        :type uris: list
+
+        :returns: A dict mapping each uri that has a record in the database
+            to its keywords dict. URIs without a record are omitted.
+        :rtype: dict
+
+        :raises: sqlite.Error if the records could not be read.
+        """
+        uris_for_hashes = {}
+        for uri in uris:
+            uris_for_hashes.setdefault(
+                self.hash_for_datasource(uri), []).append(uri)
+        hashes = uris_for_hashes.keys()
+
+        rows = []
+        try:
+            cursor = self.get_cursor()
+            for start in range(0, len(hashes), KEYWORD_DB_BATCH_SIZE):
+                batch = hashes[start:start + KEYWORD_DB_BATCH_SIZE]
+                sql = 'select hash, dict from keyword where hash in (%s);' % (
+                    ', '.join(['?'] * len(batch)))
+                cursor.execute(sql, batch)
+                rows.extend(cursor.fetchall())
+        finally:
+            self.close_connection()
+
+        keywords_for_uris = {}
+        for hash_value, data in rows:
+            keywords = self._keywords_from_metadata(pickle.loads(str(data)))
+            for uri in uris_for_hashes[hash_value]:
+                keywords_for_uris[uri] = keywords
+        return keywords_for_uris
+
+    @staticmethod
+    def _pickle_metadata(metadata_xml):
+        """Serialise ISO metadata for storage in the keywords database.
+
+        :param metadata_xml: The ISO metadata XML.
+        :type metadata_xml: str
+
+        :returns: The pickled metadata ready to be bound to a query.
+        :rtype: sqlite.Binary
+        """
+        return sqlite.Binary(
+            pickle.dumps(metadata_xml, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _keywords_from_metadata(metadata):
+        """Extract the keywords dict from ISO metadata.
+
+        :param metadata: The ISO metadata XML as stored in the database, or
+            a keywords dict for records that have not been migrated.
+        :type metadata: str, dict
+
+        :returns: The keywords dict.
+        :rtype: dict
+        """
+        if type(metadata) is dict:
+            return metadata
+        root = ElementTree.fromstring(metadata)
+        keyword_element = root.find(ISO_METADATA_KEYWORD_TAG)
+        return json.loads(keyword_element.text)
 
     def read_keyword_from_uri(self, uri, keyword=None):
         """Get metadata from the keywords file associated with a URI.
@@ -528,9 +719,8 @@ class KeywordIO(QObject):
         in a local SQLITE database for the keywords. If there is an existing
         record it will be returned, if not and error will be thrown.
 
-        If the record is a dictionary, it means that it was inserted into the
-        DB in a pre 2.2 version which had no ISO metadata. In this case, we use
-        that dictionary to update the entry to the new ISO based metadata
+        Records inserted into the DB by a pre 2.2 version, which had no ISO
+        metadata, are converted to ISO metadata by migrate_schema.
 
         .. seealso:: write_keywords_for_uri, delete_keywords_for_uri
 
@@ -550,16 +740,11 @@ class KeywordIO(QObject):
         :raises: KeywordNotFoundError if the keyword is not found.
         """
         hash_value = self.hash_for_datasource(uri)
-        try:
-            self.open_connection()
-        except OperationalError:
-            raise
         try:
             cursor = self.get_cursor()
             # now see if we have any data for our hash
-            sql = (
-                'select dict from keyword where hash = \'%s\';' % hash_value)
-            cursor.execute(sql)
+            cursor.execute(
+                'select dict from keyword where hash = ?;', (hash_value,))
             data = cursor.fetchone()
             # unpickle it to get our dict back
             if data is None:
@@ -568,17 +753,7 @@ class KeywordIO(QObject):
 
             # get the ISO XML out of the DB
             metadata = pickle.loads(str(data))
-
-            # the uri already had a KW entry in the DB using the old KW system
-            # we use that dictionary to update the entry to the new ISO based
-            # metadata system
-            if type(metadata) is dict:
-                metadata = self.write_keywords_for_uri(uri, metadata)
-
-            root = ElementTree.fromstring(metadata)
-            keyword_element = root.find(ISO_METADATA_KEYWORD_TAG)
-            dict_str = keyword_element.text
-            picked_dict = json.loads(dict_str)
+            picked_dict = self._keywords_from_metadata(metadata)
 
             if keyword is None:
                 return picked_dict
@@ -22,6 +22,8 @@ import logging
 from PyQt4.QtCore import QCoreApplication
 
 from safe.common.utilities import get_free_memory
+from safe.impact_functions.impact_function_metadata import (
+    DEFAULT_MEMORY_MODEL)
 from safe import messaging as m
 from safe.messaging import styles
 from safe.common.signals import DYNAMIC_MESSAGE_SIGNAL
@@ -60,7 +62,36 @@ def send_message(message):
         message=message)
 
 
-def check_memory_usage(buffered_geo_extent, cell_size):
+def predict_memory_usage(cell_count, feature_count=0, memory_model=None):
+    """Predict the peak memory usage of an analysis.
+
+    :param cell_count: Number of raster cells in the analysis extent at the
+        analysis cell size, 0 if no raster is involved.
+    :type cell_count: int, float
+
+    :param feature_count: Number of vector features in the analysis extent.
+    :type feature_count: int
+
+    :param memory_model: Memory cost model of the impact function, see
+        ImpactFunctionMetadata.memory_model. The default model is used for
+        missing values.
+    :type memory_model: dict
+
+    :returns: Predicted peak memory usage in MB.
+    :rtype: float
+    """
+    model = dict(DEFAULT_MEMORY_MODEL)
+    if memory_model is not None:
+        model.update(memory_model)
+
+    requirement = (
+        float(cell_count) * model['bytes_per_cell'] * model['temporaries'] +
+        float(feature_count) * model['bytes_per_feature'])
+    return requirement / 1024 / 1024
+
+
+def check_memory_usage(
+        buffered_geo_extent, cell_size, memory_model=None, feature_count=0):
     """Helper to check if analysis is feasible when extents change.
 
     For simplicity, we will do all our calculations in geocrs.
@@ -68,18 +99,25 @@ def check_memory_usage(buffered_geo_extent, cell_size):
     :param buffered_geo_extent: An extent in the for [xmin, ymin, xmax, ymax]
     :type buffered_geo_extent: list
 
-    :param cell_size: The size of a cell (assumes in the X direction).
+    :param cell_size: The size of a cell (assumes in the X direction). None
+        if no raster is involved.
     :type cell_size: float
 
-    :returns: True if it appears we have enough memory (or we can't compute
-        it), False if it appears we do not have enough.
-    :rtype: bool
+    :param memory_model: Memory cost model of the impact function, see
+        ImpactFunctionMetadata.memory_model.
+    :type memory_model: dict
+
+    :param feature_count: Estimated number of vector features in the
+        analysis extent.
+    :type feature_count: int
 
     :raises: A Message containing notes about how much memory is needed
-        for a single raster and if this is likely to result in an error.
+        at the peak of the analysis and if this is likely to result in an
+        error.
 
-    :returns: True if it is supposed that there is sufficient memory,
-        False if it is supposed that too little memory exists.
+    :returns: True if it is supposed that there is sufficient memory (or we
+        can't compute it), False if it is supposed that too little memory
+        exists.
     :rtype: bool
     """
     message = m.Message()
@@ -95,34 +133,41 @@ def check_memory_usage(buffered_geo_extent, cell_size):
         # noinspection PyAugmentAssignment
         height = height / cell_size
     except TypeError:
-        # Could have been a vector layer for example
+        # No raster involved, only the vector features count
+        width = height = 0
+
+    if width * height == 0 and not feature_count:
         reason = tr(
-            'Computed cellsize was None. Memory check currently only works '
-            'for raster input layers.')
+            'Computed cellsize was None and there are no vector features to '
+            'count. Memory check skipped.')
         message.add(reason)
         send_message(message)
-        return True  # assume enough mem since we have no vector check logic
+        return True  # assume enough mem since we have nothing to check
 
     bullet_list = m.BulletedList()
-    bullet = m.Paragraph(
-        m.ImportantText(tr('Width: ')), str(width))
-    bullet_list.add(bullet)
-    bullet = m.Paragraph(
-        m.ImportantText(tr('Height: ')), str(height))
-    bullet_list.add(bullet)
-    bullet = m.Paragraph(
-        m.ImportantText(tr('Cell Size: ')), str(cell_size))
-    bullet_list.add(bullet)
+    if width * height:
+        bullet = m.Paragraph(
+            m.ImportantText(tr('Width: ')), str(width))
+        bullet_list.add(bullet)
+        bullet = m.Paragraph(
+            m.ImportantText(tr('Height: ')), str(height))
+        bullet_list.add(bullet)
+        bullet = m.Paragraph(
+            m.ImportantText(tr('Cell Size: ')), str(cell_size))
+        bullet_list.add(bullet)
+    if feature_count:
+        bullet = m.Paragraph(
+            m.ImportantText(tr('Features: ')), str(feature_count))
+        bullet_list.add(bullet)
     message.add(bullet_list)
 
-    # Compute mem requirement in MB (assuming numpy uses 8 bytes by per
-    # cell) see this link:
+    # Predict the peak requirement in MB from the impact function's memory
+    # model: numpy arrays use 8 bytes per cell in double precision (see
     # http://stackoverflow.com/questions/11784329/
-    #      python-memory-usage-of-numpy-arrays
-    # Also note that the on-disk requirement of the clipped tifs is about
-    # half this since the tifs as in single precision,
-    # whereas numpy arrays are in double precision.
-    requirement = ((width * height * 8) / 1024 / 1024)
+    #      python-memory-usage-of-numpy-arrays)
+    # and impact functions hold several full-size arrays at once.
+    requirement = predict_memory_usage(
+        width * height, feature_count, memory_model)
     try:
         free_memory = get_free_memory()
     except ValueError:
@@ -134,21 +179,15 @@ def check_memory_usage(buffered_geo_extent, cell_size):
         LOGGER.exception(message)
         return True  # still let the user try to run their analysis
 
-    # We work on the assumption that if more than 10% of the available
-    # memory is occupied by a single layer we could run out of memory
-    # (depending on the impact function). This is because multiple
-    # in memory copies of the layer are often made during processing.
-    warning_limit = 10
     usage_indicator = (float(requirement) / float(free_memory)) * 100
     counts_message = tr(
-        'Memory requirement: about %d mb per raster layer ('
+        'Memory requirement: about %d mb at the peak of the analysis ('
         '%d mb available)') % (requirement, free_memory)
-    usage_message = tr('Memory used / available: %d/%d') % (
-        usage_indicator, warning_limit)
+    usage_message = tr('Memory used / available: %d%%') % usage_indicator
     message.add(counts_message)
     message.add(usage_message)
 
-    if warning_limit <= usage_indicator:
+    if usage_indicator >= 100:
         warning_heading = m.Heading(
             tr('Potential memory issue'), **WARNING_STYLE)
         warning_message = tr(
@@ -18,10 +18,12 @@ __date__ = '29/01/2011'
 __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
+import os
 import sys
 import logging
 import math
 import numpy
+from osgeo import gdal
 from PyQt4 import QtGui
 
 from qgis.core import (
@@ -38,6 +40,7 @@ from qgis.core import (
     QgsSingleBandPseudoColorRenderer)
 
 from safe.common.exceptions import StyleError
+from safe.storage.utilities import read_keywords
 
 
 LOGGER = logging.getLogger('InaSAFE')
@@ -396,6 +399,39 @@ def add_extrema_to_style(style):
     return new_styles
 
 
+def raster_statistics(raster_layer):
+    """Get the minimum and maximum of a raster layer without scanning it.
+
+    Impact functions store the statistics of their output in the
+    class_statistics keyword. For other layers only statistics GDAL
+    already knows (e.g. stored in the file) are used: computing them here
+    would write a .aux.xml file next to the user's data.
+
+    :param raster_layer: A QGIS raster layer.
+    :type raster_layer: QgsRasterLayer
+
+    :returns: The minimum and maximum or None if they are not known.
+    :rtype: (float, float), None
+    """
+    source = str(raster_layer.source())
+    keywords_path = os.path.splitext(source)[0] + '.keywords'
+    if os.path.exists(keywords_path):
+        statistics = read_keywords(keywords_path).get('class_statistics')
+        # NaN statistics are read back as a string
+        if isinstance(statistics, dict):
+            return statistics['minimum'], statistics['maximum']
+
+    dataset = gdal.Open(source, gdal.GA_ReadOnly)
+    if dataset is None:
+        return None
+    # approx_ok but do not force, so nothing is computed or persisted
+    statistics = dataset.GetRasterBand(1).GetStatistics(True, False)
+    # Unknown statistics come back as None or with a negative std dev
+    if statistics is None or statistics[3] < 0:
+        return None
+    return statistics[0], statistics[1]
+
+
 def set_raster_style(raster_layer, style):
     """Set QGIS raster style based on InaSAFE style dictionary for QGIS >= 2.0.
 
@@ -486,6 +522,13 @@ def set_raster_style(raster_layer, style):
     LOGGER.debug('Setting colour ramp list')
     raster_shader = QgsRasterShader()
     color_ramp_shader = QgsColorRampShader()
+    # Known extrema spare QGIS from computing the band statistics
+    extrema = raster_statistics(raster_layer)
+    if extrema is not None:
+        raster_shader.setMinimumValue(extrema[0])
+        raster_shader.setMaximumValue(extrema[1])
+        color_ramp_shader.setMinimumValue(extrema[0])
+        color_ramp_shader.setMaximumValue(extrema[1])
     color_ramp_shader.setColorRampType(QgsColorRampShader.INTERPOLATED)
     color_ramp_shader.setColorRampItemList(ramp_item_list)
     LOGGER.debug('Setting shader function')
@@ -495,6 +538,9 @@ def set_raster_style(raster_layer, style):
         raster_layer.dataProvider(),
         band,
         raster_shader)
+    if extrema is not None and hasattr(renderer, 'setClassificationMin'):
+        renderer.setClassificationMin(extrema[0])
+        renderer.setClassificationMax(extrema[1])
     LOGGER.debug('Assigning renderer to raster layer')
     raster_layer.setRenderer(renderer)
 
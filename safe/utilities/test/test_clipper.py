@@ -22,10 +22,12 @@ import os
 import shutil
 from unittest import expectedFailure
 import numpy
+from osgeo import gdal
 
 from qgis.core import (
     QgsVectorLayer,
     QgsRasterLayer,
+    QgsMapLayer,
     QgsGeometry,
     QgsPoint)
 
@@ -38,10 +40,12 @@ from safe.common.exceptions import (
     GetDataError)
 from safe.utilities.clipper import (
     clip_layer,
+    clip_layers,
     extent_to_kml,
     explode_multipart_geometry,
     clip_geometry,
-    adjust_clip_extent)
+    adjust_clip_extent,
+    warp_raster)
 from safe.test.utilities import (
     set_canvas_crs,
     RedirectStreams,
@@ -153,6 +157,131 @@ class ClipperTest(unittest.TestCase):
         # Check the output is valid
         assert os.path.exists(result.source())
 
+    def test_clip_vector_to_geopackage(self):
+        """Vector layers can be clipped to an indexed GeoPackage."""
+        vector_layer = QgsVectorLayer(VECTOR_PATH, 'padang', 'ogr')
+        bounding_box = [100.03, -1.14, 100.81, -0.73]
+
+        shapefile_result = clip_layer(vector_layer, bounding_box)
+        result = clip_layer(
+            vector_layer, bounding_box, vector_output_format='GPKG')
+
+        self.assertTrue(result.source().endswith('.gpkg'))
+        self.assertTrue(result.isValid())
+        self.assertEqual(
+            result.featureCount(), shapefile_result.featureCount())
+        self.assertEqual(
+            result.dataProvider().fields().count(),
+            vector_layer.dataProvider().fields().count())
+        safe_layer = read_safe_layer(result.source())
+        self.assertEqual(len(safe_layer), shapefile_result.featureCount())
+        self.assertIn('category', safe_layer.get_keywords())
+
+    def test_warp_raster_in_memory(self):
+        """Rasters can be clipped in process to a MEM dataset."""
+        if not hasattr(gdal, 'Warp'):
+            self.skipTest('gdal.Warp requires GDAL 2.1 or newer')
+
+        source = gdal.Open(RASTERPATH)
+        source_type = source.GetRasterBand(1).DataType
+        source_cell_size = source.GetGeoTransform()[1]
+        source = None
+
+        bounding_box = [100.0, -1.5, 101.0, -0.5]
+        dataset = warp_raster(RASTERPATH, bounding_box)
+        geotransform = dataset.GetGeoTransform()
+
+        self.assertEqual(dataset.GetDriver().ShortName, 'MEM')
+        self.assertEqual(dataset.GetRasterBand(1).DataType, source_type)
+        self.assertAlmostEqual(geotransform[0], bounding_box[0])
+        self.assertAlmostEqual(geotransform[3], bounding_box[3])
+        self.assertAlmostEqual(geotransform[1], source_cell_size)
+
+        # Resampled to a requested cell size
+        dataset = warp_raster(RASTERPATH, bounding_box, cell_size=0.05)
+        self.assertAlmostEqual(dataset.GetGeoTransform()[1], 0.05)
+        self.assertEqual(dataset.RasterXSize, 20)
+
+    def test_clip_raster_to_vrt(self):
+        """Raster layers can be clipped to a virtual raster."""
+        if not hasattr(gdal, 'Warp'):
+            self.skipTest('gdal.Warp requires GDAL 2.1 or newer')
+
+        raster_layer = QgsRasterLayer(RASTERPATH, 'shake')
+        bounding_box = [100.0, -1.5, 101.0, -0.5]
+        result = clip_layer(
+            raster_layer, bounding_box, raster_output_format='VRT')
+
+        self.assertTrue(result.source().endswith('.vrt'))
+        self.assertTrue(result.isValid())
+        safe_layer = read_safe_layer(result.source())
+        self.assertIn('category', safe_layer.get_keywords())
+
+    def test_clip_raster_window(self):
+        """Clipping without resampling needs no copy of the pixels."""
+        if not hasattr(gdal, 'Translate'):
+            self.skipTest('gdal.Translate requires GDAL 2.1 or newer')
+
+        raster_layer = QgsRasterLayer(RASTERPATH, 'shake')
+        extent = raster_layer.extent()
+        layer_extent = [
+            extent.xMinimum(),
+            extent.yMinimum(),
+            extent.xMaximum(),
+            extent.yMaximum()]
+
+        # The layer itself is used when it already has the clip extent
+        result = clip_layer(raster_layer, layer_extent, reuse_source=True)
+        self.assertIs(result, raster_layer)
+        # but not unless asked for
+        result = clip_layer(raster_layer, layer_extent)
+        self.assertIsNot(result, raster_layer)
+
+        # A smaller extent is cropped without resampling, in the format
+        # asked for
+        bounding_box = [100.0, -1.5, 101.0, -0.5]
+        result = clip_layer(raster_layer, bounding_box)
+        self.assertTrue(result.source().endswith('.tif'))
+        self.assertTrue(result.isValid())
+        self.assertAlmostEqual(
+            result.rasterUnitsPerPixelX(),
+            raster_layer.rasterUnitsPerPixelX())
+        result = clip_layer(
+            raster_layer, bounding_box, raster_output_format='VRT')
+        self.assertTrue(result.source().endswith('.vrt'))
+        self.assertTrue(result.isValid())
+
+    def test_clip_vector_reuse_source(self):
+        """Only whole, unfiltered vector files are used as they are."""
+        vector_layer = QgsVectorLayer(VECTOR_PATH3, 'buildings', 'ogr')
+        world = [-180.0, -90.0, 180.0, 90.0]
+        result = clip_layer(
+            vector_layer, world, explode_flag=False, reuse_source=True)
+        self.assertIs(result, vector_layer)
+
+        # A filtered layer is not the file read_layer would read
+        vector_layer.setSubsetString('1 = 1')
+        result = clip_layer(
+            vector_layer, world, explode_flag=False, reuse_source=True)
+        self.assertIsNot(result, vector_layer)
+
+    def test_clip_layers(self):
+        """Several layers can be clipped at once."""
+        raster_layer = QgsRasterLayer(RASTERPATH, 'shake')
+        vector_layer = QgsVectorLayer(VECTOR_PATH, 'icon', 'ogr')
+        bounding_box = [100.03, -1.14, 100.81, -0.73]
+        results = clip_layers([
+            {'layer': raster_layer, 'extent': bounding_box,
+             'cell_size': 0.05},
+            {'layer': vector_layer, 'extent': bounding_box}])
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0].type(), QgsMapLayer.RasterLayer)
+        self.assertTrue(results[0].isValid())
+        self.assertAlmostEqual(results[0].rasterUnitsPerPixelX(), 0.05)
+        self.assertEqual(results[1].type(), QgsMapLayer.VectorLayer)
+        self.assertTrue(os.path.exists(results[1].source()))
+
     # See issue #349
     @expectedFailure
     def test_clip_one_pixel(self):
@@ -16,8 +16,12 @@ __date__ = '16/03/2014'
 __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 
+import os
+import json
 import unittest
 import tempfile
+import threading
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
 
 # AG: Although we don't use qgis here, qgis should be imported before PyQt to
 #  force this test to use SIP API V.2
@@ -26,14 +30,98 @@ import qgis
 from PyQt4.QtNetwork import QNetworkAccessManager
 
 from safe.utilities.file_downloader import FileDownloader
+from safe.common.utilities import temp_dir
 from safe.common.exceptions import DownloadError
 from safe.test.utilities import assert_hash_for_file, get_qgis_app
 
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
+CONTENT = ''.join(chr(index % 256) for index in range(100000))
+ETAG = '"inasafe-test"'
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Serve CONTENT with an ETag, range requests and 304 replies."""
+    requests = []
+
+    def do_GET(self):
+        """Answer a GET request."""
+        # Header names are lower case in this dict
+        RequestHandler.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == ETAG:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header(
+                'Content-Range',
+                'bytes %d-%d/%d' % (start, len(CONTENT) - 1, len(CONTENT)))
+        else:
+            start = 0
+            self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(CONTENT) - start))
+        self.end_headers()
+        self.wfile.write(CONTENT[start:])
+
+    def log_message(self, *args):
+        """Keep the test output quiet."""
+        pass
+
 
 class FileDownloaderTest(unittest.TestCase):
     """Test FileDownloader class."""
+    def setUp(self):
+        """Start a local http server."""
+        RequestHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.url = 'http://127.0.0.1:%d/extract.zip' % self.server.server_port
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        """Stop the local http server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_download_cache(self):
+        """A second download of the same url comes from the cache."""
+        manager = QNetworkAccessManager(PARENT)
+        cache_dir = tempfile.mkdtemp(dir=temp_dir('test'))
+        for _ in range(2):
+            path = tempfile.mktemp()
+            result = FileDownloader(
+                manager, self.url, path, cache_dir=cache_dir).download()
+            self.assertEqual(result, (True, None))
+            with open(path, 'rb') as downloaded_file:
+                self.assertEqual(downloaded_file.read(), CONTENT)
+            self.assertFalse(os.path.exists(path + '.part'))
+
+        self.assertNotIn('if-none-match', RequestHandler.requests[0])
+        self.assertEqual(RequestHandler.requests[1]['if-none-match'], ETAG)
+
+    def test_download_resume(self):
+        """An interrupted download is resumed with a range request."""
+        manager = QNetworkAccessManager(PARENT)
+        path = tempfile.mktemp()
+        downloader = FileDownloader(manager, self.url, path)
+        # What an interrupted download leaves behind
+        with open(downloader.part_path, 'wb') as part_file:
+            part_file.write(CONTENT[:40000])
+        with open(downloader.part_path + '.json', 'w') as metadata_file:
+            json.dump(
+                {'url': self.url, 'etag': ETAG, 'last_modified': ''},
+                metadata_file)
+
+        self.assertEqual(downloader.download(), (True, None))
+        self.assertEqual(RequestHandler.requests[0]['range'], 'bytes=40000-')
+        with open(path, 'rb') as downloaded_file:
+            self.assertEqual(downloaded_file.read(), CONTENT)
+
     # noinspection PyMethodMayBeStatic
     def test_download(self):
         """Test download."""
@@ -21,7 +21,10 @@ import os
 import unittest
 
 from safe.utilities.impact_calculator import ImpactCalculator
-from safe.common.exceptions import InsufficientParametersError
+from safe.utilities.impact_calculator_process import ImpactCalculatorProcess
+from safe.common.exceptions import (
+    InsufficientParametersError,
+    AnalysisCancelledError)
 from safe.test.utilities import HAZDATA, EXPDATA, TESTDATA
 from safe.storage.core import read_layer as read_safe_layer
 
@@ -99,6 +102,29 @@ class ImpactCalculatorTest(unittest.TestCase):
             message = 'Calculator run failed:\n' + str(e)
             assert(), message
 
+    def test_process(self):
+        """Test that running in a child process works as expected."""
+        function_runner = self.calculator.get_runner(isolated=True)
+        self.assertIsInstance(function_runner, ImpactCalculatorProcess)
+        stages = []
+        function_runner.progress.connect(stages.append)
+        function_runner.run()
+        self.assertIsNone(function_runner.last_exception())
+        impact_layer = function_runner.impact_layer()
+        self.assertTrue(os.path.exists(impact_layer.get_filename()))
+        self.assertTrue(impact_layer.get_style_info())
+        self.assertIn('impact_function', stages)
+
+    def test_process_cancel(self):
+        """Test that a calculation in a child process can be cancelled."""
+        function_runner = self.calculator.get_runner(isolated=True)
+        function_runner.start()
+        function_runner.cancel()
+        self.assertFalse(function_runner.is_alive())
+        self.assertIsNone(function_runner.impact_layer())
+        self.assertIsInstance(
+            function_runner.last_exception(), AnalysisCancelledError)
+
     def test_start_with_no_parameters(self):
         """Test that run raises an error properly when no parameters defined.
         """
@@ -4,6 +4,7 @@ import unittest
 import os
 import tempfile
 import shutil
+import sqlite3 as sqlite
 
 from qgis.core import QgsDataSourceURI, QgsVectorLayer
 
@@ -14,7 +15,10 @@ from safe.test.utilities import (
     get_qgis_app,
     test_data_path,
     clone_raster_layer)
-from safe.utilities.keyword_io import KeywordIO
+from safe.utilities.keyword_io import (
+    KeywordIO,
+    KEYWORD_DB_SCHEMA_VERSION,
+    close_keyword_db_connections)
 from safe.common.exceptions import HashNotFoundError
 from safe.common.utilities import temp_dir
 from safe.common.exceptions import NoKeywordsFoundError
@@ -129,6 +133,68 @@ class KeywordIOTest(unittest.TestCase):
             # we expect this outcome so good!
             pass
 
+    def test_batch_keywords_for_uris(self):
+        """Test we can write and read keywords for many uris at once."""
+        filename = unique_filename(suffix='.db', dir=temp_dir())
+        self.keyword_io.set_keyword_db_path(filename)
+
+        keywords_for_uris = {}
+        for index in range(20):
+            uri = 'dbname=\'osm\' table="layer_%i" (geom) sql=' % index
+            keywords_for_uris[uri] = {
+                'category': 'exposure',
+                'title': 'Layer %i' % index}
+        self.keyword_io.write_keywords_for_uris(keywords_for_uris)
+
+        missing_uri = 'dbname=\'osm\' table="missing" (geom) sql='
+        keywords = self.keyword_io.read_keywords_for_uris(
+            keywords_for_uris.keys() + [missing_uri])
+        self.assertEqual(keywords, keywords_for_uris)
+
+        # The single uri API sees the same records
+        uri = keywords_for_uris.keys()[0]
+        self.assertEqual(
+            self.keyword_io.read_keyword_from_uri(uri),
+            keywords_for_uris[uri])
+
+    def test_migrate_schema_skips_corrupt_records(self):
+        """Test an unreadable record does not block the migration."""
+        filename = unique_filename(suffix='.db', dir=temp_dir())
+        connection = sqlite.connect(filename)
+        connection.execute(
+            'create table keyword (hash varchar(32) primary key, dict text);')
+        connection.execute(
+            'insert into keyword values (?, ?);', ('corrupt', 'not a pickle'))
+        connection.commit()
+        connection.close()
+
+        self.keyword_io.set_keyword_db_path(filename)
+        uri = 'dbname=\'osm\' table="migrated" (geom) sql='
+        self.keyword_io.write_keywords_for_uri(uri, {'title': 'Migrated'})
+        self.assertEqual(
+            self.keyword_io.read_keyword_from_uri(uri, 'title'), 'Migrated')
+
+        cursor = self.keyword_io.get_cursor()
+        cursor.execute('PRAGMA user_version;')
+        self.assertEqual(cursor.fetchone()[0], KEYWORD_DB_SCHEMA_VERSION)
+        self.keyword_io.close_connection()
+        close_keyword_db_connections()
+
+    def test_pooled_connection_revalidated(self):
+        """Test a pooled connection to a removed database is replaced."""
+        filename = unique_filename(suffix='.db', dir=temp_dir())
+        self.keyword_io.set_keyword_db_path(filename)
+        uri = 'dbname=\'osm\' table="pooled" (geom) sql='
+        self.keyword_io.write_keywords_for_uri(uri, {'title': 'First'})
+        os.remove(filename)
+
+        # The new database gets a schema even though the old one was migrated
+        self.keyword_io.write_keywords_for_uri(uri, {'title': 'Second'})
+        self.assertTrue(os.path.exists(filename))
+        self.assertEqual(
+            self.keyword_io.read_keyword_from_uri(uri, 'title'), 'Second')
+        close_keyword_db_connections()
+
     def test_are_keywords_file_based(self):
         """Can we correctly determine if keywords should be written to file or
         to database?"""
@@ -4,7 +4,9 @@
 import os
 import unittest
 
-from safe.utilities.memory_checker import check_memory_usage
+from safe.utilities.memory_checker import (
+    check_memory_usage,
+    predict_memory_usage)
 
 
 class TestMemoryChecker(unittest.TestCase):
@@ -36,3 +38,33 @@ class TestMemoryChecker(unittest.TestCase):
             cell_size=1
         )
         self.assertTrue(actual)
+
+    def test_predict_memory_usage(self):
+        """Test predict_memory_usage uses the memory model.
+        """
+        # Default model: 10 float64 temporaries per cell
+        actual = predict_memory_usage(1024 * 1024)
+        self.assertEqual(actual, 80)
+
+        model = {'bytes_per_cell': 4, 'temporaries': 3}
+        actual = predict_memory_usage(1024 * 1024, memory_model=model)
+        self.assertEqual(actual, 12)
+
+        # Vector features only
+        model = {'bytes_per_feature': 1024}
+        actual = predict_memory_usage(0, 2048, memory_model=model)
+        self.assertEqual(actual, 2)
+
+    def test_check_memory_usage_vector(self):
+        """Test check_memory_usage with vector features only.
+        """
+        actual = check_memory_usage(
+            buffered_geo_extent=[0, 0, 100, 100],
+            cell_size=None,
+            feature_count=100)
+        self.assertTrue(actual)
+        actual = check_memory_usage(
+            buffered_geo_extent=[0, 0, 100, 100],
+            cell_size=None,
+            feature_count=10 ** 15)
+        self.assertFalse(actual)
@@ -17,13 +17,16 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
                  'Disaster Reduction')
 import unittest
 import os
+import shutil
 
 from safe.utilities.styling import (
     set_vector_graduated_style,
     setRasterStyle,
     add_extrema_to_style,
-    mmi_colour)
+    mmi_colour,
+    raster_statistics)
 from safe.utilities.utilities import get_error_message
+from safe.common.utilities import unique_filename
 from safe.test.utilities import (
     test_data_path,
     load_layer,
@@ -286,6 +289,16 @@ class StylingTest(unittest.TestCase):
             print str(e)
         assert False, 'Incorrect handling of broken styles'
 
+    def test_raster_statistics_not_persisted(self):
+        """Test raster_statistics does not write a .aux.xml file."""
+        source_file = test_data_path('other', 'issue126.tif')
+        test_file = unique_filename(prefix='issue126-', suffix='.tif')
+        shutil.copyfile(source_file, test_file)
+        layer, _ = load_layer(test_file)
+
+        raster_statistics(layer)
+        self.assertFalse(os.path.exists(test_file + '.aux.xml'))
+
     def testAddMinMaxToStyle(self):
         """Test our add min max to style function."""
         myClasses = [dict(colour='#38A800', quantity=2, transparency=0),
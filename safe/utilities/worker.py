@@ -0,0 +1,63 @@
+# coding=utf-8
+"""Helpers to run InaSAFE code in a fresh python interpreter.
+
+QGIS keeps threads running and holds a connection to the display, so a
+forked copy of it (which multiprocessing makes on posix) is not safe to
+use. Workers are started as new interpreters instead, with the module
+search path and the QGIS prefix of this process.
+"""
+import os
+import sys
+from subprocess import Popen
+
+# noinspection PyPackageRequirements
+from qgis.core import QgsApplication
+
+
+def python_executable():
+    """Python interpreter able to run a worker.
+
+    Inside QGIS sys.executable may be the QGIS binary rather than python.
+
+    :returns: Path of the interpreter.
+    :rtype: str
+    """
+    executable = sys.executable
+    if os.path.basename(executable).lower().startswith('python'):
+        return executable
+    if sys.platform == 'win32':
+        candidate = os.path.join(sys.exec_prefix, 'python.exe')
+    else:
+        candidate = os.path.join(sys.exec_prefix, 'bin', 'python')
+    if os.path.exists(candidate):
+        return candidate
+    return 'python'
+
+
+def worker_environment():
+    """Environment of a worker: this process's paths and QGIS prefix."""
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        [path for path in sys.path if path])
+    environment['QGIS_PREFIX_PATH'] = QgsApplication.prefixPath()
+    return environment
+
+
+def start_worker(module, arguments, **kwargs):
+    """Run a module as a script in a new python interpreter.
+
+    :param module: Dotted name of the module, it is run like python -m.
+    :type module: str
+
+    :param arguments: Command line arguments of the module.
+    :type arguments: list
+
+    :param kwargs: Further arguments of Popen, e.g. stdout=PIPE.
+
+    :returns: The worker process.
+    :rtype: Popen
+    """
+    return Popen(
+        [python_executable(), '-m', module] + list(arguments),
+        env=worker_environment(),
+        **kwargs)